@@ -1,6 +1,7 @@
 # agents/clarification_agent.py
 
 from typing import Dict, Any
+from core.conversation_events import mark_prompted
 
 AGENT_STATE_HINT = {
     "requires": ["clarifications_needed", "ambiguous_tables"],
@@ -18,15 +19,18 @@ def ClarificationAgent():
         for table in clarifications_needed:
             options = ambiguous_tables.get(table, [])
             if options:
-                clarification_prompt += f"\n🔹 **{table}** → " + ", ".join([f"`{opt}`" for opt in options])
+                clarification_prompt += f"\n🔹 **{table}** → " + ", ".join([f"{i}. `{opt}`" for i, opt in enumerate(options, 1)])
 
         if clarification_prompt:
             messages.append({
                 "sender": "assistant",
-                "text": f"⚠️ I found multiple matches for the following tables:{clarification_prompt}\n\nPlease let me know which one you meant for each."
+                "text": f"⚠️ I found multiple matches for the following tables:{clarification_prompt}\n\nPlease let me know which one you meant for each, by name or number."
             })
             state["clarification_requested"] = True
             state["clarifications_pending"] = True  # ✅ Hold planner until clarified
+            # ⏸️ ClarificationHandlerAgent only reads replies sent after this question
+            state.setdefault("conversation_cursors", {}).pop("clarification_handler_agent", None)
+            mark_prompted(state, "clarification_handler_agent")
         else:
             state["clarification_requested"] = False
             state["clarifications_pending"] = False
@@ -1,13 +1,40 @@
 # agents/clarification_handler_agent.py
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import re
+from core.conversation_events import take_user_reply, mark_prompted, mark_answered
+
+AGENT_NAME = "clarification_handler_agent"
 
 AGENT_STATE_HINT = {
     "requires": ["clarifications_needed", "ambiguous_tables", "chatbot_messages"],
     "produces": ["resolved_tables", "clarifications_needed", "clarifications_pending"]  # ✅ Added
 }
 
+def match_option(table: str, options: List[str], reply: str, single: bool) -> Optional[str]:
+    """
+    The option a reply picks for an ambiguous table: its DB.SCHEMA.TABLE, its bare table name
+    or its position in the list ClarificationAgent showed ("2", or "custmers 2" when several
+    tables are pending). A name that is also the mention itself only counts when nothing else does.
+    """
+    def named(name: str) -> bool:
+        return re.search(rf"(?<![\w.]){re.escape(name)}(?![\w.])", reply, re.IGNORECASE) is not None
+
+    for candidates in ([o for o in options if named(o)],
+                       [o for o in options if named(o.split(".")[-1])]):
+        preferred = [o for o in candidates if o.split(".")[-1].lower() != table.lower()] or candidates
+        if len(preferred) == 1:
+            return preferred[0]
+        if preferred:
+            return None  # names more than one option
+
+    after_mention = re.search(rf"(?<![\w.]){re.escape(table)}\W+(\d+)\b", reply, re.IGNORECASE)
+    numbers = [after_mention.group(1)] if after_mention else re.findall(r"(?<![\w.])\d+(?![\w.])", reply) if single else []
+    if len(numbers) == 1 and 0 < int(numbers[0]) <= len(options):
+        return options[int(numbers[0]) - 1]
+    return None
+
+
 def ClarificationHandlerAgent():
     def invoke(state: Dict[str, Any]) -> Dict[str, Any]:
         print("✅ ClarificationHandlerAgent")
@@ -20,18 +47,13 @@ def ClarificationHandlerAgent():
             state["clarifications_pending"] = False  # Still needed
             return state
 
-        # 🔍 Find the latest user message after the last clarification request
-        clarify_index = max(
-            idx for idx, m in enumerate(messages) if m["sender"] == "assistant" and "multiple matches" in m["text"]
-        )
-        user_msg = next(
-            (m["text"] for m in messages[clarify_index + 1:] if m["sender"] == "user"),
-            None
-        )
+        # 🔍 Latest user reply sent after the clarification request (cursor set by ClarificationAgent)
+        user_msg = take_user_reply(state, AGENT_NAME)
 
         # 🧯 If no new user reply yet, don’t process — just wait
         if not user_msg:
             state["clarifications_pending"] = True  # 👈 This was missing
+            mark_prompted(state, AGENT_NAME)
             return state
 
 
@@ -39,12 +61,7 @@ def ClarificationHandlerAgent():
 
         for table in needed:
             options = ambiguous.get(table, [])
-            matched = None
-
-            for opt in options:
-                if opt.lower() in user_msg.lower() or re.search(table, user_msg, re.IGNORECASE):
-                    matched = opt
-                    break
+            matched = match_option(table, options, user_msg, single=len(needed) == 1) if options else None
 
             if matched:
                 resolved[table] = matched
@@ -56,11 +73,13 @@ def ClarificationHandlerAgent():
         state["clarifications_pending"] = bool(updated_needed)  # ✅ Set correctly
 
         if not updated_needed:
+            mark_answered(state, AGENT_NAME)
             messages.append({
                 "sender": "assistant",
                 "text": "✅ Thanks for the clarification. All table ambiguities are now resolved!"
             })
         else:
+            mark_prompted(state, AGENT_NAME)
             messages.append({
                 "sender": "assistant",
                 "text": f"⚠️ Still need clarification for: {', '.join(updated_needed)}"
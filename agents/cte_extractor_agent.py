@@ -1,15 +1,63 @@
 # agents/cte_extractor_agent.py
 
 from typing import Dict, Any, List
-from utils.llm_provider import model
+from utils.llm_provider import model_for
 import json
 import re
+from core.state_schema import json_default
+from utils.prompt_cache import prompt_messages
+
+LLM_TIER = "quality"
+model = model_for(LLM_TIER)
 
 AGENT_STATE_HINT = {
     "requires": ["sql_logic"],
     "produces": ["staging_tables", "final_table"]
 }
 
+# Static prompt prefix (placeholders instead of names), cacheable by the provider across runs
+CTE_RULES = """
+You are a Snowflake SQL expert specialized in ETL optimization.
+
+Analyze the SQL query you are given and break it down into separate staging tables with a final output table.
+
+🔍 Task:
+1. Identify all Common Table Expressions (CTEs) in the query
+2. For each intermediate CTE, create a separate CREATE OR REPLACE TRANSIENT TABLE statement
+3. For the final result (the last CTE or main query), create a regular permanent CREATE OR REPLACE TABLE statement
+4. Track the dependencies between all tables
+
+🛠️ Rules:
+- Every intermediate CTE becomes a transient staging table (e.g., CTE 'users' becomes 'stg_users')
+- All staging tables should use CREATE OR REPLACE TRANSIENT TABLE
+- The final output table should use CREATE OR REPLACE TABLE (not transient) with the final table name given
+- Every table should be fully qualified: DATABASE.SCHEMA.table_name (the database and schema given)
+- Make sure staged tables can be built independently given their dependencies
+- Make sure to preserve the order and dependencies of operations
+
+Return the results as a JSON array of tables with this structure:
+```json
+[
+  {
+    "table_name": "stg_table_name",
+    "original_cte_name": "original_cte_name",
+    "create_statement": "CREATE OR REPLACE TRANSIENT TABLE DATABASE.SCHEMA.stg_table_name AS SELECT...",
+    "depends_on": ["stg_another_table"], // Names of tables this one depends on
+    "is_final_table": false
+  },
+  {
+    "table_name": "<final table name>",
+    "original_cte_name": "final_query_or_cte_name",
+    "create_statement": "CREATE OR REPLACE TABLE DATABASE.SCHEMA.<final table name> AS SELECT...",
+    "depends_on": ["stg_table_name"],
+    "is_final_table": true
+  }
+]
+```
+
+Return only the JSON array of tables, no additional explanation.
+"""
+
 class CTEExtractorAgent:
     def __init__(self, input_mode="streamlit"):
         self.input_mode = input_mode
@@ -67,7 +115,7 @@ class CTEExtractorAgent:
             updated_state["workflow_status"] = state["workflow_status"]
             
         with open("cte_extraction_state.json", "w") as f:
-            json.dump(updated_state, f, indent=4, default=str)
+            json.dump(updated_state, f, indent=4, default=json_default)
 
         return updated_state
 
@@ -95,53 +143,14 @@ class CTEExtractorAgent:
     def _build_prompt(self, sql_query, database, schema, final_table_name="final_output"):
         # Remove SQL code block markers if present
         sql_query = re.sub(r'```sql|```', '', sql_query).strip()
-        
-        return f"""
-You are a Snowflake SQL expert specialized in ETL optimization.
-
-Analyze the following SQL query and break it down into separate staging tables with a final output table:
-
-```sql
-{sql_query}
-```
 
+        return prompt_messages("cte_extractor", CTE_RULES, f"""
 📂 Database: {database}
 📁 Schema: {schema}
+""", f"""
 🎯 Final table name: {final_table_name}
 
-🔍 Task:
-1. Identify all Common Table Expressions (CTEs) in the query
-2. For each intermediate CTE, create a separate CREATE OR REPLACE TRANSIENT TABLE statement
-3. For the final result (the last CTE or main query), create a regular permanent CREATE OR REPLACE TABLE statement
-4. Track the dependencies between all tables
-
-🛠️ Rules:
-- Every intermediate CTE becomes a transient staging table (e.g., CTE 'users' becomes 'stg_users')
-- All staging tables should use CREATE OR REPLACE TRANSIENT TABLE
-- The final output table should use CREATE OR REPLACE TABLE (not transient) with name {final_table_name}
-- Every table should be fully qualified: {database}.{schema}.table_name
-- Make sure staged tables can be built independently given their dependencies
-- Make sure to preserve the order and dependencies of operations
-
-Return the results as a JSON array of tables with this structure:
-```json
-[
-  {{
-    "table_name": "stg_table_name",
-    "original_cte_name": "original_cte_name",
-    "create_statement": "CREATE OR REPLACE TRANSIENT TABLE {database}.{schema}.stg_table_name AS SELECT...",
-    "depends_on": ["stg_another_table"], // Names of tables this one depends on
-    "is_final_table": false
-  }},
-  {{
-    "table_name": "{final_table_name}",
-    "original_cte_name": "final_query_or_cte_name",
-    "create_statement": "CREATE OR REPLACE TABLE {database}.{schema}.{final_table_name} AS SELECT...",
-    "depends_on": ["stg_table_name"],
-    "is_final_table": true
-  }}
-]
+```sql
+{sql_query}
 ```
-
-Return only the JSON array of tables, no additional explanation.
-""".strip()
\ No newline at end of file
+""")
@@ -1,5 +1,5 @@
 from typing import Dict, Any
-from utils.snowflake_utils import get_all_databases_and_schemas
+from utils.catalog_cache import get_catalog_cache
 import re
 
 AGENT_STATE_HINT = {
@@ -22,8 +22,8 @@ def DBSchemaSelectorAgent():
                 user_input = msg["text"]
                 break
 
-        db_schema_map = get_all_databases_and_schemas()
-        all_dbs = list(db_schema_map.keys())
+        # Shared, lazily expanded catalog: only databases we display or match get SHOW SCHEMAS
+        catalog = get_catalog_cache()
 
         if not selected_db or not selected_schema:
             # ✅ Try extracting DB + schema from user message
@@ -32,14 +32,14 @@ def DBSchemaSelectorAgent():
                 schema_match = re.search(r"(?i)schema\s+([a-zA-Z0-9_]+)", user_input)
 
                 if db_match:
-                    db = db_match.group(1).upper()
-                    if db in db_schema_map:
+                    db = catalog.find_database(db_match.group(1))
+                    if db:
                         state["selected_database"] = db
                         selected_db = db
 
                 if schema_match and selected_db:
-                    schema = schema_match.group(1).upper()
-                    if schema in db_schema_map.get(selected_db, []):
+                    schema = catalog.find_schema(selected_db, schema_match.group(1))
+                    if schema:
                         state["selected_schema"] = schema
                         selected_schema = schema
 
@@ -54,10 +54,10 @@ def DBSchemaSelectorAgent():
             return state
 
         # 🔁 Otherwise, still waiting for valid input — show options
-        db_list = all_dbs[:10]  # limit for simplicity
+        db_schema_map = catalog.overview(limit=10)
         display_text = "\n".join([
-            f"- {db}: {', '.join(db_schema_map[db][:5]) or 'No schemas'}"
-            for db in db_list
+            f"- {db}: {', '.join(schemas[:5]) or 'No schemas'}"
+            for db, schemas in db_schema_map.items()
         ])
 
         messages.append({
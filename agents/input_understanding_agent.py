@@ -2,11 +2,94 @@ from typing import Dict, Any
 import os
 import json
 import re
+import time
+import threading
+import statistics
+from collections import deque
 from dotenv import load_dotenv
-from utils.llm_provider import model  # Your LLM wrapper (e.g., Groq, Together)
+from utils.llm_provider import model_for  # Your LLM wrapper (e.g., Groq, Together)
+from utils.rate_limiter import is_retryable
+from utils.table_index import get_table_index
+from utils.prompt_extractor import extract_from_prompt
+from core.state_schema import json_default
+from core.conversation_events import mark_prompted
 
 load_dotenv()
 
+LLM_TIER = "fast"
+model = model_for(LLM_TIER)
+
+# Deterministic extraction first; the LLM only when it is not confident (false: always the LLM)
+INPUT_RULES_FAST_PATH = os.getenv("INPUT_RULES_FAST_PATH", "true").lower() == "true"
+
+EXTRACTION_SCHEMA = {
+    "title": "RequirementExtraction",
+    "description": "Task summary, source tables and output table of a business requirement",
+    "type": "object",
+    "properties": {
+        "task": {"type": "string", "description": "A clean task summary"},
+        "tables": {"type": "array", "items": {"type": "string"}, "description": "Source tables mentioned, without the output table"},
+        "output_table": {"type": "string", "description": "A suitable output table name"}
+    },
+    "required": ["task", "tables", "output_table"]
+}
+
+# Process-wide: how many turns each path served and their latency
+_path_stats = {"rules": deque(maxlen=1000), "llm": deque(maxlen=1000)}
+_path_counts = {"rules": 0, "llm": 0}
+_path_lock = threading.Lock()
+
+
+def record_path(path: str, elapsed_ms: float):
+    with _path_lock:
+        _path_counts[path] += 1
+        _path_stats[path].append(elapsed_ms)
+
+
+def extraction_stats() -> Dict[str, Any]:
+    """Share of turns served without the LLM, and p50 / mean latency of each path."""
+    with _path_lock:
+        total = sum(_path_counts.values())
+        stats = {"turns": total, "rules_share": round(_path_counts["rules"] / total, 3) if total else None}
+        for path, latencies in _path_stats.items():
+            stats[f"{path}_turns"] = _path_counts[path]
+            stats[f"{path}_p50_ms"] = round(statistics.median(latencies), 2) if latencies else None
+            stats[f"{path}_mean_ms"] = round(statistics.fmean(latencies), 2) if latencies else None
+        return stats
+
+
+def extract_with_rules(prompt: str, db: str, schema: str):
+    """The rule-based extraction when it resolves every table with confidence, else None."""
+    if not INPUT_RULES_FAST_PATH:
+        return None
+    try:
+        found = extract_from_prompt(prompt, get_table_index(db, schema))
+    except Exception as e:
+        print(f"⚠️ Rule-based extraction unavailable: {e}")
+        return None
+    if not found["confident"]:
+        print(f"↪️ Rule-based extraction not confident ({found['reason']}); asking the LLM")
+        return None
+    return {"task": prompt.strip(), "tables": found["tables"], "output_table": found["output_table"]}
+
+
+def extract_with_llm(llm_prompt: str) -> Dict[str, Any]:
+    """Structured output; plain text + JSON parsing if the provider cannot do it."""
+    try:
+        result = model.with_structured_output(EXTRACTION_SCHEMA).invoke(llm_prompt)
+        refined = result if isinstance(result, dict) else result.model_dump()
+        if refined.get("tables") is not None:
+            return refined
+    except Exception as e:
+        if is_retryable(e):
+            raise
+        print(f"⚠️ Structured output failed ({e}); falling back to plain text")
+    response = model.invoke(llm_prompt)
+    raw_content = response.content.strip()
+    print("🔍 Raw LLM Response:", repr(raw_content))
+    cleaned = re.sub(r"^```(?:json)?|```$", "", raw_content, flags=re.MULTILINE).strip()
+    return json.loads(cleaned)
+
 AGENT_STATE_HINT = {
     "requires": ["raw_prompt"],
     "produces": ["user_prompt", "mentioned_tables", "output_table_name", "resolved_tables"]
@@ -26,6 +109,11 @@ def InputUnderstandingAgent():
             print("⚠️ Skipping InputUnderstandingAgent — already resolved and confirmed")
             return state
 
+        # ⏸️ An agent is waiting on this user turn — let the planner hand it over
+        if state.get("waiting_on"):
+            print(f"⚠️ Skipping InputUnderstandingAgent — {state['waiting_on']} is waiting for a reply")
+            return state
+
         llm_prompt = f"""
 You are a Snowflake expert assistant. Extract the following from the business requirement:
 
@@ -45,20 +133,22 @@ Business Requirement:
 {prompt}
 """.strip()
 
-        try:
-            print(model)
-            response = model.invoke(llm_prompt)
-            raw_content = response.content.strip()
-            print("🔍 Raw LLM Response:", repr(raw_content))
-            cleaned = re.sub(r"^```(?:json)?|```$", "", raw_content, flags=re.MULTILINE).strip()
-            refined = json.loads(cleaned)
-        except Exception as e:
-            print(f"❌ Failed to parse LLM output: {e}")
-            refined = {
-                "task": prompt.strip(),
-                "tables": [],
-                "output_table": "fact_result_table"
-            }
+        started = time.perf_counter()
+        refined = extract_with_rules(prompt, db, schema)
+        path = "rules" if refined else "llm"
+        if refined is None:
+            try:
+                refined = extract_with_llm(llm_prompt)
+            except Exception as e:
+                print(f"❌ Failed to parse LLM output: {e}")
+                refined = {
+                    "task": prompt.strip(),
+                    "tables": [],
+                    "output_table": "fact_result_table"
+                }
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record_path(path, elapsed_ms)
+        print(f"{'⚡' if path == 'rules' else '🧠'} Extracted via {path} in {elapsed_ms:.1f} ms — {extraction_stats()}")
 
         user_prompt = refined.get("task", prompt.strip())
         mentioned_tables = refined.get("tables", [])
@@ -77,9 +167,10 @@ Business Requirement:
         state["selected_schema"] = schema
 
         # ✅ Format confirmation message and show in chat
+        table_lines = "\n".join([f"- `{tbl}`" for tbl in mentioned_tables]) or "- (none detected)"
         confirmation_message = f"""
 📌 We'll use the following tables from schema `{schema}` in database `{db}`:
-{ "\n".join([f"- `{tbl}`" for tbl in mentioned_tables]) or "- (none detected)" }
+{table_lines}
 
 📋 Output table: `{output_table}`
 
@@ -94,8 +185,9 @@ Business Requirement:
 
         state["awaiting_user_confirmation"] = True
         state["chatbot_messages"] = messages
+        mark_prompted(state, "user_confirmation_agent")
 
-        print("✅ InputUnderstandingAgent OUTPUT", json.dumps(state, indent=2))
+        print("✅ InputUnderstandingAgent OUTPUT", json.dumps(state, indent=2, default=json_default))
 
         return state
 
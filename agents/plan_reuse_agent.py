@@ -0,0 +1,90 @@
+# agents/plan_reuse_agent.py
+
+from typing import Dict, Any
+import os
+from dotenv import load_dotenv
+from core.conversation_events import take_user_reply, mark_prompted, mark_answered
+from utils.plan_library import get_library, find_plan, retarget_plan
+
+load_dotenv()
+
+AGENT_NAME = "plan_reuse_agent"
+
+AGENT_STATE_HINT = {
+    "requires": ["raw_metadata", "resolved_tables"],
+    "produces": ["plan_reuse"]
+}
+
+def PlanReuseAgent():
+    def invoke(state: Dict[str, Any]) -> Dict[str, Any]:
+        print("📚 PlanReuseAgent invoked")
+
+        if os.getenv("PLAN_REUSE", "true").lower() != "true":
+            state["plan_reuse"] = {"status": "disabled"}
+            return state
+
+        messages = state.get("chatbot_messages", [])
+
+        # 📨 Answer to the "use this saved plan?" question
+        offer = state.get("plan_reuse") or {}
+        if offer.get("status") == "offered":
+            reply = take_user_reply(state, AGENT_NAME)
+            if reply is None:
+                mark_prompted(state, AGENT_NAME)
+                return state
+            mark_answered(state, AGENT_NAME)
+            plan = offer.pop("plan")
+            if reply.strip().lower() != "yes":
+                state["plan_reuse"] = {**offer, "status": "declined"}
+                messages.append({"sender": "assistant", "text": "👍 Saved plan skipped, new SQL will be generated."})
+                state["chatbot_messages"] = messages
+                return state
+
+            # ✅ Pre-fill the outputs of SQL generation, SOP validation and CTE extraction
+            for key in ("sql_logic", "sop_sql", "staging_tables", "final_table"):
+                if plan.get(key) is not None:
+                    state[key] = plan[key]
+            state["output"] = plan["sop_sql"]
+            state["plan_reuse"] = {**offer, "status": "hit"}
+            messages.append({"sender": "assistant", "text": f"♻️ Using saved plan {offer['plan_id']}."})
+            state["chatbot_messages"] = messages
+            return state
+
+        try:
+            match = find_plan(
+                get_library(),
+                state.get("raw_prompt", ""),
+                state.get("raw_metadata", {}),
+                state.get("resolved_tables", {})
+            )
+        except Exception as e:
+            print(f"⚠️ Plan library lookup failed: {e}")
+            match = None
+
+        if not match:
+            state["plan_reuse"] = {"status": "miss"}
+            return state
+
+        plan = retarget_plan(match["plan"], match["output_table"], state.get("output_table_name"))
+
+        # ⏸️ Nothing is reused until the user says so; the reply comes back to this agent
+        state["plan_reuse"] = {
+            "status": "offered",
+            "plan_id": match["plan_id"],
+            "match": match["match"],
+            "similarity": match["similarity"],
+            "plan": plan
+        }
+        messages.append({
+            "sender": "assistant",
+            "text": (
+                f"♻️ Found a saved plan for the same tables ({match['match']} match, similarity {match['similarity']}).\n\n"
+                f"```sql\n{plan['sop_sql']['refined_sql']}\n```\n\n"
+                "👉 Reply **yes** to use this saved plan, or anything else to generate new SQL."
+            )
+        })
+        mark_prompted(state, AGENT_NAME)
+        state["chatbot_messages"] = messages
+        return state
+
+    return invoke
@@ -1,17 +1,20 @@
 from typing import Dict, Any
+from langgraph.graph import END
 from core.state_schema import StateSchema
+from core.conversation_events import has_new_user_reply
 
 # Import agent state hints
 from agents.input_understanding_agent import AGENT_STATE_HINT as input_understanding_hint
 from agents.user_confirmation_agent import AGENT_STATE_HINT as confirmation_hint
 from agents.metadata_fetcher_agent import AGENT_STATE_HINT as metadata_fetcher_hint
+from agents.plan_reuse_agent import AGENT_STATE_HINT as plan_reuse_hint
 from agents.post_metadata_confirmation_agent import AGENT_STATE_HINT as post_metadata_confirmation_hint
 from agents.sample_loader_agent import AGENT_STATE_HINT as sample_loader_hint
 from agents.post_sample_confirmation_agent import AGENT_STATE_HINT as post_sample_confirmation_hint
 # from agents.refined_prompt_builder_agent import AGENT_STATE_HINT as refined_prompt_builder_hint
 from agents.sql_logic_builder_agent import AGENT_STATE_HINT as sql_logic_builder_hint
 from agents.sop_validator_agent import AGENT_STATE_HINT as sop_validator_hint
-from agents.sql_executor_agent import AGENT_STATE_HINT as sql_executor_hint
+from agents.sql_executor_agent import AGENT_STATE_HINT as sql_executor_hint, halted
 from agents.cte_extractor_agent import AGENT_STATE_HINT as cte_extractor_hint
 from agents.sql_task_graph_agent import AGENT_STATE_HINT as sql_task_graph_hint
 
@@ -21,6 +24,7 @@ AGENT_REGISTRY = {
     "input_understanding_agent": input_understanding_hint,
     "user_confirmation_agent": confirmation_hint,
     "metadata_fetcher_agent": metadata_fetcher_hint,
+    "plan_reuse_agent": plan_reuse_hint,
     "post_metadata_confirmation_agent": post_metadata_confirmation_hint,
     "sample_loader_agent": sample_loader_hint,
     "post_sample_confirmation_agent": post_sample_confirmation_hint,
@@ -37,6 +41,20 @@ def planner_router(state: StateSchema) -> str:
     print("\n🧠📍 LangGraph Planner Called")
     print("🧠 Current State Keys:", list(state.keys()))
 
+    # Step 0: An agent asked the user something — hand it the new reply, or end the turn
+    waiting_on = state.get("waiting_on")
+    if waiting_on:
+        if has_new_user_reply(state, waiting_on):
+            print(f"📨 New user reply for: {waiting_on}")
+            return waiting_on
+        print(f"⏸️ Waiting for user reply to: {waiting_on}")
+        return END
+
+    # Step 0b: The SQL was blocked, cancelled or failed — nothing may extract or schedule it
+    if halted(state):
+        print("🛑 SQL execution halted — ending the turn")
+        return END
+
     # Step 1: Handle initial confirmation
     if state.get("awaiting_user_confirmation", False):
         confirmation = state.get("user_confirmation", "") or ""
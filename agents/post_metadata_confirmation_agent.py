@@ -1,4 +1,7 @@
 from typing import Dict, Any
+from core.conversation_events import take_user_reply, is_prompted, mark_prompted, mark_answered
+
+AGENT_NAME = "post_metadata_confirmation_agent"
 
 AGENT_STATE_HINT = {
     "requires": ["raw_metadata", "chatbot_messages"],
@@ -10,33 +13,32 @@ def PostMetadataConfirmationAgent():
         print("🤖 PostMetadataConfirmationAgent invoked")
 
         messages = state.get("chatbot_messages", [])
-        last_user_msg = next(
-            (m["text"].strip().lower() for m in reversed(messages) if m["sender"] == "user"),
-            None
-        )
-
-        # Prompt only once
-        already_prompted = any(
-            "proceed to preview sample data" in m["text"].lower()
-            for m in messages if m["sender"] == "assistant"
-        )
-
-        if not already_prompted:
+
+        # Prompt only once — replies only count once the question has been asked
+        if not is_prompted(state, AGENT_NAME):
             messages.append({
                 "sender": "assistant",
                 "text": "✅ Metadata extraction complete.\n\n📋 Shall we proceed to preview sample data?\n👉 Please reply with **yes** to continue."
             })
             state["awaiting_sample_confirmation"] = True
             state["user_confirmation"] = None
+            mark_prompted(state, AGENT_NAME)
+            state["chatbot_messages"] = messages
+            return state
+
+        reply = take_user_reply(state, AGENT_NAME)
 
         # Check for "yes" confirmation
-        if last_user_msg == "yes":
+        if reply and reply.strip().lower() == "yes":
             state["awaiting_sample_confirmation"] = False
             state["user_confirmation"] = "yes"
+            mark_answered(state, AGENT_NAME)
             messages.append({
                 "sender": "assistant",
                 "text": "✅ Great! Loading sample records now..."
             })
+        else:
+            mark_prompted(state, AGENT_NAME)
 
         state["chatbot_messages"] = messages
         return state
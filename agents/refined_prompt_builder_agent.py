@@ -1,6 +1,11 @@
 from typing import Dict, Any
-from utils.llm_provider import model  # Uses your LLM wrapper
+from utils.llm_provider import model_for  # Uses your LLM wrapper
 import json
+from core.state_schema import json_default
+from agents.sample_loader_agent import load_sample
+
+LLM_TIER = "fast"
+model = model_for(LLM_TIER)
 
 AGENT_STATE_HINT = {
     "requires": ["raw_prompt", "resolved_tables", "raw_metadata", "sample_records"],
@@ -14,7 +19,9 @@ def RefinedPromptBuilderAgent():
         raw_prompt = state.get("raw_prompt", "")
         resolved_tables = state.get("resolved_tables", {})
         raw_metadata = state.get("raw_metadata", {})
-        sample_records = state.get("sample_records", {})
+        sample_records = {
+            table: load_sample(state, table, limit=3) for table in state.get("sample_records", {})
+        }
 
         prompt = f"""
 You are an expert data analyst.
@@ -64,7 +71,7 @@ Respond with only the final refined instruction.
         # 🔽 Save state to test.json
         try:
             with open("test.json", "w", encoding="utf-8") as f:
-                json.dump(state, f, indent=2, default=str)
+                json.dump(state, f, indent=2, default=json_default)
             print("💾 State saved to test.json")
         except Exception as e:
             print(f"❌ Failed to save state: {e}")
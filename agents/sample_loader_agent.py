@@ -1,8 +1,8 @@
 # agents/sample_loader_agent.py
 
-from typing import Dict, Any
-from utils.snowflake_utils import get_snowflake_connection
-import pandas as pd
+from typing import Dict, Any, List
+from utils.artifact_store import put_table, load_records
+from utils.query_jobs import get_job_manager, session_of
 import json
 
 AGENT_STATE_HINT = {
@@ -10,6 +10,25 @@ AGENT_STATE_HINT = {
     "produces": ["sample_records"]
 }
 
+def sample_query(fqdn: str) -> str:
+    return f"SELECT * FROM {fqdn} LIMIT 5"
+
+
+def load_sample(state: Dict[str, Any], short_name: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """
+    Sample rows of a resolved table from state["sample_records"]; a sample no longer in this
+    process's artifact store is queried again rather than silently left out of the prompt.
+    """
+    fqdn = (state.get("resolved_tables") or {}).get(short_name)
+    session_id = session_of(state)
+
+    def refetch():
+        return get_job_manager().run(session_id, f"Sample of {fqdn}", sample_query(fqdn)).dataframe()
+
+    return load_records((state.get("sample_records") or {}).get(short_name), limit=limit,
+                        refetch=refetch if fqdn else None, owner=session_id)
+
+
 def SampleLoaderAgent():
     def invoke(state: Dict[str, Any]) -> Dict[str, Any]:
         resolved_tables = state.get("resolved_tables", {})
@@ -17,37 +36,37 @@ def SampleLoaderAgent():
         messages = state.get("chatbot_messages", [])
         sample_records = {}
 
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        try:
-            for short_name, fqdn in resolved_tables.items():
-                try:
-                    query = f"SELECT * FROM {fqdn} LIMIT 5"
-                    cursor.execute(query)
-                    columns = [desc[0] for desc in cursor.description]
-                    rows = cursor.fetchall()
-
-                    df = pd.DataFrame(rows, columns=columns)
-                    sample_records[short_name] = df.to_dict(orient="records")
-
-                    messages.append({
-                        "sender": "assistant",
-                        "text": f"📊 Here's a preview of `{fqdn}`:\n\n{df.head().to_markdown(index=False)}"
-                    })
-                except Exception as e:
-                    messages.append({
-                        "sender": "assistant",
-                        "text": f"⚠️ Failed to load sample data from `{fqdn}`: {e}"
-                    })
-        finally:
-            cursor.close()
-            conn.close()
+        # 🚀 All samples are submitted at once as async jobs of this session, then collected in order
+        manager = get_job_manager()
+        session_id = session_of(state)
+        jobs = {
+            short_name: manager.submit(session_id, f"Sample of {fqdn}", sample_query(fqdn))
+            for short_name, fqdn in resolved_tables.items()
+        }
+
+        for short_name, fqdn in resolved_tables.items():
+            try:
+                job = manager.collect(jobs[short_name])
+                df = job.dataframe()
+                # 📦 Rows live once in the artifact store, pinned while the session lives; state and chat keep the reference
+                ref = put_table(df, owner=session_id)
+                sample_records[short_name] = ref
+
+                messages.append({
+                    "sender": "assistant",
+                    "text": f"📊 Here's a preview of `{fqdn}`:",
+                    "attachment": ref
+                })
+            except Exception as e:
+                messages.append({
+                    "sender": "assistant",
+                    "text": f"⚠️ Failed to load sample data from `{fqdn}`: {e}"
+                })
 
         state["sample_records"] = sample_records
         state["chatbot_messages"] = messages
 
-        print("✅ SampleLoaderAgent OUTPUT", json.dumps(sample_records, indent=2, default=str))
+        print("✅ SampleLoaderAgent OUTPUT", json.dumps(sample_records, indent=2))
 
         return state
 
@@ -1,11 +1,16 @@
 from typing import Dict, Any
 from utils.snowflake_utils import get_snowflake_connection
+from core.conversation_events import take_user_reply, is_prompted, mark_prompted, mark_answered
 import os
 from dotenv import load_dotenv
 import json
+from core.state_schema import json_default
+from utils.stream_gate import STREAM_GATED_TASKS, plan_gate, source_tables
 
 load_dotenv()
 
+AGENT_NAME = "scheduler_agent"
+
 AGENT_STATE_HINT = {
     "requires": ["chatbot_messages", "sop_sql", "selected_database", "selected_schema"],
     "produces": ["task_schedule", "task_sql"]
@@ -17,12 +22,14 @@ def SchedulerAgent():
 
         messages = state.get("chatbot_messages", [])
         task_schedule = state.get("task_schedule")
-        last_user_msg = next((m["text"].strip() for m in reversed(messages) if m["sender"] == "user"), None)
+        reply = take_user_reply(state, AGENT_NAME) if not task_schedule else None
+        last_user_msg = reply.strip() if reply else None
 
         # 🟢 If schedule not yet received, but user just replied with one
         if not task_schedule and last_user_msg and ("cron" in last_user_msg.lower() or "hour" in last_user_msg.lower()):
             print(f"✅ Schedule provided: {last_user_msg}")
             state["task_schedule"] = last_user_msg
+            mark_answered(state, AGENT_NAME)
 
             db = state.get("selected_database", "SAMPLE_DB")
             schema = state.get("selected_schema", "SAMPLE_SCHEMA")
@@ -30,35 +37,72 @@ def SchedulerAgent():
             task_name = "auto_generated_task"
             warehouse = os.getenv("SNOWFLAKE_WAREHOUSE", "COMPUTE_WH")
 
-            task_sql = f"""
-                CREATE TASK IF NOT EXISTS {task_name}
+            # 🌊 Optionally skip scheduled runs while the source tables are unchanged (see utils/stream_gate.py)
+            gate = None
+            if state.get("stream_gated", STREAM_GATED_TASKS):
+                sources = source_tables([sql_code], db, schema)
+                gate = plan_gate(task_name, sources, db, schema) if sources else None
+
+            if gate:
+                gate_sql = f"""
+                CREATE OR REPLACE TASK {gate['task']['name']}
+                WAREHOUSE = {warehouse}
+                SCHEDULE = '{last_user_msg}'
+                WHEN {gate['task']['when']}
+                AS
+                {gate['task']['sql']}
+                """.strip()
+                task_sql = f"""
+                CREATE OR REPLACE TASK {task_name}
+                WAREHOUSE = {warehouse}
+                AFTER {gate['task']['name']}
+                AS
+                {sql_code}
+                """.strip()
+                setup = gate['setup'] + [gate_sql]
+            else:
+                task_sql = f"""
+                CREATE OR REPLACE TASK {task_name}
                 WAREHOUSE = {warehouse}
                 SCHEDULE = '{last_user_msg}'
                 AS
                 {sql_code}
-            """.strip()
+                """.strip()
+                setup = []
 
             try:
                 conn = get_snowflake_connection()
                 cursor = conn.cursor()
                 cursor.execute(f"USE DATABASE {db}")
                 cursor.execute(f"USE SCHEMA {schema}")
+                # A task of a started graph cannot be replaced: suspend the root (gate) first, then the task
+                if gate:
+                    cursor.execute(f"ALTER TASK IF EXISTS {gate['task']['name']} SUSPEND")
+                cursor.execute(f"ALTER TASK IF EXISTS {task_name} SUSPEND")
+                for statement in setup:
+                    cursor.execute(statement)
                 cursor.execute(task_sql)
                 cursor.execute(f"ALTER TASK {task_name} RESUME")
+                if gate:
+                    cursor.execute(f"ALTER TASK {gate['task']['name']} RESUME")
                 cursor.close()
                 conn.close()
 
                 # ✅ Save in state
+                if gate:
+                    task_sql = "\n\n".join(setup + [task_sql])
                 state["task_sql"] = task_sql
 
                 messages.append({
                     "sender": "assistant",
-                    "text": f"🚀 Task `{task_name}` created and scheduled successfully with schedule `{last_user_msg}`!\n\n```sql\n{task_sql}\n```"
+                    "text": f"🚀 Task `{task_name}` created and scheduled successfully with schedule `{last_user_msg}`!"
+                            + (f" Runs are skipped while {', '.join(gate['streams'])} are unchanged." if gate else "")
+                            + f"\n\n```sql\n{task_sql}\n```"
                 })
 
                 # Save the entire state to a JSON file
                 with open("state_with_scheduler.json", "w") as f:
-                    json.dump(state, f, indent=4, default=str)
+                    json.dump(state, f, indent=4, default=json_default)
             except Exception as e:
                 messages.append({
                     "sender": "assistant",
@@ -67,12 +111,12 @@ def SchedulerAgent():
 
         # 🟡 Ask only once for schedule
         elif not task_schedule:
-            already_prompted = any("please enter a schedule" in m["text"].lower() for m in messages if m["sender"] == "assistant")
-            if not already_prompted:
+            if not is_prompted(state, AGENT_NAME):
                 messages.append({
                     "sender": "assistant",
                     "text": "⏰ Please enter a schedule for the task (e.g., `1 hour` or `USING CRON 0 12 * * * UTC`)."
                 })
+            mark_prompted(state, AGENT_NAME)
 
         state["chatbot_messages"] = messages
         return state
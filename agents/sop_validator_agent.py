@@ -1,15 +1,44 @@
 # agents/sop_validator_agent.py
 
 from typing import Dict, Any
-from utils.llm_provider import model  # Groq/Anthropic/etc.
+from utils.llm_provider import model_for  # Groq/Anthropic/etc.
 import json
+from core.state_schema import json_default
+from utils.sql_linter import lint_sql
+from utils.prompt_cache import prompt_messages
 
 
+LLM_TIER = "quality"
+model = model_for(LLM_TIER)
+
 AGENT_STATE_HINT = {
     "requires": ["sql_logic", "raw_metadata", "selected_database", "selected_schema"],
     "produces": ["sop_sql", "output"]
 }
 
+# Static prompt prefix, cacheable by the provider across runs
+SOP_RULES = """
+You are a senior Snowflake SQL developer.
+
+Refactor the following SQL query to comply with enterprise-grade best practices and ensure 100% compatibility with Snowflake:
+
+✅ Rules:
+- Add table aliases
+- Use readable column aliases
+- Apply clean indentation and formatting
+- Fully qualify all tables as: DATABASE.SCHEMA.table (the database and schema given below)
+- Keep business logic exactly the same — no changes in logic or filters
+- Remove double quotes from column names or aliases
+- Correct any syntax errors or inconsistencies
+- Ensure the final query is executable in Snowflake
+- ❗ When creating a target table, always use: `CREATE OR REPLACE TABLE ... AS WITH ... SELECT ...`
+- 🚫 Do NOT use `CREATE TABLE ... (...) WITH ... SELECT ...`
+- 🚫 Do NOT use `SELECT INTO`, `INSERT`, `UPDATE`, `DELETE`, or `MERGE`
+- 🚫 Do NOT use `CREATE TABLE IF NOT EXISTS`
+- 🚫 Do NOT include semicolons (`;`)
+- Output only the cleaned and executable SQL — no explanations, markdown, or comments
+"""
+
 class SOPValidatorAgent:
     """
     Enhances raw SQL with enterprise-grade formatting, casing, joins, aliasing, etc.
@@ -33,40 +62,29 @@ class SOPValidatorAgent:
             col_lines = "\n".join([f"  - {col['name']} ({col['type']})" for col in columns])
             table_descriptions += f"\n📁 Table `{table}`:\n{col_lines}\n"
 
-        # 🧠 Build SOP enforcement prompt
-        prompt = f"""
-You are a senior Snowflake SQL developer.
-
-Refactor the following SQL query to comply with enterprise-grade best practices and ensure 100% compatibility with Snowflake:
-
-✅ Rules:
-- Add table aliases
-- Use readable column aliases
-- Apply clean indentation and formatting
-- Fully qualify all tables as: {database}.{schema}.table
-- Keep business logic exactly the same — no changes in logic or filters
-- Remove double quotes from column names or aliases
-- Correct any syntax errors or inconsistencies
-- Ensure the final query is executable in Snowflake
-- ❗ When creating a target table, always use: `CREATE OR REPLACE TABLE ... AS WITH ... SELECT ...`
-- 🚫 Do NOT use `CREATE TABLE ... (...) WITH ... SELECT ...`
-- 🚫 Do NOT use `SELECT INTO`, `INSERT`, `UPDATE`, `DELETE`, or `MERGE`
-- 🚫 Do NOT use `CREATE TABLE IF NOT EXISTS`
-- 🚫 Do NOT include semicolons (`;`)
-- Output only the cleaned and executable SQL — no explanations, markdown, or comments
+        # 🧠 Build SOP enforcement prompt: static rules, then the run's tables, then the SQL
+        prompt = prompt_messages("sop_validator", SOP_RULES, f"""
+📂 Database: {database}
+📁 Schema: {schema}
 
 Available tables:
 {table_descriptions}
-
+""", f"""
 SQL to refine:
 {raw_sql}
-""".strip()
-
+""")
 
         response = model.invoke(prompt)
         refined_sql = response.content.strip()
         refined_sql = refined_sql.replace("```sql", "").replace("```", "").rstrip(";")
 
+        # 📏 Deterministic SOP pass over the LLM output (qualification, aliases, CTAS form)
+        output_table = state.get("output_table_name")
+        target = f"{database}.{schema}.{output_table}" if output_table and database and schema else output_table
+        linted_sql, violations = lint_sql(refined_sql, database, schema, target)
+        if not any(not v["fixed"] for v in violations):
+            refined_sql = linted_sql
+
         state["chatbot_messages"].append({
             "sender": "assistant",
             "text": f"🛠️ Refined SQL (SOP-compliant):\n```sql\n{refined_sql}\n```"
@@ -82,12 +100,13 @@ SQL to refine:
                 "original_sql": raw_sql,
                 "refined_sql": refined_sql
             },
+            "sop_lint": {"fixed": [v for v in violations if v["fixed"]], "unfixed": [v for v in violations if not v["fixed"]]},
             "current_step": "sop_validator"
         }
 
         # Save to a JSON file
         with open("state_with_sop.json", "w") as f:
-            json.dump(final_state, f, indent=4, default=str)
+            json.dump(final_state, f, indent=4, default=json_default)
 
         return {
             **state,
@@ -99,5 +118,6 @@ SQL to refine:
                 "original_sql": raw_sql,
                 "refined_sql": refined_sql
             },
+            "sop_lint": final_state["sop_lint"],
             "current_step": "sop_validator"
         }
@@ -1,18 +1,433 @@
 # agents/sql_executor_agent.py
 
-from typing import Dict, Any
-import pandas as pd
+from typing import Dict, Any, List
+import os
+import re
 from utils.snowflake_utils import get_snowflake_connection
+from utils.artifact_store import put_table
+from utils.llm_provider import model_for
+from utils.sql_checker import blocking, build_schema, check_sql, describe_errors, output_table
+from utils.sql_linter import lint_sql
+from utils.sql_sampling import sample_tables, limit_tables, replace_tables, base_tables, is_aggregate, extrapolate_rows
+from utils.warehouse_planner import strip_ctas
+from utils.table_index import invalidate_table_index
+from utils import cost_guard, result_cache
+from utils.query_jobs import get_job_manager, session_of, QueryCancelled
+from core.conversation_events import mark_prompted, mark_answered, take_user_reply, get_cursor
+
+LLM_TIER = "quality"
+model = model_for(LLM_TIER)
 
 AGENT_STATE_HINT = {
     "requires": ["sop_sql", "selected_database", "selected_schema"],
     "produces": ["sql_result"]
 }
 
+SQL_STATIC_CHECK = os.getenv("SQL_STATIC_CHECK", "true").lower() == "true"
+SQL_REPAIR_ATTEMPTS = int(os.getenv("SQL_REPAIR_ATTEMPTS", "2"))
+COST_GUARD = os.getenv("COST_GUARD", "true").lower() == "true"
+
+# "preview": run on shrunk inputs only — the full CTAS runs when the task graph executes
+# "full": run the CTAS as generated (behind the cost guardrail)
+SQL_EXECUTION_MODE = os.getenv("SQL_EXECUTION_MODE", "preview").lower()
+PREVIEW_STRATEGY = os.getenv("PREVIEW_STRATEGY", "sample").lower()  # sample | limit | clone
+PREVIEW_TARGET_BYTES = float(os.getenv("PREVIEW_TARGET_BYTES", 256 * 1024 * 1024))  # per base table
+PREVIEW_SAMPLE_PERCENT = float(os.getenv("PREVIEW_SAMPLE_PERCENT", "1"))  # when EXPLAIN has no table sizes
+PREVIEW_SAMPLE_METHOD = os.getenv("PREVIEW_SAMPLE_METHOD", "SYSTEM")
+PREVIEW_LIMIT_ROWS = int(os.getenv("PREVIEW_LIMIT_ROWS", "10000"))
+PREVIEW_TIMEOUT_S = int(os.getenv("PREVIEW_TIMEOUT_S", "30"))
+PREVIEW_CLONE_SUFFIX = os.getenv("PREVIEW_CLONE_SUFFIX", "__PREVIEW")
+
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() == "true"
+
+# sql_result["status"] of SQL that must go no further: the planner ends the turn and the task
+# graph agent refuses to schedule it until the user replies "retry"
+HALTED = ("blocked", "cancelled", "failed")
+
+
+def halted(state: Dict[str, Any]) -> bool:
+    return (state.get("sql_result") or {}).get("status") in HALTED
+
+
+def halt(state: Dict[str, Any], status: str, error: str, text: str, **details) -> Dict[str, Any]:
+    """Records a blocked / cancelled / failed run and waits for "retry"; nothing downstream runs the SQL."""
+    state["sql_result"] = {"status": status, "error": error, "preview_ref": None, **details}
+    state["workflow_status"] = "halted"
+    state["chatbot_messages"].append({
+        "sender": "assistant",
+        "text": f"{text}\n\nNo task graph will be created for this SQL. Reply **retry** to check and run it again."
+    })
+    mark_prompted(state, "sql_executor_agent")
+    return state
+
+
+def repair_prompt(sql: str, errors, schema_map, database: str, schema: str) -> str:
+    tables = "\n".join(
+        f"- {fqdn}: {', '.join(columns or {}) or '(columns unknown)'}" for fqdn, columns in schema_map.items()
+    )
+    return f"""
+You are a senior Snowflake SQL developer. A static check of the SQL below against the real table metadata found these errors:
+
+{describe_errors(errors)}
+
+Available tables and their columns:
+{tables}
+
+Fix ONLY these errors and keep the business logic the same. Keep the statement as
+CREATE OR REPLACE TABLE ... AS WITH ... SELECT ..., with tables qualified as {database}.{schema}.table.
+Return only the SQL — no explanations, markdown, comments or semicolons.
+
+SQL:
+{sql}
+""".strip()
+
+
+def check_and_repair(sql: str, state: Dict[str, Any]):
+    """
+    Checks the SQL against raw_metadata before it reaches Snowflake and lets the LLM fix
+    what fails, up to SQL_REPAIR_ATTEMPTS times. Returns (sql, remaining errors, repairs);
+    only blocking() errors are repaired, warnings are returned with them.
+    """
+    database = state.get("selected_database", "")
+    schema = state.get("selected_schema", "")
+    schema_map = build_schema(state.get("raw_metadata") or {}, state.get("resolved_tables") or {})
+    if not schema_map:
+        return sql, [], 0
+
+    errors = check_sql(sql, schema_map, database, schema)
+    repairs = 0
+    while blocking(errors) and repairs < SQL_REPAIR_ATTEMPTS:
+        repairs += 1
+        print(f"🔧 Static check repair {repairs}:\n{describe_errors(blocking(errors))}")
+        try:
+            response = model.invoke(repair_prompt(sql, blocking(errors), schema_map, database, schema))
+        except Exception as e:
+            print(f"⚠️ SQL repair call failed: {e}")
+            break
+        sql, _ = lint_sql(response.content, database, schema)
+        errors = check_sql(sql, schema_map, database, schema)
+
+    return sql, errors, repairs
+
+
+def session_setup(state: Dict[str, Any], *statements: str) -> List[str]:
+    """Statements a query job runs first: the selected database/schema, then `statements`."""
+    setup = []
+    if state.get("selected_database"):
+        setup.append(f"USE DATABASE {state['selected_database']}")
+    if state.get("selected_schema"):
+        setup.append(f"USE SCHEMA {state['selected_schema']}")
+    return setup + list(statements)
+
+
+def run_query(state: Dict[str, Any], label: str, sql: str, setup: List[str]):
+    """
+    Runs through the session's query job manager (execute_async; progress and cancellation
+    from the UI). Returns (df, job) — job carries sfqid, elapsed time and QUERY_HISTORY stats.
+    """
+    job = get_job_manager().run(session_of(state), label, sql, setup)
+    return job.dataframe(), job
+
+
+def record_run(guard: Dict[str, Any], mode: str, job):
+    """Stores the actual statistics next to the EXPLAIN estimate of this query."""
+    if not guard.get("estimate_id"):
+        return
+    stats = get_job_manager().query_stats(job)
+    actual = {"query_id": job.sfqid, "elapsed_ms": job.elapsed_ms, "rows_produced": job.rows_produced, **stats}
+    cost_guard.record_actual(cost_guard.get_store(), guard["estimate_id"], mode, actual)
+    guard["actual"] = actual
+
+
+def guard_query(conn, sql: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """EXPLAINs the query, compares it to the budgets and logs the estimate."""
+    cursor = conn.cursor()
+    try:
+        estimate = cost_guard.explain_query(cursor, sql)
+    finally:
+        cursor.close()
+    decision = cost_guard.evaluate(estimate)
+    estimate_id = cost_guard.record_estimate(cost_guard.get_store(), sql, estimate, decision)
+    print(f"💰 Cost estimate: {cost_guard.describe_estimate(estimate)} → {decision['action']}")
+    guard = {"estimate": estimate, "decision": decision, "estimate_id": estimate_id, "approved": False}
+    state["cost_guard"] = guard
+    return guard
+
+
+def run_sample(sql: str, guard: Dict[str, Any], state: Dict[str, Any]):
+    """Runs the query against a sampled subset of every base table and posts the preview."""
+    percent = guard["decision"]["sample_percent"]
+    df, job = run_query(state, "Sampled query", sample_tables(sql, percent), session_setup(state))
+    record_run(guard, "sample", job)
+    guard["sampled"] = {"percent": percent, "row_count": len(df), "elapsed_ms": job.elapsed_ms}
+    state["chatbot_messages"].append({
+        "sender": "assistant",
+        "text": f"🧪 Ran the query on a {percent:g}% sample of each table ({len(df)} rows, {job.elapsed_ms:.0f} ms).",
+        "attachment": put_table(df.head(10))
+    })
+
+
+def preview_tables(conn, sql: str, state: Dict[str, Any], estimate: Dict[str, Any] = None) -> Dict[str, float]:
+    """
+    Base tables to shrink for a preview, with the sample percent that brings each one
+    down to PREVIEW_TARGET_BYTES. Tables already under the target are read as-is.
+    The cost guard's estimate is reused when given; otherwise the query is EXPLAINed.
+    """
+    if estimate is None:
+        try:
+            estimate = guard_query(conn, sql, state)["estimate"]
+        except Exception as e:
+            print(f"⚠️ EXPLAIN failed, sampling every table at {PREVIEW_SAMPLE_PERCENT:g}%: {e}")
+            estimate = {}
+
+    if not estimate.get("table_bytes"):
+        return {t: PREVIEW_SAMPLE_PERCENT for t in base_tables(sql)}
+    return {
+        table: round(max(0.01, 100.0 * PREVIEW_TARGET_BYTES / size), 4)
+        for table, size in estimate["table_bytes"].items() if size > PREVIEW_TARGET_BYTES
+    }
+
+
+def preview_sql(conn, sql: str, percents: Dict[str, float], state: Dict[str, Any]) -> str:
+    """The generated query rewritten to read PREVIEW_STRATEGY-shrunk inputs (no CREATE ... AS)."""
+    if not percents:
+        return strip_ctas(sql)
+    if PREVIEW_STRATEGY == "limit":
+        return limit_tables(sql, list(percents), PREVIEW_LIMIT_ROWS)
+    if PREVIEW_STRATEGY == "clone":
+        return replace_tables(sql, preview_clones(conn, percents, state))
+    return sample_tables(sql, percents, method=PREVIEW_SAMPLE_METHOD)
+
+
+def preview_clones(conn, percents: Dict[str, float], state: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Transient sample copies of the base tables, one per session and percent, reused while the
+    user iterates on the logic. A copy is rebuilt when its base table's LAST_ALTERED is newer
+    than its own; state["preview_clones"] lists them for drop_preview_clones().
+    """
+    session = re.sub(r"\W", "", session_of(state))[:8].upper()
+    clones = {table: f"{table}{PREVIEW_CLONE_SUFFIX}_{session}_{str(percent).replace('.', '_')}"
+              for table, percent in percents.items()}
+    cursor = conn.cursor()
+    try:
+        try:
+            versions = result_cache.fetch_table_versions(
+                cursor, [name for pair in clones.items() for name in pair if name.count(".") == 2])
+        except Exception as e:
+            print(f"⚠️ Could not read LAST_ALTERED, rebuilding the preview clones: {e}")
+            versions = {}
+        for table, clone in clones.items():
+            built, altered = versions.get(clone.upper()), versions.get(table.upper())
+            if built and altered and built >= altered:
+                continue
+            cursor.execute(f"CREATE OR REPLACE TRANSIENT TABLE {clone} AS "
+                           f"SELECT * FROM {table} TABLESAMPLE {PREVIEW_SAMPLE_METHOD} ({percents[table]})")
+    finally:
+        cursor.close()
+    known = state.setdefault("preview_clones", [])
+    known += [clone for clone in clones.values() if clone not in known]
+    return clones
+
+
+def drop_preview_clones(state: Dict[str, Any]):
+    """Drops the session's preview clones — when the workflow completes or the session ends."""
+    clones = state.get("preview_clones") or []
+    if not clones:
+        return
+    try:
+        conn = get_snowflake_connection()
+        cursor = conn.cursor()
+        try:
+            for clone in clones:
+                cursor.execute(f"DROP TABLE IF EXISTS {clone}")
+        finally:
+            cursor.close()
+            conn.close()
+    except Exception as e:
+        print(f"⚠️ Could not drop preview clones {', '.join(clones)}: {e}")
+        return
+    state["preview_clones"] = []
+    # The dropped clones must not linger in the cached table listing of their schemas
+    for schema in {tuple(c.upper().split(".")[:2]) for c in clones if c.count(".") == 2}:
+        invalidate_table_index(*schema)
+    print(f"🧹 Dropped {len(clones)} preview clone(s)")
+
+
+def run_preview(conn, sql: str, state: Dict[str, Any], estimate: Dict[str, Any] = None):
+    """Runs the query on shrunk inputs under a statement timeout and posts the preview."""
+    percents = preview_tables(conn, sql, state, estimate)
+    query = preview_sql(conn, sql, percents, state)
+
+    setup = session_setup(state, f"ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS = {PREVIEW_TIMEOUT_S}")
+    df, job = run_query(state, "Preview query", query, setup)
+    query_id, elapsed_ms = job.sfqid, job.elapsed_ms
+    guard = state.get("cost_guard") or {}
+    record_run(guard, "preview", job)
+
+    # Row-preserving queries scale with the sampled inputs; grouped output and LIMITed inputs do not
+    if not percents:
+        estimated = len(df)
+    elif PREVIEW_STRATEGY == "limit" or is_aggregate(sql):
+        estimated = None
+    else:
+        estimated = extrapolate_rows(len(df), percents)
+
+    preview_ref = put_table(df.head(10))
+    summary = f"{len(df):,} rows in {elapsed_ms:,.0f} ms"
+    if percents:
+        if PREVIEW_STRATEGY == "limit":
+            shrunk = ", ".join(f"{t.split('.')[-1]} first {PREVIEW_LIMIT_ROWS:,} rows" for t in percents)
+        else:
+            shrunk = ", ".join(f"{t.split('.')[-1]} {p:g}%" for t, p in percents.items())
+        summary += f" on {shrunk}"
+        summary += f"; ≈{estimated:,} rows expected on the full data" if estimated is not None else "; full row count not extrapolated"
+
+    state["chatbot_messages"].append({
+        "sender": "assistant",
+        "text": f"👀 Preview ({summary}). The full query runs when the task graph is created.",
+        "attachment": preview_ref
+    })
+    state["sql_execution_done"] = True
+    print(f"✅ Preview executed: {summary}")
+
+    state["sql_result"] = {
+        "mode": "preview",
+        "strategy": PREVIEW_STRATEGY if percents else "none",
+        "sampled_tables": percents,
+        "row_count": len(df),
+        "extrapolated_row_count": estimated,
+        "elapsed_ms": elapsed_ms,
+        "columns": list(df.columns),
+        "preview_ref": preview_ref,
+        "query_id": query_id,
+        "cost_estimate": guard.get("estimate")
+    }
+    return df
+
+
+def cache_tables(sql: str, db: str, schema: str):
+    """
+    Tables whose LAST_ALTERED keys the cached result. A full run also depends on its own
+    output table, so a dropped or rebuilt target is never served from the cache.
+    """
+    tables = base_tables(sql, db, schema)
+    target = output_table(sql, db, schema) if SQL_EXECUTION_MODE != "preview" else None
+    return tables + [target] if target else tables
+
+
+def cache_variant() -> str:
+    if SQL_EXECUTION_MODE == "preview":
+        return f"preview:{PREVIEW_STRATEGY}:{PREVIEW_TARGET_BYTES:g}:{PREVIEW_SAMPLE_METHOD}:{PREVIEW_LIMIT_ROWS}"
+    return "full"
+
+
+def cached_key(conn, sql: str, db: str, schema: str):
+    cursor = conn.cursor()
+    try:
+        versions = result_cache.fetch_table_versions(cursor, cache_tables(sql, db, schema))
+    finally:
+        cursor.close()
+    return result_cache.cache_key(sql, versions, cache_variant()), versions
+
+
+def serve_cached(entry: Dict[str, Any], state: Dict[str, Any]):
+    preview_ref = put_table(entry["preview"])
+    state["chatbot_messages"].append({
+        "sender": "assistant",
+        "text": f"♻️ Same SQL over unchanged source tables — reused the result from {entry['created_at'][:19]} "
+                f"(no warehouse compute).",
+        "attachment": preview_ref
+    })
+    state["sql_execution_done"] = True
+    state["sql_result"] = {**entry["result"], "preview_ref": preview_ref, "cached": True}
+    print(f"♻️ Result cache hit (query {entry['query_id']})")
+
+
+def cost_prompt(guard: Dict[str, Any], scheduled: bool = False) -> str:
+    reasons = "\n".join(f"- {r}" for r in guard["decision"]["reasons"])
+    if scheduled:
+        choices = ("Reply **run** to preview it and schedule the full query in the task graph, "
+                   "**sample** to see the preview first, or **cancel**.")
+    else:
+        choices = (f"Reply **run** to execute it in full, **sample** to try it on a "
+                   f"{guard['decision']['sample_percent']:g}% sample first, or **cancel**.")
+    return (f"💰 The EXPLAIN estimate for this query is over budget:\n{reasons}\n\n"
+            f"Estimate: {cost_guard.describe_estimate(guard['estimate'])}\n\n{choices}")
+
+
+def guard_action(conn, sql: str, state: Dict[str, Any], guard: Dict[str, Any], reply: str = None):
+    """(guard, action) for the query: run | confirm | sample | block. An approved guard runs."""
+    if not COST_GUARD or guard.get("approved"):
+        return guard, "run"
+    if reply == "sample":
+        return guard, "sample"
+    try:
+        guard = guard_query(conn, sql, state)
+        return guard, guard["decision"]["action"]
+    except Exception as e:
+        print(f"⚠️ EXPLAIN failed, running without a cost estimate: {e}")
+        return guard, "run"
+
+
+def use_approval(guard: Dict[str, Any]):
+    """
+    An approval covers this one run; a later run of other SQL is guarded again. The task graph
+    may schedule the approved query (see SQLTaskGraphAgent._refusal).
+    """
+    if guard.get("approved"):
+        guard["approved"] = False
+        guard["schedule_approved"] = True
+
+
+def stop_for_cost(state: Dict[str, Any], guard: Dict[str, Any], action: str, sql: str) -> Dict[str, Any]:
+    """Halts on a block, asks the user on a confirm."""
+    preview = SQL_EXECUTION_MODE == "preview"
+    if action == "block":
+        reasons = "\n".join(f"- {r}" for r in guard["decision"]["reasons"])
+        what = "Not scheduled — the full query the task graph would run" if preview else "Not executed — the query"
+        return halt(state, "blocked", "Blocked by cost guardrail",
+                    f"🚫 {what} is over the hard cost limit:\n{reasons}\n\n"
+                    f"Estimate: {cost_guard.describe_estimate(guard['estimate'])}",
+                    cost_estimate=guard["estimate"])
+    state["chatbot_messages"].append({"sender": "assistant", "text": cost_prompt(guard, scheduled=preview)})
+    mark_prompted(state, "sql_executor_agent")
+    return state
+
+
+def ask_to_schedule(state: Dict[str, Any]):
+    """After a preview the user asked for instead of approving an over-budget query."""
+    state["chatbot_messages"].append({
+        "sender": "assistant",
+        "text": "Reply **run** to schedule the full query in the task graph, or **cancel**."
+    })
+    mark_prompted(state, "sql_executor_agent")
+
+
 def SQLExecutorAgent():
     def invoke(state: Dict[str, Any]) -> Dict[str, Any]:
         print("\n🟣 [SQLExecutorAgent] - Executing final SQL...")
 
+        # 💬 Resuming after a cost confirmation prompt, or a halted run
+        reply = None
+        if state.get("waiting_on") == "sql_executor_agent":
+            reply = ((take_user_reply(state, "sql_executor_agent") or "").strip().lower().split() or [""])[0].strip(".!*")
+            mark_answered(state, "sql_executor_agent")
+            get_cursor(state, "sql_executor_agent")["prompted"] = False
+            guard = state.get("cost_guard") or {}
+            if halted(state):
+                if reply != "retry":
+                    mark_prompted(state, "sql_executor_agent")
+                    return state
+                reply = None
+                state["workflow_status"] = "in_progress"
+                state.pop("sql_result", None)
+                guard["approved"] = False
+            elif reply in ("run", "yes", "y", "ok", "proceed"):
+                guard["approved"] = True
+            elif reply != "sample":
+                return halt(state, "cancelled", "Cancelled after cost preview", "🛑 Query cancelled — it was not executed.",
+                            cost_estimate=guard.get("estimate"))
+
         sql = state.get("sop_sql", {}).get("refined_sql", "")
         if not sql:
             raise ValueError("❌ No SQL found in `sop_sql.refined_sql`")
@@ -23,6 +438,27 @@ def SQLExecutorAgent():
         db = state.get("selected_database")
         schema = state.get("selected_schema")
 
+        # 🔎 Static check against the fetched metadata — no warehouse resume for SQL that cannot run
+        if SQL_STATIC_CHECK:
+            checked_sql, errors, repairs = check_and_repair(sql, state)
+            state["sql_check"] = {"errors": errors, "llm_repairs": repairs}
+            if blocking(errors):
+                print(f"❌ SQL failed static check:\n{describe_errors(errors)}")
+                return halt(state, "failed", "SQL failed static check",
+                            f"❌ The SQL did not pass the pre-execution check (not sent to Snowflake):\n{describe_errors(errors)}",
+                            check_errors=blocking(errors))
+            if errors:
+                print(f"⚠️ Static check warnings (not blocking):\n{describe_errors(errors)}")
+            if repairs:
+                sql = checked_sql
+                state["sop_sql"] = {**state["sop_sql"], "refined_sql": sql}
+                state["output"] = {**(state.get("output") or {}), "refined_sql": sql}
+                state["chatbot_messages"].append({
+                    "sender": "assistant",
+                    "text": f"🔧 Fixed the SQL after a pre-execution check:\n```sql\n{sql}\n```"
+                })
+
+        guard = state.get("cost_guard") or {}
         try:
             conn = get_snowflake_connection()
 
@@ -34,17 +470,80 @@ def SQLExecutorAgent():
                 cursor.execute(f"USE SCHEMA {schema}")
             cursor.close()
 
+            # 💰 In preview mode the preview itself is cheap, but the task graph will run the full
+            # CTAS on every schedule: the guard decides on the full query before anything else
+            preview = SQL_EXECUTION_MODE == "preview"
+            if preview:
+                guard, action = guard_action(conn, sql, state, guard, reply)
+                if action in ("block", "confirm"):
+                    conn.close()
+                    return stop_for_cost(state, guard, action, sql)
+                use_approval(guard)
+
+            # ♻️ Same SQL over unchanged tables → cached result, no warehouse compute
+            cache_key = None
+            if RESULT_CACHE:
+                try:
+                    cache_key, versions = cached_key(conn, sql, db, schema)
+                    entry = result_cache.get_result(result_cache.get_cache(), cache_key)
+                except Exception as e:
+                    print(f"⚠️ Result cache lookup failed: {e}")
+                    cache_key, entry = None, None
+                if entry:
+                    conn.close()
+                    serve_cached(entry, state)
+                    if preview and action == "sample":
+                        ask_to_schedule(state)
+                    return state
+
+            # 👀 Preview on shrunk inputs; the full CTAS is left to the task graph
+            if preview:
+                df = run_preview(conn, sql, state, guard.get("estimate"))
+                conn.close()
+                if cache_key:
+                    result_cache.put_result(result_cache.get_cache(), cache_key, sql, versions, df,
+                                            state["sql_result"], state["sql_result"].get("query_id"))
+                if action == "sample":
+                    ask_to_schedule(state)
+                return state
+
+            # 💰 EXPLAIN-based cost guardrail
+            guard, action = guard_action(conn, sql, state, guard, reply)
+            if action in ("block", "confirm"):
+                conn.close()
+                return stop_for_cost(state, guard, action, sql)
+            if action == "sample":
+                run_sample(sql, guard, state)
+                conn.close()
+                state["chatbot_messages"].append({"sender": "assistant",
+                                                  "text": "Reply **run** to execute the full query, or **cancel**."})
+                mark_prompted(state, "sql_executor_agent")
+                return state
+            use_approval(guard)
+
             # Execute SQL and fetch
-            df = pd.read_sql(sql, conn)
+            setup = session_setup(state, "ALTER SESSION UNSET STATEMENT_TIMEOUT_IN_SECONDS")
+            df, job = run_query(state, "Full query", sql, setup)
+            query_id = job.sfqid
+            record_run(guard, "full", job)
+            # The CTAS created a table: the cached table listing of this schema is stale
+            invalidate_table_index(db, schema)
+            if RESULT_CACHE:
+                # Keyed after the run: the output table's LAST_ALTERED is part of the key
+                try:
+                    cache_key, versions = cached_key(conn, sql, db, schema)
+                except Exception as e:
+                    print(f"⚠️ Result cache key failed: {e}")
+                    cache_key = None
             conn.close()
 
-            result_preview = df.head(10).to_dict(orient="records")
-
-            preview_text = pd.DataFrame(df.head(5)).to_markdown(index=False)
+            # 📦 Keep only a 10-row preview, stored once by reference
+            preview_ref = put_table(df.head(10))
 
             state["chatbot_messages"].append({
                 "sender": "assistant",
-                "text": f"📊 Executed SQL! Here's a preview of the result:\n\n{preview_text}"
+                "text": "📊 Executed SQL! Here's a preview of the result:",
+                "attachment": preview_ref
             })
 
             state["sql_execution_done"] = True
@@ -52,21 +551,25 @@ def SQLExecutorAgent():
             print(f"✅ SQL executed successfully. Rows: {len(df)}")
 
             state["sql_result"] = {
+                "mode": "full",
                 "row_count": len(df),
                 "columns": list(df.columns),
-                "preview": result_preview
+                "preview_ref": preview_ref,
+                "query_id": query_id,
+                "cost_estimate": guard.get("estimate")
             }
+            if cache_key:
+                result_cache.put_result(result_cache.get_cache(), cache_key, sql, versions, df, state["sql_result"], query_id)
+
+        except QueryCancelled as e:
+            print(f"🛑 {e}")
+            halt(state, "cancelled", "Cancelled by user", "🛑 The query was cancelled.")
 
         except Exception as e:
             print(f"❌ SQL execution error: {e}")
-            state["sql_result"] = {
-                "error": str(e),
-                "preview": []
-            }
-            state["chatbot_messages"].append({
-                "sender": "assistant",
-                "text": f"❌ Error while executing SQL: `{str(e)}`"
-                })
+            if guard.get("estimate_id"):
+                cost_guard.record_actual(cost_guard.get_store(), guard["estimate_id"], "full", {"error": str(e)})
+            halt(state, "failed", str(e), f"❌ Error while executing SQL: `{str(e)}`")
 
         return state
 
@@ -1,15 +1,80 @@
 # agents/sql_logic_builder_agent.py
 
 from typing import Dict, Any
-from utils.llm_provider import model  # uses dynamic provider (Groq, Together, etc.)
+from utils.llm_provider import model_for  # uses dynamic provider (Groq, Together, etc.)
+import os
 import json
 import datetime
+from core.state_schema import json_default
+from agents.sample_loader_agent import load_sample
+from utils.rate_limiter import is_retryable
+from utils.sql_linter import lint_sql, unfixed, describe_violations
+from utils.prompt_cache import prompt_messages
+from core.conversation_events import mark_prompted, mark_answered, take_user_reply, get_cursor
+
+LLM_TIER = "quality"
+model = model_for(LLM_TIER)
 
 AGENT_STATE_HINT = {
     "requires": ["raw_prompt", "mentioned_tables", "raw_metadata", "sample_records"],
     "produces": ["sql_logic"]
 }
 
+# "combined": one structured call for SOP-compliant SQL + local linter (SOPValidatorAgent is skipped)
+# "legacy": free-form SQL here, LLM reformatting in SOPValidatorAgent
+SQL_GENERATION_MODE = os.getenv("SQL_GENERATION_MODE", "combined").lower()
+SOP_REPAIR_ATTEMPTS = int(os.getenv("SOP_REPAIR_ATTEMPTS", "1"))
+
+GENERATED_SQL_SCHEMA = {
+    "title": "GeneratedSQL",
+    "description": "A single SOP-compliant Snowflake CREATE OR REPLACE TABLE ... AS statement",
+    "type": "object",
+    "properties": {
+        "sql": {"type": "string", "description": "The complete SQL statement, no semicolon, no markdown"},
+        "tables_used": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["sql"]
+}
+
+# Static prompt prefixes: nothing request-specific, so providers can cache them across runs
+COMBINED_RULES = """
+You are a senior Snowflake SQL developer.
+
+Write ONE enterprise-grade, SOP-compliant Snowflake SQL statement for the business requirement
+you are given, using only the database, schema and tables described after these rules.
+
+✅ SOP rules:
+- Use only the provided tables/columns
+- Fully qualify all tables as: DATABASE.SCHEMA.table (the database and schema given) and give every table an alias
+- Give every computed column a readable alias; no double quotes on names
+- Create meaningful CTEs for modular logic
+- ❗ The statement must be `CREATE OR REPLACE TABLE <output table> AS WITH ... SELECT ...`
+- 🚫 Do NOT use `CREATE TABLE ... (cols) ...`, `CREATE TABLE IF NOT EXISTS`, `SELECT INTO`, `INSERT`, `UPDATE`, `DELETE` or `MERGE`
+- 🚫 No semicolons, markdown or comments
+
+Return JSON: {"sql": "<the statement>", "tables_used": ["..."]}
+"""
+
+LEGACY_RULES = """
+You are a Snowflake SQL expert.
+
+For the business requirement you are given, generate a **robust SQL query** using professional formatting, CTEs if needed, and Snowflake best practices, over the database, schema and tables described after these rules.
+
+🛠️ Rules:
+- Use only the provided tables/columns
+- Use aliases and indentation for readability
+- Always qualify tables as `DATABASE.SCHEMA.table` (the database and schema given)
+- Create meaningful CTEs for modular logic
+- ❗ When creating a target table, always use `CREATE OR REPLACE TABLE ... AS WITH ... SELECT ...` syntax
+- Do NOT use `CREATE TABLE ... (cols) WITH ... SELECT ...` — it's not valid in Snowflake
+- Do NOT use `SELECT INTO`, `INSERT INTO`, or `MERGE`
+- Do NOT use `CREATE TABLE IF NOT EXISTS`
+- Do NOT include explanations or markdown
+- Do NOT use the SQL with a `;` — it may break parser compatibility
+
+Return only the final SQL query using valid Snowflake syntax.
+"""
+
 class SQLLogicBuilderAgent:
     def __init__(self, input_mode="streamlit"):
         self.input_mode = input_mode
@@ -17,56 +82,117 @@ class SQLLogicBuilderAgent:
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
         print("\n🟣 [SQLLogicBuilderAgent] - Generating SQL")
 
+        # 🔁 Resuming after the user was told the provider was throttling
+        if state.get("waiting_on") == "sql_logic_builder_agent":
+            take_user_reply(state, "sql_logic_builder_agent")
+            mark_answered(state, "sql_logic_builder_agent")
+            get_cursor(state, "sql_logic_builder_agent")["prompted"] = False
+
         # 🧠 Extract state inputs
         problem = state.get("raw_prompt")
         database = state.get("selected_database", "")
         schema = state.get("selected_schema", "")
         tables = state.get("mentioned_tables", [])
         metadata = state.get("raw_metadata", {})
-        sample_data = state.get("sample_records", {})
         output_table = state.get("output_table_name", "fact_result_table")
 
         if not problem or not tables or not metadata:
             raise ValueError("❌ Missing required fields for SQL generation")
         
 
-        # 🛠️ Build the final SQL generation prompt
-        prompt = self._build_prompt(
-            problem, database, schema, tables, metadata, sample_data, output_table
-        )
+        combined = SQL_GENERATION_MODE == "combined"
+        table_details = self._table_details(tables, metadata, state)
 
-        # 🧠 LLM call
-        response = model.invoke(prompt)
-        sql_code = response.content.strip().replace(";","")
+        # 🛠️ Build the final SQL generation prompt
+        if combined:
+            prompt = self._build_combined_prompt(problem, database, schema, table_details, output_table)
+        else:
+            prompt = self._build_prompt(problem, database, schema, table_details, output_table)
+
+        # 🧠 LLM call (429/5xx are retried by the rate limiter; pause the turn if they persist)
+        try:
+            sql_code = self._generate(prompt, structured=combined)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            print(f"❌ SQL generation failed after retries: {e}")
+            state["chatbot_messages"].append({
+                "sender": "assistant",
+                "text": "⏳ The LLM provider is busy (rate limited). Please reply **retry** in a moment to generate the SQL."
+            })
+            mark_prompted(state, "sql_logic_builder_agent")
+            return state
 
-        # Inside SQLLogicBuilderAgent.__call__ method, just before the return
         updated_state = {
             **state,
             "sql_logic": {
                 "problem_statement": problem,
-                "generated_sql": sql_code
+                "generated_sql": sql_code.replace(";", "")
             },
             "current_step": "sql_logic_builder"
         }
 
+        # ✅ Combined mode: enforce SOP locally, repair with the LLM only for what the linter cannot fix
+        if combined:
+            refined_sql, lint = self._lint_and_repair(sql_code, database, schema, output_table, table_details)
+            updated_state["sop_sql"] = {"original_sql": sql_code, "refined_sql": refined_sql}
+            updated_state["output"] = {"original_sql": sql_code, "refined_sql": refined_sql}
+            updated_state["sop_lint"] = lint
+
+            state["chatbot_messages"].append({
+                "sender": "assistant",
+                "text": f"🛠️ Refined SQL (SOP-compliant):\n```sql\n{refined_sql}\n```"
+            })
+            if lint["unfixed"]:
+                state["chatbot_messages"].append({
+                    "sender": "assistant",
+                    "text": f"⚠️ SQL still has SOP issues the checker could not fix:\n{describe_violations(lint['unfixed'])}"
+                })
+
         # 🔽 Save JSON here
         with open("test.json", "w") as f:
-            json.dump(updated_state, f, indent=4, default=str)
-
-        return {
-            **state,
-            "sql_logic": {
-                "problem_statement": problem,
-                "generated_sql": sql_code
-            },
-            "current_step": "sql_logic_builder"
+            json.dump(updated_state, f, indent=4, default=json_default)
+
+        return updated_state
+
+    def _generate(self, prompt, structured: bool) -> str:
+        """Structured output when asked for (falls back to plain text if the provider cannot do it)."""
+        if structured:
+            try:
+                result = model.with_structured_output(GENERATED_SQL_SCHEMA).invoke(prompt)
+                sql = result.get("sql") if isinstance(result, dict) else getattr(result, "sql", None)
+                if sql:
+                    return sql.strip()
+            except Exception as e:
+                if is_retryable(e):
+                    raise
+                print(f"⚠️ Structured output failed ({e}); falling back to plain text")
+        return model.invoke(prompt).content.strip()
+
+    def _lint_and_repair(self, sql_code, database, schema, output_table, table_details):
+        """Local SOP linter; the LLM is called again only for violations the linter cannot fix."""
+        target = f"{database}.{schema}.{output_table}" if database and schema else output_table
+        refined_sql, violations = lint_sql(sql_code, database, schema, target)
+        repairs = 0
+
+        while unfixed(violations) and repairs < SOP_REPAIR_ATTEMPTS:
+            repairs += 1
+            print(f"🔧 SOP repair {repairs}: {describe_violations(unfixed(violations))}")
+            prompt = self._build_repair_prompt(refined_sql, unfixed(violations), database, schema, table_details, target)
+            refined_sql, violations = lint_sql(self._generate(prompt, structured=True), database, schema, target)
+
+        print(f"✅ SOP lint: {len(violations)} findings, {len(unfixed(violations))} unfixed, {repairs} LLM repairs")
+        return refined_sql, {
+            "fixed": [v for v in violations if v["fixed"]],
+            "unfixed": unfixed(violations),
+            "llm_repairs": repairs
         }
 
-    def _build_prompt(self, business_problem, database, schema, tables, metadata, sample_data, output_table):
+    def _table_details(self, tables, metadata, state):
         table_details = ""
         for table in tables:
             columns = metadata.get(table, [])
-            sample_rows = sample_data.get(table, [])
+            sample_rows = load_sample(state, table, limit=3)
 
             column_lines = "\n".join(
                 [f"  - {col['name']} ({col['type']})" for col in columns]
@@ -78,31 +204,40 @@ class SQLLogicBuilderAgent:
             ) if sample_rows else "(no samples)"
 
             table_details += f"\n\n📌 Table `{table}`:\nColumns:\n{column_lines}\nSample:\n{sample_lines}\n"
+        return table_details
 
+    def _context(self, database, schema, table_details):
+        """Shared by every prompt of a run — sits in the cached system prefix after the rules."""
         return f"""
-You are a Snowflake SQL expert.
-
-Given the following structured inputs, generate a **robust SQL query** using professional formatting, CTEs if needed, and Snowflake best practices:
-
 📂 Database: {database}
 📁 Schema: {schema}
+{table_details}
+"""
+
+    def _build_combined_prompt(self, business_problem, database, schema, table_details, output_table):
+        return prompt_messages("sql_logic_builder", COMBINED_RULES, self._context(database, schema, table_details), f"""
 🧠 Business Requirement: {business_problem}
-📝 Output Table: {output_table}
+📝 Output Table: {database}.{schema}.{output_table}
+""")
 
-{table_details}
+    def _build_repair_prompt(self, sql, violations, database, schema, table_details, target):
+        # Same prefix as the generation call, so the repair reads it from the provider's cache
+        return prompt_messages("sql_logic_builder", COMBINED_RULES, self._context(database, schema, table_details), f"""
+The SQL below breaks these rules:
 
-🛠️ Rules:
-- Use only the provided tables/columns
-- Use aliases and indentation for readability
-- Always qualify tables as `{database}.{schema}.table`
-- Create meaningful CTEs for modular logic
-- ❗ When creating a target table, always use `CREATE OR REPLACE TABLE ... AS WITH ... SELECT ...` syntax
-- Do NOT use `CREATE TABLE ... (cols) WITH ... SELECT ...` — it's not valid in Snowflake
-- Do NOT use `SELECT INTO`, `INSERT INTO`, or `MERGE`
-- Do NOT use `CREATE TABLE IF NOT EXISTS`
-- Do NOT include explanations or markdown
-- Do NOT use the SQL with a `;` — it may break parser compatibility
+{describe_violations(violations)}
 
-Return only the final SQL query using valid Snowflake syntax.
-""".strip()
+Fix ONLY these problems, keep the business logic exactly the same, and return a single
+`CREATE OR REPLACE TABLE {target} AS ...` statement (tables qualified as {database}.{schema}.table).
+
+SQL to fix:
+{sql}
 
+Return JSON: {{"sql": "<the fixed statement>"}}
+""")
+
+    def _build_prompt(self, business_problem, database, schema, table_details, output_table):
+        return prompt_messages("sql_logic_builder", LEGACY_RULES, self._context(database, schema, table_details), f"""
+🧠 Business Requirement: {business_problem}
+📝 Output Table: {output_table}
+""")
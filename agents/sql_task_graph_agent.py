@@ -2,7 +2,18 @@
 
 from typing import Dict, Any, List
 import json
+import os
 from utils.snowflake_utils import get_snowflake_connection
+from utils.warehouse_planner import (build_estimates, fetch_task_history, fetch_warehouse_size, get_size_ladder,
+                                     load_history_fixture, plan_warehouses)
+from core.state_schema import json_default
+from utils.sql_checker import build_schema, check_task_graph, describe_errors
+from utils.query_jobs import get_job_manager, session_of
+from utils.staging_optimizer import STAGING_OPTIMIZER, optimize_staging_plan, view_names, view_statement
+from utils.staging_registry import STAGING_SHARING, get_staging_registry
+from utils.table_index import invalidate_table_index
+from utils.stream_gate import STREAM_GATED_TASKS, drop_statements, plan_gate, source_tables
+from agents.sql_executor_agent import HALTED, session_setup
 
 AGENT_STATE_HINT = {
     "requires": ["staging_tables", "final_table"],
@@ -11,17 +22,39 @@ AGENT_STATE_HINT = {
 
 class SQLTaskGraphAgent:
     def __init__(self, input_mode="streamlit", warehouse="COMPUTE_WH", schedule="1 hour", 
-                 task_prefix="ETL_", final_task_prefix="FINAL_"):
+                 task_prefix="ETL_", final_task_prefix="FINAL_", cost_aware=False, history_fixture=None,
+                 optimize_staging=STAGING_OPTIMIZER, share_staging=STAGING_SHARING, stream_gated=STREAM_GATED_TASKS):
         self.input_mode = input_mode
         self.warehouse = warehouse
         self.schedule = schedule
         self.task_prefix = task_prefix
         self.final_task_prefix = final_task_prefix
+        self.cost_aware = cost_aware
+        self.history_fixture = history_fixture
+        self.optimize_staging = optimize_staging
+        self.share_staging = share_staging
+        self.stream_gated = stream_gated
+        self.database = ""
+        self.schema = ""
+        self.warehouse_plan = None
+        self.staging_plan = None
+        self.sharing = None
+        self.gate = None
         self.task_configs = []
+        self.views = []
         self.task_sqls = []
     
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
         print("\n🔵 [SQLTaskGraphAgent] - Creating Snowflake Task Graph")
+
+        # 🛑 SQL that was blocked, cancelled or failed is never scheduled
+        refusal = self._refusal(state)
+        if refusal:
+            print(f"🛑 Task graph not created: {refusal}")
+            if "chatbot_messages" in state:
+                state["chatbot_messages"].append({"sender": "assistant", "text": f"🛑 Task graph not created: {refusal}"})
+            return {**state, "task_sqls": [], "task_graph": {}, "current_step": "sql_task_graph",
+                    "execution_result": {"status": "skipped", "message": refusal}}
         
         # 🧠 Extract state inputs
         staging_tables = state.get("staging_tables", [])
@@ -32,7 +65,25 @@ class SQLTaskGraphAgent:
         # Process the tables and create task graph
         self.warehouse = warehouse
         self.schedule = schedule
+        self.database = state.get("selected_database", "")
+        self.schema = state.get("selected_schema", "")
+        pipeline = self._pipeline_id(final_table)
+
+        # ♻️ Staging tables another pipeline already builds the same way are read from there
+        if self.share_staging and pipeline:
+            self.sharing = self._share_staging(staging_tables, final_table, pipeline)
+            if self.sharing:
+                staging_tables, final_table = self.sharing["staging_tables"], self.sharing["final_table"]
+
+        # 🧩 Inline / view / materialize each staging table before it becomes a task
+        if self.optimize_staging and self.database and self.schema:
+            self.staging_plan = self._optimize_staging(staging_tables, final_table)
+            staging_tables, final_table = self.staging_plan["staging_tables"], self.staging_plan["final_table"]
         
+        # 🌊 Run the graph only when a source table has changed since the last run
+        if self.stream_gated and pipeline:
+            self.gate = self._plan_gate(staging_tables, final_table, pipeline)
+
         # First create all the task configurations and SQL statements
         self.process_cte_extractions(staging_tables, final_table)
         task_graph = self.get_task_graph_visualization()
@@ -41,12 +92,25 @@ class SQLTaskGraphAgent:
         root_tasks = [task for task in self.task_configs if not task['dependencies']]
         dependent_tasks = [task for task in self.task_configs if task['dependencies']]
         
+        # 🔎 Check every task's SQL against the fetched metadata before creating anything
+        check_failures = self._check_task_sql(state, staging_tables, final_table)
+
         # Execute the tasks using the Snowflake connection from utils
         try:
-            snowflake_connection = get_snowflake_connection()
-            executor = TaskGraphExecutor(snowflake_connection)
+            if check_failures:
+                details = "\n".join(f"{name}:\n{describe_errors(errors)}" for name, errors in check_failures.items())
+                raise ValueError(f"Task SQL failed static check (nothing sent to Snowflake):\n{details}")
+
+            executor = TaskGraphExecutor(session_of(state), session_setup(state))
             execution_result = executor.execute_task_graph(self.task_sqls)
             print(f"✅ Task graph created successfully with {len(self.task_sqls)} tasks")
+            if execution_result["status"] == "success" and state.get("selected_database"):
+                # Staging tables and views now exist: the cached table listing is stale
+                invalidate_table_index(state["selected_database"], state.get("selected_schema"))
+            if self.sharing and execution_result["status"] == "success":
+                self._register_staging(pipeline, staging_tables, executor)
+            if pipeline and execution_result["status"] == "success":
+                self._record_gate(pipeline, executor)
             
             if "chatbot_messages" in state:
                 # Create a more detailed task summary
@@ -57,7 +121,29 @@ class SQLTaskGraphAgent:
                 # Add execution details
                 task_summary += f"\n✅ Successfully created and activated {len(self.task_configs)} Snowflake tasks!"
                 task_summary += f"\n- Scheduling: '{schedule}'"
-                task_summary += f"\n- Warehouse: {warehouse}"
+                if self.gate:
+                    task_summary += (f"\n- Stream-gated by {self.gate['task']['name']}: a scheduled run is skipped "
+                                     f"unless one of {', '.join(self.gate['streams'])} has changed")
+                if self.staging_plan and self.staging_plan["decisions"]:
+                    summary = self.staging_plan["summary"]
+                    task_summary += (f"\n- Staging plan: {summary['tasks_before']} → {summary['tasks_after']} tasks"
+                                     f", {summary['views']} views")
+                    for d in self.staging_plan["decisions"]:
+                        task_summary += f"\n  - {d['table_name']} → {d['decision']} ({d['reason']})"
+                if self.sharing and self.sharing["shared"]:
+                    task_summary += ("\n- Shared with other pipelines (read from the existing table, which "
+                                     "its own pipeline refreshes; this graph runs on its own schedule):")
+                    for shared in self.sharing["shared"]:
+                        task_summary += f"\n  - {shared['table_name']} → {shared['table_fqdn']} ({shared['task_name']})"
+                if self.warehouse_plan:
+                    task_summary += "\n- Warehouses (cost-aware):"
+                    for name, a in self.warehouse_plan["assignments"].items():
+                        target = f"serverless {a['size']}" if a["mode"] == "serverless" else f"{a['warehouse']} ({a['size']})"
+                        task_summary += f"\n  - {name} → {target}, ~{a['est_runtime_s']}s, ~{a['est_credits']} credits"
+                    path = self.warehouse_plan["critical_path"]
+                    task_summary += f"\n- Critical path: {' → '.join(path['path'])} (~{path['duration_s']}s)"
+                else:
+                    task_summary += f"\n- Warehouse: {warehouse}"
                 
                 # Add final task info if exists
                 final_tasks = [task for task in self.task_configs if task.get('is_final', False)]
@@ -84,6 +170,11 @@ class SQLTaskGraphAgent:
             **state,
             "task_sqls": self.task_sqls,
             "task_graph": task_graph,
+            "warehouse_plan": self.warehouse_plan,
+            "staging_plan": self.staging_plan,
+            "shared_staging": self.sharing["shared"] if self.sharing else [],
+            "stream_gate": {"task": self.gate["task"]["name"], "when": self.gate["task"]["when"],
+                            "streams": self.gate["streams"]} if self.gate else None,
             "execution_result": execution_result,
             "current_step": "sql_task_graph"
         }
@@ -93,22 +184,43 @@ class SQLTaskGraphAgent:
             updated_state["workflow_status"] = state["workflow_status"]
             
         with open("task_graph_state.json", "w") as f:
-            json.dump(updated_state, f, indent=4, default=str)
+            json.dump(updated_state, f, indent=4, default=json_default)
         
         return updated_state
     
+    def _refusal(self, state):
+        """Why the SQL must not be scheduled, None if it may"""
+        result = state.get("sql_result") or {}
+        if result.get("status") in HALTED:
+            return f"the SQL run was {result['status']} ({result.get('error')})"
+        # The cost guard's decision on the full query carries over to its schedule
+        guard = state.get("cost_guard") or {}
+        action = (guard.get("decision") or {}).get("action")
+        if action == "block":
+            return "the full query is over the hard cost limit"
+        if action in ("confirm", "sample") and not guard.get("schedule_approved"):
+            return "the full query is over the cost budget and was not approved"
+        return None
+
     def process_cte_extractions(self, staging_tables, final_table=None):
         """Main method to process CTE extractions and create task graph"""
         self._create_task_configs(staging_tables, final_table)
+        if self.cost_aware:
+            self._plan_warehouses()
         self._generate_task_creation_sql()
         return self.task_sqls
     
     def _create_task_configs(self, staging_tables, final_table=None):
         """Create task configurations from CTE extractions"""
         self.task_configs = []
+        # Views are created once, up front; they are not tasks and nothing waits on them
+        self.views = [extract for extract in staging_tables if extract.get('materialization') == 'view']
+        views = view_names(staging_tables)
         
         # Process staging tables
         for extract in staging_tables:
+            if extract.get('materialization') == 'view':
+                continue
             table_name = extract['table_name'].split('.')[-1]
             task_name = f"{self.task_prefix}{table_name}"
             
@@ -118,6 +230,7 @@ class SQLTaskGraphAgent:
                 "dependencies": [
                     f"{self.task_prefix}{dep.split('.')[-1]}" 
                     for dep in extract.get('depends_on', [])
+                    if dep.split('.')[-1].upper() not in views
                 ],
                 "is_final": False
             }
@@ -132,6 +245,8 @@ class SQLTaskGraphAgent:
             for dep in final_table.get('depends_on', []):
                 # Extract the table name part (last part after the dot)
                 dep_name = dep.split('.')[-1]
+                if dep_name.upper() in views:
+                    continue
                 dependencies.append(f"{self.task_prefix}{dep_name}")
             
             config = {
@@ -141,10 +256,191 @@ class SQLTaskGraphAgent:
                 "is_final": True
             }
             self.task_configs.append(config)
+
+        # The gate becomes the only root: it carries the schedule, former roots run AFTER it
+        if self.gate:
+            roots = [task for task in self.task_configs if not task['dependencies']]
+            if not roots:
+                print("⚠️ Stream gate skipped, the graph has no root task")
+                self.gate = None
+                return
+            for task in roots:
+                task['dependencies'] = [self.gate['task']['name']]
+            self.task_configs.insert(0, dict(self.gate['task']))
     
+    def _check_task_sql(self, state, staging_tables, final_table):
+        """{ table_name: errors } for task SQL that would fail in Snowflake (SQL_STATIC_CHECK=false to skip)"""
+        if os.getenv("SQL_STATIC_CHECK", "true").lower() != "true":
+            return {}
+        schema_map = build_schema(state.get("raw_metadata") or {}, state.get("resolved_tables") or {})
+        if not schema_map:
+            return {}
+        if self.sharing:
+            schema_map.update(self.sharing["external"])
+        return check_task_graph(staging_tables, final_table, schema_map,
+                                state.get("selected_database", ""), state.get("selected_schema", ""))
+
+    def _pipeline_id(self, final_table):
+        """A pipeline is named by the table it builds"""
+        if not (final_table and self.database and self.schema):
+            return None
+        return f"{self.database}.{self.schema}.{final_table['table_name'].split('.')[-1]}".upper()
+
+    def _share_staging(self, staging_tables, final_table, pipeline):
+        """Plan with the staging tables registered by other pipelines taken out (see utils/staging_registry.py)"""
+        try:
+            return get_staging_registry().share(staging_tables, final_table, self.database, self.schema, pipeline)
+        except Exception as e:
+            print(f"⚠️ Staging registry lookup failed, building every staging table: {e}")
+            return None
+
+    def _register_staging(self, pipeline, staging_tables, executor):
+        """Records what this pipeline built and reads; drops staging it built before and no one reads any more"""
+        fingerprints = self.sharing["fingerprints"]
+        materialized = []
+        for table in staging_tables:
+            name = table['table_name'].split('.')[-1].upper()
+            if table.get('materialization') != 'view' and name in fingerprints:
+                materialized.append({"fingerprint": fingerprints[name],
+                                     "table_fqdn": f"{self.database}.{self.schema}.{name}",
+                                     "task_name": f"{self.task_prefix}{table['table_name'].split('.')[-1]}",
+                                     "create_statement": table['create_statement']})
+        shared = [s["fingerprint"] for s in self.sharing["shared"]]
+        final_task = f"{self.final_task_prefix}{pipeline.split('.')[-1]}"
+        registry = get_staging_registry()
+        try:
+            orphans = registry.register(pipeline, final_task, materialized, shared, list(fingerprints.values()) + shared,
+                                        warehouse=self.warehouse, schedule=self.schedule)
+        except Exception as e:
+            print(f"⚠️ Could not record staging tables in the registry: {e}")
+            return
+        if orphans:
+            statements = registry.teardown_statements(pipeline, orphans)
+            result = executor.execute_task_graph(statements)
+            print(f"🧹 Dropped {len(orphans)} staging tables no pipeline uses any more: {result['status']}")
+
+    def _plan_gate(self, staging_tables, final_table, pipeline):
+        """Streams on the plan's source tables and the gate task (see utils/stream_gate.py); None if nothing to watch"""
+        statements = staging_tables + ([final_table] if final_table else [])
+        produced = {f"{self.database}.{self.schema}.{t['table_name'].split('.')[-1]}" for t in statements}
+        sqls = [t['create_statement'] for t in statements]
+        try:
+            if self.sharing and self.sharing["external"]:
+                # A shared table changes when its own sources do: watch those instead of the table
+                upstream = get_staging_registry().upstream_statements(list(self.sharing["external"]))
+                produced |= set(self.sharing["external"]) | set(upstream)
+                sqls += list(upstream.values())
+            sources = source_tables(sqls, self.database, self.schema, produced)
+        except Exception as e:
+            print(f"⚠️ Stream gate skipped, could not list source tables: {e}")
+            return None
+        if not sources:
+            print("⚠️ Stream gate skipped, the plan reads no source tables")
+            return None
+        gate = plan_gate(pipeline, sources, self.database, self.schema)
+        print(f"🌊 Stream gate {gate['task']['name']} on {len(sources)} source tables: {', '.join(sources)}")
+        return gate
+
+    def _record_gate(self, pipeline, executor):
+        """
+        Records the gate's task and streams for teardown; drops those a previous deploy left behind.
+        Without sharing the registry does not know the graph's own tasks, so they are recorded too.
+        """
+        objects = []
+        if self.gate:
+            objects = [{"kind": "task", "name": self.gate['task']['name']}] + \
+                      [{"kind": "stream", "name": stream} for stream in self.gate['streams'].values()]
+        if not self.sharing:
+            objects += [{"kind": "task", "name": task['name']} for task in self.task_configs if not task.get('is_gate')]
+        try:
+            stale = get_staging_registry().record_objects(pipeline, objects)
+        except Exception as e:
+            print(f"⚠️ Could not record the stream gate in the registry: {e}")
+            return
+        if stale:
+            result = executor.execute_task_graph(drop_statements(stale))
+            print(f"🧹 Dropped {len(stale)} gate objects of the previous deploy: {result['status']}")
+
+    def _optimize_staging(self, staging_tables, final_table):
+        """Staging plan with each stage inlined, kept as a view or materialized (see utils/staging_optimizer.py)"""
+        history, cursor, conn = [], None, None
+        try:
+            if self.history_fixture:
+                history = load_history_fixture(self.history_fixture)
+            else:
+                conn = get_snowflake_connection()
+                cursor = conn.cursor()
+                names = [f"{self.task_prefix}{t['table_name'].split('.')[-1]}" for t in staging_tables]
+                try:
+                    history = fetch_task_history(cursor, names)
+                except Exception as e:
+                    print(f"⚠️ Could not read TASK_HISTORY: {e}")
+
+            def estimate(name, sql):
+                task = {"name": f"{self.task_prefix}{name}", "sql": sql}
+                return build_estimates([task], history, cursor)[task["name"]]
+
+            reuse = self.sharing["reuse"] if self.sharing else None
+            return optimize_staging_plan(staging_tables, final_table, self.database, self.schema, estimate,
+                                         external_consumers=reuse)
+        except Exception as e:
+            print(f"⚠️ Staging optimizer failed, keeping one task per staging table: {e}")
+            return {"staging_tables": staging_tables, "final_table": final_table, "decisions": [], "summary": {}}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if conn is not None:
+                conn.close()
+
+    def _plan_warehouses(self):
+        """Estimate each task's cost and assign a warehouse (or serverless size) per task"""
+        # The gate's INSERT into the run log is not worth planning; it keeps the default warehouse
+        tasks = [task for task in self.task_configs if not task.get('is_gate')]
+        size = None
+        try:
+            if self.history_fixture:
+                history = load_history_fixture(self.history_fixture)
+                estimates = build_estimates(tasks, history)
+            else:
+                conn = get_snowflake_connection()
+                cursor = conn.cursor()
+                try:
+                    try:
+                        history = fetch_task_history(cursor, [t['name'] for t in tasks])
+                    except Exception as e:
+                        print(f"⚠️ Could not read TASK_HISTORY: {e}")
+                        history = []
+                    estimates = build_estimates(tasks, history, cursor)
+                    if not os.getenv("WAREHOUSE_SIZE_LADDER"):
+                        size = fetch_warehouse_size(cursor, self.warehouse)
+                finally:
+                    cursor.close()
+                    conn.close()
+
+            # Without a configured ladder, plan on the agent's own warehouse rather than a global default
+            self.warehouse_plan = plan_warehouses(tasks, estimates, ladder=get_size_ladder(self.warehouse, size))
+        except Exception as e:
+            # Planning is an optimization: every task falls back to the configured warehouse
+            print(f"⚠️ Warehouse planning failed, using {self.warehouse} for every task: {e}")
+            self.warehouse_plan = None
+            return
+        for task in self.task_configs:
+            task['assignment'] = self.warehouse_plan["assignments"].get(task['name'])
+
+    def _warehouse_clause(self, task):
+        """WAREHOUSE clause, or serverless initial size when the planner chose serverless"""
+        assignment = task.get('assignment')
+        if assignment and assignment["mode"] == "serverless":
+            return f"USER_TASK_MANAGED_INITIAL_WAREHOUSE_SIZE = '{assignment['size']}'"
+        if assignment:
+            return f"WAREHOUSE = {assignment['warehouse']}"
+        return f"WAREHOUSE = {self.warehouse}"
+
     def _generate_task_creation_sql(self):
         """Generate Snowflake task creation SQL statements"""
-        self.task_sqls = []
+        self.task_sqls = [f"{view_statement(view, self.database, self.schema)};" for view in self.views]
+        if self.gate:
+            self.task_sqls += self.gate['setup']
         
         # Create root tasks first
         root_tasks = [task for task in self.task_configs if not task['dependencies']]
@@ -163,8 +459,10 @@ class SQLTaskGraphAgent:
     
     def _create_root_task_sql(self, task):
         """Generate SQL for root tasks (with schedule)"""
-        warehouse_clause = f"WAREHOUSE = {self.warehouse}"
+        warehouse_clause = self._warehouse_clause(task)
         schedule_clause = f"SCHEDULE = '{self.schedule}'"
+        if task.get('when'):
+            schedule_clause += f"\n            WHEN {task['when']}"
         
         return f"""
         CREATE OR REPLACE TASK {task['name']}
@@ -176,7 +474,7 @@ class SQLTaskGraphAgent:
     
     def _create_dependent_task_sql(self, task):
         """Generate SQL for dependent tasks"""
-        warehouse_clause = f"WAREHOUSE = {self.warehouse}"
+        warehouse_clause = self._warehouse_clause(task)
         dependencies_clause = f"AFTER {', '.join(task['dependencies'])}"
         
         return f"""
@@ -188,8 +486,8 @@ class SQLTaskGraphAgent:
         """
     
     def _add_task_resumption_commands(self):
-        """Add commands to resume all tasks"""
-        for task in self.task_configs:
+        """Add commands to resume all tasks, root tasks last so no run starts before its graph is resumed"""
+        for task in sorted(self.task_configs, key=lambda t: not t['dependencies']):
             self.task_sqls.append(f"ALTER TASK {task['name']} RESUME;")
     
     def get_task_graph_visualization(self):
@@ -198,29 +496,35 @@ class SQLTaskGraphAgent:
             task['name']: {
                 'dependencies': task['dependencies'],
                 'is_root': not task['dependencies'],
-                'is_final': task.get('is_final', False)
+                'is_final': task.get('is_final', False),
+                'is_gate': task.get('is_gate', False),
+                'assignment': task.get('assignment')
             }
             for task in self.task_configs
         }
 
 
 class TaskGraphExecutor:
-    def __init__(self, snowflake_connection):
-        self.connection = snowflake_connection
+    def __init__(self, session_id="local", setup=()):
+        # Statements run as query jobs of this session, so the UI can follow and cancel them.
+        # The session connection keeps whatever USE / ALTER SESSION earlier queries ran, so
+        # `setup` resets that context before each batch of task statements.
+        self.session_id = session_id
+        self.setup = list(setup) + ["ALTER SESSION UNSET STATEMENT_TIMEOUT_IN_SECONDS"]
+        self.jobs = get_job_manager()
     
     def execute_task_graph(self, task_sqls):
         """Execute the task creation SQLs in Snowflake"""
         results = []
         try:
             for i, sql in enumerate(task_sqls):
-                cursor = self.connection.cursor()
-                cursor.execute(sql)
+                self.jobs.run(self.session_id, f"Task statement {i + 1}/{len(task_sqls)}", sql,
+                              self.setup if i == 0 else ())
                 results.append({
                     "index": i,
                     "status": "success",
                     "sql": sql[:100] + "..." if len(sql) > 100 else sql
                 })
-                cursor.close()
             return {
                 "status": "success", 
                 "message": "Task graph created successfully",
@@ -241,11 +545,31 @@ class TaskGraphExecutor:
             }
 
 
+def teardown_pipeline(pipeline: str, session_id: str = "local") -> Dict[str, Any]:
+    """
+    Drops a pipeline's gate and final task, its streams, and the staging tasks and tables no other
+    pipeline references; the pipeline is DATABASE.SCHEMA.<final table>. The final table itself is kept.
+    """
+    registry = get_staging_registry()
+    statements = registry.teardown_statements(pipeline.upper())
+    database, schema, _ = pipeline.upper().split(".")
+    setup = [f"USE DATABASE {database}", f"USE SCHEMA {database}.{schema}"]
+    result = TaskGraphExecutor(session_id, setup).execute_task_graph(statements)
+    if result["status"] == "success":
+        registry.release(pipeline.upper())
+    return result
+
+
 def SQLTaskGraphAgentInvoke():
     def invoke(state: Dict[str, Any]) -> Dict[str, Any]:
         agent = SQLTaskGraphAgent(
             warehouse=state.get("warehouse", "COMPUTE_WH"),
-            schedule=state.get("schedule", "1 hour")
+            schedule=state.get("schedule", "1 hour"),
+            cost_aware=state.get("cost_aware_warehouses", os.getenv("COST_AWARE_WAREHOUSES", "false").lower() == "true"),
+            history_fixture=state.get("task_history_fixture"),
+            optimize_staging=state.get("optimize_staging", STAGING_OPTIMIZER),
+            share_staging=state.get("share_staging", STAGING_SHARING),
+            stream_gated=state.get("stream_gated", STREAM_GATED_TASKS)
         )
         return agent(state)
     
@@ -1,5 +1,5 @@
 from typing import Dict, Any, List
-from utils.snowflake_utils import get_snowflake_tables
+from utils.table_index import get_table_index
 
 AGENT_STATE_HINT = {
     "requires": ["mentioned_tables", "selected_database", "selected_schema"],
@@ -21,20 +21,29 @@ def TableLocatorAgent():
         if not db or not schema:
             raise ValueError("❌ selected_database or selected_schema missing in state")
 
-        available_tables = get_snowflake_tables(db, schema)
-        print(f"📦 Tables in {db}.{schema} → {available_tables}")
+        # Cached per-schema index: one listing query per TTL, then dict/trigram lookups
+        index = get_table_index(db, schema)
+        print(f"📦 {len(index.tables)} tables indexed for {db}.{schema}")
 
+        # A table created since the listing was cached shows up as missing: refresh once and retry
+        matched = {name: index.match(name) for name in mentioned_tables}
+        if any(kind == "missing" for kind, _ in matched.values()):
+            print("🔄 Table not in the cached listing — refreshing it once")
+            index = get_table_index(db, schema, refresh=True)
+            matched = {name: index.match(name) if kind == "missing" else (kind, matches)
+                       for name, (kind, matches) in matched.items()}
+
+        plural_matches = {}
         for table_name in mentioned_tables:
-            matches = [t for t in available_tables if t.lower() == table_name.lower()]
-            if len(matches) == 1:
-                fqdn = f"{db}.{schema}.{matches[0]}"
-                resolved_tables[table_name] = fqdn
-            elif len(matches) > 1:
-                ambiguous_tables[table_name] = [f"{db}.{schema}.{m}" for m in matches]
-                clarifications_needed.append(table_name)
+            kind, matches = matched[table_name]
+            if len(matches) == 1 and kind in ("exact", "plural"):
+                resolved_tables[table_name] = index.fqdn(matches[0])
+                if kind == "plural":
+                    plural_matches[table_name] = matches[0]
+                    print(f"🔤 `{table_name}` matched `{matches[0]}` ignoring plural form")
             else:
-                # Not found, still add to clarification
-                ambiguous_tables[table_name] = []
+                # Several hits, ranked fuzzy candidates, or nothing ([]): ask the user
+                ambiguous_tables[table_name] = [index.fqdn(m) for m in matches]
                 clarifications_needed.append(table_name)
 
         print("✅ resolved_tables =", resolved_tables)
@@ -47,7 +56,8 @@ def TableLocatorAgent():
 
         # Optionally log to chatbot
         if resolved_tables:
-            resolved_msg = "\n".join([f"- `{k}` → `{v}`" for k, v in resolved_tables.items()])
+            resolved_msg = "\n".join([f"- `{k}` → `{v}`" + (" (matched ignoring plural form)" if k in plural_matches else "")
+                                      for k, v in resolved_tables.items()])
             state["chatbot_messages"].append({
                 "sender": "assistant",
                 "text": f"🔍 Located the following tables in `{db}.{schema}`:\n{resolved_msg}"
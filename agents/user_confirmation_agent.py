@@ -1,4 +1,7 @@
 from typing import Dict, Any
+from core.conversation_events import take_user_reply, is_prompted, mark_prompted, mark_answered
+
+AGENT_NAME = "user_confirmation_agent"
 
 AGENT_STATE_HINT = {
     "requires": ["awaiting_user_confirmation", "chatbot_messages"],
@@ -10,19 +13,20 @@ def UserConfirmationAgent():
         print("🤖 UserConfirmationAgent invoked")
 
         messages = state.get("chatbot_messages", [])
-        last_user_message = next(
-            (m["text"].strip().lower() for m in reversed(messages) if m["sender"] == "user"), None
-        )
+        reply = take_user_reply(state, AGENT_NAME)
+        last_user_message = reply.strip().lower() if reply else None
 
-        print(f"🧾 Last user reply: {last_user_message}")
+        print(f"🧾 New user reply: {last_user_message}")
 
         # If this is the first time the agent is called, set awaiting_user_confirmation to True
         if not state.get("awaiting_user_confirmation"):
             state["awaiting_user_confirmation"] = True
-            messages.append({
-                "sender": "assistant",
-                "text": "Please reply with **yes** to proceed or rephrase your requirement."
-            })
+            if not is_prompted(state, AGENT_NAME):
+                messages.append({
+                    "sender": "assistant",
+                    "text": "Please reply with **yes** to proceed or rephrase your requirement."
+                })
+            mark_prompted(state, AGENT_NAME)
             state["chatbot_messages"] = messages
             return state
 
@@ -30,6 +34,7 @@ def UserConfirmationAgent():
         if last_user_message == "yes":
             state["user_confirmation"] = "yes"
             state["awaiting_user_confirmation"] = False
+            mark_answered(state, AGENT_NAME)
             messages.append({
                 "sender": "assistant",
                 "text": "✅ Thanks! Proceeding with metadata analysis."
@@ -38,17 +43,14 @@ def UserConfirmationAgent():
             return state
 
         # If we're still waiting for confirmation but haven't prompted yet
-        if state.get("awaiting_user_confirmation"):
-            already_prompted = any(
-                "please reply with **yes**" in m["text"].lower() for m in messages if m["sender"] == "assistant"
-            )
-
-            if not already_prompted:
-                messages.append({
-                    "sender": "assistant",
-                    "text": "Please reply with **yes** to proceed or rephrase your requirement."
-                })
-                state["chatbot_messages"] = messages
+        if not is_prompted(state, AGENT_NAME):
+            messages.append({
+                "sender": "assistant",
+                "text": "Please reply with **yes** to proceed or rephrase your requirement."
+            })
+            state["chatbot_messages"] = messages
 
+        # ⏸️ Pause the turn until the user sends something new
+        mark_prompted(state, AGENT_NAME)
         return state
-    return invoke
\ No newline at end of file
+    return invoke
@@ -0,0 +1,98 @@
+# benchmarks/input_understanding.py
+"""
+InputUnderstandingAgent on a corpus of requirement prompts: rule-based fast path + LLM
+fallback vs the LLM on every turn. Reports the share of turns served without the LLM
+and the latency of each path (the LLM is the replaying stand-in with --llm-latency).
+
+Run: python -m benchmarks.input_understanding [--llm-latency 0.3] [--tables 1000] [--repeat 5]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from benchmarks.pipeline import BENCH_DB, BENCH_SCHEMA, build_catalog, scripted_llm  # sets the benchmark env first
+
+import pandas as pd
+
+import agents.input_understanding_agent as input_agent
+from core.state_schema import get_initial_state
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.llm_provider import set_llm
+from utils.snowflake_utils import set_connection_factory
+
+PROMPTS = [
+    # Tables named verbatim and an explicit output table → rules
+    "Join CUSTOMERS and ORDERS into table CUSTOMER_REVENUE",
+    "Summarise ORDERS by CUSTOMER_ID into ORDER_TOTALS",
+    "Total AMOUNT per REGION from CUSTOMERS and ORDERS, output table: REGION_REVENUE",
+    "Create a table named ACTIVE_CUSTOMERS from CUSTOMERS with orders in the last 90 days from ORDERS",
+    "Load `orders` and `customers` into a new table called customer_order_facts",
+    "Monthly revenue from ORDERS joined to CUSTOMERS as table MONTHLY_REVENUE",
+    # Needs the LLM: no output table, typos, unknown or other-schema tables,
+    # tables mentioned in lowercase prose, an existing table as output, tables described rather than named
+    "Summarise customers, orders and revenue by region from CUSTOMERS and ORDERS",
+    "Build a report from CUSTOMRS and ORDERS into table CUSTOMER_REPORT",
+    "Join ORDERS with MARKETING.CAMPAIGNS into table ORDER_CAMPAIGNS",
+    "Join ORDERS and SHIPMENTS into table ORDER_SHIPMENTS",
+    "Join ORDERS and PRODCUTS into table ORDER_PRODUCTS",
+    "Join orders with CUSTOMERS and save into table REV_BY_REGION",
+    "Total revenue from ORDERS and customers by region into table REV",
+    "Load ORDERS into CUSTOMERS",
+    "I want revenue per customer and region",
+    "Which regions have the most repeat buyers?",
+]
+
+
+def run_corpus(repeat: int) -> pd.DataFrame:
+    agent = input_agent.InputUnderstandingAgent()
+    rows = []
+    for _ in range(repeat):
+        for prompt in PROMPTS:
+            before = input_agent.extraction_stats()
+            state = get_initial_state(prompt)
+            started = time.perf_counter()
+            agent(state)
+            after = input_agent.extraction_stats()
+            path = "rules" if after["rules_turns"] > before["rules_turns"] else "llm"
+            rows.append({"prompt": prompt, "path": path, "latency_ms": (time.perf_counter() - started) * 1000,
+                         "tables": ",".join(state["mentioned_tables"]), "output_table": state["output_table_name"]})
+    return pd.DataFrame(rows)
+
+
+def summarise(label: str, runs: pd.DataFrame) -> dict:
+    return {
+        "mode": label,
+        "turns": len(runs),
+        "without_llm": f"{(runs['path'] == 'rules').mean():.0%}",
+        "rules_p50_ms": round(runs[runs.path == "rules"].latency_ms.median(), 2) if (runs.path == "rules").any() else None,
+        "llm_p50_ms": round(runs[runs.path == "llm"].latency_ms.median(), 2) if (runs.path == "llm").any() else None,
+        "mean_ms": round(runs.latency_ms.mean(), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="simulated seconds per LLM call")
+    parser.add_argument("--tables", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    standin = SnowflakeStandIn()
+    build_catalog(standin, args.tables, 10, 100)
+    set_connection_factory(standin.connect)
+    set_llm(scripted_llm(args.llm_latency))
+
+    input_agent.INPUT_RULES_FAST_PATH = False
+    llm_only = run_corpus(args.repeat)
+    input_agent.INPUT_RULES_FAST_PATH = True
+    fast_path = run_corpus(args.repeat)
+    sys.stdout = stdout
+
+    print(f"\n🧪 {len(PROMPTS)} prompts x {args.repeat}, {args.tables} tables, {args.llm_latency}s per LLM call\n")
+    print(pd.DataFrame([summarise("LLM every turn", llm_only), summarise("rules + LLM fallback", fast_path)]).to_markdown(index=False))
+    print()
+    print(fast_path.drop_duplicates("prompt")[["prompt", "path", "tables", "output_table"]].to_markdown(index=False))
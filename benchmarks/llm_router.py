@@ -0,0 +1,75 @@
+# benchmarks/llm_router.py
+"""
+Latency of one provider vs the LLMRouter (with and without hedging), using ReplayLLM
+providers that simulate heavy-tailed latency and failures.
+
+Run: python -m benchmarks.llm_router [--requests 200] [--tier fast]
+"""
+
+import argparse
+import statistics
+import time
+from collections import Counter
+
+import pandas as pd
+
+from utils.fake_llm import ReplayLLM
+from utils.llm_router import LLMRouter
+
+# name → (base latency s, exponential jitter mean s, failure rate)
+FAKE_PROVIDERS = {
+    "groq": (0.02, 0.04, 0.02),       # fastest median, heavy tail
+    "together": (0.06, 0.02, 0.0),
+    "fireworks": (0.03, 0.02, 0.3),   # fast but flaky
+    "anthropic": (0.12, 0.04, 0.0),
+}
+
+
+def fake_providers() -> dict:
+    return {
+        name: ReplayLLM(rules=[("benchmark prompt", f"answer from {name}")], latency_s=base, latency_jitter_s=jitter, failure_rate=failures)
+        for name, (base, jitter, failures) in FAKE_PROVIDERS.items()
+    }
+
+
+def measure(label: str, llm, requests: int) -> dict:
+    latencies, errors, served = [], 0, Counter()
+    for i in range(requests):
+        started = time.perf_counter()
+        try:
+            message = llm.invoke(f"benchmark prompt {i}")
+            served[message.response_metadata.get("router_provider", label)] += 1
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    ordered = sorted(latencies)
+    return {
+        "mode": label,
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1),
+        "p99_ms": round(ordered[int(0.99 * (len(ordered) - 1))] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+        "errors": errors,
+        "served_by": ", ".join(f"{k}:{v}" for k, v in served.most_common()),
+    }
+
+
+def run(requests: int, tier: str):
+    rows = [measure("together", fake_providers()["together"], requests)]
+    for hedge in (False, True):
+        router = LLMRouter(providers=fake_providers(), hedge=hedge).for_tier(tier)
+        rows.append(measure(f"router{' + hedge' if hedge else ''} (tier={tier})", router, requests))
+
+    print(f"\n🧪 {requests} sequential requests per mode\n")
+    print(pd.DataFrame(rows).to_markdown(index=False))
+    print("\nRouter statistics after the hedged run:\n")
+    print(pd.DataFrame(router.router_stats()).T.to_markdown())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tier", default="fast")
+    args = parser.parse_args()
+    run(args.requests, args.tier)
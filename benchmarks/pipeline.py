@@ -0,0 +1,293 @@
+# benchmarks/pipeline.py
+"""
+End-to-end pipeline benchmark against the DuckDB Snowflake stand-in and a replaying LLM.
+
+For every (tables, columns) combination it builds a synthetic catalog, times the catalog
+helpers in utils.snowflake_utils, then drives build_etl_graph() through a full conversation
+(prompt → yes → yes → ...) and reports per-agent latency, stand-in query counts, LLM calls
+prompt tokens with the share read from the (simulated) prefix cache, and peak Python
+allocations above the pre-node baseline.
+
+Run: python -m benchmarks.pipeline [--tables 100,1000] [--columns 10,100] [--rows 1000]
+                                   [--llm-latency 0] [--recordings replay.json] [--json out.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from collections import defaultdict
+
+BENCH_DB = "BENCH_DB"
+BENCH_SCHEMA = "PUBLIC"
+OUTPUT_TABLE = "CUSTOMER_ORDER_SUMMARY"
+
+# Settings read at import time by the agents — must be in place before they load
+_workdir = tempfile.mkdtemp(prefix="etl_bench_")
+os.environ.setdefault("PLAN_LIBRARY_DB", os.path.join(_workdir, "plan_library.db"))
+os.environ.setdefault("PLAN_REUSE", "false")
+os.environ.setdefault("STAGING_REGISTRY_DB", os.path.join(_workdir, "staging_registry.db"))
+os.environ["SNOWFLAKE_DATABASE"] = BENCH_DB
+os.environ["SNOWFLAKE_SCHEMA"] = BENCH_SCHEMA
+
+import pandas as pd
+
+from core.state_schema import get_initial_state
+from core.langgraph_runner import build_etl_graph
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.fake_llm import ReplayLLM
+from utils.llm_provider import set_llm, prompt_caching
+from utils.prompt_cache import usage_totals
+from utils.snowflake_utils import (
+    set_connection_factory, get_snowflake_tables, list_all_tables, get_all_databases_and_schemas,
+)
+from utils.catalog_cache import get_catalog_cache
+from utils.table_index import get_table_index
+
+FQ = f"{BENCH_DB}.{BENCH_SCHEMA}"
+
+SOP_SQL = f"""CREATE OR REPLACE TABLE {FQ}.{OUTPUT_TABLE} AS
+WITH customer_orders AS (
+    SELECT c.CUSTOMER_ID AS customer_id, c.REGION AS region, o.ORDER_ID AS order_id, o.AMOUNT AS amount
+    FROM {FQ}.CUSTOMERS c
+    JOIN {FQ}.ORDERS o ON o.CUSTOMER_ID = c.CUSTOMER_ID
+)
+SELECT region, COUNT(DISTINCT customer_id) AS customers, COUNT(order_id) AS orders, SUM(amount) AS revenue
+FROM customer_orders
+GROUP BY region"""
+
+STAGING_JSON = json.dumps([
+    {
+        "table_name": "stg_customer_orders",
+        "original_cte_name": "customer_orders",
+        "create_statement": f"CREATE OR REPLACE TRANSIENT TABLE {FQ}.stg_customer_orders AS "
+                            f"SELECT c.CUSTOMER_ID AS customer_id, c.REGION AS region, o.ORDER_ID AS order_id, o.AMOUNT AS amount "
+                            f"FROM {FQ}.CUSTOMERS c JOIN {FQ}.ORDERS o ON o.CUSTOMER_ID = c.CUSTOMER_ID",
+        "depends_on": [],
+        "is_final_table": False,
+    },
+    {
+        "table_name": OUTPUT_TABLE,
+        "original_cte_name": "final",
+        "create_statement": f"CREATE OR REPLACE TABLE {FQ}.{OUTPUT_TABLE} AS "
+                            f"SELECT region, COUNT(DISTINCT customer_id) AS customers, COUNT(order_id) AS orders, "
+                            f"SUM(amount) AS revenue FROM {FQ}.stg_customer_orders GROUP BY region",
+        "depends_on": [f"{FQ}.stg_customer_orders"],
+        "is_final_table": True,
+    },
+])
+
+GENERATED_JSON = json.dumps({"sql": SOP_SQL, "tables_used": ["CUSTOMERS", "ORDERS"]})
+
+EXTRACT_JSON = json.dumps({
+    "task": "Summarise customers, orders and revenue by region",
+    "tables": ["CUSTOMERS", "ORDERS"],
+    "output_table": OUTPUT_TABLE,
+})
+
+
+def scripted_llm(latency_s: float, recordings: str = None) -> ReplayLLM:
+    """Rule-based responses for each LLM step of the pipeline; recordings (if given) take precedence."""
+    rules = [
+        ("Extract the following from the business requirement", EXTRACT_JSON),
+        ("break it down into separate staging tables", STAGING_JSON),
+        ("Refactor the following SQL query", SOP_SQL),
+        ("generate a \*\*robust SQL query\*\*", SOP_SQL),
+        ("Write ONE enterprise-grade, SOP-compliant", GENERATED_JSON),
+    ]
+    if recordings:
+        return ReplayLLM.from_file(recordings, rules=rules, default_response=SOP_SQL, latency_s=latency_s)
+    return ReplayLLM(rules=rules, default_response=SOP_SQL, latency_s=latency_s)
+
+
+def build_catalog(standin: SnowflakeStandIn, tables: int, columns: int, rows: int) -> float:
+    """Synthetic catalog plus the two tables the scripted request reads. Returns build seconds."""
+    started = time.perf_counter()
+    standin.create_schema(BENCH_DB, BENCH_SCHEMA)
+
+    padding = "".join(f", PAD_{c:04d} VARCHAR" for c in range(max(0, columns - 3)))
+    pad_values = "".join(", CAST(r AS VARCHAR)" for _ in range(max(0, columns - 3)))
+    standin.db.execute(f"CREATE TABLE {FQ}.CUSTOMERS (CUSTOMER_ID BIGINT, REGION VARCHAR, SIGNUP_DATE DATE{padding})")
+    standin.db.execute(f"""
+        INSERT INTO {FQ}.CUSTOMERS
+        SELECT r, 'REGION_' || CAST(r % 5 AS VARCHAR), DATE '2024-01-01' + CAST(r % 365 AS INTEGER){pad_values}
+        FROM range({rows}) t(r)
+    """)
+    standin.db.execute(f"CREATE TABLE {FQ}.ORDERS (ORDER_ID BIGINT, CUSTOMER_ID BIGINT, AMOUNT DOUBLE{padding})")
+    standin.db.execute(f"""
+        INSERT INTO {FQ}.ORDERS
+        SELECT r, r % {max(rows, 1)}, (r % 97) * 1.5{pad_values}
+        FROM range({rows * 4}) t(r)
+    """)
+
+    standin.create_synthetic_catalog(tables, columns, databases=max(1, tables // 10000), schemas_per_db=4)
+    return time.perf_counter() - started
+
+
+def time_catalog_ops(standin: SnowflakeStandIn) -> list:
+    """Catalog helpers used by the selector/locator agents, timed against the synthetic catalog."""
+    ops = [
+        ("get_all_databases_and_schemas", get_all_databases_and_schemas),
+        ("get_snowflake_tables(SYN_DB_00.SCHEMA_00)", lambda: get_snowflake_tables("SYN_DB_00", "SCHEMA_00")),
+        ("list_all_tables", list_all_tables),
+        # Cached versions the agents use: first call, then a repeat served from the process cache
+        ("catalog_cache.overview (cold)", lambda: get_catalog_cache().overview()),
+        ("catalog_cache.overview (warm)", lambda: get_catalog_cache().overview()),
+        ("table_index(SYN_DB_00.SCHEMA_00) (cold)", lambda: get_table_index("SYN_DB_00", "SCHEMA_00").tables),
+        ("table_index(SYN_DB_00.SCHEMA_00) (warm)", lambda: get_table_index("SYN_DB_00", "SCHEMA_00").tables),
+    ]
+    results = []
+    for name, op in ops:
+        before = standin.stats["total"]
+        started = time.perf_counter()
+        output = op()
+        results.append({
+            "operation": name,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "queries": standin.stats["total"] - before,
+            "items": len(output),
+        })
+    return results
+
+
+def run_conversation(standin: SnowflakeStandIn, llm: ReplayLLM, max_turns: int = 8) -> dict:
+    """
+    Drives the graph one user turn at a time, timing every node from the stream of updates.
+    Per-agent figures are summed across turns.
+    """
+    per_agent = defaultdict(lambda: {"runs": 0, "latency_ms": 0.0, "queries": 0, "llm_calls": 0,
+                                     "prompt_tokens": 0, "cached_tokens": 0, "peak_alloc_kb": 0.0})
+    graph = build_etl_graph()
+    state = get_initial_state("")
+    replies = ["Summarise customers, orders and revenue by region from CUSTOMERS and ORDERS"] + ["yes"] * (max_turns - 1)
+
+    turns = 0
+    started_all = time.perf_counter()
+    for reply in replies:
+        if state.get("workflow_status") == "completed":
+            break
+        turns += 1
+        state["chatbot_messages"].append({"sender": "user", "text": reply})
+        if not state.get("raw_prompt"):
+            state["raw_prompt"] = reply
+
+        queries, calls, tokens = standin.stats["total"], llm.calls, usage_totals()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        mark = time.perf_counter()
+        for update in graph.stream(state, config={"recursion_limit": 50}, stream_mode="updates"):
+            for node, value in update.items():
+                now = time.perf_counter()
+                stats = per_agent[node]
+                stats["runs"] += 1
+                stats["latency_ms"] += (now - mark) * 1000
+                stats["queries"] += standin.stats["total"] - queries
+                stats["llm_calls"] += llm.calls - calls
+                now_tokens = usage_totals()
+                stats["prompt_tokens"] += now_tokens["input_tokens"] - tokens["input_tokens"]
+                stats["cached_tokens"] += now_tokens["cached_tokens"] - tokens["cached_tokens"]
+                stats["peak_alloc_kb"] = max(stats["peak_alloc_kb"], (tracemalloc.get_traced_memory()[1] - base) / 1024)
+                if isinstance(value, dict):
+                    state = value
+                queries, calls, tokens = standin.stats["total"], llm.calls, now_tokens
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                mark = time.perf_counter()
+
+    agents = [{"agent": name, **{k: round(v, 1) if isinstance(v, float) else v for k, v in s.items()}}
+              for name, s in per_agent.items()]
+    return {
+        "turns": turns,
+        "completed": state.get("workflow_status") == "completed",
+        "total_ms": round((time.perf_counter() - started_all) * 1000, 1),
+        "queries": sum(a["queries"] for a in agents),
+        "llm_calls": sum(a["llm_calls"] for a in agents),
+        "prompt_tokens": sum(a["prompt_tokens"] for a in agents),
+        "cached_tokens": sum(a["cached_tokens"] for a in agents),
+        "llm_misses": llm.misses,
+        "agents": agents,
+    }
+
+
+def run_config(tables: int, columns: int, rows: int, llm_latency: float, recordings: str = None) -> dict:
+    standin = SnowflakeStandIn()
+    set_connection_factory(standin.connect)
+    llm = scripted_llm(llm_latency, recordings)
+    set_llm(prompt_caching("replay", llm))  # records prompt/cached tokens per call
+
+    try:
+        build_s = build_catalog(standin, tables, columns, rows)
+        standin.reset_stats()
+        catalog = time_catalog_ops(standin)
+        conversation = run_conversation(standin, llm)
+    finally:
+        set_connection_factory(None)
+        set_llm(None)
+
+    return {
+        "tables": tables,
+        "columns": columns,
+        "rows": rows,
+        "catalog_build_s": round(build_s, 2),
+        "catalog_ops": catalog,
+        "pipeline": conversation,
+        "query_kinds": {k: v for k, v in standin.stats.items() if k != "total"},
+    }
+
+
+def report(result: dict):
+    pipeline = result["pipeline"]
+    print(f"\n🧪 {result['tables']} tables x {result['columns']} columns "
+          f"(catalog built in {result['catalog_build_s']}s)\n")
+    print(pd.DataFrame(result["catalog_ops"]).to_markdown(index=False))
+    print()
+    print(pd.DataFrame(pipeline["agents"]).to_markdown(index=False))
+    status = "✅ completed" if pipeline["completed"] else "❌ did not complete"
+    print(f"\n{status} in {pipeline['turns']} turns, {pipeline['total_ms']} ms, "
+          f"{pipeline['queries']} queries, {pipeline['llm_calls']} LLM calls ({pipeline['llm_misses']} unscripted), "
+          f"{pipeline['cached_tokens']}/{pipeline['prompt_tokens']} prompt tokens from cache")
+    print(f"Query mix: {result['query_kinds']}")
+
+
+def _ints(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=_ints, default=[100, 1000], help="comma-separated catalog sizes")
+    parser.add_argument("--columns", type=_ints, default=[10, 100], help="comma-separated column counts")
+    parser.add_argument("--rows", type=int, default=1000, help="rows in the CUSTOMERS table (ORDERS gets 4x)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--recordings", help="RecordingLLM capture to replay before the scripted rules")
+    parser.add_argument("--json", help="write all results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the agents' own console output")
+    args = parser.parse_args()
+
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.recordings = os.path.abspath(args.recordings) if args.recordings else None
+    os.chdir(_workdir)  # agents drop state snapshots (test.json, ...) in the working directory
+    tracemalloc.start()
+    results = []
+    for n_tables in args.tables:
+        for n_columns in args.columns:
+            stdout = sys.stdout
+            if not args.verbose:
+                sys.stdout = open(os.devnull, "w")
+            try:
+                result = run_config(n_tables, n_columns, args.rows, args.llm_latency, args.recordings)
+            finally:
+                if not args.verbose:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+            report(result)
+            results.append(result)
+    tracemalloc.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Results written to {args.json}")
@@ -0,0 +1,131 @@
+# benchmarks/rate_limiter.py
+"""
+Many sessions sharing one throttled provider: unprotected calls vs calls through the
+shared rate limiter (token buckets, AIMD concurrency, retries, priority queue).
+
+The fake provider answers 429 whenever more than --server-concurrency calls are in flight
+or it has served more than --server-rpm calls in the last minute.
+
+Run: python -m benchmarks.rate_limiter [--sessions 50] [--calls 3] [--batch-share 0.3]
+"""
+
+import os
+import time
+import random
+import argparse
+import threading
+from collections import deque, Counter
+from typing import Any, List
+
+os.environ.setdefault("LLM_BACKOFF_BASE_S", "0.05")
+os.environ.setdefault("LLM_BACKOFF_CAP_S", "1")
+
+import pandas as pd
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from utils import rate_limiter
+from utils.rate_limiter import RateLimitedLLM, llm_priority, limiter_metrics
+
+
+class ThrottleError(Exception):
+    status_code = 429
+
+
+class ThrottledFakeLLM(BaseChatModel):
+    """Fake provider with a hard concurrency cap and a sliding-window request limit."""
+    latency_s: float = 0.05
+    max_concurrency: int = 4
+    rpm: int = 600
+    in_flight: int = 0
+    served: Any = None
+    lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.served = deque()
+        self.lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "throttled-fake"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        now = time.monotonic()
+        with self.lock:
+            while self.served and now - self.served[0] > 60:
+                self.served.popleft()
+            if self.in_flight >= self.max_concurrency or len(self.served) >= self.rpm:
+                raise ThrottleError("429 Too Many Requests")
+            self.in_flight += 1
+            self.served.append(now)
+        try:
+            time.sleep(self.latency_s * random.uniform(0.5, 1.5))
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="SELECT 1"))])
+
+
+def run_sessions(llm, sessions: int, calls: int, batch_share: float) -> dict:
+    outcomes, latencies = Counter(), {"interactive": [], "batch": []}
+    lock = threading.Lock()
+
+    def session(i: int):
+        priority = "batch" if i < int(sessions * batch_share) else "interactive"
+        with llm_priority(priority):
+            for c in range(calls):
+                started = time.perf_counter()
+                try:
+                    llm.invoke(f"session {i} call {c}: generate SQL")
+                    result = "ok"
+                except Exception:
+                    result = "failed"
+                with lock:
+                    outcomes[result] += 1
+                    latencies[priority].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    random.Random(7).shuffle(threads)  # interleave batch and interactive arrivals
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    row = {"ok": outcomes["ok"], "failed": outcomes["failed"], "wall_s": round(time.perf_counter() - started, 2)}
+    for priority, values in latencies.items():
+        if values:
+            values.sort()
+            row[f"{priority}_p50_s"] = round(values[len(values) // 2], 3)
+            row[f"{priority}_p95_s"] = round(values[int(0.95 * (len(values) - 1))], 3)
+    return row
+
+
+def run(sessions: int, calls: int, batch_share: float, server_concurrency: int, server_rpm: int):
+    server = ThrottledFakeLLM(max_concurrency=server_concurrency, rpm=server_rpm)
+    rows = [{"mode": "unprotected", **run_sessions(server, sessions, calls, batch_share)}]
+
+    rate_limiter._limiters.clear()
+    os.environ["LLM_RPM_FAKE"] = str(server_rpm)
+    limited = RateLimitedLLM(inner=ThrottledFakeLLM(max_concurrency=server_concurrency, rpm=server_rpm), provider="fake")
+    rows.append({"mode": "rate limited", **run_sessions(limited, sessions, calls, batch_share)})
+
+    print(f"\n🧪 {sessions} sessions x {calls} calls ({int(sessions * batch_share)} batch sessions), "
+          f"provider allows {server_concurrency} concurrent / {server_rpm} per minute\n")
+    print(pd.DataFrame(rows).to_markdown(index=False))
+    print("\nLimiter metrics:")
+    for name, metrics in limiter_metrics().items():
+        print(f"- {name}: {metrics}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--batch-share", type=float, default=0.3)
+    parser.add_argument("--server-concurrency", type=int, default=4)
+    parser.add_argument("--server-rpm", type=int, default=600)
+    args = parser.parse_args()
+    run(args.sessions, args.calls, args.batch_share, args.server_concurrency, args.server_rpm)
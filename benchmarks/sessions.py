@@ -0,0 +1,143 @@
+# benchmarks/sessions.py
+"""
+Concurrent chat sessions: graph.invoke on one thread per session (what run.py does without
+workers) vs the core.turn_service worker pool with thread and process workers.
+
+Every session plays the benchmarks.pipeline conversation (prompt → yes → yes → ...) with
+all sessions starting at once. Process workers each build their own DuckDB stand-in catalog;
+the other modes share one. Reported per mode: completed sessions, turn latency, throughput
+and the CPU time spent in the app process (what Streamlit itself would burn), plus the share
+of prompt tokens served from the simulated prefix cache (app-process LLM calls only).
+
+Run: python -m benchmarks.sessions [--sessions 50] [--workers 4] [--threads 4] [--tables 100]
+                                   [--llm-latency 0.05] [--modes inline,thread,process]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import functools
+
+os.environ.setdefault("TURN_TRACE_PROJECT", "")  # no LangSmith tracing
+os.environ.setdefault("RESULT_CACHE", "false")  # modes share a catalog — keep later modes from reusing results
+
+from benchmarks.pipeline import _workdir, build_catalog, scripted_llm  # sets the benchmark env first
+
+import pandas as pd
+
+from core.state_schema import get_initial_state
+from core.langgraph_runner import build_etl_graph
+from core.turn_service import TurnService, run_turn
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.llm_provider import set_llm, prompt_caching
+from utils.prompt_cache import usage_totals
+from utils.snowflake_utils import set_connection_factory
+
+REPLIES = ["Summarise customers, orders and revenue by region from CUSTOMERS and ORDERS"] + ["yes"] * 7
+
+
+def init_backend(tables: int, columns: int, rows: int, llm_latency: float, quiet: bool = True):
+    """Stand-in catalog + scripted LLM for this process (also the process workers' initializer)."""
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    standin = SnowflakeStandIn()
+    build_catalog(standin, tables, columns, rows)
+    set_connection_factory(standin.connect)
+    set_llm(prompt_caching("replay", scripted_llm(llm_latency)))
+
+
+def run_sessions(sessions: int, play_turn) -> dict:
+    """Starts every session at once; play_turn(session_id, state, reply) returns the new state."""
+    latencies, completed = [], []
+    lock = threading.Lock()
+
+    def session(i: int):
+        session_id = f"bench-{i:03d}"
+        state = get_initial_state("", {"session_id": session_id})
+        for reply in REPLIES:
+            if state.get("workflow_status") == "completed":
+                break
+            started = time.perf_counter()
+            state = play_turn(session_id, state, reply)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+        with lock:
+            completed.append(state.get("workflow_status") == "completed")
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    tokens = usage_totals()
+    cpu, started = time.process_time(), time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "completed": sum(completed),
+        "turns": len(latencies),
+        "wall_s": round(wall, 2),
+        "turns_per_s": round(len(latencies) / wall, 1),
+        "turn_p50_s": round(latencies[len(latencies) // 2], 3),
+        "turn_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        "turn_max_s": round(latencies[-1], 3),
+        "app_cpu_s": round(time.process_time() - cpu, 2),
+        "cached_prompt_pct": _cached_pct(tokens, usage_totals()),
+    }
+
+
+def _cached_pct(before: dict, after: dict):
+    prompt = after["input_tokens"] - before["input_tokens"]
+    return round(100 * (after["cached_tokens"] - before["cached_tokens"]) / prompt, 1) if prompt else None
+
+
+def run_mode(mode: str, sessions: int, workers: int, threads: int, init) -> dict:
+    if mode == "inline":
+        graph = build_etl_graph()
+        return {"mode": "inline (thread per session)", **run_sessions(sessions, lambda _, state, reply: run_turn(graph, state, reply))}
+
+    # Thread workers share this process's backend; process workers build their own
+    service = TurnService(workers=workers, mode=mode, threads=threads, initializer=init if mode == "process" else None)
+    started = time.perf_counter()
+    service.wait_ready(timeout=120)
+    startup = round(time.perf_counter() - started, 2)
+
+    def play_turn(session_id, state, reply):
+        ticket = service.submit(session_id, state, reply)
+        service.wait(ticket)
+        return service.result(ticket)
+
+    try:
+        row = run_sessions(sessions, play_turn)
+    finally:
+        service.close()
+    return {"mode": f"{mode} workers ({workers}x{threads})", **row, "startup_s": startup}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent turns per worker")
+    parser.add_argument("--tables", type=int, default=100)
+    parser.add_argument("--columns", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="simulated seconds per LLM call")
+    parser.add_argument("--modes", default="inline,thread,process")
+    args = parser.parse_args()
+
+    os.chdir(_workdir)
+    stdout = sys.stdout
+    init = functools.partial(init_backend, args.tables, args.columns, args.rows, args.llm_latency)
+    init()
+
+    rows = []
+    for mode in args.modes.split(","):
+        rows.append(run_mode(mode.strip(), args.sessions, args.workers, args.threads, init))
+    sys.stdout = stdout
+
+    print(f"\n🧪 {args.sessions} concurrent sessions, {args.tables} tables, {args.llm_latency}s per LLM call\n")
+    print(pd.DataFrame(rows).to_markdown(index=False))
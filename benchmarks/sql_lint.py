@@ -0,0 +1,76 @@
+# benchmarks/sql_lint.py
+"""
+utils.sql_linter on SQL shaped like what the generator returns: bare queries, unqualified
+and unaliased tables, correlated subqueries, quoted and reserved names. Each statement is
+linted, statically checked (utils.sql_checker) and then executed against the DuckDB stand-in.
+Reports the fixes applied, the checker findings, lint latency, and whether the linted SQL ran.
+
+Run: python -m benchmarks.sql_lint [--repeat 200]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from benchmarks.pipeline import BENCH_DB, BENCH_SCHEMA, build_catalog  # sets the benchmark env first
+
+import pandas as pd
+
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.sql_checker import check_sql
+from utils.sql_linter import lint_sql
+
+CASES = [
+    ("bare query", "SELECT CUSTOMERS.REGION, SUM(ORDERS.AMOUNT) FROM CUSTOMERS "
+                   "JOIN ORDERS ON ORDERS.CUSTOMER_ID = CUSTOMERS.CUSTOMER_ID GROUP BY CUSTOMERS.REGION"),
+    ("select into", "SELECT ORDERS.ORDER_ID, ORDERS.AMOUNT INTO LINT_OUT FROM ORDERS WHERE ORDERS.AMOUNT > 0"),
+    ("correlated EXISTS", "SELECT ORDERS.ORDER_ID FROM ORDERS WHERE EXISTS "
+                          "(SELECT 1 FROM CUSTOMERS WHERE CUSTOMERS.CUSTOMER_ID = ORDERS.CUSTOMER_ID)"),
+    ("correlated scalar", "SELECT CUSTOMERS.CUSTOMER_ID, (SELECT COUNT(*) FROM ORDERS "
+                          "WHERE ORDERS.CUSTOMER_ID = CUSTOMERS.CUSTOMER_ID) AS ORDER_COUNT FROM CUSTOMERS"),
+    ("shadowed in subquery", "SELECT ORDERS.ORDER_ID FROM ORDERS WHERE ORDERS.CUSTOMER_ID IN "
+                             "(SELECT ORDERS.CUSTOMER_ID FROM ORDERS WHERE ORDERS.AMOUNT > 100)"),
+    ("CTE + join", "WITH big AS (SELECT ORDERS.CUSTOMER_ID FROM ORDERS WHERE ORDERS.AMOUNT > 100) "
+                   "SELECT big.CUSTOMER_ID, CUSTOMERS.REGION FROM big JOIN CUSTOMERS USING (CUSTOMER_ID)"),
+    ("quoted names", 'CREATE TABLE IF NOT EXISTS LINT_OUT AS SELECT "REGION", COUNT(*) FROM "CUSTOMERS" GROUP BY "REGION"'),
+]
+
+
+def run_cases(standin: SnowflakeStandIn, repeat: int) -> pd.DataFrame:
+    schema_map = {f"{BENCH_DB}.{BENCH_SCHEMA}.{name}": {c: None for c in columns} for name, columns in
+                  {"CUSTOMERS": ["CUSTOMER_ID", "REGION", "SIGNUP_DATE"],
+                   "ORDERS": ["ORDER_ID", "CUSTOMER_ID", "AMOUNT"]}.items()}
+    cursor = standin.connect().cursor()
+    rows = []
+    for label, sql in CASES:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            linted, violations = lint_sql(sql, BENCH_DB, BENCH_SCHEMA, "LINT_OUT")
+        lint_ms = (time.perf_counter() - started) * 1000 / repeat
+        findings = check_sql(linted, schema_map, BENCH_DB, BENCH_SCHEMA)
+        try:
+            cursor.execute(linted)
+            error = None
+        except Exception as e:
+            error = str(e).splitlines()[0][:60]
+        rows.append({"case": label, "fixes": sum(1 for v in violations if v["fixed"]),
+                     "findings": ", ".join(f["rule"] for f in findings) or "-",
+                     "lint_ms": round(lint_ms, 3), "runs": error is None, "error": error or ""})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    standin = SnowflakeStandIn()
+    build_catalog(standin, 10, 3, 1000)
+    results = run_cases(standin, args.repeat)
+    sys.stdout = stdout
+
+    print(f"\n🧪 {len(CASES)} statements, lint latency averaged over {args.repeat} runs\n")
+    print(results.to_markdown(index=False))
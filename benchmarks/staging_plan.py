@@ -0,0 +1,116 @@
+# benchmarks/staging_plan.py
+"""
+One task per CTE-extracted staging table vs the staging optimizer (utils.staging_optimizer),
+on a six-stage plan against the DuckDB stand-in. SQLTaskGraphAgent builds the graph both
+ways; one scheduled run is then simulated by executing every task's SQL in dependency order.
+Reports tasks, views, rows and bytes written per run (rows x columns x 8, the stand-in's
+EXPLAIN sizing), run time, and whether the final table is identical.
+
+Run: python -m benchmarks.staging_plan [--rows 200000] [--view-max-bytes 1073741824]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from benchmarks.pipeline import BENCH_DB, BENCH_SCHEMA, FQ, build_catalog  # sets the benchmark env first
+
+import pandas as pd
+
+import utils.staging_optimizer as staging_optimizer
+from agents.sql_task_graph_agent import SQLTaskGraphAgent
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.snowflake_utils import set_connection_factory
+
+
+def stage(name: str, select: str, depends_on=(), final: bool = False) -> dict:
+    kind = "TABLE" if final else "TRANSIENT TABLE"
+    return {"table_name": name, "original_cte_name": name.lower().replace("stg_", ""),
+            "create_statement": f"CREATE OR REPLACE {kind} {FQ}.{name} AS {select}",
+            "depends_on": [f"{FQ}.{d}" for d in depends_on], "is_final_table": final}
+
+
+STAGING = [
+    # projection / filter of one table
+    stage("stg_orders", f"SELECT o.ORDER_ID, o.CUSTOMER_ID, o.AMOUNT FROM {FQ}.ORDERS o WHERE o.AMOUNT > 0"),
+    stage("stg_customers", f"SELECT c.CUSTOMER_ID, c.REGION, c.SIGNUP_DATE FROM {FQ}.CUSTOMERS c"),
+    # join read by two aggregates
+    stage("stg_customer_orders",
+          f"SELECT sc.CUSTOMER_ID, sc.REGION, so.ORDER_ID, so.AMOUNT FROM {FQ}.stg_customers sc "
+          f"JOIN {FQ}.stg_orders so ON so.CUSTOMER_ID = sc.CUSTOMER_ID",
+          ["stg_customers", "stg_orders"]),
+    stage("stg_region_revenue",
+          f"SELECT co.REGION, SUM(co.AMOUNT) AS revenue, COUNT(co.ORDER_ID) AS orders "
+          f"FROM {FQ}.stg_customer_orders co GROUP BY co.REGION", ["stg_customer_orders"]),
+    stage("stg_region_buyers",
+          f"SELECT co.REGION, COUNT(DISTINCT co.CUSTOMER_ID) AS buyers "
+          f"FROM {FQ}.stg_customer_orders co GROUP BY co.REGION", ["stg_customer_orders"]),
+    # left over from the original query, read by nothing
+    stage("stg_signups", f"SELECT c.CUSTOMER_ID, c.SIGNUP_DATE FROM {FQ}.CUSTOMERS c WHERE c.SIGNUP_DATE >= '2024-06-01'"),
+]
+FINAL = stage("REGION_SUMMARY",
+              f"SELECT rr.REGION, rr.revenue, rr.orders, rb.buyers FROM {FQ}.stg_region_revenue rr "
+              f"JOIN {FQ}.stg_region_buyers rb ON rb.REGION = rr.REGION",
+              ["stg_region_revenue", "stg_region_buyers"], final=True)
+
+
+def written(standin: SnowflakeStandIn, table: str) -> tuple:
+    row = standin.db.execute("""
+        SELECT estimated_size, column_count FROM duckdb_tables()
+        WHERE upper(database_name) = ? AND upper(schema_name) = ? AND upper(table_name) = ?
+    """, [BENCH_DB, BENCH_SCHEMA, table.upper()]).fetchone()
+    return (row[0], row[0] * row[1] * 8) if row else (0, 0)
+
+
+def run_mode(rows: int, optimize: bool) -> dict:
+    standin = SnowflakeStandIn()
+    build_catalog(standin, 10, 3, rows)
+    set_connection_factory(standin.connect)
+    agent = SQLTaskGraphAgent(optimize_staging=optimize)
+    state = agent({"staging_tables": [dict(s) for s in STAGING], "final_table": dict(FINAL),
+                   "selected_database": BENCH_DB, "selected_schema": BENCH_SCHEMA})
+    if state["execution_result"]["status"] != "success":
+        raise RuntimeError(state["execution_result"]["message"])
+
+    # One scheduled run: each task's SQL once its predecessors are done
+    cursor = standin.connect().cursor()
+    pending, done, rows_written, bytes_written = list(agent.task_configs), set(), 0, 0
+    started = time.perf_counter()
+    while pending:
+        for task in [t for t in pending if set(t["dependencies"]) <= done]:
+            cursor.execute(task["sql"])
+            table_rows, table_bytes = written(standin, task["name"].split("_", 1)[1])
+            rows_written, bytes_written = rows_written + table_rows, bytes_written + table_bytes
+            done.add(task["name"])
+            pending.remove(task)
+    elapsed = time.perf_counter() - started
+
+    output = cursor.execute(f"SELECT * FROM {FQ}.{FINAL['table_name']} ORDER BY 1").fetchall()
+    summary = (state.get("staging_plan") or {}).get("summary") or {}
+    return {"mode": "optimized" if optimize else "one task per stage", "tasks": len(agent.task_configs),
+            "views": summary.get("views", 0), "rows_written": rows_written, "bytes_written": bytes_written,
+            "run_ms": round(elapsed * 1000, 1), "output": output,
+            "decisions": (state.get("staging_plan") or {}).get("decisions", [])}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000, help="customers (orders are 4x)")
+    parser.add_argument("--view-max-bytes", type=int, default=staging_optimizer.STAGING_VIEW_MAX_BYTES)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="staging_bench_"))  # the agent dumps task_graph_state.json
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    staging_optimizer.STAGING_VIEW_MAX_BYTES = args.view_max_bytes
+
+    results = [run_mode(args.rows, False), run_mode(args.rows, True)]
+    sys.stdout = stdout
+
+    print(f"\n🧪 {len(STAGING)} staging tables + final, {args.rows} customers / {args.rows * 4} orders\n")
+    print(pd.DataFrame([{k: v for k, v in r.items() if k not in ("output", "decisions")} for r in results])
+          .to_markdown(index=False))
+    print(f"\nFinal table identical: {results[0]['output'] == results[1]['output']}\n")
+    print(pd.DataFrame(results[1]["decisions"])[["table_name", "decision", "reason", "est_bytes"]].to_markdown(index=False))
@@ -0,0 +1,146 @@
+# benchmarks/staging_sharing.py
+"""
+Ten pipelines that clean ORDERS the same way (written with different aliases and casing),
+each with its own regional aggregate and final table, deployed one after another through
+SQLTaskGraphAgent against the DuckDB stand-in:
+- independent:         every pipeline builds its own staging tables
+- shared:              the staging registry (utils.staging_registry) — later pipelines read the
+                       first pipeline's cleaned table on their own schedule instead of rebuilding it
+- shared + optimizer:  registry plus the staging optimizer, which materializes the cleaning stage
+                       once it sees other pipelines build it and inlines the rest
+One scheduled run is simulated by executing every task once in dependency order, pipelines in
+deployment order (so a shared table is refreshed before its readers' runs). Reports
+tasks, cleaning passes, rows and bytes written per run, whether every final table matches
+the independent deployment, whether tearing the pipelines down one by one kept each
+shared table until its last reference was gone (and then dropped it), and how many tasks
+were left dangling along the way (suspended, or AFTER a dropped task — a shared stage whose
+owner was torn down must be handed over to a surviving reader, not frozen).
+
+Run: python -m benchmarks.staging_sharing [--pipelines 10] [--rows 100000] [--view-max-bytes 1000000]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+
+from benchmarks.pipeline import BENCH_DB, BENCH_SCHEMA, FQ, build_catalog  # sets the benchmark env first
+from benchmarks.staging_plan import stage, written
+
+import pandas as pd
+
+import utils.staging_optimizer as staging_optimizer
+import utils.staging_registry as staging_registry
+from agents.sql_task_graph_agent import SQLTaskGraphAgent, teardown_pipeline
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.snowflake_utils import set_connection_factory
+
+ALIASES = ["o", "ord", "src", "orders_raw"]
+
+
+def pipeline_plan(i: int) -> tuple:
+    alias = ALIASES[i % len(ALIASES)]
+    select = "SELECT" if i % 2 else "select"
+    clean = stage(f"stg_clean_orders_{i}",
+                  f"{select} {alias}.ORDER_ID, {alias}.customer_id, ROUND({alias}.AMOUNT, 2) AS amount "
+                  f"FROM {FQ}.ORDERS {alias} WHERE {alias}.AMOUNT > 0 "
+                  f"QUALIFY ROW_NUMBER() OVER (PARTITION BY {alias}.ORDER_ID ORDER BY {alias}.AMOUNT DESC) = 1")
+    region = stage(f"stg_region_{i}_orders",
+                   f"SELECT c.CUSTOMER_ID, c.REGION, co.amount FROM {FQ}.CUSTOMERS c "
+                   f"JOIN {FQ}.stg_clean_orders_{i} co ON co.CUSTOMER_ID = c.CUSTOMER_ID "
+                   f"WHERE c.REGION = 'REGION_{i % 5}'", [f"stg_clean_orders_{i}"])
+    final = stage(f"REGION_REPORT_{i}",
+                  f"SELECT ro.REGION, COUNT(*) AS orders, SUM(ro.amount) AS revenue "
+                  f"FROM {FQ}.stg_region_{i}_orders ro GROUP BY ro.REGION", [f"stg_region_{i}_orders"], final=True)
+    return [clean, region], final
+
+
+def dangling_tasks(standin: SnowflakeStandIn) -> list:
+    """Tasks that would never run: suspended, or neither scheduled nor AFTER an existing task."""
+    dangling = []
+    for name, task in standin.tasks.items():
+        after = re.search(r"(?is)\bAFTER\s+(.+?)\s+AS\b", task["sql"] or "")
+        predecessors = [p.strip().upper() for p in after.group(1).split(",")] if after else []
+        scheduled = re.search(r"(?i)\bSCHEDULE\s*=", task["sql"] or "")
+        if task["state"] != "started" or not (scheduled or predecessors) \
+                or any(p not in standin.tasks for p in predecessors):
+            dangling.append(name)
+    return dangling
+
+
+def run_mode(mode: str, pipelines: int, rows: int) -> dict:
+    standin = SnowflakeStandIn()
+    build_catalog(standin, 10, 3, rows)
+    set_connection_factory(standin.connect)
+    staging_registry._registry = staging_registry.StagingRegistry(
+        os.path.join(tempfile.mkdtemp(prefix="registry_"), "staging_registry.db"))
+
+    share, optimize = mode != "independent", mode == "shared + optimizer"
+    tasks, graphs = {}, []
+    for i in range(pipelines):
+        staging, final = pipeline_plan(i)
+        agent = SQLTaskGraphAgent(share_staging=share, optimize_staging=optimize, stream_gated=True)
+        state = agent({"staging_tables": staging, "final_table": final,
+                       "selected_database": BENCH_DB, "selected_schema": BENCH_SCHEMA})
+        if state["execution_result"]["status"] != "success":
+            raise RuntimeError(state["execution_result"]["message"])
+        tasks.update({t["name"].upper(): t for t in agent.task_configs})
+        graphs.append(agent.task_configs)
+
+    # One scheduled run of every deployed graph; a graph only waits on its own tasks
+    cursor = standin.connect().cursor()
+    cleaning, rows_written, bytes_written = 0, 0, 0
+    started = time.perf_counter()
+    for graph in graphs:
+        pending, done = list(graph), set()
+        while pending:
+            for task in [t for t in pending if {d.upper() for d in t["dependencies"]} <= done]:
+                cursor.execute(task["sql"])
+                cleaning += task["sql"].upper().count("ROW_NUMBER()")
+                table_rows, table_bytes = written(standin, task["name"].split("_", 1)[1])
+                rows_written, bytes_written = rows_written + table_rows, bytes_written + table_bytes
+                done.add(task["name"].upper())
+                pending.remove(task)
+    elapsed = time.perf_counter() - started
+    outputs = [cursor.execute(f"SELECT * FROM {FQ}.REGION_REPORT_{i} ORDER BY 1").fetchall() for i in range(pipelines)]
+
+    # Teardown in deployment order: a shared table must exist exactly while a pipeline still reads it
+    references = staging_registry.get_staging_registry().references()
+    shared = {fqdn: set(users) for fqdn, users in references.items() if len(users) > 1}
+    survived, dangling = True, 0
+    for i in range(pipelines):
+        teardown_pipeline(f"{FQ}.REGION_REPORT_{i}")
+        dangling += len(dangling_tasks(standin))
+        live = {f"{FQ}.REGION_REPORT_{j}".upper() for j in range(i + 1, pipelines)}
+        tables = {r[0] for r in standin.db.execute(
+            "SELECT upper(database_name || '.' || schema_name || '.' || table_name) FROM duckdb_tables()").fetchall()}
+        if any((fqdn in tables) != bool(users & live) for fqdn, users in shared.items()):
+            survived = False
+
+    return {"mode": mode, "tasks": len(tasks), "cleaning_passes": cleaning, "rows_written": rows_written,
+            "bytes_written": bytes_written, "run_ms": round(elapsed * 1000, 1), "outputs": outputs,
+            "shared_tables": len(shared), "refcount_teardown_ok": survived, "dangling_tasks": dangling,
+            "tasks_after_teardown": len(standin.tasks)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pipelines", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=100_000, help="customers (orders are 4x)")
+    parser.add_argument("--view-max-bytes", type=int, default=1_000_000,
+                        help="the stand-in's tables are small; scaled down from the 1 GB default")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="sharing_bench_"))  # the agent dumps task_graph_state.json
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    staging_optimizer.STAGING_VIEW_MAX_BYTES = args.view_max_bytes
+    results = [run_mode(mode, args.pipelines, args.rows) for mode in ("independent", "shared", "shared + optimizer")]
+    sys.stdout = stdout
+
+    baseline = results[0]["outputs"]
+    print(f"\n🧪 {args.pipelines} pipelines cleaning ORDERS the same way, {args.rows * 4} orders\n")
+    print(pd.DataFrame([{**{k: v for k, v in r.items() if k != "outputs"}, "same_output": r["outputs"] == baseline}
+                        for r in results]).to_markdown(index=False))
@@ -0,0 +1,103 @@
+# benchmarks/standardization.py
+"""
+Column standardization for a multi-table onboarding: one get_column_standardization_chain()
+call per table (sequential) vs utils.column_standardizer (token-budgeted batches run with
+chain.batch, suggestions cached by column signature). Tables share id/audit columns, as
+real schemas do. The LLM is the replaying stand-in with --llm-latency per call.
+
+Run: python -m benchmarks.standardization [--tables 40] [--columns 25] [--llm-latency 0.5]
+                                          [--batch-tokens 3000] [--concurrency 4]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import pandas as pd
+
+from utils.fake_llm import ReplayLLM
+from utils.llm_provider import set_llm
+
+SHARED = [("ID", "NUMBER(38,0)"), ("CREATED_AT", "TIMESTAMP_NTZ(9)"), ("UPDATED_AT", "TIMESTAMP_NTZ(9)"),
+          ("CREATED_BY", "VARCHAR(256)"), ("IS_DELETED", "BOOLEAN"), ("TENANT_ID", "NUMBER(38,0)")]
+
+
+def build_metadata(tables: int, columns: int, seed: int = 7) -> dict:
+    random.seed(seed)
+    vocabulary = [f"ATTR_{i:04d}" for i in range(columns * tables // 2)]  # own columns recur across tables too
+    metadata = {}
+    for t in range(tables):
+        own = random.sample(vocabulary, max(0, columns - len(SHARED)))
+        metadata[f"TABLE_{t:03d}"] = [{"name": n, "type": ty} for n, ty in SHARED] + \
+                                     [{"name": n, "type": "VARCHAR(16777216)"} for n in own]
+    return metadata
+
+
+def _suggest(column: dict) -> dict:
+    return {"original": column["name"], "suggested": column["name"].lower(), "type": re.sub(r"\(.*\)", "", column["type"]),
+            "comment": f"Standardized {column['name'].lower()}"}
+
+
+def respond(prompt: str) -> str:
+    """Answers both prompt shapes from the column list embedded in the prompt."""
+    if "Tables:\n" in prompt:
+        tables = json.loads(prompt.split("Tables:\n", 1)[1])
+        return json.dumps({"tables": [{"table_name": t["table_name"], "columns": [_suggest(c) for c in t["columns"]]}
+                                      for t in tables]})
+    columns = json.loads(re.search(r"- Columns: (\[.*\])\n", prompt).group(1))
+    return json.dumps({"columns": [_suggest(c) for c in columns]})
+
+
+def run_sequential(metadata: dict) -> dict:
+    from utils.llm_utils import get_column_standardization_chain
+
+    started = time.perf_counter()
+    chain = get_column_standardization_chain()
+    for table, columns in metadata.items():
+        chain.invoke({"table_name": table, "columns": json.dumps([{"name": c["name"], "type": c["type"]} for c in columns])})
+    return {"wall_s": time.perf_counter() - started}
+
+
+def run_batched(metadata: dict, batch_tokens: int, concurrency: int, store: str) -> dict:
+    from utils.column_standardizer import ColumnStandardizer
+
+    standardizer = ColumnStandardizer(store_path=store, batch_tokens=batch_tokens, max_concurrency=concurrency)
+    started = time.perf_counter()
+    result = standardizer.standardize(metadata)
+    sources = pd.Series([s["source"] for cols in result.values() for s in cols]).value_counts().to_dict()
+    return {"wall_s": time.perf_counter() - started, **sources}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=40)
+    parser.add_argument("--columns", type=int, default=25)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="simulated seconds per LLM call")
+    parser.add_argument("--batch-tokens", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    metadata = build_metadata(args.tables, args.columns)
+    store = os.path.join(tempfile.mkdtemp(prefix="std_bench_"), "column_standardization.db")
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    rows = []
+    for mode in ("sequential", "batched (cold)", "batched (warm store)"):
+        llm = ReplayLLM(rules=[("", respond)], latency_s=args.llm_latency)
+        set_llm(llm)
+        if mode == "sequential":
+            row = run_sequential(metadata)
+        else:
+            row = run_batched(metadata, args.batch_tokens, args.concurrency, store)
+        rows.append({"mode": mode, "llm_calls": llm.calls, "prompt_chars": llm.prompt_chars,
+                     **{k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()}})
+    sys.stdout = stdout
+
+    print(f"\n🧪 {args.tables} tables x {args.columns} columns, {args.llm_latency}s per LLM call\n")
+    print(pd.DataFrame(rows).fillna(0).to_markdown(index=False))
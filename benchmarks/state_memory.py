@@ -0,0 +1,107 @@
+# benchmarks/state_memory.py
+"""
+Per-session state footprint after a 50-turn conversation: legacy dict messages with
+markdown previews inline vs ChatLog/ChatMessage with previews in the artifact store.
+
+Run: python -m benchmarks.state_memory [--turns 50] [--tables 3] [--columns 20]
+"""
+
+import argparse
+import sys
+import tracemalloc
+from datetime import date
+
+import pandas as pd
+
+from core.state_schema import get_initial_state, ChatLog
+from utils.artifact_store import put_table, store_stats
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Recursive sys.getsizeof over dicts, lists, slotted objects and strings."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, s, None), seen) for s in obj.__slots__)
+    return size
+
+
+def sample_frame(table: int, turn: int, columns: int, rows: int = 5) -> pd.DataFrame:
+    return pd.DataFrame([
+        {f"COL_{c:02d}": (f"value_{table}_{turn}_{r}_{c}" if c % 3 else date(2025, 1, 1 + r)) for c in range(columns)}
+        for r in range(rows)
+    ])
+
+
+def simulate(turns: int, tables: int, columns: int, compact: bool) -> dict:
+    state = get_initial_state("benchmark")
+    if not compact:
+        state["chatbot_messages"] = []
+
+    for turn in range(turns):
+        messages = state["chatbot_messages"]
+        messages.append({"sender": "user", "text": f"turn {turn}: yes"})
+        messages.append({"sender": "assistant", "text": "📋 Shall we proceed? 👉 Please reply with **yes** to continue."})
+
+        sample_records = {}
+        for t in range(tables):
+            df = sample_frame(t, turn, columns)
+            if compact:
+                ref = put_table(df)
+                sample_records[f"table_{t}"] = ref
+                messages.append({"sender": "assistant", "text": f"📊 Here's a preview of `table_{t}`:", "attachment": ref})
+            else:
+                sample_records[f"table_{t}"] = df.to_dict(orient="records")
+                messages.append({"sender": "assistant", "text": f"📊 Here's a preview of `table_{t}`:\n\n{df.to_markdown(index=False)}"})
+
+        result = sample_frame(99, turn, columns, rows=10)
+        if compact:
+            ref = put_table(result)
+            state["sql_result"] = {"row_count": 10, "columns": list(result.columns), "preview_ref": ref}
+            messages.append({"sender": "assistant", "text": "📊 Executed SQL! Here's a preview of the result:", "attachment": ref})
+        else:
+            state["sql_result"] = {"row_count": 10, "columns": list(result.columns), "preview": result.to_dict(orient="records")}
+            messages.append({"sender": "assistant", "text": f"📊 Executed SQL! Here's a preview of the result:\n\n{result.head(5).to_markdown(index=False)}"})
+
+        state["sample_records"] = sample_records
+
+    return state
+
+
+def run(turns: int, tables: int, columns: int):
+    rows = []
+    for label, compact in (("legacy dict + inline markdown", False), ("ChatLog + artifact refs", True)):
+        before = store_stats()["bytes"]
+        tracemalloc.start()
+        state = simulate(turns, tables, columns, compact)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append({
+            "mode": label,
+            "messages": len(state["chatbot_messages"]),
+            "state_kb": round(deep_sizeof(state) / 1024, 1),
+            "side_store_kb": round((store_stats()["bytes"] - before) / 1024, 1),
+            "peak_alloc_kb": round(peak / 1024, 1),
+        })
+
+    print(f"\n🧪 State footprint after {turns} turns ({tables} sample tables x {columns} columns per turn)\n")
+    print(pd.DataFrame(rows).to_markdown(index=False))
+    print(f"\nChatLog bound: {ChatLog().max_messages} messages (MAX_CHAT_MESSAGES)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--tables", type=int, default=3)
+    parser.add_argument("--columns", type=int, default=20)
+    args = parser.parse_args()
+    run(args.turns, args.tables, args.columns)
@@ -0,0 +1,125 @@
+# benchmarks/stream_gating.py
+"""
+Hourly-scheduled task graph whose sources change only now and then: SCHEDULE-only root tasks
+vs the stream gate (utils/stream_gate.py), deployed by SQLTaskGraphAgent from the staging_plan
+benchmark's plan against the DuckDB stand-in. Each tick, ORDERS receives new rows with
+probability --change-rate (the same ticks in both modes), then the schedule fires:
+- schedule only:  every task runs
+- stream-gated:   the gate's WHEN SYSTEM$STREAM_HAS_DATA(...) is evaluated; false → the run is
+                  SKIPPED, true → the gate consumes the streams and the graph runs
+Runs are recorded in a task monitor store shaped like TASK_HISTORY; the avoided runs come from
+utils.task_monitor.summarize_gated_runs. Checks the final table matches after every tick.
+
+Run: python -m benchmarks.stream_gating [--ticks 48] [--change-rate 0.15] [--rows 50000] [--batch 500]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.pipeline import BENCH_DB, BENCH_SCHEMA, FQ, build_catalog  # sets the benchmark env first
+from benchmarks.staging_plan import STAGING, FINAL
+
+import pandas as pd
+
+from agents.sql_task_graph_agent import SQLTaskGraphAgent
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.snowflake_utils import set_connection_factory
+from utils.task_monitor import get_store, record_task_runs, summarize_gated_runs
+
+START = datetime(2026, 1, 1)
+
+
+def deploy(rows: int, gated: bool):
+    standin = SnowflakeStandIn()
+    build_catalog(standin, 10, 3, rows)
+    set_connection_factory(standin.connect)
+    agent = SQLTaskGraphAgent(stream_gated=gated, share_staging=False)
+    state = agent({"staging_tables": [dict(s) for s in STAGING], "final_table": dict(FINAL),
+                   "selected_database": BENCH_DB, "selected_schema": BENCH_SCHEMA})
+    if state["execution_result"]["status"] != "success":
+        raise RuntimeError(state["execution_result"]["message"])
+    return standin, agent, state
+
+
+def run_graph(cursor, tasks: list, tick: int) -> list:
+    """Every task once in dependency order; returns TASK_HISTORY-shaped rows."""
+    scheduled = START + timedelta(hours=tick)
+    clock, history = scheduled, []
+    pending, done = list(tasks), set()
+    while pending:
+        for task in [t for t in pending if set(t["dependencies"]) <= done]:
+            started = time.perf_counter()
+            cursor.execute(task["sql"])
+            elapsed = timedelta(seconds=time.perf_counter() - started)
+            history.append({"run_id": tick, "graph_run_group_id": f"{tick}", "root_task_id": tasks[0]["name"],
+                            "name": task["name"], "state": "SUCCEEDED", "scheduled_time": scheduled,
+                            "query_start_time": clock, "completed_time": clock + elapsed})
+            clock += elapsed
+            done.add(task["name"])
+            pending.remove(task)
+    return history
+
+
+def run_mode(gated: bool, args) -> dict:
+    standin, agent, state = deploy(args.rows, gated)
+    cursor = standin.connect().cursor()
+    store = get_store(os.path.join(tempfile.mkdtemp(prefix="monitor_"), "task_monitor.db"))
+    random.seed(args.seed)
+    gate = agent.gate["task"] if agent.gate else None
+
+    outputs, task_runs, started, next_id = [], 0, time.perf_counter(), args.rows * 4
+    for tick in range(args.ticks):
+        if random.random() < args.change_rate:
+            cursor.execute(f"INSERT INTO {FQ}.ORDERS SELECT * REPLACE (ORDER_ID + {next_id} AS ORDER_ID) "
+                           f"FROM {FQ}.ORDERS WHERE ORDER_ID < {args.batch}")
+            next_id += args.batch
+
+        if gate and not cursor.execute(f"SELECT {gate['when']}").fetchone()[0]:
+            scheduled = START + timedelta(hours=tick)
+            history = [{"run_id": tick, "graph_run_group_id": f"{tick}", "root_task_id": gate["name"],
+                        "name": gate["name"], "state": "SKIPPED", "scheduled_time": scheduled,
+                        "query_start_time": None, "completed_time": scheduled}]
+        else:
+            history = run_graph(cursor, agent.task_configs, tick)
+            task_runs += len(history)
+        record_task_runs(store, BENCH_DB, history)
+        outputs.append(cursor.execute(f"SELECT * FROM {FQ}.{FINAL['table_name']} ORDER BY 1").fetchall())
+    elapsed = time.perf_counter() - started
+
+    gated_runs = summarize_gated_runs(store, state["task_graph"])
+    return {"mode": "stream-gated" if gated else "schedule only", "tasks": len(agent.task_configs),
+            "scheduled_runs": args.ticks,
+            "executed_runs": gated_runs[0]["executed_runs"] if gated_runs else args.ticks,
+            "skipped_runs": gated_runs[0]["skipped_runs"] if gated_runs else 0,
+            "task_runs": task_runs, "avoided_task_runs": gated_runs[0]["avoided_task_runs"] if gated_runs else 0,
+            "run_s": round(elapsed, 2), "outputs": outputs,
+            "changed_rows_logged": cursor.execute(
+                f"SELECT COALESCE(SUM(CHANGED_ROWS), 0) FROM {FQ}.ETL_STREAM_RUNS").fetchone()[0] if gate else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=48, help="scheduled runs (SCHEDULE = '1 hour')")
+    parser.add_argument("--change-rate", type=float, default=0.15, help="chance ORDERS changes before a tick")
+    parser.add_argument("--rows", type=int, default=50_000, help="customers (orders are 4x)")
+    parser.add_argument("--batch", type=int, default=500, help="orders inserted per change")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="gating_bench_"))  # the agent dumps task_graph_state.json
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    results = [run_mode(False, args), run_mode(True, args)]
+    sys.stdout = stdout
+
+    random.seed(args.seed)
+    changes = sum(random.random() < args.change_rate for _ in range(args.ticks))
+    print(f"\n🧪 {args.ticks} hourly ticks, ORDERS changed before {changes} of them "
+          f"({args.batch} rows each), {args.rows * 4} orders\n")
+    print(pd.DataFrame([{k: v for k, v in r.items() if k != "outputs"} for r in results]).to_markdown(index=False))
+    print(f"\nFinal table identical after every tick: {results[0]['outputs'] == results[1]['outputs']}")
@@ -0,0 +1,119 @@
+# benchmarks/trace_replay.py
+"""
+Records the scripted pipeline conversation (benchmarks.pipeline) against the DuckDB stand-in
+and a replaying LLM with --llm-latency per call, then replays the trace offline through
+core.trace_replay — no stand-in, no LLM rules:
+- recorded latency:  same routing and outputs, in about the recorded time
+- zero latency:      same routing and outputs, without the LLM and query waits
+- code change:       the staging optimizer switched off; the diff shows the outputs it changes
+- tool calls:        recorded again with structured-output prompts answered by tool calls (empty
+                     content, as function-calling providers reply), then replayed at zero latency
+Reports turns, routing and output regressions, misses and wall time per mode.
+
+Run: python -m benchmarks.trace_replay [--llm-latency 0.3] [--rows 1000]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from benchmarks.pipeline import build_catalog, scripted_llm  # sets the benchmark env first
+
+import pandas as pd
+
+import agents.sql_task_graph_agent as sql_task_graph_agent
+import utils.trace_recorder as trace_recorder
+from core.langgraph_runner import build_etl_graph
+from core.state_schema import get_initial_state
+from core.trace_replay import replay_trace, summarize
+from core.turn_service import run_turn
+from utils.duckdb_backend import SnowflakeStandIn
+from utils.llm_provider import set_llm
+from utils.snowflake_utils import set_connection_factory
+
+REPLIES = ["Summarise customers, orders and revenue by region from CUSTOMERS and ORDERS"] + ["yes"] * 7
+STRUCTURED_PROMPTS = ("Extract the following from the business requirement", "Write ONE enterprise-grade, SOP-compliant")
+
+
+def tool_call_llm(llm_latency: float):
+    """scripted_llm, but the prompts agents send through with_structured_output are answered with a tool call."""
+    llm = scripted_llm(llm_latency)
+    llm.rules = [(pattern, {"response": "", "tool_calls": [{"name": "structured_output", "args": json.loads(response),
+                                                             "id": f"call_{i}"}]})
+                 if pattern in STRUCTURED_PROMPTS else (pattern, response)
+                 for i, (pattern, response) in enumerate(llm.rules)]
+    return llm
+
+
+def record(directory: str, rows: int, llm_latency: float, tool_calls: bool = False) -> tuple:
+    """Runs REPLIES with TRACE_RECORDING on; returns (seconds, final workflow_status)."""
+    standin = SnowflakeStandIn()
+    build_catalog(standin, 100, 10, rows)
+    set_connection_factory(standin.connect)
+    set_llm(tool_call_llm(llm_latency) if tool_calls else scripted_llm(llm_latency))
+    trace_recorder.TRACE_RECORDING = True
+    trace_recorder._recorder = trace_recorder.TraceRecorder(directory)
+
+    graph = build_etl_graph()
+    state = get_initial_state("", {"session_id": "bench"})
+    started = time.perf_counter()
+    try:
+        for reply in REPLIES:
+            state = run_turn(graph, state, reply, project="")
+            if state.get("workflow_status") == "completed":
+                break
+    finally:
+        trace_recorder.TRACE_RECORDING = False
+        trace_recorder._recorder = None
+        set_connection_factory(None)
+        set_llm(None)
+    return time.perf_counter() - started, state.get("workflow_status")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="simulated seconds per LLM call while recording")
+    parser.add_argument("--rows", type=int, default=1000, help="rows in CUSTOMERS (ORDERS gets 4x)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="trace_bench_")
+    os.chdir(directory)  # agents drop state snapshots in the working directory
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    recorded_s, status = record(directory, args.rows, args.llm_latency)
+    turns = trace_recorder.load_trace(os.path.join(directory, "trace_bench.jsonl"))
+
+    rows = [{"mode": "recording", "turns": len(turns), "route_regressions": "-", "output_regressions": "-",
+             "misses": "-", "errors": "-", "wall_s": round(recorded_s, 2)}]
+    for mode, latency in (("replay, recorded latency", "recorded"), ("replay, zero latency", "zero")):
+        summary = summarize(replay_trace(turns, latency))
+        rows.append({"mode": mode, **{k: v for k, v in summary.items() if k not in ("recorded_s", "replay_s")},
+                     "wall_s": summary["replay_s"]})
+
+    sql_task_graph_agent.STAGING_OPTIMIZER = False
+    changed = replay_trace(turns, "zero")
+    sql_task_graph_agent.STAGING_OPTIMIZER = True
+    summary = summarize(changed)
+    rows.append({"mode": "replay, staging optimizer off", **{k: v for k, v in summary.items()
+                                                          if k not in ("recorded_s", "replay_s")},
+                 "wall_s": summary["replay_s"]})
+
+    tool_directory = tempfile.mkdtemp(prefix="trace_bench_tools_")
+    os.chdir(tool_directory)  # fresh local stores, as for the first recording
+    tool_s, tool_status = record(tool_directory, args.rows, args.llm_latency, tool_calls=True)
+    tool_turns = trace_recorder.load_trace(os.path.join(tool_directory, "trace_bench.jsonl"))
+    summary = summarize(replay_trace(tool_turns, "zero"))
+    rows.append({"mode": f"tool calls ({tool_status}), zero latency",
+                 **{k: v for k, v in summary.items() if k not in ("recorded_s", "replay_s")}, "wall_s": summary["replay_s"]})
+    sys.stdout = stdout
+
+    print(f"\n🧪 Pipeline conversation ({status}) recorded with {args.llm_latency}s per LLM call, "
+          f"{sum(len(t['llm']) for t in turns)} LLM calls and {sum(len(t['queries']) for t in turns)} queries\n")
+    print(pd.DataFrame(rows).to_markdown(index=False))
+    print("\nOutputs changed by the staging optimizer switch:")
+    for r in changed:
+        if r["changed_keys"] or not r["same_route"]:
+            print(f"- turn {r['turn']}: {', '.join(r['changed_keys'])}" + ("" if r["same_route"] else " (routing changed)"))
@@ -0,0 +1,169 @@
+# core/batch_runner.py
+"""
+Headless batch mode: drives build_etl_graph() through every spec of a manifest, answering
+each confirmation gate from the spec instead of a person.
+
+Manifest (YAML list, or a mapping with a `jobs` list; or JSONL, one spec per line):
+
+    - id: customer_revenue
+      requirement: Summarise customers, orders and revenue by region from CUSTOMERS and ORDERS
+      answers: {sql_executor_agent: run}   # reply for a specific waiting agent
+      replies: [yes, yes]                  # replies used in order for any other gate
+      default_reply: yes                   # once `replies` runs out (default: yes)
+      max_turns: 12
+      state: {selected_database: SALES}    # extra initial state fields
+
+All jobs run in one process on a bounded thread pool, so they share the Snowflake query
+job manager, result cache, plan library and LLM rate limiter; LLM calls queue at "batch"
+priority behind interactive sessions. Per-job results go to <out>/<id>.json, a summary
+to <out>/summary.jsonl.
+
+Run: python -m core.batch_runner manifest.yaml [--out batch_results] [--concurrency 4]
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List
+
+import yaml
+import pandas as pd
+
+from core.state_schema import get_initial_state, json_default
+from core.langgraph_runner import build_etl_graph
+from core.turn_service import run_turn
+from agents.sql_executor_agent import drop_preview_clones
+from utils.rate_limiter import llm_priority
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_TURNS = int(os.getenv("BATCH_MAX_TURNS", "12"))
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            specs = [json.loads(line) for line in f if line.strip()]
+        else:
+            specs = yaml.safe_load(f) or []
+    if isinstance(specs, dict):
+        specs = specs.get("jobs", [])
+
+    seen = set()
+    for i, spec in enumerate(specs):
+        if not spec.get("requirement"):
+            raise ValueError(f"❌ Manifest entry {i} has no requirement")
+        spec.setdefault("id", f"job_{i:04d}")
+        if spec["id"] in seen:
+            raise ValueError(f"❌ Duplicate job id in manifest: {spec['id']}")
+        seen.add(spec["id"])
+    return specs
+
+
+def next_reply(state: Dict[str, Any], spec: Dict[str, Any], replies: List[str]) -> str:
+    """The pre-answered reply for whichever gate the graph paused at."""
+    answers = spec.get("answers") or {}
+    waiting_on = state.get("waiting_on")
+    if waiting_on in answers:
+        return str(answers[waiting_on])
+    if replies:
+        return str(replies.pop(0))
+    return str(spec.get("default_reply", "yes"))
+
+
+def run_job(graph, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """One spec through the graph: the requirement, then replies until completion, an error or max_turns."""
+    state = get_initial_state("", {"session_id": f"batch-{spec['id']}", **(spec.get("state") or {})})
+    replies = list(spec.get("replies") or [])
+    max_turns = int(spec.get("max_turns", BATCH_MAX_TURNS))
+    turns, status, error = [], "max_turns", None
+    started = time.perf_counter()
+
+    with llm_priority("batch"):
+        text = spec["requirement"]
+        for _ in range(max_turns):
+            mark = time.perf_counter()
+            seen = state["chatbot_messages"].total
+            try:
+                state = run_turn(graph, state, text)
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {e}"
+                break
+            turns.append({"reply": text, "waiting_on": state.get("waiting_on"),
+                          "elapsed_s": round(time.perf_counter() - mark, 3)})
+
+            if state.get("workflow_status") == "completed":
+                status = "completed"
+                break
+            if state.get("error"):
+                status, error = "failed", str(state["error"])
+                break
+            # Only the user message was added — the graph is not asking for anything we can answer
+            if state["chatbot_messages"].total - seen <= 1:
+                status = "stalled"
+                break
+            text = next_reply(state, spec, replies)
+
+    # The session ends with the job, however it ended
+    drop_preview_clones(state)
+    sop_sql = state.get("sop_sql") or {}
+    return {
+        "id": spec["id"],
+        "status": status,
+        "error": error,
+        "turns": len(turns),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "turn_timings": turns,
+        "output_table": state.get("output_table_name"),
+        "refined_sql": sop_sql.get("refined_sql") if isinstance(sop_sql, dict) else None,
+        "sql_result": state.get("sql_result"),
+        "task_sqls": state.get("task_sqls"),
+        "execution_result": state.get("execution_result"),
+        "messages": [m.to_dict() if hasattr(m, "to_dict") else m for m in state["chatbot_messages"]],
+    }
+
+
+def run_batch(specs: List[Dict[str, Any]], out_dir: str, concurrency: int = BATCH_CONCURRENCY) -> List[Dict[str, Any]]:
+    os.makedirs(out_dir, exist_ok=True)
+    graph = build_etl_graph()
+    summary = []
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        futures = {pool.submit(run_job, graph, spec): spec for spec in specs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": futures[future]["id"], "status": "failed", "error": f"{type(e).__name__}: {e}",
+                          "turns": 0, "elapsed_s": 0.0, "output_table": None}
+            with open(os.path.join(out_dir, f"{result['id']}.json"), "w") as f:
+                json.dump(result, f, indent=2, default=json_default)
+            row = {k: result[k] for k in ("id", "status", "turns", "elapsed_s", "output_table", "error")}
+            summary.append(row)
+            print(f"{'✅' if result['status'] == 'completed' else '⚠️'} {result['id']}: {result['status']} "
+                  f"in {result['turns']} turns, {result['elapsed_s']:.1f}s")
+
+    with open(os.path.join(out_dir, "summary.jsonl"), "w") as f:
+        for row in sorted(summary, key=lambda r: r["id"]):
+            f.write(json.dumps(row) + "\n")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a manifest of ETL specs through the graph without the UI")
+    parser.add_argument("manifest", help="YAML or JSONL manifest of specs")
+    parser.add_argument("--out", default="batch_results", help="directory for per-job results and summary.jsonl")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--only", help="comma-separated job ids to run")
+    args = parser.parse_args()
+
+    specs = load_manifest(args.manifest)
+    if args.only:
+        wanted = set(args.only.split(","))
+        specs = [s for s in specs if s["id"] in wanted]
+
+    started = time.perf_counter()
+    summary = run_batch(specs, args.out, args.concurrency)
+    print(f"\n🧾 {len(summary)} jobs in {time.perf_counter() - started:.1f}s\n")
+    print(pd.DataFrame(sorted(summary, key=lambda r: r["id"])).drop(columns=["error"]).to_markdown(index=False))
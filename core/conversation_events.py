@@ -0,0 +1,60 @@
+# core/conversation_events.py
+
+from typing import Dict, Any, Optional
+from core.state_schema import ChatLog
+
+# Per-agent cursors live in state["conversation_cursors"]:
+# { agent_name: {"seen": <last consumed message seq>, "prompted": bool, "answered": bool} }
+# state["waiting_on"] names the agent that is paused until the user sends a new message.
+
+
+def ensure_chat_log(state: Dict[str, Any]) -> ChatLog:
+    """Upgrades a plain-list chatbot_messages (older sessions, snapshots) to a ChatLog."""
+    messages = state.get("chatbot_messages")
+    if not isinstance(messages, ChatLog):
+        messages = ChatLog(messages or [])
+        state["chatbot_messages"] = messages
+    return messages
+
+
+def get_cursor(state: Dict[str, Any], agent: str) -> Dict[str, Any]:
+    cursors = state.setdefault("conversation_cursors", {})
+    return cursors.setdefault(agent, {"seen": 0, "prompted": False, "answered": False})
+
+
+def is_prompted(state: Dict[str, Any], agent: str) -> bool:
+    return get_cursor(state, agent)["prompted"]
+
+
+def mark_prompted(state: Dict[str, Any], agent: str, wait: bool = True):
+    """
+    Records that `agent`'s question is on screen. Only user messages sent after this
+    point count as answers. With `wait`, the planner pauses the turn until one arrives.
+    """
+    cursor = get_cursor(state, agent)
+    if not cursor["prompted"]:
+        cursor["prompted"] = True
+        cursor["answered"] = False
+        cursor["seen"] = ensure_chat_log(state).total
+    if wait:
+        state["waiting_on"] = agent
+
+
+def mark_answered(state: Dict[str, Any], agent: str):
+    get_cursor(state, agent)["answered"] = True
+    if state.get("waiting_on") == agent:
+        state["waiting_on"] = None
+
+
+def has_new_user_reply(state: Dict[str, Any], agent: str) -> bool:
+    return ensure_chat_log(state).last_user_seq > get_cursor(state, agent)["seen"]
+
+
+def take_user_reply(state: Dict[str, Any], agent: str) -> Optional[str]:
+    """Returns the latest user message not yet consumed by `agent` (and consumes it), else None."""
+    log = ensure_chat_log(state)
+    cursor = get_cursor(state, agent)
+    if log.last_user_seq <= cursor["seen"]:
+        return None
+    cursor["seen"] = log.last_user_seq
+    return log.last_user_text
@@ -4,18 +4,31 @@ from agents.planner_agent import planner_router
 from agents.input_understanding_agent import InputUnderstandingAgent
 from agents.user_confirmation_agent import UserConfirmationAgent
 from agents.metadata_fetcher_agent import MetadataFetcherAgent
+from agents.plan_reuse_agent import PlanReuseAgent
 from agents.post_metadata_confirmation_agent import PostMetadataConfirmationAgent
 from agents.sample_loader_agent import SampleLoaderAgent
 from agents.post_sample_confirmation_agent import PostSampleConfirmationAgent
 # from agents.refined_prompt_builder_agent import RefinedPromptBuilderAgent
 from agents.sql_logic_builder_agent import SQLLogicBuilderAgent
 from agents.sop_validator_agent import SOPValidatorAgent
-from agents.sql_executor_agent import SQLExecutorAgent
+from agents.sql_executor_agent import SQLExecutorAgent, drop_preview_clones
 from agents.cte_extractor_agent import CTEExtractorAgent
 from agents.sql_task_graph_agent import SQLTaskGraphAgentInvoke
+from utils.plan_library import get_library, save_plan
 
 def workflow_complete_agent(state: StateSchema) -> StateSchema:
     state["workflow_status"] = "completed"
+
+    # 🧹 Preview clones are only for iterating on the SQL; the task graph reads the real tables
+    drop_preview_clones(state)
+
+    # 📚 Remember the finished plan so similar requests can skip the LLM steps
+    if (state.get("plan_reuse") or {}).get("status") != "hit":
+        try:
+            save_plan(get_library(), state)
+        except Exception as e:
+            print(f"⚠️ Could not save plan: {e}")
+
     state["chatbot_messages"].append({
         "sender": "assistant",
         "text": "✅ Workflow completed successfully!"
@@ -32,6 +45,7 @@ def build_etl_graph():
     # 🧠 All other agents
     builder.add_node("user_confirmation_agent", UserConfirmationAgent())
     builder.add_node("metadata_fetcher_agent", MetadataFetcherAgent())
+    builder.add_node("plan_reuse_agent", PlanReuseAgent())
     builder.add_node("post_metadata_confirmation_agent", PostMetadataConfirmationAgent())
     builder.add_node("sample_loader_agent", SampleLoaderAgent())
     builder.add_node("post_sample_confirmation_agent", PostSampleConfirmationAgent())
@@ -48,6 +62,7 @@ def build_etl_graph():
     conditional_agents = [
         "user_confirmation_agent",
         "metadata_fetcher_agent",
+        "plan_reuse_agent",
         "post_metadata_confirmation_agent",
         "sample_loader_agent",
         "post_sample_confirmation_agent",
@@ -62,6 +77,7 @@ def build_etl_graph():
     all_agents = {
         agent_name: agent_name for agent_name in conditional_agents + ["workflow_complete_agent"]
     }
+    all_agents[END] = END  # ⏸️ Planner pauses here while an agent waits for the user
 
     for agent_name in conditional_agents:
         builder.add_conditional_edges(agent_name, planner_router, all_agents)
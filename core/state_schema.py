@@ -1,13 +1,130 @@
 # core/state_schema.py
 
-from typing import Dict, Any, Optional
+import os
+from typing import Dict, Any, Optional, Iterable
 from datetime import datetime
 
 StateSchema = Dict[str, Any]
 
+# Older messages are dropped once the chat log grows past this many entries
+MAX_CHAT_MESSAGES = int(os.getenv("MAX_CHAT_MESSAGES", "200"))
+
+
+class ChatMessage:
+    """
+    One chat entry. Slot-based instead of a dict, but still readable as m["text"] / m.get("sender").
+    Tables (sample records, result previews) are not embedded in `text` — `attachment` holds
+    a reference into utils.artifact_store instead.
+    """
+    __slots__ = ("sender", "text", "attachment")
+
+    def __init__(self, sender: str, text: str, attachment: Optional[str] = None):
+        self.sender = sender
+        self.text = text
+        self.attachment = attachment
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"sender": self.sender, "text": self.text}
+        if self.attachment:
+            data["attachment"] = self.attachment
+        return data
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, dict):
+            other = as_message(other)
+        return isinstance(other, ChatMessage) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"ChatMessage({self.to_dict()!r})"
+
+
+def as_message(message) -> ChatMessage:
+    if isinstance(message, ChatMessage):
+        return message
+    return ChatMessage(message["sender"], message["text"], message.get("attachment"))
+
+
+class ChatLog(list):
+    """
+    `chatbot_messages` container: converts appended dicts to ChatMessage and keeps
+    only the newest `max_messages` entries so long sessions stay bounded.
+
+    It also acts as the conversation event log: every append gets an absolute sequence
+    number (`total`) and the latest user message is tracked, so agents can check for new
+    replies in O(1) via core.conversation_events instead of rescanning the list.
+    """
+    __slots__ = ("max_messages", "total", "last_user_seq", "last_user_text")
+
+    def __init__(self, messages: Iterable = (), max_messages: int = MAX_CHAT_MESSAGES):
+        super().__init__()
+        self.max_messages = max_messages
+        self.total = 0
+        self.last_user_seq = 0
+        self.last_user_text = None
+        self.extend(messages)
+
+    def append(self, message):
+        message = as_message(message)
+        super().append(message)
+        self._record(message)
+        self._trim()
+
+    def extend(self, messages: Iterable):
+        for message in messages:
+            message = as_message(message)
+            super().append(message)
+            self._record(message)
+        self._trim()
+
+    def _record(self, message: ChatMessage):
+        self.total += 1
+        if message.sender == "user":
+            self.last_user_seq = self.total
+            self.last_user_text = message.text
+
+    def _trim(self):
+        overflow = len(self) - self.max_messages
+        if overflow > 0:
+            del self[:overflow]
+
+    def __reduce__(self):
+        # Pickled with its counters (the state crosses process boundaries in core.turn_service)
+        return _restore_chat_log, (list(self), self.max_messages, self.total, self.last_user_seq, self.last_user_text)
+
+
+def _restore_chat_log(messages, max_messages, total, last_user_seq, last_user_text) -> ChatLog:
+    log = ChatLog(messages, max_messages=max_messages)
+    log.total, log.last_user_seq, log.last_user_text = total, last_user_seq, last_user_text
+    return log
+
+
+def json_default(value):
+    """`default=` hook for json.dump of a state that contains ChatMessage entries."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return str(value)
+
+
 def get_initial_state(raw_prompt: str, extra_fields: Optional[Dict[str, Any]] = None) -> StateSchema:
     base_state = {
-        "chatbot_messages": [],
+        "chatbot_messages": ChatLog(),
         "raw_prompt": raw_prompt,
         "input_mode": "chat",
         "workflow_status": "in_progress",
@@ -23,6 +140,7 @@ def get_initial_state(raw_prompt: str, extra_fields: Optional[Dict[str, Any]] =
         "task_schedule": None,
         "task_sql": None,
         # ✅ Removed raw_metadata & standardized_metadata here
+        # ✅ sample_records / sql_result["preview_ref"] hold artifact_store references, not rows
     }
 
     if extra_fields:
@@ -0,0 +1,300 @@
+# core/trace_replay.py
+"""
+Offline replay of sessions recorded with TRACE_RECORDING=true (utils/trace_recorder.py).
+
+Each recorded turn is re-run through build_etl_graph() with the LLM and Snowflake replaced by
+the trace: prompts are answered from the recorded responses (ReplayLLM), statements from the
+recorded query / result pairs. Latency is the recorded one (--latency recorded) or none
+(--latency zero, the default). The replayed session then is diffed against the recording,
+turn by turn: nodes visited (routing), the state keys whose values changed (outputs), LLM
+calls and queries, prompts and statements the trace has no answer for (misses), and time.
+
+- session (default): turn 0's recorded state, then each recorded reply in order — a change that
+  alters turn 2 carries into turn 3, like a real session
+- --isolated: every turn starts from its own recorded input state, to localize a regression
+
+A miss does not stop the replay: the LLM answers "" and a statement returns no rows (or raises
+with --strict), and the count shows up in the report. Statements get their recorded query ids.
+Artifact references and timings are masked before states are compared. The replay runs in a
+scratch working directory (--workdir), so local stores such as the result cache start empty
+instead of answering from the recording machine's runs.
+
+Run: python -m core.trace_replay state_logs/traces/trace_<session>.jsonl [--latency zero|recorded]
+                                 [--isolated] [--strict] [--workdir DIR] [--json diff.json]
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+import itertools
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+from snowflake.connector.connection import SnowflakeConnection
+from snowflake.connector.constants import QueryStatus
+
+from core.langgraph_runner import build_etl_graph
+from core.turn_service import run_turn
+from utils.fake_llm import ReplayLLM
+from utils.llm_provider import set_llm
+from utils.snowflake_utils import connection_backend, set_connection_factory
+from utils.trace_recorder import TraceCallbackHandler, decode, encode, load_trace, query_key
+
+# Keys (at any depth) and text that differ between any two runs of the same turn
+VOLATILE_KEYS = {"final_timestamp", "elapsed_ms", "elapsed_s"}
+_MASKS = [(re.compile(r"\btbl_[0-9a-f]{12}\b"), "tbl_*"),  # utils.artifact_store references
+          (re.compile(r"\b\d+(?:\.\d+)?\s?(?:ms|s)\b"), "<time>")]
+
+
+# --- Snowflake stand-in answering from the trace ---
+
+class ReplayBackend:
+    """
+    Answers statements from a trace. Results are looked up by query_key() in the current turn
+    first (in recorded order, so a statement run twice gets its two results), then in any turn
+    (last result seen).
+    """
+
+    def __init__(self, turns: List[Dict[str, Any]], use_recorded_latency: bool = False, strict: bool = False):
+        self.use_recorded_latency = use_recorded_latency
+        self.strict = strict
+        self.by_turn: List[Dict[str, deque]] = []
+        self.anywhere: Dict[str, Dict[str, Any]] = {}
+        for turn in turns:
+            queue = defaultdict(deque)
+            for query in turn.get("queries", []):
+                key = query_key(query["sql"], decode(query.get("params")))
+                queue[key].append(query)
+                self.anywhere[key] = query
+            self.by_turn.append(queue)
+        self.turn = 0
+        self.queries = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def begin_turn(self, index: int):
+        self.turn = index
+
+    def connect(self) -> "ReplayConnection":
+        return ReplayConnection(self)
+
+    def lookup(self, sql: str, params=None) -> Optional[Dict[str, Any]]:
+        key = query_key(sql, params)
+        with self._lock:
+            self.queries += 1
+            queue = self.by_turn[self.turn].get(key) if self.turn < len(self.by_turn) else None
+            query = queue.popleft() if queue else self.anywhere.get(key)
+            if query is None:
+                self.misses += 1
+        if query is None:
+            print(f"⚠️ Replay: no recorded result for {' '.join(sql.split())[:120]}")
+            if self.strict:
+                raise RuntimeError("Statement not in the trace (replay --strict)")
+        elif self.use_recorded_latency and query.get("latency_s"):
+            time.sleep(query["latency_s"])
+        return query
+
+    def new_query_id(self) -> str:
+        return f"replay-{next(self._ids):08d}"
+
+
+class ReplayConnection:
+    def __init__(self, backend: ReplayBackend):
+        self.backend = backend
+        self.queries: Dict[str, Optional[Dict[str, Any]]] = {}  # execute_async sfqid → recorded result
+
+    def cursor(self) -> "ReplayCursor":
+        return ReplayCursor(self)
+
+    def get_query_status(self, sfqid: str) -> QueryStatus:
+        query = self.queries.get(sfqid)
+        return QueryStatus.FAILED_WITH_ERROR if query and query.get("error") else QueryStatus.SUCCESS
+
+    def get_query_status_throw_if_error(self, sfqid: str) -> QueryStatus:
+        status = self.get_query_status(sfqid)
+        if self.is_an_error(status):
+            raise RuntimeError(self.queries[sfqid]["error"])
+        return status
+
+    is_still_running = staticmethod(SnowflakeConnection.is_still_running)
+    is_an_error = staticmethod(SnowflakeConnection.is_an_error)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplayCursor:
+    def __init__(self, connection: ReplayConnection):
+        self.connection = connection
+        self._rows: List[tuple] = []
+        self.description = None
+        self.rowcount = -1
+        self.sfqid = None
+
+    def execute(self, sql: str, params=None, *args, **kwargs):
+        query = self.connection.backend.lookup(sql, params)
+        self.sfqid = (query or {}).get("sfqid") or self.connection.backend.new_query_id()
+        self._load(query)
+        return self
+
+    def execute_async(self, sql: str, params=None, *args, **kwargs) -> Dict[str, Any]:
+        query = self.connection.backend.lookup(sql, params)
+        self.sfqid = (query or {}).get("sfqid") or self.connection.backend.new_query_id()
+        self.connection.queries[self.sfqid] = query
+        return {"queryId": self.sfqid}
+
+    def get_results_from_sfqid(self, sfqid: str):
+        self.sfqid = sfqid
+        self._load(self.connection.queries.get(sfqid))
+
+    def _load(self, query: Optional[Dict[str, Any]]):
+        if query and query.get("error"):
+            raise RuntimeError(query["error"])
+        query = query or {}
+        self.description = [(c, None, None, None, None, None, None) for c in query.get("columns", [])] or None
+        self._rows = [tuple(r) for r in decode(query.get("rows", []))]
+        self.rowcount = query.get("rowcount", len(self._rows))
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int = 1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+# --- Diff ---
+
+def _comparable(value):
+    if isinstance(value, dict):
+        return {k: _comparable(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_comparable(v) for v in value]
+    if isinstance(value, str):
+        for pattern, mask in _MASKS:
+            value = pattern.sub(mask, value)
+    return value
+
+
+def changed_keys(recorded: Optional[Dict[str, Any]], replayed: Optional[Dict[str, Any]]) -> List[str]:
+    """State keys whose (encoded, masked) values differ."""
+    recorded, replayed = _comparable(recorded or {}), _comparable(encode(replayed or {}))
+    return sorted(k for k in set(recorded) | set(replayed) if recorded.get(k) != replayed.get(k))
+
+
+# --- Replay ---
+
+def replay_trace(turns: List[Dict[str, Any]], latency: str = "zero", isolated: bool = False,
+                 strict: bool = False, graph=None, workdir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Replays recorded turns; returns one comparison row per turn (see module docstring).
+    workdir: working directory during the replay, a new scratch directory by default.
+    """
+    recorded_latency = latency == "recorded"
+    backend = ReplayBackend(turns, use_recorded_latency=recorded_latency, strict=strict)
+    llm = ReplayLLM(use_recorded_latency=recorded_latency)
+    every_call = {call["prompt_key"]: call for turn in turns for call in turn.get("llm", []) if not call.get("error")}
+    previous_backend, previous_dir = connection_backend(), os.getcwd()
+    set_connection_factory(backend.connect)
+    set_llm(llm)
+    os.chdir(workdir or tempfile.mkdtemp(prefix="trace_replay_"))
+
+    graph = graph or build_etl_graph()
+    state = decode(turns[0]["state_in"]) if turns else None
+    results = []
+    try:
+        for index, turn in enumerate(turns):
+            if isolated or index == 0:
+                state = decode(turn["state_in"])
+            backend.begin_turn(index)
+            # This turn's responses win over the same prompt answered differently in another turn
+            llm.recordings = {**every_call, **{c["prompt_key"]: c for c in turn.get("llm", []) if not c.get("error")}}
+            handler = TraceCallbackHandler()
+            calls, misses, queries, query_misses = llm.calls, llm.misses, backend.queries, backend.misses
+
+            started, error = time.perf_counter(), None
+            try:
+                state = run_turn(graph, state, turn["user_text"], project="", callbacks=[handler])
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+
+            changed = changed_keys(turn.get("state_out"), state) if error is None else []
+            results.append({
+                "turn": turn["turn"],
+                "reply": turn["user_text"][:40],
+                "same_route": handler.route == turn.get("route", []),
+                "route": " → ".join(handler.route),
+                "recorded_route": " → ".join(turn.get("route", [])),
+                "changed_keys": changed,
+                "llm_calls": f"{len(turn.get('llm', []))} → {llm.calls - calls}",
+                "llm_misses": llm.misses - misses,
+                "queries": f"{len(turn.get('queries', []))} → {backend.queries - queries}",
+                "query_misses": backend.misses - query_misses,
+                "recorded_s": turn.get("elapsed_s"),
+                "replay_s": round(elapsed, 3),
+                "error": error or ("" if not turn.get("error") else f"recorded: {turn['error']}"),
+            })
+            if error and not isolated:
+                break
+    finally:
+        os.chdir(previous_dir)
+        set_connection_factory(previous_backend)
+        set_llm(None)
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "turns": len(results),
+        "route_regressions": sum(not r["same_route"] for r in results),
+        "output_regressions": sum(bool(r["changed_keys"]) for r in results),
+        "misses": sum(r["llm_misses"] + r["query_misses"] for r in results),
+        "errors": sum(bool(r["error"]) and not r["error"].startswith("recorded") for r in results),
+        "recorded_s": round(sum(r["recorded_s"] or 0 for r in results), 3),
+        "replay_s": round(sum(r["replay_s"] for r in results), 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the graph and diff it")
+    parser.add_argument("trace", help="trace_<session>.jsonl written with TRACE_RECORDING=true")
+    parser.add_argument("--latency", choices=["zero", "recorded"], default="zero")
+    parser.add_argument("--isolated", action="store_true", help="start every turn from its recorded input state")
+    parser.add_argument("--strict", action="store_true", help="fail a statement the trace has no result for")
+    parser.add_argument("--workdir", help="working directory for the replay (default: a new scratch directory)")
+    parser.add_argument("--json", help="write the per-turn comparison to this file")
+    args = parser.parse_args()
+
+    results = replay_trace(load_trace(args.trace), args.latency, args.isolated, args.strict, workdir=args.workdir)
+    table = pd.DataFrame([{**r, "changed_keys": ", ".join(r["changed_keys"]) or "-"} for r in results])
+    print(f"\n🎞️ Replay of {args.trace} ({args.latency} latency{', isolated turns' if args.isolated else ''})\n")
+    print(table.drop(columns=["route", "recorded_route"]).to_markdown(index=False))
+    for r in results:
+        if not r["same_route"]:
+            print(f"\n🔀 Turn {r['turn']} routing changed:\n  recorded: {r['recorded_route']}\n  replayed: {r['route']}")
+    print(f"\n{summarize(results)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📄 Comparison written to {args.json}")
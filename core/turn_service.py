@@ -0,0 +1,337 @@
+# core/turn_service.py
+
+import os
+import copy
+import time
+import contextlib
+import uuid
+import zlib
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+from dotenv import load_dotenv
+
+from core.state_schema import StateSchema
+from utils.callbacks import enable_langsmith
+from utils.trace_recorder import get_trace_recorder
+
+load_dotenv()
+
+# 0 = no service: run.py invokes the graph inside the Streamlit script, as before
+TURN_WORKERS = int(os.getenv("TURN_WORKERS", "0"))
+TURN_WORKER_MODE = os.getenv("TURN_WORKER_MODE", "process")  # process | thread
+TURN_WORKER_THREADS = int(os.getenv("TURN_WORKER_THREADS", "4"))  # turns one worker runs at once
+TURN_START_METHOD = os.getenv("TURN_START_METHOD", "spawn")  # workers use threads (job poller, DuckDB) — no fork
+TURN_PROGRESS_INTERVAL_S = float(os.getenv("TURN_PROGRESS_INTERVAL_S", "0.5"))
+TURN_RECURSION_LIMIT = int(os.getenv("TURN_RECURSION_LIMIT", "20"))
+TURN_TRACE_PROJECT = os.getenv("TURN_TRACE_PROJECT", "Enterprise ETL Studio")  # empty: no LangSmith tracing
+
+
+def run_turn(graph, state: StateSchema, user_text: str, project: str = TURN_TRACE_PROJECT,
+             callbacks: Optional[list] = None) -> StateSchema:
+    """
+    One user turn: records the message and runs the graph until it pauses or completes.
+    With TRACE_RECORDING=true the turn is also written to a replayable trace (utils/trace_recorder.py).
+    """
+    recorder = get_trace_recorder()
+    if recorder is None:
+        return _run_turn(graph, state, user_text, project, callbacks)
+
+    turn = recorder.start_turn(state.get("session_id") or "local", state, user_text)
+    try:
+        state = _run_turn(graph, state, user_text, project, [*(callbacks or []), turn["handler"]])
+    except Exception as e:
+        recorder.finish_turn(turn, None, f"{type(e).__name__}: {e}")
+        raise
+    recorder.finish_turn(turn, state)
+    return state
+
+
+def _run_turn(graph, state: StateSchema, user_text: str, project: str, callbacks: Optional[list]) -> StateSchema:
+    from utils.artifact_store import touch_owner
+
+    # The session is alive: its pinned artifacts (sample records) stay in the store
+    touch_owner(state.get("session_id") or "local")
+    state["chatbot_messages"].append({"sender": "user", "text": user_text})
+
+    # Only set raw_prompt on first input
+    if not state.get("raw_prompt"):
+        state["raw_prompt"] = user_text
+
+    with enable_langsmith(project) if project else contextlib.nullcontext():
+        state = graph.invoke(
+            state,
+            config={
+                "recursion_limit": TURN_RECURSION_LIMIT,
+                "callbacks": callbacks,
+                "stop_condition": lambda state: (
+                    # Stop if we're waiting for user confirmation
+                    state.get("awaiting_user_confirmation") and not state.get("user_confirmation")
+                    # Stop if there's a pending message
+                    or state.get("pending_confirmation_message") is not None
+                    # Stop if workflow is completed
+                    or state.get("workflow_status") == "completed"
+                    # Stop if we've reached an error state
+                    or state.get("error") is not None
+                    # Stop if we've been through all major steps
+                    or (state.get("metadata_confirmed")
+                        and state.get("sample_confirmed")
+                        and state.get("sql_logic_built")
+                        and state.get("sop_validated"))
+                )
+            }
+        )
+
+    # ✅ Show assistant message from InputUnderstandingAgent, if any
+    if state.get("pending_confirmation_message"):
+        state["chatbot_messages"].append({
+            "sender": "assistant",
+            "text": state["pending_confirmation_message"]
+        })
+        state["awaiting_user_confirmation"] = True
+        state["pending_confirmation_message"] = None
+
+    return state
+
+
+# --- Worker side ---
+
+def _new_attachments(state: StateSchema, seen: int) -> List[str]:
+    """Artifact references attached to chat messages appended after message number `seen`."""
+    messages = state.get("chatbot_messages") or []
+    added = getattr(messages, "total", len(messages)) - seen
+    if added <= 0:
+        return []
+    return [m.get("attachment") for m in messages[max(0, len(messages) - added):] if m.get("attachment")]
+
+
+def _execute_turn(graph, turn: Dict[str, Any], outbox, export: bool):
+    from utils.artifact_store import export_tables
+    from utils.query_jobs import set_progress_callback
+
+    ticket, session_id, state = turn["ticket"], turn["session_id"], turn["state"]
+    outbox.put(("running", ticket, {}))
+
+    last = [0.0]
+
+    def progress(job):
+        now = time.monotonic()
+        if now - last[0] >= TURN_PROGRESS_INTERVAL_S or job.done.is_set():
+            last[0] = now
+            outbox.put(("progress", ticket, job.snapshot()))
+
+    set_progress_callback(session_id, progress)
+    try:
+        messages = state.get("chatbot_messages") or []
+        seen = getattr(messages, "total", len(messages))
+        state = run_turn(graph, state, turn["user_text"])
+        artifacts = export_tables(_new_attachments(state, seen)) if export else {}
+        outbox.put(("done", ticket, {"state": state, "artifacts": artifacts}))
+    except Exception as e:
+        print(f"❌ Turn {ticket} failed: {e}")
+        outbox.put(("failed", ticket, {"error": f"{type(e).__name__}: {e}"}))
+    finally:
+        set_progress_callback(session_id, None)
+
+
+def _worker_main(index: int, inbox, outbox, initializer: Optional[Callable], threads: int, export: bool):
+    """
+    Worker loop: compiles the graph once, then runs turns on a small thread pool so
+    cancel messages are still handled while turns are running.
+    """
+    if initializer:
+        initializer()
+    from core.langgraph_runner import build_etl_graph
+    from utils.query_jobs import get_job_manager
+
+    graph = build_etl_graph()
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"turn-worker-{index}")
+    print(f"🧵 Turn worker {index} ready (pid {os.getpid()})")
+    outbox.put(("ready", None, {"worker": index, "pid": os.getpid()}))
+
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+        kind, payload = message
+        if kind == "turn":
+            pool.submit(_execute_turn, graph, payload, outbox, export)
+        elif kind == "cancel":
+            manager = get_job_manager()
+            if payload.get("job_id"):
+                manager.cancel(payload["job_id"])
+            else:
+                manager.cancel_session(payload["session_id"])
+
+    pool.shutdown(wait=True)
+
+
+# --- App side ---
+
+class TurnBusy(RuntimeError):
+    """A session submitted a turn while its previous turn is still unclaimed; carries that ticket."""
+
+    def __init__(self, ticket: str):
+        super().__init__(f"Turn {ticket} of this session is still running")
+        self.ticket = ticket
+
+
+class TurnService:
+    """
+    Runs build_etl_graph() turns on a pool of workers, outside the Streamlit script.
+    - each session is routed to one worker (crc32 of the session id) so its artifacts,
+      query jobs and warm caches stay in one place
+    - workers are processes (TURN_WORKER_MODE=process) or threads; both talk through queues,
+      so the queue pair is the seam for moving workers to other hosts behind a broker
+    - callers submit() a turn, then poll()/wait() for its ticket; a ticket stays claimable
+      until result() is called, so a Streamlit rerun picks up the turn it started
+    """
+
+    def __init__(self, workers: int = max(TURN_WORKERS, 1), mode: str = TURN_WORKER_MODE,
+                 threads: int = TURN_WORKER_THREADS, initializer: Optional[Callable] = None):
+        self.mode = mode
+        context = multiprocessing.get_context(TURN_START_METHOD) if mode == "process" else None
+        new_queue = context.Queue if context else queue.Queue
+        self._outbox = new_queue()
+        self._inboxes = []
+        self._workers = []
+        for index in range(workers):
+            inbox = new_queue()
+            args = (index, inbox, self._outbox, initializer, threads, mode == "process")
+            if context:
+                worker = context.Process(target=_worker_main, args=args, daemon=True, name=f"turn-worker-{index}")
+            else:
+                worker = threading.Thread(target=_worker_main, args=args, daemon=True, name=f"turn-worker-{index}")
+            worker.start()
+            self._inboxes.append(inbox)
+            self._workers.append(worker)
+
+        self._tickets: Dict[str, Dict[str, Any]] = {}
+        self._ready: Dict[int, int] = {}  # worker index → pid
+        self._lock = threading.Lock()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """True once every worker has compiled its graph (process workers take a few seconds to start)."""
+        deadline = time.monotonic() + timeout if timeout else None
+        while len(self._ready) < len(self._workers):
+            if deadline and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def worker_for(self, session_id: str) -> int:
+        return zlib.crc32(session_id.encode()) % len(self._inboxes)
+
+    def submit(self, session_id: str, state: StateSchema, user_text: str) -> str:
+        """
+        Queues one turn. A session has at most one unclaimed turn: submitting while it is pending
+        raises TurnBusy (with the pending ticket) rather than dropping the new message.
+        Thread workers get a copy of the state, so the caller's state is not mutated mid-turn.
+        """
+        ticket = uuid.uuid4().hex[:12]
+        worker = self.worker_for(session_id)
+        if self.mode != "process":
+            state = copy.deepcopy(state)
+        with self._lock:
+            for pending, record in self._tickets.items():
+                if record["session_id"] == session_id:
+                    raise TurnBusy(pending)
+            self._tickets[ticket] = {
+                "ticket": ticket, "session_id": session_id, "worker": worker, "status": "queued",
+                "submitted": time.monotonic(), "started": None, "finished": None,
+                "progress": None, "state": None, "error": None, "done": threading.Event(),
+            }
+        self._inboxes[worker].put(("turn", {"ticket": ticket, "session_id": session_id,
+                                            "state": state, "user_text": user_text}))
+        return ticket
+
+    def pending(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            for ticket, record in self._tickets.items():
+                if record["session_id"] == session_id:
+                    return ticket
+        return None
+
+    def poll(self, ticket: str) -> Optional[Dict[str, Any]]:
+        return self._tickets.get(ticket)
+
+    def wait(self, ticket: str, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Blocks until the turn finishes (or timeout), calling on_progress(record) when its query progress changes."""
+        record = self._tickets[ticket]
+        deadline = time.monotonic() + timeout if timeout else None
+        shown = None
+        while not record["done"].wait(0.1):
+            if on_progress and record["progress"] is not shown:
+                shown = record["progress"]
+                on_progress(record)
+            if deadline and time.monotonic() > deadline:
+                break
+        return record
+
+    def result(self, ticket: str) -> StateSchema:
+        """The state after a finished turn; the ticket is released. Raises if the turn failed."""
+        with self._lock:
+            record = self._tickets.pop(ticket)
+        if record["status"] == "failed":
+            raise RuntimeError(record["error"])
+        return record["state"]
+
+    def cancel(self, session_id: str, job_id: Optional[str] = None):
+        """Cancels one query job (or all running queries) of the session on its worker."""
+        self._inboxes[self.worker_for(session_id)].put(("cancel", {"session_id": session_id, "job_id": job_id}))
+
+    def active_queries(self, session_id: str) -> List[Dict[str, Any]]:
+        """Latest running-query snapshot of the session's pending turn."""
+        ticket = self.pending(session_id)
+        progress = (self._tickets.get(ticket) or {}).get("progress") if ticket else None
+        return [progress] if progress and progress["status"] in ("queued", "running") else []
+
+    def close(self):
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for worker in self._workers:
+            worker.join(timeout=10)
+
+    def _collect(self):
+        from utils.artifact_store import import_tables
+
+        while True:
+            kind, ticket, payload = self._outbox.get()
+            if kind == "ready":
+                self._ready[payload["worker"]] = payload["pid"]
+                continue
+            record = self._tickets.get(ticket)
+            if record is None:
+                continue
+            if kind == "running":
+                record["status"], record["started"] = "running", time.monotonic()
+            elif kind == "progress":
+                record["progress"] = payload
+            else:
+                if kind == "done":
+                    import_tables(payload["artifacts"], owner=record["session_id"])
+                    record["state"] = payload["state"]
+                else:
+                    record["error"] = payload["error"]
+                record["status"], record["finished"] = kind, time.monotonic()
+                record["done"].set()
+
+
+_service: Optional[TurnService] = None
+_service_lock = threading.Lock()
+
+
+def get_turn_service() -> Optional[TurnService]:
+    """Process-wide TurnService when TURN_WORKERS > 0, else None (turns run inline)."""
+    global _service
+    if TURN_WORKERS <= 0:
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = TurnService()
+        return _service
@@ -4,10 +4,15 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import uuid
 import streamlit as st
 from core.state_schema import get_initial_state
 from core.langgraph_runner import build_etl_graph
-from utils.callbacks import enable_langsmith
+from core.turn_service import get_turn_service, run_turn, TurnBusy
+from utils.artifact_store import get_dataframe
+from utils.task_monitor_ui import render_task_monitor
+from utils.query_jobs import set_progress_callback, session_of, describe_snapshot
+from utils.query_jobs_ui import render_query_jobs, progress_placeholder
 
 # --- Title and layout ---
 st.set_page_config(page_title="Enterprise ETL Studio", layout="wide")
@@ -39,57 +44,75 @@ st.title("AI ETL Orchestrator Studio")
 
 # --- Session state initialization ---
 if "chat_state" not in st.session_state:
-    st.session_state.chat_state = get_initial_state("")
+    st.session_state.chat_state = get_initial_state("", {"session_id": uuid.uuid4().hex})
+
+# --- Task graph monitoring (once a task graph exists) ---
+render_task_monitor(st.session_state.chat_state)
+
+# --- Turns run inline, or on the turn service workers when TURN_WORKERS > 0 ---
+service = get_turn_service()
+session_id = session_of(st.session_state.chat_state)
+
+# --- Queries still running for this session (survive reruns; cancellable) ---
+render_query_jobs(st.session_state.chat_state, service)
 
 # --- Chat history rendering ---
 for msg in st.session_state.chat_state.get("chatbot_messages", []):
-    st.chat_message(msg["sender"]).markdown(msg["text"])
+    with st.chat_message(msg["sender"]):
+        st.markdown(msg["text"])
+        # 📦 Tables are stored once in the artifact store and rendered by reference
+        if msg.get("attachment"):
+            preview = get_dataframe(msg["attachment"])
+            if preview is not None:
+                st.dataframe(preview, hide_index=True)
 
 # --- Chat input ---
-if user_input := st.chat_input("Describe your data transformation goal or type 'yes' to proceed..."):
+def finish_turn(ticket):
+    """Waits for a turn running on the turn service, showing its query progress, then renders the new state."""
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        placeholder.info("⏳ Working...")
+
+    def show_progress(record):
+        if record["progress"]:
+            placeholder.info(f"⏳ {describe_snapshot(record['progress'])}")
+
+    service.wait(ticket, on_progress=show_progress)
+    try:
+        st.session_state.chat_state = service.result(ticket)
+    except RuntimeError as e:
+        st.session_state.chat_state["chatbot_messages"].append({"sender": "assistant", "text": f"❌ {e}"})
+    st.rerun()
+
+
+# A message sent while the previous turn was still running is not run; say so after the rerun
+if st.session_state.get("busy_notice"):
+    st.warning(st.session_state.pop("busy_notice"))
+
+user_input = st.chat_input("Describe your data transformation goal or type 'yes' to proceed...")
+if service and not user_input and service.pending(session_id):
+    # A rerun interrupted the wait — pick the turn up again
+    finish_turn(service.pending(session_id))
+
+if user_input:
     st.chat_message("user").markdown(user_input)
-    st.session_state.chat_state["chatbot_messages"].append({
-        "sender": "user",
-        "text": user_input
-    })
-
-    # Only set raw_prompt on first input
-    if not st.session_state.chat_state.get("raw_prompt"):
-        st.session_state.chat_state["raw_prompt"] = user_input
-
-    # 🧠 Run LangGraph for each user input
-    graph = build_etl_graph()
-    with enable_langsmith("Enterprise ETL Studio"):
-        updated_state = graph.invoke(
-            st.session_state.chat_state,
-            config={
-                "recursion_limit": 20,
-                "stop_condition": lambda state: (
-                    # Stop if we're waiting for user confirmation
-                    state.get("awaiting_user_confirmation") and not state.get("user_confirmation")
-                    # Stop if there's a pending message
-                    or state.get("pending_confirmation_message") is not None
-                    # Stop if workflow is completed
-                    or state.get("workflow_status") == "completed"
-                    # Stop if we've reached an error state
-                    or state.get("error") is not None
-                    # Stop if we've been through all major steps
-                    or (state.get("metadata_confirmed") 
-                        and state.get("sample_confirmed") 
-                        and state.get("sql_logic_built")
-                        and state.get("sop_validated"))
-                )
-            }
-        )
-
-    # ✅ Step 3: Show assistant message from InputUnderstandingAgent, if any
-    if updated_state.get("pending_confirmation_message"):
-        updated_state["chatbot_messages"].append({
-            "sender": "assistant",
-            "text": updated_state["pending_confirmation_message"]
-        })
-        updated_state["awaiting_user_confirmation"] = True
-        updated_state["pending_confirmation_message"] = None
-
-    st.session_state.chat_state = updated_state
 
+    if service:
+        # 🧵 The turn runs on this session's worker; the script only waits for it
+        try:
+            ticket = service.submit(session_id, st.session_state.chat_state, user_input)
+        except TurnBusy as busy:
+            st.session_state["busy_notice"] = (f"⏳ Still working on your previous message — "
+                                               f"\"{user_input}\" was not sent. Send it again once this turn finishes.")
+            ticket = busy.ticket
+        finish_turn(ticket)
+    else:
+        # 🧠 Run LangGraph for each user input
+        graph = build_etl_graph()
+        # ⏳ Elapsed time / rows produced of the running query, shown under the user's message
+        with st.chat_message("assistant"):
+            progress = progress_placeholder(st.session_state.chat_state)
+        st.session_state.chat_state = run_turn(graph, st.session_state.chat_state, user_input)
+        set_progress_callback(session_id, None)
+        progress.empty()
+        st.rerun()
@@ -0,0 +1,163 @@
+# utils/artifact_store.py
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Iterable, List, Optional, Union
+import pandas as pd
+import pyarrow as pa
+
+# Process-wide side store for tabular artifacts (sample records, result previews).
+# State and chat messages keep only the reference string returned by put_table().
+# Tables stored with an owner (a session) are pinned: never evicted while the owner is alive,
+# i.e. until release_owner() or ARTIFACT_PIN_IDLE_S without touch_owner().
+MAX_ARTIFACT_BYTES = int(os.getenv("MAX_ARTIFACT_BYTES", str(256 * 1024 * 1024)))
+ARTIFACT_PIN_IDLE_S = float(os.getenv("ARTIFACT_PIN_IDLE_S", "3600"))
+
+_TABLES: "OrderedDict[str, pa.Table]" = OrderedDict()
+_BYTES = 0
+_OWNERS: Dict[str, Dict[str, Any]] = {}  # owner → {"refs": set, "last_seen": monotonic}
+_PINNED: Dict[str, str] = {}  # ref → owner
+_LOCK = threading.Lock()
+
+
+def _to_arrow(data: Union[pd.DataFrame, List[Dict[str, Any]]]) -> pa.Table:
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (common in VARIANT data) — keep them as text
+        return pa.Table.from_pandas(df.astype(str), preserve_index=False)
+
+
+def put_table(data: Union[pd.DataFrame, List[Dict[str, Any]]], owner: Optional[str] = None) -> str:
+    """Stores a table once and returns its reference; with an owner the table is pinned to it."""
+    ref = f"tbl_{uuid.uuid4().hex[:12]}"
+    _put(ref, _to_arrow(data), owner)
+    return ref
+
+
+def _put(ref: str, table: pa.Table, owner: Optional[str] = None):
+    global _BYTES
+    with _LOCK:
+        old = _TABLES.pop(ref, None)
+        _BYTES += table.nbytes - (old.nbytes if old is not None else 0)
+        _TABLES[ref] = table
+        if owner:
+            _pin(ref, owner)
+        _expire_owners()
+        # Least recently used unpinned tables go first; pinned ones may keep the store over budget
+        for candidate in [r for r in _TABLES if r not in _PINNED and r != ref]:
+            if _BYTES <= MAX_ARTIFACT_BYTES:
+                break
+            _BYTES -= _TABLES.pop(candidate).nbytes
+
+
+def _pin(ref: str, owner: str):
+    entry = _OWNERS.setdefault(owner, {"refs": set(), "last_seen": time.monotonic()})
+    entry["refs"].add(ref)
+    entry["last_seen"] = time.monotonic()
+    _PINNED[ref] = owner
+
+
+def _expire_owners():
+    now = time.monotonic()
+    for owner in [o for o, e in _OWNERS.items() if now - e["last_seen"] > ARTIFACT_PIN_IDLE_S]:
+        _unpin_owner(owner)
+
+
+def _unpin_owner(owner: str):
+    for ref in _OWNERS.pop(owner, {"refs": ()})["refs"]:
+        _PINNED.pop(ref, None)
+
+
+def touch_owner(owner: str):
+    """Marks the owner (session) as alive, keeping its pinned tables."""
+    with _LOCK:
+        if owner in _OWNERS:
+            _OWNERS[owner]["last_seen"] = time.monotonic()
+
+
+def release_owner(owner: str):
+    """Unpins the owner's tables; they are evicted like any other from now on."""
+    with _LOCK:
+        _unpin_owner(owner)
+
+
+def get_table(ref: Optional[str]) -> Optional[pa.Table]:
+    with _LOCK:
+        table = _TABLES.get(ref) if ref else None
+        if table is not None:
+            _TABLES.move_to_end(ref)
+        return table
+
+
+def get_dataframe(ref: Optional[str], limit: Optional[int] = None) -> Optional[pd.DataFrame]:
+    table = get_table(ref)
+    if table is None:
+        return None
+    return (table.slice(0, limit) if limit is not None else table).to_pandas()
+
+
+def load_records(value: Union[str, List[Dict[str, Any]], None], limit: Optional[int] = None,
+                 refetch: Optional[Callable[[], pd.DataFrame]] = None,
+                 owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns rows for either an artifact reference or a legacy inline list of records.
+    A reference that is not in this process's store (evicted, or stored by another process)
+    is rebuilt with refetch() under the same reference when given; otherwise it warns and
+    returns [].
+    """
+    if isinstance(value, list):
+        return value[:limit] if limit is not None else value
+    df = get_dataframe(value, limit)
+    if df is None and value:
+        if refetch is None:
+            print(f"⚠️ Artifact {value} is no longer available — its rows are missing")
+            return []
+        print(f"🔁 Artifact {value} is no longer available — fetching it again")
+        _put(value, _to_arrow(refetch()), owner)
+        df = get_dataframe(value, limit)
+    return [] if df is None else df.to_dict(orient="records")
+
+
+def to_markdown(ref: Optional[str], limit: int = 5) -> str:
+    df = get_dataframe(ref, limit)
+    return "(preview no longer available)" if df is None else df.to_markdown(index=False)
+
+
+def release(ref: str):
+    global _BYTES
+    with _LOCK:
+        table = _TABLES.pop(ref, None)
+        if table is not None:
+            _BYTES -= table.nbytes
+        owner = _PINNED.pop(ref, None)
+        if owner in _OWNERS:
+            _OWNERS[owner]["refs"].discard(ref)
+
+
+def store_stats() -> Dict[str, int]:
+    with _LOCK:
+        return {"tables": len(_TABLES), "bytes": _BYTES, "pinned": len(_PINNED)}
+
+
+def export_tables(refs: Iterable[str]) -> Dict[str, bytes]:
+    """Arrow IPC bytes of the given tables — for handing artifacts to another process."""
+    exported = {}
+    for ref in refs:
+        table = get_table(ref)
+        if table is not None:
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            exported[ref] = sink.getvalue().to_pybytes()
+    return exported
+
+
+def import_tables(exported: Dict[str, bytes], owner: Optional[str] = None):
+    """Stores tables from export_tables() under their original references (pinned to owner, if given)."""
+    for ref, data in (exported or {}).items():
+        _put(ref, pa.ipc.open_stream(data).read_all(), owner)
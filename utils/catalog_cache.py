@@ -0,0 +1,127 @@
+# utils/catalog_cache.py
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Dict, List, Tuple, Optional
+from dotenv import load_dotenv
+
+from utils.snowflake_utils import list_databases, list_schemas, connection_backend
+
+load_dotenv()
+
+CATALOG_TTL_S = float(os.getenv("CATALOG_TTL_S", "600"))
+CATALOG_PREFETCH = int(os.getenv("CATALOG_PREFETCH", "50"))  # databases whose schemas load in the background
+CATALOG_PREFETCH_WORKERS = int(os.getenv("CATALOG_PREFETCH_WORKERS", "4"))
+CATALOG_BATCH = int(os.getenv("CATALOG_BATCH", "10"))  # SHOW SCHEMAS per connection
+
+
+class CatalogCache:
+    """
+    Lazily expanded DATABASE → SCHEMA hierarchy shared by every session of the process.
+    - the database list is one SHOW DATABASES per CATALOG_TTL_S
+    - a database's schemas are fetched the first time it is displayed or matched,
+      batched CATALOG_BATCH databases per connection on a small thread pool
+    - prefetch() warms the next databases in the background; a caller asking for a
+      database that is already in flight waits on that fetch instead of repeating it
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL_S, workers: int = CATALOG_PREFETCH_WORKERS):
+        self.ttl = ttl
+        self._databases: Optional[Tuple[float, List[str]]] = None
+        self._schemas: Dict[str, Tuple[float, List[str]]] = {}  # db → (loaded_at, schemas)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="catalog")
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def databases(self, refresh: bool = False) -> List[str]:
+        with self._lock:
+            entry = self._databases
+        if refresh or not self._fresh(entry):
+            entry = (time.monotonic(), list_databases())
+            with self._lock:
+                self._databases = entry
+            print(f"🗄️ Listed {len(entry[1])} databases")
+        return entry[1]
+
+    def _load(self, databases: List[str]):
+        try:
+            loaded = list_schemas(databases)
+        except Exception as e:
+            print(f"⚠️ Schema listing failed for {databases}: {e}")
+            loaded = {}
+        now = time.monotonic()
+        with self._lock:
+            for db in databases:
+                if db in loaded:
+                    self._schemas[db] = (now, loaded[db])
+                self._inflight.pop(db, None)
+
+    def _request(self, databases: List[str]) -> List[Future]:
+        """Futures covering every given database that is not cached — new fetches are batched."""
+        futures, missing = [], []
+        with self._lock:
+            for db in dict.fromkeys(databases):
+                if self._fresh(self._schemas.get(db)):
+                    continue
+                if db in self._inflight:
+                    futures.append(self._inflight[db])
+                else:
+                    missing.append(db)
+            for i in range(0, len(missing), CATALOG_BATCH):
+                batch = missing[i:i + CATALOG_BATCH]
+                future = self._pool.submit(self._load, batch)
+                futures.append(future)
+                for db in batch:
+                    self._inflight[db] = future
+        return futures
+
+    def schemas(self, databases: List[str]) -> Dict[str, List[str]]:
+        """{db: [schemas]} for the given databases, fetching only those not cached."""
+        wait(self._request(databases))
+        with self._lock:
+            return {db: (self._schemas.get(db) or (0, []))[1] for db in databases}
+
+    def prefetch(self, databases: List[str]):
+        """Starts background fetches for the databases' schemas and returns immediately."""
+        self._request(databases)
+
+    def overview(self, limit: int = 10) -> Dict[str, List[str]]:
+        """The first `limit` databases with their schemas; the next CATALOG_PREFETCH load in the background."""
+        databases = self.databases()
+        shown = self.schemas(databases[:limit])
+        self.prefetch(databases[limit:limit + CATALOG_PREFETCH])
+        return shown
+
+    def find_database(self, name: str) -> Optional[str]:
+        wanted = name.upper()
+        return next((db for db in self.databases() if db.upper() == wanted), None)
+
+    def find_schema(self, database: str, name: str) -> Optional[str]:
+        wanted = name.upper()
+        return next((s for s in self.schemas([database])[database] if s.upper() == wanted), None)
+
+    def invalidate(self, database: Optional[str] = None):
+        with self._lock:
+            if database is None:
+                self._databases = None
+                self._schemas.clear()
+            else:
+                self._schemas.pop(database, None)
+
+
+_caches: Dict[int, CatalogCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_catalog_cache() -> CatalogCache:
+    """Process-wide CatalogCache for the active connection backend."""
+    key = id(connection_backend())
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = CatalogCache()
+        return _caches[key]
@@ -0,0 +1,296 @@
+# utils/column_standardizer.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from utils.llm_provider import model_for
+
+load_dotenv()
+
+STANDARDIZATION_CACHE_DB = os.getenv("STANDARDIZATION_CACHE_DB", "column_standardization.db")
+STANDARDIZATION_BATCH_TOKENS = int(os.getenv("STANDARDIZATION_BATCH_TOKENS", "3000"))  # prompt budget per call
+STANDARDIZATION_CONCURRENCY = int(os.getenv("STANDARDIZATION_CONCURRENCY", "4"))
+
+model = model_for("fast")
+
+SUGGESTION_PROPERTIES = {
+    "original": {"type": "string"},
+    "suggested": {"type": "string"},
+    "type": {"type": "string"},
+    "comment": {"type": "string"}
+}
+
+BATCH_SCHEMA = {
+    "title": "TableColumnSuggestions",
+    "description": "Suggested column names, types, and comments for each table",
+    "type": "object",
+    "properties": {
+        "tables": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "table_name": {"type": "string"},
+                    "columns": {
+                        "type": "array",
+                        "items": {"type": "object", "properties": SUGGESTION_PROPERTIES,
+                                  "required": ["original", "suggested", "type"]}
+                    }
+                },
+                "required": ["table_name", "columns"]
+            }
+        }
+    },
+    "required": ["tables"]
+}
+
+BATCH_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+You are a data engineering assistant. Given raw column metadata from Snowflake tables,
+suggest standardized column names and types based on enterprise naming conventions.
+
+Output JSON format:
+{{
+  "tables": [
+    {{
+      "table_name": "ORDERS",
+      "columns": [
+        {{"original": "order_id", "suggested": "order_id", "type": "NUMBER", "comment": "Unique identifier for order"}}
+      ]
+    }}
+  ]
+}}
+Return one entry per input table and one suggestion per input column. Only return the JSON object — no explanation.
+""".strip()),
+    ("user", "Tables:\n{tables}")
+])
+
+
+# --- Signatures ---
+
+def base_type(data_type: str) -> str:
+    """NUMBER(38,0) → NUMBER, VARCHAR(16777216) → VARCHAR."""
+    return re.sub(r"\(.*\)", "", str(data_type or "")).strip().upper()
+
+
+def column_signature(column: Dict[str, Any]) -> str:
+    """
+    Hash of a column's name and base type — the same column in any table gets the same name and
+    type. Comments describe a column in its table, so they are kept per table, not per signature.
+    """
+    key = f"{str(column.get('name', '')).lower()}:{base_type(column.get('type'))}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+# --- Store ---
+
+def get_store(path: str = STANDARDIZATION_CACHE_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS column_suggestions (
+            signature TEXT PRIMARY KEY,
+            original TEXT,
+            suggested TEXT,
+            type TEXT,
+            comment TEXT,
+            created_at TEXT,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS column_comments (
+            table_name TEXT,
+            original TEXT,
+            comment TEXT,
+            PRIMARY KEY (table_name, original)
+        )
+    """)
+    return conn
+
+
+class ColumnStandardizer:
+    """
+    Column-name/type standardization for many tables at once.
+    - one chain, built on first use
+    - suggested names and types cached by column signature (name + base type), in memory and in
+      SQLite, so a column shared by several tables — or seen in an earlier onboarding — is sent once;
+      comments are cached per (table, column) and left empty for a table the LLM has not described
+    - the remaining columns are packed, grouped by table, into batches of at most
+      STANDARDIZATION_BATCH_TOKENS prompt tokens and run with chain.batch(max_concurrency=N)
+    """
+
+    def __init__(self, store_path: str = STANDARDIZATION_CACHE_DB, batch_tokens: int = STANDARDIZATION_BATCH_TOKENS,
+                 max_concurrency: int = STANDARDIZATION_CONCURRENCY):
+        self.store = get_store(store_path)
+        self.batch_tokens = batch_tokens
+        self.max_concurrency = max_concurrency
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._comments: Dict[Tuple[str, str], str] = {}
+        self._chain: Optional[Runnable] = None
+        self._lock = threading.Lock()
+
+    @property
+    def chain(self) -> Runnable:
+        if self._chain is None:
+            # The module model resolves (and keeps) the provider on first call; the structured
+            # runnable is derived per call so set_llm() swaps still apply
+            self._chain = BATCH_PROMPT | RunnableLambda(lambda messages: model.with_structured_output(BATCH_SCHEMA).invoke(messages))
+        return self._chain
+
+    # --- Cache ---
+    def _cached(self, signature: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if signature in self._memory:
+                return self._memory[signature]
+            row = self.store.execute("SELECT * FROM column_suggestions WHERE signature = ?", (signature,)).fetchone()
+            if row is None:
+                return None
+            self.store.execute("UPDATE column_suggestions SET hit_count = hit_count + 1 WHERE signature = ?", (signature,))
+            self.store.commit()
+            suggestion = {"suggested": row["suggested"], "type": row["type"]}
+            self._memory[signature] = suggestion
+            return suggestion
+
+    def _comment(self, table: str, original: str) -> str:
+        key = (table.lower(), str(original).lower())
+        with self._lock:
+            if key not in self._comments:
+                row = self.store.execute("SELECT comment FROM column_comments WHERE table_name = ? AND original = ?",
+                                         key).fetchone()
+                self._comments[key] = row["comment"] if row else ""
+            return self._comments[key]
+
+    def _remember(self, signature: str, table: str, original: str, suggestion: Dict[str, Any], comment: str):
+        with self._lock:
+            self._memory[signature] = suggestion
+            self.store.execute("""
+                INSERT OR REPLACE INTO column_suggestions (signature, original, suggested, type, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (signature, original, suggestion["suggested"], suggestion["type"], datetime.now().isoformat()))
+            if comment:
+                key = (table.lower(), str(original).lower())
+                self._comments[key] = comment
+                self.store.execute("INSERT OR REPLACE INTO column_comments (table_name, original, comment) VALUES (?, ?, ?)",
+                                   (*key, comment))
+            self.store.commit()
+
+    # --- Batching ---
+    def plan_batches(self, pending: Dict[str, List[Dict[str, Any]]]) -> List[List[Tuple[str, List[Dict[str, Any]]]]]:
+        """Packs (table, columns) pieces into token-budgeted batches; a table too large for one batch is split."""
+        overhead = estimate_tokens(BATCH_PROMPT.format(tables=""))
+        batches, current, used = [], [], overhead
+        for table, columns in pending.items():
+            piece: List[Dict[str, Any]] = []
+            table_cost = estimate_tokens(table) + 4
+            for column in columns:
+                cost = estimate_tokens(json.dumps({"name": column["name"], "type": column["type"]})) + 2
+                extra = cost + (0 if piece else table_cost)
+                if used + extra > self.batch_tokens and (current or piece):
+                    if piece:
+                        current.append((table, piece))
+                        piece = []
+                    batches.append(current)
+                    current, used, extra = [], overhead, cost + table_cost
+                piece.append(column)
+                used += extra
+            if piece:
+                current.append((table, piece))
+        if current:
+            batches.append(current)
+        return batches
+
+    def _batch_input(self, batch: List[Tuple[str, List[Dict[str, Any]]]]) -> Dict[str, str]:
+        payload = [{"table_name": table, "columns": [{"name": c["name"], "type": c["type"]} for c in columns]}
+                   for table, columns in batch]
+        return {"tables": json.dumps(payload, indent=1)}
+
+    # --- Entry point ---
+    def standardize(self, metadata: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        { table: DESC TABLE rows (name, type, ...) } → { table: [{original, suggested, type, comment, source}] }
+        in column order. source is "cache", "llm" or "fallback" (column missing from the LLM answer).
+        """
+        started = time.perf_counter()
+        pending: Dict[str, List[Dict[str, Any]]] = {}
+        claimed = set()
+        for table, columns in metadata.items():
+            for column in columns:
+                signature = column_signature(column)
+                if signature in claimed or self._cached(signature):
+                    continue
+                claimed.add(signature)  # a column shared by several tables is asked about once
+                pending.setdefault(table, []).append(
+                    {"name": column.get("name"), "type": column.get("type"), "signature": signature})
+
+        batches = self.plan_batches(pending)
+        if batches:
+            results = self.chain.batch([self._batch_input(b) for b in batches],
+                                       config={"max_concurrency": self.max_concurrency}, return_exceptions=True)
+            for batch, result in zip(batches, results):
+                if isinstance(result, Exception):
+                    print(f"⚠️ Standardization batch ({', '.join(t for t, _ in batch)}) failed: {result}")
+                    continue
+                self._absorb(batch, result)
+
+        suggestions = {table: [self._suggestion(table, column, claimed) for column in columns]
+                       for table, columns in metadata.items()}
+        n_columns = sum(len(c) for c in metadata.values())
+        print(f"🧮 Standardized {len(metadata)} tables ({n_columns} columns): {len(claimed)} columns sent "
+              f"in {len(batches)} LLM calls, {n_columns - len(claimed)} from cache, "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms")
+        return suggestions
+
+    def _absorb(self, batch, result: Any):
+        tables = result.get("tables", []) if isinstance(result, dict) else getattr(result, "tables", [])
+        answered = {}
+        for entry in tables:
+            for suggestion in entry.get("columns", []):
+                answered[(str(entry.get("table_name", "")).lower(), str(suggestion.get("original", "")).lower())] = suggestion
+        for table, columns in batch:
+            for column in columns:
+                suggestion = answered.get((table.lower(), str(column["name"]).lower()))
+                if suggestion and suggestion.get("suggested"):
+                    self._remember(column["signature"], table, column["name"], {
+                        "suggested": suggestion["suggested"],
+                        "type": suggestion.get("type") or column["type"],
+                    }, suggestion.get("comment", ""))
+
+    def _suggestion(self, table: str, column: Dict[str, Any], sent: set) -> Dict[str, Any]:
+        signature = column_signature(column)
+        cached = self._memory.get(signature)
+        if cached is None:
+            return {"original": column.get("name"), "suggested": str(column.get("name", "")).lower(),
+                    "type": column.get("type"), "comment": "", "source": "fallback"}
+        return {"original": column.get("name"), **cached, "comment": self._comment(table, column.get("name")),
+                "source": "llm" if signature in sent else "cache"}
+
+
+_standardizer: Optional[ColumnStandardizer] = None
+_standardizer_lock = threading.Lock()
+
+
+def get_standardizer() -> ColumnStandardizer:
+    global _standardizer
+    with _standardizer_lock:
+        if _standardizer is None:
+            _standardizer = ColumnStandardizer()
+        return _standardizer
+
+
+def standardize_tables(metadata: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    return get_standardizer().standardize(metadata)
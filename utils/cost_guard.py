@@ -0,0 +1,231 @@
+# utils/cost_guard.py
+
+import os
+import json
+import sqlite3
+import hashlib
+import statistics
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from utils.warehouse_planner import strip_ctas, parse_explain_json
+
+load_dotenv()
+
+GB = 1024 ** 3
+
+COST_GUARD_DB = os.getenv("COST_GUARD_DB", "cost_guard.db")
+
+# Soft budget: over it the query needs confirmation (or is sampled / blocked, see COST_SOFT_ACTION)
+CONFIRM_BYTES = float(os.getenv("COST_CONFIRM_BYTES", 10 * GB))
+CONFIRM_PARTITIONS = int(os.getenv("COST_CONFIRM_PARTITIONS", "10000"))
+# Hard budget: over it the query never runs in full as-is
+MAX_BYTES = float(os.getenv("COST_MAX_BYTES", 1024 * GB))
+MAX_PARTITIONS = int(os.getenv("COST_MAX_PARTITIONS", "500000"))
+
+SOFT_ACTION = os.getenv("COST_SOFT_ACTION", "confirm")   # confirm | sample | block
+HARD_ACTION = os.getenv("COST_HARD_ACTION", "block")     # block | sample
+CARTESIAN_ACTION = os.getenv("COST_CARTESIAN_ACTION", "confirm")  # run | confirm | sample | block
+
+MIN_SAMPLE_PERCENT = float(os.getenv("COST_MIN_SAMPLE_PERCENT", "0.01"))
+
+# Most restrictive wins
+_SEVERITY = {"run": 0, "confirm": 1, "sample": 2, "block": 3}
+
+
+# --- Estimate ---
+
+def _operations(explain_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flattens the `Operations` list of lists from EXPLAIN USING JSON."""
+    operations = []
+    for group in explain_json.get("Operations") or []:
+        operations += group if isinstance(group, list) else [group]
+    return [op for op in operations if isinstance(op, dict)]
+
+
+def parse_explain_plan(explain_json: Any) -> Dict[str, Any]:
+    """
+    GlobalStats plus the plan shape from `EXPLAIN USING JSON` output.
+    Output: { bytes_assigned, partitions_assigned, partitions_total, join_types: {op: n}, cartesian_joins,
+              tables, table_bytes: {table: bytes} }
+    """
+    if isinstance(explain_json, str):
+        explain_json = json.loads(explain_json)
+    explain_json = explain_json or {}
+
+    operations = _operations(explain_json)
+    joins = Counter(op["operation"] for op in operations if "join" in str(op.get("operation", "")).lower())
+    table_bytes = Counter()
+    for op in operations:
+        if op.get("operation") == "TableScan":
+            for obj in op.get("objects", []):
+                table_bytes[obj.upper()] += int(op.get("bytesAssigned", 0) or 0)
+
+    return {
+        **parse_explain_json(explain_json),
+        "join_types": dict(joins),
+        "cartesian_joins": sum(n for op, n in joins.items() if "cartesian" in op.lower()),
+        "tables": sorted(table_bytes),
+        "table_bytes": dict(table_bytes),
+    }
+
+
+def explain_query(cursor, sql: str) -> Dict[str, Any]:
+    """Runs EXPLAIN USING JSON on the SELECT behind a CTAS statement — compiles, does not execute."""
+    cursor.execute(f"EXPLAIN USING JSON {strip_ctas(sql)}")
+    row = cursor.fetchone()
+    return parse_explain_plan(row[0] if row else {})
+
+
+# --- Budgets ---
+
+def evaluate(estimate: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compares an estimate to the budgets.
+    Output: { action: run | confirm | sample | block, reasons: [...], sample_percent }
+    """
+    checks = [
+        (estimate["bytes_assigned"] > MAX_BYTES, HARD_ACTION,
+         f"scans {format_bytes(estimate['bytes_assigned'])}, over the {format_bytes(MAX_BYTES)} limit"),
+        (estimate["partitions_assigned"] > MAX_PARTITIONS, HARD_ACTION,
+         f"reads {estimate['partitions_assigned']:,} partitions, over the {MAX_PARTITIONS:,} limit"),
+        (estimate["bytes_assigned"] > CONFIRM_BYTES, SOFT_ACTION,
+         f"scans {format_bytes(estimate['bytes_assigned'])} (confirmation above {format_bytes(CONFIRM_BYTES)})"),
+        (estimate["partitions_assigned"] > CONFIRM_PARTITIONS, SOFT_ACTION,
+         f"reads {estimate['partitions_assigned']:,} partitions (confirmation above {CONFIRM_PARTITIONS:,})"),
+        (estimate.get("cartesian_joins", 0) > 0, CARTESIAN_ACTION,
+         f"contains {estimate['cartesian_joins']} cartesian join(s) — likely a missing join predicate"),
+    ]
+
+    action, reasons = "run", []
+    for triggered, check_action, reason in checks:
+        if triggered and check_action != "run":
+            reasons.append(reason)
+            if _SEVERITY.get(check_action, 3) > _SEVERITY[action]:
+                action = check_action
+
+    return {"action": action, "reasons": reasons, "sample_percent": sample_percent(estimate)}
+
+
+def sample_percent(estimate: Dict[str, Any]) -> float:
+    """Sampling rate that brings the scan under the confirmation budget."""
+    scanned = estimate.get("bytes_assigned") or 0
+    if scanned <= CONFIRM_BYTES:
+        return 100.0
+    return round(max(MIN_SAMPLE_PERCENT, 100.0 * CONFIRM_BYTES / scanned), 4)
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:,.0f} B" if unit == "B" else f"{n:,.1f} {unit}"
+        n /= 1024
+    return f"{n:,.1f} TB"
+
+
+def describe_estimate(estimate: Dict[str, Any]) -> str:
+    joins = ", ".join(f"{op} x{n}" for op, n in estimate.get("join_types", {}).items()) or "none"
+    return (f"{format_bytes(estimate['bytes_assigned'])} across {estimate['partitions_assigned']:,} "
+            f"of {estimate['partitions_total']:,} partitions; joins: {joins}")
+
+
+# --- Estimate vs actual log ---
+
+def get_store(path: str = COST_GUARD_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS query_costs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT,
+            sql_hash TEXT,
+            mode TEXT,
+            action TEXT,
+            reasons TEXT,
+            bytes_assigned INTEGER,
+            partitions_assigned INTEGER,
+            partitions_total INTEGER,
+            join_types TEXT,
+            query_id TEXT,
+            bytes_scanned INTEGER,
+            partitions_scanned INTEGER,
+            elapsed_ms REAL,
+            rows_produced INTEGER,
+            error TEXT
+        )
+    """)
+    return conn
+
+
+def record_estimate(store: sqlite3.Connection, sql: str, estimate: Dict[str, Any], decision: Dict[str, Any]) -> int:
+    cursor = store.execute("""
+        INSERT INTO query_costs (created_at, sql_hash, mode, action, reasons, bytes_assigned,
+                                 partitions_assigned, partitions_total, join_types)
+        VALUES (?, ?, 'estimate', ?, ?, ?, ?, ?, ?)
+    """, (
+        datetime.now().isoformat(), hashlib.sha256(sql.encode()).hexdigest()[:20], decision["action"],
+        json.dumps(decision["reasons"]), estimate["bytes_assigned"], estimate["partitions_assigned"],
+        estimate["partitions_total"], json.dumps(estimate.get("join_types", {})),
+    ))
+    store.commit()
+    return cursor.lastrowid
+
+
+def record_actual(store: sqlite3.Connection, estimate_id: Optional[int], mode: str, actual: Dict[str, Any]):
+    """Attaches the executed query's statistics (mode: full | sample) to its estimate row."""
+    if estimate_id is None:
+        return
+    store.execute("""
+        UPDATE query_costs SET mode = ?, query_id = ?, bytes_scanned = ?, partitions_scanned = ?,
+                               elapsed_ms = ?, rows_produced = ?, error = ?
+        WHERE id = ?
+    """, (
+        mode, actual.get("query_id"), actual.get("bytes_scanned"), actual.get("partitions_scanned"),
+        actual.get("elapsed_ms"), actual.get("rows_produced"), actual.get("error"), estimate_id,
+    ))
+    store.commit()
+
+
+def fetch_query_stats(cursor, query_id: Optional[str]) -> Dict[str, Any]:
+    """Actual scan statistics of a finished query from this session's QUERY_HISTORY (empty if unavailable)."""
+    if not query_id:
+        return {}
+    try:
+        cursor.execute(f"""
+            SELECT BYTES_SCANNED, PARTITIONS_SCANNED, TOTAL_ELAPSED_TIME, ROWS_PRODUCED
+            FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+            WHERE QUERY_ID = '{query_id}'
+        """)
+        row = cursor.fetchone()
+    except Exception as e:
+        print(f"⚠️ QUERY_HISTORY lookup failed for {query_id}: {e}")
+        return {}
+    if not row:
+        return {}
+    return {"bytes_scanned": row[0], "partitions_scanned": row[1], "elapsed_ms": row[2], "rows_produced": row[3]}
+
+
+def calibration(store: sqlite3.Connection) -> Dict[str, Any]:
+    """
+    How estimates compare with what full runs actually scanned, per decision —
+    the numbers to look at when tuning the COST_* budgets.
+    """
+    rows = store.execute("""
+        SELECT action, bytes_assigned, bytes_scanned, elapsed_ms FROM query_costs
+        WHERE mode = 'full' AND bytes_scanned IS NOT NULL AND bytes_assigned > 0
+    """).fetchall()
+    report = {}
+    for action in sorted({r["action"] for r in rows}):
+        subset = [r for r in rows if r["action"] == action]
+        ratios = [r["bytes_scanned"] / r["bytes_assigned"] for r in subset]
+        report[action] = {
+            "queries": len(subset),
+            "median_actual_to_estimated_bytes": round(statistics.median(ratios), 3),
+            "max_bytes_scanned": max(r["bytes_scanned"] for r in subset),
+            "median_elapsed_ms": statistics.median(r["elapsed_ms"] or 0 for r in subset),
+        }
+    counts = store.execute("SELECT action, mode, COUNT(*) AS n FROM query_costs GROUP BY action, mode").fetchall()
+    report["decisions"] = {f"{r['action']}/{r['mode']}": r["n"] for r in counts}
+    return report
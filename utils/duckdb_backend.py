@@ -0,0 +1,527 @@
+# utils/duckdb_backend.py
+
+import os
+import re
+import json
+import itertools
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import duckdb
+from snowflake.connector.connection import SnowflakeConnection
+from snowflake.connector.constants import QueryStatus
+import sqlglot
+from sqlglot import exp
+
+# Snowflake-flavoured DESC TABLE columns (describe_table_full keys off these names)
+DESC_COLUMNS = ["name", "type", "kind", "null?", "default", "primary key", "unique key", "check", "expression", "comment"]
+
+TYPE_MAP = {
+    "VARCHAR": "VARCHAR(16777216)",
+    "BIGINT": "NUMBER(38,0)",
+    "INTEGER": "NUMBER(38,0)",
+    "DOUBLE": "FLOAT",
+    "BOOLEAN": "BOOLEAN",
+    "DATE": "DATE",
+    "TIMESTAMP": "TIMESTAMP_NTZ(9)",
+}
+
+_CTAS = re.compile(r"(?is)^\s*CREATE\s+(?:OR\s+REPLACE\s+)?(?:TRANSIENT\s+|TEMPORARY\s+)?TABLE\s+([\w.\"]+)\s+AS\s+")
+_TASK = re.compile(r"(?is)^\s*CREATE\s+(?:OR\s+REPLACE\s+)?TASK\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.\"]+)")
+_ALTER_TASK = re.compile(r"(?is)^\s*ALTER\s+TASK\s+(IF\s+EXISTS\s+)?([\w.\"]+)\s+(RESUME|SUSPEND)")
+_DROP_TASK = re.compile(r"(?is)^\s*DROP\s+TASK\s+(IF\s+EXISTS\s+)?([\w.\"]+)")
+_STREAM = re.compile(r"(?is)^\s*CREATE\s+(OR\s+REPLACE\s+)?STREAM\s+(IF\s+NOT\s+EXISTS\s+)?([\w.\"]+)\s+ON\s+TABLE\s+([\w.\"]+)")
+_DROP_STREAM = re.compile(r"(?is)^\s*DROP\s+STREAM\s+(IF\s+EXISTS\s+)?([\w.\"]+)")
+_HAS_DATA = re.compile(r"(?i)SYSTEM\$STREAM_HAS_DATA\s*\(\s*'([^']+)'\s*\)")
+_DML = re.compile(r"(?is)^\s*(?:INSERT\s+(?:OVERWRITE\s+)?INTO|UPDATE|DELETE\s+FROM)\s+([\w.\"]+)")
+_SAMPLE = re.compile(r"(?i)\b(?:TABLE)?SAMPLE\s+(?:BERNOULLI|ROW|SYSTEM|BLOCK)?\s*\(")
+_FQN = re.compile(r"\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b")
+
+
+class StandInCursor:
+    """
+    Snowflake-connector-shaped cursor over DuckDB. Understands the statements this
+    app sends: SHOW DATABASES / SCHEMAS, DESC TABLE, <db>.INFORMATION_SCHEMA.*,
+    USE DATABASE / SCHEMA, transient CTAS, CREATE/ALTER/DROP TASK, CREATE/DROP STREAM with
+    SYSTEM$STREAM_HAS_DATA, EXPLAIN USING JSON,
+    (empty) QUERY_HISTORY lookups, ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS and
+    SYSTEM$CANCEL_QUERY; TABLESAMPLE queries are transpiled to DuckDB. execute_async /
+    get_results_from_sfqid run statements on background threads.
+    """
+
+    def __init__(self, standin: "SnowflakeStandIn", conn: "StandInConnection"):
+        self.standin = standin
+        self.connection = conn
+        self._cursor = conn.duck.cursor()
+        self._rows: Optional[List[Tuple]] = None
+        self.description = None
+        self.rowcount = -1
+        self.sfqid = None
+        self._last_target = None
+        self._consumed: Dict[str, int] = {}  # streams read by the current DML → offset to advance to
+
+    # --- DB-API surface ---
+    def execute(self, sql: str, params=None, _query_id: Optional[str] = None):
+        statement = sql.strip().rstrip(";").strip()
+        kind, rows, columns, translated = self._translate(statement)
+        self.standin.record(kind, statement)
+        self.sfqid = _query_id or self.standin.new_query_id()
+
+        if translated is not None:
+            self._run(translated, params)
+            self.description = self._cursor.description
+            self._rows = None
+            if kind == "ctas":
+                self.standin.touch(self._qualified(self._last_target))
+                self.description = [("status", None, None, None, None, None, None)]
+                self._rows = [(f"Table {self._last_target} successfully created.",)]
+            elif kind == "dml":
+                changed = (self._cursor.fetchone() or (0,))[0]
+                self.standin.record_change(self._qualified(self._last_target), changed, self._consumed)
+                self.description = [("number of rows affected", None, None, None, None, None, None)]
+                self._rows = [(changed,)]
+        else:
+            self.description = [(c, None, None, None, None, None, None) for c in columns]
+            self._rows = rows
+
+        return self
+
+    def execute_async(self, sql: str, params=None) -> Dict[str, Any]:
+        """Runs the statement on a background thread; poll it through the connection like Snowflake."""
+        self.sfqid = self.standin.start_async(self.connection, sql, params)
+        return {"queryId": self.sfqid}
+
+    def get_results_from_sfqid(self, sfqid: str):
+        query = self.standin.queries[sfqid]
+        query["done"].wait()
+        if query["error"]:
+            raise RuntimeError(query["error"])
+        self.sfqid = sfqid
+        self.description = query["description"]
+        self._rows = list(query["rows"])
+
+    def _qualified(self, name: str) -> str:
+        parts = [p.strip('"').upper() for p in name.split(".")]
+        if len(parts) < 3:
+            database, schema = self.connection.duck.execute("SELECT current_database(), current_schema()").fetchone()
+            parts = [database.upper(), schema.upper()][:3 - len(parts)] + parts
+        return ".".join(parts)
+
+    def _run(self, translated: str, params=None):
+        """Executes on DuckDB, interrupting it after the session's STATEMENT_TIMEOUT_IN_SECONDS."""
+        timeout = self.connection.statement_timeout
+        timer = threading.Timer(timeout, self._cursor.interrupt) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            self._cursor.execute(translated, params) if params else self._cursor.execute(translated)
+        except duckdb.InterruptException:
+            raise RuntimeError(f"Statement reached its statement or warehouse timeout of {timeout} second(s) and was canceled.")
+        finally:
+            if timer:
+                timer.cancel()
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        if self._rows is not None:
+            rows, self._rows = self._rows[:size], self._rows[size:]
+            return rows
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+    def _information_schema(self, database: str, view: str) -> str:
+        if view == "columns":
+            return f"(SELECT * FROM information_schema.columns WHERE upper(table_catalog) = '{database}')"
+        # TABLES gets Snowflake's LAST_ALTERED; tables not created through a cursor report the stand-in's start
+        return (f"(SELECT t.*, COALESCE(v.last_altered, TIMESTAMP '{self.standin.created_at}') AS last_altered "
+                f"FROM information_schema.tables t LEFT JOIN {self.standin.versions_table} v "
+                f"ON v.fqdn = upper(t.table_catalog || '.' || t.table_schema || '.' || t.table_name) "
+                f"WHERE upper(t.table_catalog) = '{database}')")
+
+    def _read_streams(self, sql: str) -> str:
+        """
+        SYSTEM$STREAM_HAS_DATA(...) becomes a TRUE / FALSE literal and each stream reference a
+        subquery of its pending change rows; the offsets to advance to are kept for a DML.
+        """
+        streams = self.standin.streams
+        self._consumed = {}
+        if not streams:
+            return sql
+        sql = _HAS_DATA.sub(lambda m: "TRUE" if self.standin.stream_pending(self._qualified(m.group(1))) else "FALSE", sql)
+
+        def replace(match):
+            name = match.group(0).upper()
+            if name not in streams:
+                return match.group(0)
+            self._consumed[name] = self.standin.changes[streams[name]["source"]]
+            pending = self.standin.stream_pending(name)
+            return f'(SELECT range AS "METADATA$ROW_ID", \'INSERT\' AS "METADATA$ACTION" FROM range({pending}))'
+        return _FQN.sub(replace, sql)
+
+    # --- Snowflake → DuckDB translation ---
+    def _translate(self, sql: str):
+        upper = sql.upper()
+
+        if upper.startswith("SHOW DATABASES"):
+            rows = [(None, name) for name in self.standin.databases()]
+            return "show", rows, ["created_on", "name"], None
+
+        match = re.match(r"(?is)^SHOW\s+SCHEMAS\s+IN\s+DATABASE\s+(\w+)", sql)
+        if match:
+            rows = [(None, name) for name in self.standin.schemas(match.group(1))]
+            return "show", rows, ["created_on", "name"], None
+
+        match = re.match(r"(?is)^DESC(?:RIBE)?\s+TABLE\s+([\w.\"]+)", sql)
+        if match:
+            return "describe", self.standin.describe(match.group(1)), DESC_COLUMNS, None
+
+        match = re.match(r"(?is)^USE\s+DATABASE\s+(\w+)", sql)
+        if match:
+            self.connection.database = match.group(1).upper()
+            return "use", None, None, f"USE {self.connection.database}"
+
+        match = re.match(r"(?is)^USE\s+SCHEMA\s+([\w.]+)", sql)
+        if match:
+            schema = match.group(1).upper()
+            target = schema if "." in schema else f"{self.connection.database or 'memory'}.{schema}"
+            return "use", None, None, f"USE {target}"
+
+        match = re.match(r"(?is)^ALTER\s+SESSION\s+(?:SET\s+STATEMENT_TIMEOUT_IN_SECONDS\s*=\s*(\d+)|UNSET\s+STATEMENT_TIMEOUT_IN_SECONDS)", sql)
+        if match:
+            self.connection.statement_timeout = int(match.group(1) or 0)
+            return "session", [("Statement executed successfully.",)], ["status"], None
+
+        match = _TASK.match(sql)
+        if match:
+            self.standin.tasks[match.group(1).upper()] = {"sql": sql, "state": "suspended"}
+            return "task", [(f"Task {match.group(1)} successfully created.",)], ["status"], None
+
+        match = _ALTER_TASK.match(sql)
+        if match:
+            if match.group(1) and match.group(2).upper() not in self.standin.tasks:
+                return "task", [("Statement executed successfully.",)], ["status"], None
+            task = self.standin.tasks.setdefault(match.group(2).upper(), {"sql": None})
+            task["state"] = "started" if match.group(3).upper() == "RESUME" else "suspended"
+            return "task", [("Statement executed successfully.",)], ["status"], None
+
+        match = _DROP_TASK.match(sql)
+        if match:
+            if self.standin.tasks.pop(match.group(2).upper(), None) is None and not match.group(1):
+                raise RuntimeError(f"SQL compilation error: Task '{match.group(2).upper()}' does not exist or not authorized.")
+            return "task", [(f"{match.group(2).upper()} successfully dropped.",)], ["status"], None
+
+        match = _STREAM.match(sql)
+        if match:
+            name, source = self._qualified(match.group(3)), self._qualified(match.group(4))
+            if match.group(1) or not (match.group(2) and name in self.standin.streams):
+                initial = bool(re.search(r"(?i)\bSHOW_INITIAL_ROWS\s*=\s*TRUE\b", sql))
+                self.standin.create_stream(name, source, initial)
+            return "stream", [(f"Stream {name.split('.')[-1]} successfully created.",)], ["status"], None
+
+        match = _DROP_STREAM.match(sql)
+        if match:
+            name = self._qualified(match.group(2))
+            if self.standin.streams.pop(name, None) is None and not match.group(1):
+                raise RuntimeError(f"SQL compilation error: Stream '{name}' does not exist or not authorized.")
+            return "stream", [(f"{name.split('.')[-1]} successfully dropped.",)], ["status"], None
+
+        match = re.match(r"(?is)^SELECT\s+SYSTEM\$CANCEL_QUERY\s*\(\s*'([^']+)'\s*\)", sql)
+        if match:
+            message = self.standin.cancel(match.group(1))
+            return "cancel", [(message,)], ["status"], None
+
+        if "QUERY_HISTORY" in upper:
+            # No query statistics are kept; callers treat an empty result as "not available"
+            return "query_history", [], ["BYTES_SCANNED", "PARTITIONS_SCANNED", "TOTAL_ELAPSED_TIME", "ROWS_PRODUCED"], None
+
+        match = re.match(r"(?is)^EXPLAIN\s+USING\s+JSON\s+(.*)$", sql)
+        if match:
+            plan = self.standin.explain(match.group(1))
+            return "explain", [(json.dumps(plan),)], ["content"], None
+
+        translated = re.sub(r"(?i)\b(\w+)\.INFORMATION_SCHEMA\.(TABLES|COLUMNS)\b",
+                            lambda m: self._information_schema(m.group(1).upper(), m.group(2).lower()),
+                            sql)
+
+        translated = self._read_streams(translated)
+
+        match = _CTAS.match(translated)
+        if match:
+            self._last_target = match.group(1)
+            translated = _CTAS.sub(f"CREATE OR REPLACE TABLE {match.group(1)} AS ", translated, count=1)
+            if _SAMPLE.search(translated):
+                translated = sqlglot.transpile(translated, read="snowflake", write="duckdb")[0]
+            return "ctas", None, None, translated
+
+        match = _DML.match(translated)
+        if match:
+            self._last_target = match.group(1)
+            return "dml", None, None, translated
+
+        if _SAMPLE.search(translated):
+            translated = re.sub(r"(?i)\b(CREATE\s+(?:OR\s+REPLACE\s+)?)TRANSIENT\s+", r"\1", translated)
+            # Snowflake's TABLESAMPLE BERNOULLI (10) is TABLESAMPLE BERNOULLI (10 PERCENT) in DuckDB
+            translated = sqlglot.transpile(translated, read="snowflake", write="duckdb")[0]
+
+        kind = "information_schema" if "INFORMATION_SCHEMA" in upper else "query"
+        return kind, None, None, translated
+
+
+class StandInConnection:
+    def __init__(self, standin: "SnowflakeStandIn"):
+        self.standin = standin
+        self.duck = standin.db.cursor()  # separate DuckDB connection, same database
+        self.database = None
+        self.statement_timeout = 0
+
+    def cursor(self) -> StandInCursor:
+        return StandInCursor(self.standin, self)
+
+    # --- Async query status (same surface as snowflake.connector's connection) ---
+    def get_query_status(self, sfqid: str) -> QueryStatus:
+        return self.standin.queries[sfqid]["status"]
+
+    def get_query_status_throw_if_error(self, sfqid: str) -> QueryStatus:
+        status = self.get_query_status(sfqid)
+        if self.is_an_error(status):
+            raise RuntimeError(self.standin.queries[sfqid]["error"])
+        return status
+
+    is_still_running = staticmethod(SnowflakeConnection.is_still_running)
+    is_an_error = staticmethod(SnowflakeConnection.is_an_error)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.duck.close()
+
+
+class SnowflakeStandIn:
+    """
+    In-process DuckDB database laid out like a Snowflake account:
+    each Snowflake database is an attached DuckDB catalog, schemas map 1:1.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = duckdb.connect(path)
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        # Streams track changes as row counts: { STREAM: {"source": TABLE, "offset": changes[TABLE] consumed} }
+        self.streams: Dict[str, Dict[str, Any]] = {}
+        self.changes: Counter = Counter()  # rows inserted / updated / deleted per table through a cursor
+        self.stats: Counter = Counter()
+        self.log = deque(maxlen=10000)  # recent (kind, sql) pairs
+        self._lock = threading.Lock()
+        self._query_seq = itertools.count(1)
+        self.queries: Dict[str, Dict[str, Any]] = {}  # execute_async bookkeeping by query id
+        # LAST_ALTERED of tables (re)built through CTAS, served via INFORMATION_SCHEMA.TABLES
+        self.created_at = datetime.now().isoformat(sep=" ")
+        self.versions_table = f"{self._execute('SELECT current_database()').fetchone()[0]}.main.standin_table_versions"
+        self._execute(f"CREATE TABLE IF NOT EXISTS {self.versions_table} (fqdn VARCHAR PRIMARY KEY, last_altered TIMESTAMP)")
+
+    def connect(self) -> StandInConnection:
+        return StandInConnection(self)
+
+    def _execute(self, sql: str, params=None):
+        # A fresh cursor per statement: one DuckDB connection object is not safe to share across threads
+        cursor = self.db.cursor()
+        return cursor.execute(sql, params) if params else cursor.execute(sql)
+
+    # --- Bookkeeping ---
+    def record(self, kind: str, sql: str):
+        with self._lock:
+            self.stats[kind] += 1
+            self.stats["total"] += 1
+            self.log.append((kind, sql[:200]))
+
+    def new_query_id(self) -> str:
+        with self._lock:
+            return f"standin-{next(self._query_seq):08d}"
+
+    def start_async(self, conn: "StandInConnection", sql: str, params=None) -> str:
+        query_id = self.new_query_id()
+        cursor = conn.cursor()
+        query = {"status": QueryStatus.RUNNING, "cursor": cursor, "rows": None, "description": None,
+                 "error": None, "cancelled": False, "done": threading.Event()}
+        self.queries[query_id] = query
+
+        def work():
+            try:
+                cursor.execute(sql, params, _query_id=query_id)
+                query["description"] = cursor.description
+                query["rows"] = cursor.fetchall()
+                query["status"] = QueryStatus.SUCCESS
+            except Exception as e:
+                query["error"] = "SQL execution canceled" if query["cancelled"] else str(e)
+                query["status"] = QueryStatus.ABORTED if query["cancelled"] else QueryStatus.FAILED_WITH_ERROR
+            finally:
+                query["done"].set()
+
+        threading.Thread(target=work, daemon=True).start()
+        return query_id
+
+    def cancel(self, query_id: str) -> str:
+        query = self.queries.get(query_id)
+        if not query or query["done"].is_set():
+            return f"Query {query_id} is not running."
+        query["cancelled"] = True
+        query["status"] = QueryStatus.ABORTING
+        query["cursor"]._cursor.interrupt()
+        return "Identified SQL statement is being canceled."
+
+    def touch(self, fqdn: str):
+        """Bumps a table's LAST_ALTERED."""
+        self._execute(f"INSERT OR REPLACE INTO {self.versions_table} VALUES (?, now()::TIMESTAMP)", [fqdn.upper()])
+
+    def create_stream(self, name: str, source: str, show_initial_rows: bool = False):
+        """A new stream is empty; SHOW_INITIAL_ROWS = TRUE makes the table's current rows its first changes."""
+        initial = self._execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0] if show_initial_rows else 0
+        with self._lock:
+            self.streams[name.upper()] = {"source": source.upper(), "offset": self.changes[source.upper()] - initial}
+
+    def stream_pending(self, name: str) -> int:
+        stream = self.streams.get(name.upper())
+        return max(0, self.changes[stream["source"]] - stream["offset"]) if stream else 0
+
+    def record_change(self, fqdn: str, rows: int, consumed: Dict[str, int]):
+        """A committed DML: counts its rows against the table and advances the streams it read."""
+        with self._lock:
+            self.changes[fqdn.upper()] += rows
+            for name, offset in consumed.items():
+                if name in self.streams:
+                    self.streams[name]["offset"] = max(self.streams[name]["offset"], offset)
+        if rows:
+            self.touch(fqdn)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+            self.log.clear()
+
+    # --- Catalog ---
+    def create_database(self, name: str):
+        name = name.upper()
+        if name not in self.databases():
+            self._execute(f"ATTACH ':memory:' AS {name}")
+
+    def create_schema(self, database: str, schema: str):
+        self.create_database(database)
+        self._execute(f"CREATE SCHEMA IF NOT EXISTS {database.upper()}.{schema.upper()}")
+
+    def databases(self) -> List[str]:
+        rows = self._execute(
+            "SELECT database_name FROM duckdb_databases() WHERE NOT internal AND database_name NOT IN ('memory', 'temp')"
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def schemas(self, database: str) -> List[str]:
+        rows = self._execute(
+            "SELECT schema_name FROM duckdb_schemas() WHERE upper(database_name) = ? AND schema_name NOT IN ('main', 'information_schema', 'pg_catalog')",
+            [database.upper()]
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def describe(self, fqdn: str) -> List[Tuple]:
+        database, schema, table = [p.strip('"').upper() for p in fqdn.split(".")[-3:]]
+        rows = self._execute("""
+            SELECT column_name, data_type, is_nullable FROM information_schema.columns
+            WHERE upper(table_catalog) = ? AND upper(table_schema) = ? AND upper(table_name) = ?
+            ORDER BY ordinal_position
+        """, [database, schema, table]).fetchall()
+        if not rows:
+            raise RuntimeError(f"SQL compilation error: Table '{fqdn}' does not exist or not authorized.")
+        return [
+            (name, TYPE_MAP.get(dtype, dtype), "COLUMN", "Y" if nullable == "YES" else "N", None, "N", "N", None, None, None)
+            for name, dtype, nullable in rows
+        ]
+
+    def explain(self, sql: str) -> Dict[str, Any]:
+        """
+        Approximate Snowflake GlobalStats from the size of the referenced tables, plus
+        TableScan and join operations (a join without ON/USING is a CartesianJoin).
+        """
+        total_bytes, partitions, operations = 0, 0, [{"id": 0, "operation": "Result"}]
+        for database, schema, table in set(_FQN.findall(sql)):
+            row = self._execute("""
+                SELECT estimated_size, column_count FROM duckdb_tables()
+                WHERE upper(database_name) = ? AND upper(schema_name) = ? AND upper(table_name) = ?
+            """, [database.upper(), schema.upper(), table.upper()]).fetchone()
+            if row:
+                table_bytes = (row[0] or 0) * (row[1] or 1) * 8
+                table_partitions = max(1, (row[0] or 0) // 100_000)
+                total_bytes += table_bytes
+                partitions += table_partitions
+                operations.append({"id": len(operations), "operation": "TableScan",
+                                   "objects": [f"{database}.{schema}.{table}".upper()],
+                                   "partitionsAssigned": table_partitions, "bytesAssigned": table_bytes})
+
+        try:
+            joins = sqlglot.parse_one(sql, read="snowflake").find_all(exp.Join)
+        except sqlglot.errors.SqlglotError:
+            joins = []
+        for join in joins:
+            if (join.kind or "").upper() == "CROSS" or not (join.args.get("on") or join.args.get("using")):
+                operation = "CartesianJoin"
+            else:
+                operation = {"LEFT": "LeftOuterJoin", "RIGHT": "RightOuterJoin", "FULL": "FullOuterJoin"}.get(
+                    (join.side or "").upper(), "InnerJoin")
+            operations.append({"id": len(operations), "operation": operation})
+
+        return {
+            "GlobalStats": {"partitionsTotal": partitions, "partitionsAssigned": partitions, "bytesAssigned": total_bytes},
+            "Operations": [operations],
+        }
+
+    def create_synthetic_catalog(self, n_tables: int, n_columns: int, databases: int = 1,
+                                 schemas_per_db: int = 1, rows: int = 0, prefix: str = "T"):
+        """
+        Creates `n_tables` tables of `n_columns` columns spread over databases/schemas.
+        Returns the list of (database, schema, table) created.
+        """
+        created = []
+        locations = [(f"SYN_DB_{d:02d}", f"SCHEMA_{s:02d}") for d in range(databases) for s in range(schemas_per_db)]
+        for database, schema in locations:
+            self.create_schema(database, schema)
+
+        columns = ", ".join(
+            f"COL_{c:04d} {'BIGINT' if c % 3 == 0 else 'VARCHAR' if c % 3 == 1 else 'DATE'}" for c in range(n_columns)
+        )
+        values = ", ".join(
+            "r" if c % 3 == 0 else "CAST(r AS VARCHAR)" if c % 3 == 1 else "DATE '2025-01-01' + CAST(r % 365 AS INTEGER)"
+            for c in range(n_columns)
+        )
+        for i in range(n_tables):
+            database, schema = locations[i % len(locations)]
+            table = f"{prefix}_{i:06d}"
+            self._execute(f"CREATE TABLE {database}.{schema}.{table} ({columns})")
+            if rows:
+                self._execute(f"INSERT INTO {database}.{schema}.{table} SELECT {values} FROM range({rows}) t(r)")
+            created.append((database, schema, table))
+        return created
+
+
+_default_standin: Optional[SnowflakeStandIn] = None
+
+
+def get_default_standin() -> SnowflakeStandIn:
+    """Process-wide stand-in used when ETL_BACKEND=duckdb (DUCKDB_PATH selects a file database)."""
+    global _default_standin
+    if _default_standin is None:
+        _default_standin = SnowflakeStandIn(os.getenv("DUCKDB_PATH", ":memory:"))
+    return _default_standin
@@ -0,0 +1,176 @@
+# utils/fake_llm.py
+
+import re
+import json
+import time
+import random
+import hashlib
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+
+def prompt_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(m.content) for m in messages)
+
+
+def prompt_key(text: str) -> str:
+    """Stable key for a prompt — whitespace-insensitive so reformatting does not break replays."""
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()[:16]
+
+
+def response_record(message: Any) -> Dict[str, Any]:
+    """
+    What a recording keeps of a model reply: the content, plus the tool calls and
+    additional_kwargs (function_call) a structured-output call answers with — those
+    replies usually have empty content.
+    """
+    record = {"response": getattr(message, "content", message)}
+    tool_calls = [{"name": c["name"], "args": c["args"], "id": c.get("id")} for c in getattr(message, "tool_calls", None) or []]
+    if tool_calls:
+        record["tool_calls"] = tool_calls
+    extra = getattr(message, "additional_kwargs", None)
+    if extra:
+        record["additional_kwargs"] = json.loads(json.dumps(extra, default=str))
+    return record
+
+
+class ReplayLLM(BaseChatModel):
+    """
+    Deterministic chat model for offline runs and benchmarks.
+
+    Responses come from, in order:
+    - `recordings`: { prompt_key: {"response": str, "latency_s": float} } captured from real runs;
+      a recorded "tool_calls" / "additional_kwargs" is replayed on the message as well
+    - `rules`: [(substring or regex, response str or callable(prompt) -> str)], first match wins;
+      a response may also be a recording entry dict, e.g. one answering with "tool_calls"
+    - `default_response`
+
+    `latency_jitter_s` and `failure_rate` let it stand in for a slow or flaky provider.
+    Responses carry usage_metadata (~4 characters per token) with an automatic prefix cache
+    like OpenAI's: a system message seen before counts as cache_read tokens.
+    """
+    recordings: Dict[str, Dict[str, Any]] = {}
+    rules: List[Any] = []
+    default_response: str = ""
+    latency_s: float = 0.0
+    latency_jitter_s: float = 0.0
+    failure_rate: float = 0.0
+    use_recorded_latency: bool = False
+    calls: int = 0
+    misses: int = 0
+    prompt_chars: int = 0
+    seen_prefixes: Dict[str, int] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplayLLM":
+        with open(path) as f:
+            data = json.load(f)
+        recordings = {r["prompt_key"]: r for r in data.get("recordings", [])}
+        return cls(recordings=recordings, **kwargs)
+
+    def respond(self, text: str) -> str:
+        return self.reply(text)["response"]
+
+    def reply(self, text: str) -> Dict[str, Any]:
+        """The response for a prompt as a recording entry: {"response", and any "tool_calls" / "additional_kwargs"}."""
+        self.calls += 1
+        self.prompt_chars += len(text)
+
+        recorded = self.recordings.get(prompt_key(text))
+        if recorded:
+            delay = recorded.get("latency_s", 0.0) if self.use_recorded_latency else self.latency_s
+            if delay:
+                time.sleep(delay)
+            return recorded
+
+        delay = self.latency_s + (random.expovariate(1 / self.latency_jitter_s) if self.latency_jitter_s else 0.0)
+        if delay:
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("ReplayLLM: simulated provider failure (503)")
+
+        for pattern, response in self.rules:
+            if pattern in text or re.search(pattern, text, re.DOTALL):
+                response = response(text) if callable(response) else response
+                return response if isinstance(response, dict) else {"response": response}
+
+        self.misses += 1
+        print(f"⚠️ ReplayLLM: no recording or rule for prompt {prompt_key(text)}")
+        return {"response": self.default_response}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        text = prompt_text(messages)
+        entry = self.reply(text)
+        content, tool_calls = entry["response"] or "", entry.get("tool_calls") or []
+        output = content + (json.dumps(tool_calls) if tool_calls else "")
+        message = AIMessage(content=content, tool_calls=tool_calls, additional_kwargs=entry.get("additional_kwargs") or {},
+                            usage_metadata=self._usage(messages, text, output))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _usage(self, messages: List[BaseMessage], text: str, content: str) -> Dict[str, Any]:
+        cached = 0
+        if messages and messages[0].type == "system":
+            key = prompt_key(str(messages[0].content))
+            cached = self.seen_prefixes.get(key, 0)
+            self.seen_prefixes[key] = len(str(messages[0].content)) // 4
+        input_tokens, output_tokens = len(text) // 4, len(content) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens, "input_token_details": {"cache_read": cached}}
+
+    def with_structured_output(self, schema: Any = None, include_raw: bool = False, **kwargs):
+        """
+        Replays a structured response and parses it (into the pydantic schema if one is given):
+        the recorded tool call's args, else a recorded function_call's arguments, else JSON content.
+        """
+        def parse(value):
+            message = self.invoke(value)
+            function_call = message.additional_kwargs.get("function_call") or {}
+            if message.tool_calls:
+                data = message.tool_calls[0]["args"]
+            elif function_call.get("arguments"):
+                data = json.loads(function_call["arguments"])
+            else:
+                data = json.loads(re.sub(r"^```(?:json)?|```$", "", message.content.strip(), flags=re.MULTILINE))
+            if isinstance(schema, type) and hasattr(schema, "model_validate"):
+                data = schema.model_validate(data)
+            return {"raw": message, "parsed": data, "parsing_error": None} if include_raw else data
+
+        return RunnableLambda(parse)
+
+
+class RecordingLLM(BaseChatModel):
+    """
+    Wraps a real chat model and records every prompt/response pair with its latency,
+    in the format ReplayLLM.from_file() reads.
+    """
+    inner: Any
+    recordings: List[Dict[str, Any]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        text = prompt_text(messages)
+        started = time.perf_counter()
+        response = self.inner.invoke(messages)
+        self.recordings.append({
+            "prompt_key": prompt_key(text),
+            "prompt": text,
+            **response_record(response),
+            "latency_s": round(time.perf_counter() - started, 3),
+        })
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"recordings": self.recordings}, f, indent=2)
@@ -21,10 +21,30 @@ LLM_MODEL_ChatAnthropic= "claude-3-7-sonnet-20250219"
 LLM_MODEL_ChatOpenAI= "gpt-3.5-turbo"
 LLM_MODEL_ChatFireworks= "accounts/fireworks/models/deepseek-v3-0324"
 
-def get_llm():
-    provider = os.getenv("LLM_PROVIDER_groq", "together").lower()
+# 🔌 Pluggable override (offline runs, benchmarks, replays)
+_llm_override = None
+
+def set_llm(llm):
+    """Routes every agent to `llm` (e.g. utils.fake_llm.ReplayLLM) instead of the configured provider."""
+    global _llm_override, _default_llm
+    _llm_override = llm
+    _default_llm = None
+
+# Provider → API key env var (a provider joins the router only when its key is set)
+PROVIDER_KEYS = {
+    "groq": "GROQ_API_KEY_2",
+    "together": "TOGETHER_API_KEY",
+    "fireworks": "FIREWORKS_API_KEY",
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+}
+
+def build_provider(provider: str):
+    if provider == "replay":
+        from utils.fake_llm import ReplayLLM
+        return ReplayLLM.from_file(os.getenv("LLM_REPLAY_FILE", "llm_recordings.json"))
 
-    if provider == "groq":
+    elif provider == "groq":
         return ChatGroq(
             temperature=0,
             model_name= LLM_MODEL_ChatGroq,
@@ -62,5 +82,73 @@ def get_llm():
     else:
         raise ValueError(f"❌ Unsupported LLM_PROVIDER: {provider}")
 
+def rate_limited(provider: str, llm):
+    """Puts the provider behind the shared rate limiter (LLM_RATE_LIMIT=false to bypass)."""
+    if provider == "replay" or os.getenv("LLM_RATE_LIMIT", "true").lower() != "true":
+        return llm
+    from utils.rate_limiter import RateLimitedLLM
+    return RateLimitedLLM(inner=llm, provider=provider)
+
+def prompt_caching(provider: str, llm):
+    """Cache breakpoints on stable prompt prefixes where the provider needs them, plus cached-token stats."""
+    from utils.prompt_cache import PromptCachingLLM
+    return PromptCachingLLM(inner=llm, provider=provider)
+
+def build_router(providers: dict = None):
+    """
+    LLMRouter over every provider with an API key (or LLM_ROUTER_PROVIDERS), or over
+    the given { name: chat model } — e.g. ReplayLLMs with simulated latency.
+    """
+    from utils.llm_router import LLMRouter
+
+    if providers is None:
+        names = os.getenv("LLM_ROUTER_PROVIDERS", ",".join(PROVIDER_KEYS)).split(",")
+        providers = {
+            name.strip(): rate_limited(name.strip(), prompt_caching(name.strip(), build_provider(name.strip())))
+            for name in names if os.getenv(PROVIDER_KEYS.get(name.strip(), ""), "")
+        }
+    return LLMRouter(providers=providers, hedge=os.getenv("LLM_ROUTER_HEDGE", "true").lower() == "true")
+
+def get_llm():
+    if _llm_override is not None:
+        return _llm_override
+
+    # 🧭 LLM_ROUTER=true spreads requests over all configured providers
+    if os.getenv("LLM_ROUTER", "false").lower() == "true":
+        return build_router()
+
+    provider = os.getenv("LLM_PROVIDER_groq", "together").lower()
+    return rate_limited(provider, prompt_caching(provider, build_provider(provider)))
+
+class _ModelProxy:
+    """
+    Module-level `model` used by the agents. Resolves the LLM lazily on first use so
+    importing an agent needs no API key, and so set_llm() takes effect everywhere.
+    With the router on, `tier` picks which providers may serve the agent.
+    """
+    def __init__(self, tier: str = None):
+        self.tier = tier
+
+    def _target(self):
+        global _default_llm
+        if _llm_override is not None:
+            llm = _llm_override
+        else:
+            if _default_llm is None:
+                _default_llm = get_llm()
+            llm = _default_llm
+        return llm.for_tier(self.tier) if self.tier and hasattr(llm, "for_tier") else llm
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __repr__(self):
+        return f"model -> {self._target()!r}"
+
+def model_for(tier: str) -> _ModelProxy:
+    """Model for an agent's latency/quality tier ("fast", "quality"; see utils.llm_router)."""
+    return _ModelProxy(tier)
+
 # Optional default
-model = get_llm()
+_default_llm = None
+model = _ModelProxy()
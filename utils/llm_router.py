@@ -0,0 +1,226 @@
+# utils/llm_router.py
+
+import os
+import time
+import random
+import threading
+import statistics
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+load_dotenv()
+
+ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "50"))
+MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+COOLDOWN_S = float(os.getenv("LLM_ROUTER_COOLDOWN_S", "30"))
+HEDGE_DEFAULT_S = float(os.getenv("LLM_ROUTER_HEDGE_DEFAULT_S", "2.0"))
+HEDGE_MIN_S = float(os.getenv("LLM_ROUTER_HEDGE_MIN_S", "0.05"))
+EXPLORE_RATE = float(os.getenv("LLM_ROUTER_EXPLORE_RATE", "0.05"))
+MIN_SAMPLES = 5
+
+# Tier → providers allowed to serve it (comma-separated env overrides)
+DEFAULT_TIERS = {
+    "fast": "groq,fireworks,together",
+    "quality": "anthropic,openai,together,fireworks",
+}
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_ROUTER_WORKERS", "16")), thread_name_prefix="llm-router")
+
+
+def _submit(fn, *args):
+    """Runs on the router pool with the caller's context (e.g. its LLM priority)."""
+    return _executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class ProviderStats:
+    """Rolling latency / error window for one provider."""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.last_failure = 0.0
+        self.requests = 0
+        self.hedges_won = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency_s: float, ok: bool):
+        with self._lock:
+            self.requests += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency_s)
+            else:
+                self.last_failure = time.time()
+
+    def p50(self) -> Optional[float]:
+        with self._lock:
+            return statistics.median(self.latencies) if self.latencies else None
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+    def samples(self) -> int:
+        with self._lock:
+            return len(self.outcomes)
+
+    def expected_latency(self) -> Optional[float]:
+        """Median latency inflated by the failure rate (a failure costs a retry elsewhere)."""
+        p50 = self.p50()
+        return p50 / max(0.05, 1.0 - self.error_rate()) if p50 is not None else None
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def healthy(self) -> bool:
+        """Unhealthy while the error rate is over the limit and the last failure is within the cooldown."""
+        return self.error_rate() <= MAX_ERROR_RATE or time.time() - self.last_failure > COOLDOWN_S
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.p50(), self.p95()
+        return {
+            "requests": self.requests,
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            "healthy": self.healthy(),
+            "hedges_won": self.hedges_won,
+        }
+
+
+def tier_providers(tier: Optional[str], available: List[str]) -> List[str]:
+    """Providers allowed for a tier, in preference order, limited to the configured ones."""
+    if not tier:
+        return list(available)
+    spec = os.getenv(f"LLM_TIER_{tier.upper()}", DEFAULT_TIERS.get(tier, ""))
+    allowed = [p.strip() for p in spec.split(",") if p.strip() in available]
+    return allowed or list(available)
+
+
+class LLMRouter(BaseChatModel):
+    """
+    Chat model that routes each request across several providers.
+
+    - Candidates are the providers of the caller's tier, healthy ones first, ordered by
+      rolling median latency inflated by error rate. Providers with fewer than
+      MIN_SAMPLES results go first, and a small share of requests probes a random one,
+      so a provider that recovers gets picked up again.
+    - With hedging on, a duplicate request goes to the next candidate once the
+      primary has been running longer than its p95; the first answer wins.
+    - A failed provider is skipped and the next candidate is tried.
+
+    `for_tier()` returns a view sharing the same providers and statistics.
+    """
+    providers: Dict[str, Any]
+    tier: Optional[str] = None
+    hedge: bool = True
+    stats: Dict[str, Any] = {}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if not self.stats:
+            self.stats = {name: ProviderStats() for name in self.providers}
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    def for_tier(self, tier: Optional[str]) -> "LLMRouter":
+        return self.model_copy(update={"tier": tier})
+
+    # --- Selection ---
+    def ranked_providers(self) -> List[str]:
+        candidates = tier_providers(self.tier, list(self.providers))
+
+        def key(name):
+            stats = self.stats[name]
+            expected = stats.expected_latency() if stats.samples() >= MIN_SAMPLES else None
+            return (not stats.healthy(), expected if expected is not None else -1.0, candidates.index(name))
+
+        ranked = sorted(candidates, key=key)
+        healthy = [name for name in ranked if self.stats[name].healthy()]
+        if len(healthy) > 1 and random.random() < EXPLORE_RATE:
+            probe = random.choice(healthy[1:])
+            ranked.remove(probe)
+            ranked.insert(0, probe)
+        return ranked
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.stats[name].p95()
+        return max(HEDGE_MIN_S, p95 if p95 is not None else HEDGE_DEFAULT_S)
+
+    # --- Calls ---
+    def _call(self, name: str, fn):
+        started = time.perf_counter()
+        try:
+            result = fn(self.providers[name])
+        except Exception:
+            self.stats[name].record(time.perf_counter() - started, ok=False)
+            raise
+        self.stats[name].record(time.perf_counter() - started, ok=True)
+        return result
+
+    def route(self, fn):
+        """
+        Runs fn(provider_model) on the best candidate, hedging onto the next one when it is slow.
+        Returns (provider name, result).
+        """
+        queue = self.ranked_providers()
+        pending = {}
+        last_error = None
+
+        while queue or pending:
+            if not pending:
+                name = queue.pop(0)
+                pending[_submit(self._call, name, fn)] = name
+
+            timeout = self.hedge_delay(next(iter(pending.values()))) if self.hedge and queue and len(pending) == 1 else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                name = queue.pop(0)
+                print(f"⏱️ LLMRouter: hedging onto {name}")
+                pending[_submit(self._call, name, fn)] = name
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠️ LLMRouter: {name} failed — {e}")
+                    last_error = e
+                    continue
+                if pending:
+                    self.stats[name].hedges_won += 1  # the slower request is left to finish in the background
+                return name, result
+
+        raise last_error or RuntimeError("❌ LLMRouter: no providers configured")
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        name, message = self.route(lambda llm: llm.invoke(messages, stop=stop, **kwargs))
+        message.response_metadata = {**(message.response_metadata or {}), "router_provider": name}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema: Any = None, **kwargs):
+        """Structured calls use each provider's own structured-output runnable, with the same routing."""
+        def call(value):
+            _, result = self.route(lambda llm: llm.with_structured_output(schema, **kwargs).invoke(value))
+            return result
+
+        return RunnableLambda(call)
+
+    def router_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
@@ -32,7 +32,17 @@ def refine_user_prompt_with_llm(raw_prompt: str, tables: List[str]) -> dict:
             "output_table": "fact_result_table"
         }
 
+_column_chain: Runnable = None
+
 def get_column_standardization_chain() -> Runnable:
+    """
+    Single-table chain, built once per process. For many tables use
+    utils.column_standardizer.standardize_tables (batched, cached by column signature).
+    """
+    global _column_chain
+    if _column_chain is not None:
+        return _column_chain
+
     prompt = ChatPromptTemplate.from_template("""
 You are a data engineering assistant. Given raw column metadata from a Snowflake table,
 suggest standardized column names and types based on enterprise naming conventions.
@@ -58,7 +68,7 @@ Only return the JSON object — no explanation.
 
     model = get_llm()
 
-    return prompt | model.with_structured_output(schema={
+    _column_chain = prompt | model.with_structured_output(schema={
         "title": "ColumnSuggestions",
         "description": "Suggested column names, types, and comments",
         "type": "object",
@@ -79,4 +89,4 @@ Only return the JSON object — no explanation.
         },
         "required": ["columns"]
     })
-
+    return _column_chain
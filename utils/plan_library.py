@@ -0,0 +1,211 @@
+# utils/plan_library.py
+
+import os
+import re
+import json
+import math
+import sqlite3
+import hashlib
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PLAN_LIBRARY_DB = os.getenv("PLAN_LIBRARY_DB", "plan_library.db")
+SIMILARITY_THRESHOLD = float(os.getenv("PLAN_SIMILARITY_THRESHOLD", "0.85"))
+EMBEDDING_DIM = 512
+
+STOPWORDS = {
+    "a", "an", "the", "from", "of", "by", "and", "for", "to", "in", "into", "with", "using",
+    "please", "create", "build", "make", "table", "tables", "me", "show", "get", "give",
+}
+
+# Words that flip or bound a request's meaning; a similar prompt only matches with the same ones
+QUALIFIER_WORDS = {
+    "not", "no", "non", "never", "without", "except", "exclude", "excludes", "excluding",
+    "include", "includes", "including", "only", "before", "after", "above", "below", "over", "under",
+    "less", "more", "min", "max", "minimum", "maximum", "first", "last", "top", "bottom",
+    "asc", "desc", "ascending", "descending", "earliest", "latest",
+}
+
+
+# --- Fingerprints ---
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, strip punctuation and filler words so equivalent asks compare equal."""
+    words = re.findall(r"[a-z0-9_]+", (prompt or "").lower())
+    return " ".join(w for w in words if w not in STOPWORDS)
+
+
+def prompt_constraints(prompt: str) -> List[str]:
+    """
+    The parts of a prompt that must match exactly for a similar plan to apply:
+    numbers ("2023", "top 10"), quoted literals and QUALIFIER_WORDS. Sorted, for comparison.
+    """
+    prompt = prompt or ""
+    numbers = {f"num:{n}" for n in re.findall(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])", prompt)}
+    literals = {f"lit:{a or b}" for a, b in re.findall(r"'([^']*)'|\"([^\"]*)\"", prompt)}
+    words = {f"word:{w}" for w in re.findall(r"[a-z]+", prompt.lower()) if w in QUALIFIER_WORDS}
+    return sorted(numbers | literals | words)
+
+
+def table_fingerprint(columns: List[Dict[str, Any]]) -> str:
+    """Hash of a table's (column name, type) pairs as returned by DESC TABLE."""
+    signature = sorted(f"{c.get('name', '')}:{c.get('type', '')}".upper() for c in columns)
+    return hashlib.sha256("|".join(signature).encode()).hexdigest()[:16]
+
+
+def metadata_fingerprints(raw_metadata: Dict[str, Any], resolved_tables: Dict[str, str]) -> Dict[str, str]:
+    """ { "DB.SCHEMA.TABLE": fingerprint } for every resolved input table """
+    return {
+        fqdn.upper(): table_fingerprint(raw_metadata.get(short_name) or [])
+        for short_name, fqdn in resolved_tables.items()
+    }
+
+
+def embed_text(text: str) -> List[float]:
+    """
+    Local hashed character-trigram embedding — cheap enough to keep plan lookup off the LLM path.
+    """
+    vector = [0.0] * EMBEDDING_DIM
+    padded = f"  {text}  "
+    for i in range(len(padded) - 2):
+        bucket = int(hashlib.md5(padded[i:i + 3].encode()).hexdigest(), 16) % EMBEDDING_DIM
+        vector[bucket] += 1.0
+
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+# --- Store ---
+
+def get_library(path: str = PLAN_LIBRARY_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS plans (
+            plan_id TEXT PRIMARY KEY,
+            normalized_prompt TEXT,
+            table_set TEXT,
+            table_fingerprints TEXT,
+            output_table TEXT,
+            embedding TEXT,
+            plan_json TEXT,
+            created_at TEXT,
+            hit_count INTEGER DEFAULT 0,
+            prompt_constraints TEXT
+        )
+    """)
+    # Libraries created before prompt_constraints existed
+    if "prompt_constraints" not in {row["name"] for row in conn.execute("PRAGMA table_info(plans)")}:
+        conn.execute("ALTER TABLE plans ADD COLUMN prompt_constraints TEXT")
+    return conn
+
+
+def save_plan(library: sqlite3.Connection, state: Dict[str, Any]) -> Optional[str]:
+    """Stores a completed workflow's SQL/CTE plan keyed by prompt, tables and metadata fingerprint."""
+    sop_sql = state.get("sop_sql") or {}
+    resolved_tables = state.get("resolved_tables") or {}
+    if not sop_sql.get("refined_sql") or not resolved_tables:
+        return None
+
+    normalized = normalize_prompt(state.get("raw_prompt", ""))
+    fingerprints = metadata_fingerprints(state.get("raw_metadata") or {}, resolved_tables)
+    table_set = json.dumps(sorted(fingerprints))
+    plan_id = hashlib.sha256(f"{normalized}|{table_set}".encode()).hexdigest()[:20]
+
+    plan = {
+        "sql_logic": state.get("sql_logic"),
+        "sop_sql": sop_sql,
+        "staging_tables": state.get("staging_tables"),
+        "final_table": state.get("final_table"),
+    }
+
+    library.execute("""
+        INSERT OR REPLACE INTO plans (plan_id, normalized_prompt, table_set, table_fingerprints,
+                                      output_table, embedding, plan_json, created_at, prompt_constraints)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        plan_id, normalized, table_set, json.dumps(fingerprints), state.get("output_table_name"),
+        json.dumps(embed_text(normalized)), json.dumps(plan, default=str), datetime.now().isoformat(),
+        json.dumps(prompt_constraints(state.get("raw_prompt", ""))),
+    ))
+    library.commit()
+    print(f"📚 Plan {plan_id} saved to plan library")
+    return plan_id
+
+
+def find_plan(library: sqlite3.Connection, raw_prompt: str, raw_metadata: Dict[str, Any],
+              resolved_tables: Dict[str, str], threshold: float = SIMILARITY_THRESHOLD) -> Optional[Dict[str, Any]]:
+    """
+    Looks up a stored plan for the same table set: exact prompt match first, then embedding similarity.
+    Either way the prompt_constraints() must be identical — "revenue for 2023" never matches
+    "revenue for 2024", nor "excluding" "including". Plans whose input-table fingerprints no
+    longer match the current metadata are invalidated.
+    """
+    normalized = normalize_prompt(raw_prompt)
+    constraints = prompt_constraints(raw_prompt)
+    fingerprints = metadata_fingerprints(raw_metadata, resolved_tables)
+    table_set = json.dumps(sorted(fingerprints))
+
+    candidates = library.execute("SELECT * FROM plans WHERE table_set = ?", (table_set,)).fetchall()
+    query_vector = embed_text(normalized)
+    best = None
+
+    for row in candidates:
+        if json.loads(row["table_fingerprints"]) != fingerprints:
+            print(f"🗑️ Plan {row['plan_id']} invalidated — input table metadata changed")
+            library.execute("DELETE FROM plans WHERE plan_id = ?", (row["plan_id"],))
+            continue
+
+        stored = row["prompt_constraints"]
+        stored = json.loads(stored) if stored else prompt_constraints(row["normalized_prompt"])
+        if stored != constraints:
+            continue
+
+        if row["normalized_prompt"] == normalized:
+            best = (1.0, row, "exact")
+            break
+
+        score = cosine(query_vector, json.loads(row["embedding"]))
+        if score >= threshold and (best is None or score > best[0]):
+            best = (score, row, "similar")
+
+    library.commit()
+    if not best:
+        return None
+
+    score, row, match = best
+    library.execute("UPDATE plans SET hit_count = hit_count + 1 WHERE plan_id = ?", (row["plan_id"],))
+    library.commit()
+
+    return {
+        "plan_id": row["plan_id"],
+        "match": match,
+        "similarity": round(score, 3),
+        "output_table": row["output_table"],
+        "plan": json.loads(row["plan_json"]),
+    }
+
+
+def invalidate_table(library: sqlite3.Connection, fqdn: str) -> int:
+    """Drops every stored plan that reads the given table. Returns plans removed."""
+    rows = library.execute("SELECT plan_id, table_set FROM plans").fetchall()
+    stale = [r["plan_id"] for r in rows if fqdn.upper() in json.loads(r["table_set"])]
+    library.executemany("DELETE FROM plans WHERE plan_id = ?", [(p,) for p in stale])
+    library.commit()
+    return len(stale)
+
+
+def retarget_plan(plan: Dict[str, Any], old_output: Optional[str], new_output: Optional[str]) -> Dict[str, Any]:
+    """Renames the stored output table inside the plan's SQL when the new request names a different one."""
+    if not old_output or not new_output or old_output.lower() == new_output.lower():
+        return plan
+
+    pattern = re.compile(rf"\b{re.escape(old_output)}\b", re.IGNORECASE)
+    return json.loads(pattern.sub(new_output, json.dumps(plan)))
@@ -0,0 +1,155 @@
+# utils/prompt_cache.py
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+load_dotenv()
+
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "true").lower() == "true"
+
+# Providers that cache a prompt prefix only where the request marks it (cache_control breakpoints);
+# OpenAI caches stable prefixes of 1024+ tokens on its own, the others may or may not
+BREAKPOINT_PROVIDERS = set(os.getenv("PROMPT_CACHE_BREAKPOINT_PROVIDERS", "anthropic").split(","))
+
+
+def prompt_messages(label: str, rules: str, context: str, request: str) -> List[BaseMessage]:
+    """
+    Splits a prompt into a stable system prefix and a variable suffix:
+    - rules: static instructions and SOPs, identical for every call of the agent
+    - context: data shared by a run's calls (database, schema, table columns and samples)
+    - request: what changes per call (requirement, SQL to fix, ...) — the human message
+    The label names the prompt in prompt_cache_stats().
+    """
+    blocks = [b.strip() for b in (rules, context) if b and b.strip()]
+    return [
+        SystemMessage(content="\n\n".join(blocks), additional_kwargs={"prompt_label": label, "prompt_blocks": blocks}),
+        HumanMessage(content=request.strip()),
+    ]
+
+
+def with_breakpoints(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Copies of the messages with a cache_control breakpoint after each block of the system prefix."""
+    marked = []
+    for message in messages:
+        blocks = message.additional_kwargs.get("prompt_blocks") if isinstance(message, SystemMessage) else None
+        if blocks:
+            message = SystemMessage(content=[
+                {"type": "text", "text": block + ("\n\n" if i < len(blocks) - 1 else ""),
+                 "cache_control": {"type": "ephemeral"}}
+                for i, block in enumerate(blocks)
+            ])
+        marked.append(message)
+    return marked
+
+
+def label_of(messages: Any) -> str:
+    if isinstance(messages, list):
+        for message in messages:
+            if isinstance(message, BaseMessage) and message.additional_kwargs.get("prompt_label"):
+                return message.additional_kwargs["prompt_label"]
+    return "unlabelled"
+
+
+# --- Usage ---
+
+_usage: Dict[str, Dict[str, int]] = {}
+_usage_lock = threading.Lock()
+
+
+def token_usage(message: Any) -> Optional[Dict[str, int]]:
+    """Input, cache-read and cache-write tokens of a response (LangChain usage_metadata or raw provider usage)."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return {"input_tokens": usage.get("input_tokens", 0), "cached_tokens": details.get("cache_read", 0),
+                "cache_write_tokens": details.get("cache_creation", 0)}
+
+    raw = (getattr(message, "response_metadata", None) or {}).get("usage") \
+        or (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    if not raw:
+        return None
+    if "cache_read_input_tokens" in raw or "cache_creation_input_tokens" in raw:  # Anthropic: input_tokens excludes cache
+        cached, written = raw.get("cache_read_input_tokens") or 0, raw.get("cache_creation_input_tokens") or 0
+        return {"input_tokens": raw.get("input_tokens", 0) + cached + written, "cached_tokens": cached,
+                "cache_write_tokens": written}
+    details = raw.get("prompt_tokens_details") or {}  # OpenAI-compatible
+    return {"input_tokens": raw.get("prompt_tokens", 0), "cached_tokens": details.get("cached_tokens") or 0,
+            "cache_write_tokens": 0}
+
+
+def record_usage(provider: str, label: str, message: Any):
+    usage = token_usage(message)
+    if not usage:
+        return
+    with _usage_lock:
+        for key in (label, f"provider:{provider}"):
+            entry = _usage.setdefault(key, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0})
+            entry["calls"] += 1
+            for field in ("input_tokens", "cached_tokens", "cache_write_tokens"):
+                entry[field] += usage[field] or 0
+    if usage["input_tokens"]:
+        print(f"🧊 Prompt cache [{label} @ {provider}]: {usage['cached_tokens']}/{usage['input_tokens']} input tokens "
+              f"read from cache ({usage['cached_tokens'] / usage['input_tokens']:.0%}), {usage['cache_write_tokens']} written")
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Per prompt label (and per "provider:<name>"): calls, input/cached tokens and cached_ratio."""
+    with _usage_lock:
+        return {key: {**entry, "cached_ratio": round(entry["cached_tokens"] / entry["input_tokens"], 3)
+                      if entry["input_tokens"] else None}
+                for key, entry in _usage.items()}
+
+
+def usage_totals() -> Dict[str, int]:
+    with _usage_lock:
+        entries = [e for k, e in _usage.items() if not k.startswith("provider:")]
+        return {"input_tokens": sum(e["input_tokens"] for e in entries),
+                "cached_tokens": sum(e["cached_tokens"] for e in entries)}
+
+
+class PromptCachingLLM(BaseChatModel):
+    """
+    Chat model wrapper that sets cache breakpoints on prompt_messages() prefixes for providers
+    that need them, and records cached-token usage of every call.
+    """
+    inner: Any
+    provider: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"prompt-caching-{self.provider}"
+
+    def _prepare(self, value: Any) -> Any:
+        if PROMPT_CACHE and self.provider in BREAKPOINT_PROVIDERS and isinstance(value, list):
+            return with_breakpoints(value)
+        return value
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        message = self.inner.invoke(self._prepare(messages), stop=stop, **kwargs)
+        record_usage(self.provider, label_of(messages), message)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema: Any = None, **kwargs):
+        """Asks for the raw message alongside the parsed output, so structured calls are measured too."""
+        include_raw = kwargs.pop("include_raw", False)
+        structured = self.inner.with_structured_output(schema, include_raw=True, **kwargs)
+
+        def call(value):
+            result = structured.invoke(self._prepare(value))
+            if not (isinstance(result, dict) and "raw" in result and "parsed" in result):
+                return result  # inner model ignores include_raw
+            record_usage(self.provider, label_of(value), result["raw"])
+            if include_raw:
+                return result
+            if result.get("parsing_error"):
+                raise result["parsing_error"]
+            return result["parsed"]
+
+        return RunnableLambda(call)
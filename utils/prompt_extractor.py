@@ -0,0 +1,134 @@
+# utils/prompt_extractor.py
+
+import os
+import re
+import difflib
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from utils.table_index import SchemaTableIndex, normalize
+
+load_dotenv()
+
+# An identifier-style token that is not a table but this close to one is probably a typo → ask the LLM
+NEAR_MISS_SCORE = float(os.getenv("INPUT_RULES_NEAR_MISS_SCORE", "0.88"))
+
+IDENT = r"[A-Za-z_][A-Za-z0-9_$]*(?:\.[A-Za-z_][A-Za-z0-9_$]*){0,2}"
+_QUOTED = re.compile(rf"[`\"']({IDENT})[`\"']")
+_TOKEN = re.compile(IDENT)
+
+# "into table X", "as a new table X", "output table named X", "save it as X", "into X"
+_OUTPUT_PATTERNS = [
+    re.compile(rf"(?i)\b(?:into|as|to)\s+(?:(?:a|an|the|new|output|target|final)\s+)*table\s+(?:(?:named|called)\s+)?[`\"']?({IDENT})"),
+    re.compile(rf"(?i)\b(?:output|target|result|destination)\s+table\s*(?:(?:named|called|is|should\s+be)\s+)?[:=]?\s*[`\"']?({IDENT})"),
+    re.compile(rf"(?i)\b(?:named|called)\s+[`\"']?({IDENT})"),
+    re.compile(rf"(?i)\b(?:into|as)\s+[`\"']?({IDENT})"),
+]
+_NOT_A_NAME = {"a", "an", "the", "new", "one", "table", "tables", "well", "per", "of", "snowflake", "it", "them", "named", "called"}
+# An unresolved identifier right after one of these is read as a column ("by CUSTOMER_ID", "total AMOUNT")
+_COLUMN_CUES = {"by", "per", "on", "using", "where", "of", "sum", "total", "count", "avg", "average",
+                "min", "max", "column", "columns", "field", "fields"}
+
+
+def _identifier_style(token: str, quoted: set) -> bool:
+    """Written like a table name rather than a word: quoted, dotted, UPPER CASE or snake_case."""
+    return token in quoted or "." in token or "_" in token or (token.isupper() and len(token) > 1)
+
+
+def _near_miss(key: str, index: SchemaTableIndex) -> bool:
+    """CUSTOMRS → CUSTOMERS is a near miss; CUSTOMER_ID → CUSTOMERS is not."""
+    return any(difflib.SequenceMatcher(None, key, normalize(table)).ratio() >= NEAR_MISS_SCORE
+               for table, _ in index.candidates(key, limit=3, min_score=0.5))
+
+
+def _outside(token: str, index: SchemaTableIndex) -> bool:
+    """A DB.SCHEMA.TABLE or SCHEMA.TABLE name qualified with another database or schema than the index's."""
+    parts = [part.strip('"').upper() for part in token.split(".")]
+    if len(parts) < 2:
+        return False
+    if parts[-2] != index.schema.upper():
+        return True
+    return len(parts) == 3 and parts[0] != index.database.upper()
+
+
+def find_output_table(prompt: str, qualified: bool = False) -> Optional[str]:
+    """The output table name (its last part, or as written with `qualified`), if the prompt names one."""
+    for pattern in _OUTPUT_PATTERNS:
+        for match in pattern.finditer(prompt):
+            name = match.group(1)
+            # The bare "into X" / "as X" forms only count for identifier-style names
+            if name.lower() in _NOT_A_NAME or (pattern is _OUTPUT_PATTERNS[-1] and not _identifier_style(name, set())):
+                continue
+            return name if qualified else name.split(".")[-1]
+    return None
+
+
+def extract_from_prompt(prompt: str, index: SchemaTableIndex) -> Dict[str, Any]:
+    """
+    Deterministic extraction of source tables and the output table.
+    Returns {"tables", "output_table", "confident", "reason"}. `confident` is True only when
+    at least one table was found verbatim in the catalog, the output table is named explicitly,
+    every identifier-style token outside a column position resolved to a table, every catalog
+    table mentioned in prose ("join orders with ...") is among the tables found, no name is
+    qualified with another database or schema than the index's, and the output table is not an
+    existing table (its CREATE OR REPLACE would overwrite it).
+    """
+    written_output = find_output_table(prompt, qualified=True)
+    output_table = written_output.split(".")[-1] if written_output else None
+    quoted = set(_QUOTED.findall(prompt))
+    tokens = _TOKEN.findall(prompt)
+    words = [t.lower() for t in tokens]
+
+    tables: List[str] = []
+    near_misses: List[str] = []
+    unresolved: List[str] = []
+    prose: Dict[str, str] = {}  # table → lowercase mention that names it
+    outside: List[str] = [written_output] if written_output and _outside(written_output, index) else []
+    output_key = normalize(output_table) if output_table else None
+
+    for i, token in enumerate(tokens):
+        key = normalize(token)
+        if key == output_key:
+            continue
+        # MARKETING.CAMPAIGNS is not CAMPAIGNS of the selected schema
+        if _outside(token, index):
+            outside.append(token)
+            continue
+        hits = index.lookup(token)
+        # "order items" → ORDER_ITEMS
+        if not hits and i + 1 < len(tokens):
+            hits = index.lookup(f"{words[i]}_{words[i + 1]}")
+        # Plain lowercase words ("the orders") only count through a snake_case table name
+        strong = _identifier_style(token, quoted) or any("_" in h for h in hits)
+        if hits and strong:
+            if len(hits) > 1:
+                near_misses.append(token)
+            elif hits[0] not in tables:
+                tables.append(hits[0])
+        elif hits:
+            # "join orders with ..." may be the ORDERS table or just a word: only fine if it is named anyway
+            for hit in hits:
+                prose.setdefault(hit, token)
+        elif _identifier_style(token, quoted) and not hits:
+            if _near_miss(key, index):
+                near_misses.append(token)
+            elif not (i and words[i - 1] in _COLUMN_CUES):
+                unresolved.append(token)
+
+    if not tables:
+        reason = "no catalog table named verbatim"
+    elif not output_table:
+        reason = "no explicit output table"
+    elif index.lookup(output_table):
+        reason = f"output table {output_table} already exists in {index.database}.{index.schema}"
+    elif outside:
+        reason = f"tables outside {index.database}.{index.schema}: {', '.join(outside)}"
+    elif unresolved:
+        reason = f"names not found in {index.database}.{index.schema}: {', '.join(unresolved)}"
+    elif near_misses:
+        reason = f"possible misspelt or ambiguous tables: {', '.join(near_misses)}"
+    elif set(prose) - set(tables):
+        reason = f"tables mentioned in prose: {', '.join(prose[t] for t in prose if t not in tables)}"
+    else:
+        reason = None
+    return {"tables": tables, "output_table": output_table, "confident": reason is None, "reason": reason}
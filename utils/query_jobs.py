@@ -0,0 +1,323 @@
+# utils/query_jobs.py
+
+import os
+import time
+import uuid
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Sequence
+import pandas as pd
+from dotenv import load_dotenv
+
+from utils.snowflake_utils import get_snowflake_connection, connection_backend
+from utils.cost_guard import fetch_query_stats
+
+load_dotenv()
+
+JOB_POLL_INTERVAL_S = float(os.getenv("QUERY_JOB_POLL_INTERVAL_S", "0.5"))
+JOB_PROGRESS_INTERVAL_S = float(os.getenv("QUERY_JOB_PROGRESS_INTERVAL_S", "5"))  # ROWS_PRODUCED lookups
+JOB_RETENTION_S = float(os.getenv("QUERY_JOB_RETENTION_S", "3600"))
+SESSION_IDLE_S = float(os.getenv("QUERY_JOB_SESSION_IDLE_S", "600"))
+
+TERMINAL = {"succeeded", "failed", "cancelled"}
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class QueryJob:
+    """One statement submitted with execute_async and tracked by its sfqid."""
+
+    def __init__(self, session_id: str, label: str, sql: str, setup: Sequence[str] = ()):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.label = label
+        self.sql = sql
+        self.setup = tuple(setup)
+        self.sfqid: Optional[str] = None
+        self.status = "submitting"
+        self.submitted_at = datetime.now()
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.rows_produced: Optional[int] = None
+        self.columns: List[str] = []
+        self.rows: Optional[List[tuple]] = None
+        self.stats: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self.consumed = False
+        self.done = threading.Event()
+        self.lock = threading.Lock()  # one poller at a time (waiting caller or background thread)
+        self._last_progress = self.started  # first ROWS_PRODUCED lookup after JOB_PROGRESS_INTERVAL_S
+
+    @property
+    def elapsed_s(self) -> float:
+        return round((self.finished or time.monotonic()) - self.started, 1)
+
+    @property
+    def elapsed_ms(self) -> float:
+        return round(((self.finished or time.monotonic()) - self.started) * 1000, 1)
+
+    def dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.rows or [], columns=self.columns)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id, "label": self.label, "sfqid": self.sfqid, "status": self.status,
+            "elapsed_s": self.elapsed_s, "rows_produced": self.rows_produced, "error": self.error,
+        }
+
+    def describe(self) -> str:
+        return describe_snapshot(self.snapshot())
+
+
+def describe_snapshot(snapshot: Dict[str, Any]) -> str:
+    """One-line progress text of a QueryJob.snapshot() (also used for snapshots sent by turn workers)."""
+    rows = f", {snapshot['rows_produced']:,} rows" if snapshot.get("rows_produced") is not None else ""
+    return f"{snapshot['label']}: {snapshot['status']} ({snapshot['elapsed_s']:.0f}s{rows})"
+
+
+class QueryJobManager:
+    """
+    Process-wide registry of async Snowflake queries, keyed by session so a Streamlit
+    rerun finds (and can cancel) the queries its previous run started.
+    - one Snowflake connection per session, reused by that session's jobs
+    - a background thread polls get_query_status and fetches finished results
+    - callers block in wait()/run() with a progress callback, or just poll jobs()
+    """
+
+    def __init__(self, connection_factory: Callable = None, poll_interval: float = JOB_POLL_INTERVAL_S):
+        self.connection_factory = connection_factory or get_snowflake_connection
+        self.poll_interval = poll_interval
+        self._jobs: Dict[str, QueryJob] = {}
+        self._sessions: Dict[str, Dict[str, Any]] = {}  # session_id → {"conn", "backend", "last_used"}
+        self._lock = threading.RLock()
+        self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poller.start()
+
+    # --- Sessions ---
+    def _connection(self, session_id: str):
+        backend = connection_backend()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session["backend"] is not backend and not self._busy(session_id):
+                self._sessions.pop(session_id)["conn"].close()
+                session = None
+            if session is None:
+                session = self._sessions[session_id] = {"conn": self.connection_factory(), "backend": backend}
+            session["last_used"] = time.monotonic()
+            return session["conn"]
+
+    def _busy(self, session_id: str) -> bool:
+        return any(j.session_id == session_id and j.sfqid and j.status not in TERMINAL for j in self._jobs.values())
+
+    def close_session(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session:
+            session["conn"].close()
+
+    # --- Submission ---
+    def submit(self, session_id: str, label: str, sql: str, setup: Sequence[str] = ()) -> QueryJob:
+        """
+        Starts `sql` with execute_async after running the `setup` statements (USE ..., ALTER SESSION ...).
+        A running or unconsumed finished job of the same session, SQL and setup is returned instead
+        of resubmitting — that is how a rerun picks up the query its interrupted run started. The
+        same SQL under another database, schema or timeout is a different query.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.session_id == session_id and job.sql == sql and job.setup == tuple(setup) \
+                        and not job.consumed and job.status not in ("failed", "cancelled"):
+                    print(f"🔗 Reattached to query job {job.job_id} ({job.status})")
+                    return job
+            job = QueryJob(session_id, label, sql, setup)
+            self._jobs[job.job_id] = job
+
+        try:
+            conn = self._connection(session_id)
+            cursor = conn.cursor()
+            for statement in setup:
+                cursor.execute(statement)
+            cursor.execute_async(sql)
+            job.sfqid = cursor.sfqid
+            job.status = "queued"
+            cursor.close()
+        except Exception as e:
+            self._finish(job, "failed", error=str(e))
+        print(f"🚀 Submitted {label} as {job.sfqid or 'failed submission'}")
+        return job
+
+    def wait(self, job: QueryJob, on_progress: Optional[Callable[[QueryJob], None]] = None,
+             timeout: Optional[float] = None) -> QueryJob:
+        """
+        Blocks until the job finishes, calling on_progress(job) after every poll. The waiting
+        thread polls itself with a backoff from 20 ms, so short queries return promptly.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        delay = 0.02
+        while not job.done.is_set():
+            self._poll(job)
+            if job.done.wait(delay):
+                break
+            if on_progress:
+                on_progress(job)
+            if deadline and time.monotonic() > deadline:
+                break
+            delay = min(delay * 2, self.poll_interval)
+        if on_progress:
+            on_progress(job)
+        return job
+
+    def run(self, session_id: str, label: str, sql: str, setup: Sequence[str] = (),
+            on_progress: Optional[Callable[[QueryJob], None]] = None) -> QueryJob:
+        """submit() + collect()."""
+        return self.collect(self.submit(session_id, label, sql, setup), on_progress)
+
+    def collect(self, job: QueryJob, on_progress: Optional[Callable[[QueryJob], None]] = None) -> QueryJob:
+        """Waits for a submitted job and consumes its result; raises on failure or cancellation."""
+        job = self.wait(job, on_progress or _progress_callbacks.get(job.session_id))
+        job.consumed = True
+        if job.status == "cancelled":
+            raise QueryCancelled(f"{job.label} was cancelled")
+        if job.status == "failed":
+            raise RuntimeError(job.error)
+        return job
+
+    def query_stats(self, job: QueryJob) -> Dict[str, Any]:
+        """QUERY_HISTORY statistics of a finished job, looked up once on request (an extra round trip)."""
+        if job.done.is_set() and job.sfqid and not job.stats:
+            cursor = self._connection(job.session_id).cursor()
+            try:
+                job.stats = {k: v for k, v in fetch_query_stats(cursor, job.sfqid).items() if v is not None}
+            finally:
+                cursor.close()
+        return job.stats
+
+    # --- Cancellation ---
+    def cancel(self, job_id: str) -> bool:
+        """Asks Snowflake to cancel the query (SYSTEM$CANCEL_QUERY); the poller records the outcome."""
+        job = self._jobs.get(job_id)
+        if not job or job.status in TERMINAL or not job.sfqid:
+            return False
+        job.cancel_requested = True
+        conn = self._connection(job.session_id)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT SYSTEM$CANCEL_QUERY('{job.sfqid}')")
+            print(f"🛑 Cancel requested for {job.sfqid}: {cursor.fetchone()[0]}")
+        finally:
+            cursor.close()
+        return True
+
+    def cancel_session(self, session_id: str) -> int:
+        return sum(self.cancel(job.job_id) for job in self.jobs(session_id, active_only=True))
+
+    # --- Queries ---
+    def jobs(self, session_id: str, active_only: bool = False) -> List[QueryJob]:
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.session_id == session_id]
+        return [j for j in jobs if not active_only or j.status not in TERMINAL]
+
+    def get(self, job_id: str) -> Optional[QueryJob]:
+        return self._jobs.get(job_id)
+
+    # --- Polling ---
+    def _finish(self, job: QueryJob, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        job.done.set()
+
+    def _poll_job(self, job: QueryJob):
+        conn = self._connection(job.session_id)
+        status = conn.get_query_status(job.sfqid)
+
+        if conn.is_still_running(status):
+            job.status = "queued" if status.name.startswith(("QUEUED", "RESUMING", "BLOCKED")) else "running"
+            if time.monotonic() - job._last_progress > JOB_PROGRESS_INTERVAL_S:
+                job._last_progress = time.monotonic()
+                cursor = conn.cursor()
+                job.rows_produced = fetch_query_stats(cursor, job.sfqid).get("rows_produced", job.rows_produced)
+                cursor.close()
+            return
+
+        if conn.is_an_error(status):
+            try:
+                conn.get_query_status_throw_if_error(job.sfqid)
+                error = status.name
+            except Exception as e:
+                error = str(e)
+            cancelled = job.cancel_requested or status.name.startswith("ABORT")
+            self._finish(job, "cancelled" if cancelled else "failed", error)
+            return
+
+        cursor = conn.cursor()
+        try:
+            cursor.get_results_from_sfqid(job.sfqid)
+            job.rows = cursor.fetchall()
+            job.columns = [d[0] for d in cursor.description or []]
+            job.rows_produced = len(job.rows)
+        finally:
+            cursor.close()
+        self._finish(job, "succeeded")
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                active = [j for j in self._jobs.values() if j.sfqid and j.status not in TERMINAL]
+            for job in active:
+                self._poll(job)
+            self._cleanup()
+
+    def _poll(self, job: QueryJob):
+        if not job.sfqid or not job.lock.acquire(blocking=False):
+            return
+        try:
+            if not job.done.is_set():
+                self._poll_job(job)
+        except Exception as e:
+            print(f"⚠️ Polling {job.sfqid} failed: {e}")
+            self._finish(job, "failed", str(e))
+        finally:
+            job.lock.release()
+
+    def _cleanup(self):
+        now = time.monotonic()
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished and now - job.finished > JOB_RETENTION_S:
+                    del self._jobs[job_id]
+            idle = [s for s, v in self._sessions.items() if not self._busy(s) and now - v["last_used"] > SESSION_IDLE_S]
+        for session_id in idle:
+            self.close_session(session_id)
+
+
+_manager: Optional[QueryJobManager] = None
+_manager_lock = threading.Lock()
+_progress_callbacks: Dict[str, Callable[[QueryJob], None]] = {}
+
+
+def get_job_manager() -> QueryJobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = QueryJobManager()
+        return _manager
+
+
+def set_progress_callback(session_id: str, callback: Optional[Callable[[QueryJob], None]]):
+    """
+    Progress hook for run() calls of this session (e.g. a Streamlit placeholder). It is
+    called from the thread that waits on the job.
+    """
+    if callback is None:
+        _progress_callbacks.pop(session_id, None)
+    else:
+        _progress_callbacks[session_id] = callback
+
+
+def session_of(state: Dict[str, Any]) -> str:
+    return state.get("session_id") or "local"
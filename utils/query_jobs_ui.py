@@ -0,0 +1,53 @@
+# utils/query_jobs_ui.py
+
+import streamlit as st
+from utils.query_jobs import get_job_manager, set_progress_callback, session_of, describe_snapshot
+
+
+def render_query_jobs(state: dict, service=None):
+    """
+    Sidebar panel listing this session's queries that are still running, with a Cancel
+    button per query. Jobs are kept by the process-wide job manager — or, when turns run
+    on a core.turn_service worker, reported by it — so the panel also shows queries
+    started by a run that a rerun interrupted.
+    """
+    session_id = session_of(state)
+    if service is not None:
+        active = service.active_queries(session_id)
+        cancel = lambda job: service.cancel(session_id, job["job_id"]) or True
+    else:
+        manager = get_job_manager()
+        active = [job.snapshot() for job in manager.jobs(session_id, active_only=True)]
+        cancel = lambda job: manager.cancel(job["job_id"])
+    if not active:
+        return
+
+    with st.sidebar:
+        st.subheader("⏳ Running Queries")
+        st.button("🔄 Refresh", key="query_jobs_refresh")
+        for job in active:
+            st.caption(f"{describe_snapshot(job)} · `{job['sfqid']}`")
+            if st.button("🛑 Cancel", key=f"cancel_{job['job_id']}"):
+                if cancel(job):
+                    state["chatbot_messages"].append({
+                        "sender": "assistant",
+                        "text": f"🛑 Cancelled {job['label'].lower()} (`{job['sfqid']}`)."
+                    })
+                    st.rerun()
+
+
+def progress_placeholder(state: dict):
+    """
+    Routes progress of this session's queries into an st.empty() placeholder while the
+    graph runs. Returns the placeholder; clear it (and call set_progress_callback(..., None)) afterwards.
+    """
+    placeholder = st.empty()
+
+    def show(job):
+        if job.status in ("queued", "running"):
+            placeholder.info(f"⏳ {job.describe()}")
+        else:
+            placeholder.empty()
+
+    set_progress_callback(session_of(state), show)
+    return placeholder
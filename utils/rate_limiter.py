@@ -0,0 +1,281 @@
+# utils/rate_limiter.py
+
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+import statistics
+import contextvars
+from collections import deque, Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+load_dotenv()
+
+# Defaults; per provider override with LLM_RPM_<PROVIDER>, LLM_TPM_<PROVIDER>, LLM_MAX_CONCURRENCY_<PROVIDER>
+DEFAULT_RPM = float(os.getenv("LLM_RPM", "120"))
+DEFAULT_TPM = float(os.getenv("LLM_TPM", "200000"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+INITIAL_CONCURRENCY = float(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+BACKOFF_CAP_S = float(os.getenv("LLM_BACKOFF_CAP_S", "30"))
+
+# Lower number = served first
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+
+_priority = contextvars.ContextVar("llm_priority", default="interactive")
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504, 529}
+_RETRYABLE_TEXT = re.compile(r"\b(429|5(?:00|02|03|04|29)|rate.?limit|too many requests|overloaded|temporarily unavailable)\b", re.I)
+_THROTTLE_TEXT = re.compile(r"\b(429|rate.?limit|too many requests)\b", re.I)
+
+
+@contextmanager
+def llm_priority(name: str):
+    """
+    LLM calls made inside this block queue at `name` priority:
+        with llm_priority("batch"):
+            graph.invoke(state)
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"❌ Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+# --- Error classification ---
+
+def _status_code(error: Exception) -> Optional[int]:
+    for source in (error, getattr(error, "response", None)):
+        status = getattr(source, "status_code", None) or getattr(source, "status", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return bool(_RETRYABLE_TEXT.search(str(error)))
+
+
+def is_throttle(error: Exception) -> bool:
+    status = _status_code(error)
+    return status == 429 if status is not None else bool(_THROTTLE_TEXT.search(str(error)))
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+
+# --- Limiter ---
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to a one-minute burst. Callers hold the limiter lock."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Charges (or refunds) the difference between estimated and actual usage."""
+        self._refill()
+        self.level = min(self.capacity, self.level - delta)
+
+
+class ProviderLimiter:
+    """
+    Admission control for one provider:
+    - requests/min and tokens/min token buckets
+    - AIMD concurrency limit: +1 per limit's worth of successes, halved on a 429
+    - waiting callers are served strictly by priority, then arrival order
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: float, max_concurrency: int,
+                 initial_concurrency: float = INITIAL_CONCURRENCY):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = min(float(max_concurrency), initial_concurrency)
+        self.in_flight = 0
+        self._queue: List = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.waits = {p: deque(maxlen=500) for p in PRIORITIES}
+        self.counters = Counter()
+
+    def acquire(self, tokens: int, priority: str = "interactive") -> float:
+        """Blocks until this call may start. Returns seconds waited."""
+        ticket = (PRIORITIES.get(priority, 0), next(self._seq))
+        started = time.monotonic()
+
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            while True:
+                if self._queue[0] == ticket and self.in_flight < int(self.limit):
+                    delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if delay == 0:
+                        break
+                    self._cond.wait(timeout=delay)
+                else:
+                    self._cond.wait(timeout=0.5)
+
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            waited = time.monotonic() - started
+            self.waits[priority].append(waited)
+            self.counters["admitted"] += 1
+            self._cond.notify_all()
+
+        return waited
+
+    def release(self, ok: bool, throttled: bool = False, token_delta: int = 0):
+        with self._cond:
+            self.in_flight -= 1
+            if token_delta:
+                self.tokens.adjust(token_delta)
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+                self.counters["throttled"] += 1
+            elif ok:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            else:
+                self.counters["errors"] += 1
+            self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = Counter(p for p, _ in self._queue)
+            names = {v: k for k, v in PRIORITIES.items()}
+            waits = {p: sorted(w) for p, w in self.waits.items() if w}
+            return {
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queue_depth": {names[p]: n for p, n in depth.items()},
+                "wait_p50_s": {p: round(statistics.median(w), 3) for p, w in waits.items()},
+                "wait_p95_s": {p: round(w[int(0.95 * (len(w) - 1))], 3) for p, w in waits.items()},
+                **dict(self.counters),
+            }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    """Process-wide limiter per provider, shared by every session."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            key = provider.upper()
+            _limiters[provider] = ProviderLimiter(
+                provider,
+                rpm=float(os.getenv(f"LLM_RPM_{key}", DEFAULT_RPM)),
+                tpm=float(os.getenv(f"LLM_TPM_{key}", DEFAULT_TPM)),
+                max_concurrency=int(os.getenv(f"LLM_MAX_CONCURRENCY_{key}", DEFAULT_MAX_CONCURRENCY)),
+            )
+        return _limiters[provider]
+
+
+def limiter_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: limiter.metrics() for name, limiter in list(_limiters.items())}
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token plus the expected completion."""
+    return len(text) // 4 + EXPECTED_OUTPUT_TOKENS
+
+
+def call_with_limits(provider: str, text: str, fn, priority: Optional[str] = None):
+    """
+    Runs fn() under the provider's limiter, retrying 429/5xx with jittered backoff.
+    fn's result may carry usage_metadata; the token bucket is corrected with it.
+    """
+    limiter = get_limiter(provider)
+    priority = priority or current_priority()
+    estimate = estimate_tokens(text)
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(estimate, priority)
+        try:
+            result = fn()
+        except Exception as e:
+            throttled = is_throttle(e)
+            limiter.release(ok=False, throttled=throttled)
+            if not is_retryable(e) or attempt == MAX_RETRIES:
+                raise
+            delay = retry_after(e) or backoff_delay(attempt)
+            limiter.counters["retries"] += 1
+            print(f"🔁 {provider}: {'rate limited' if throttled else 'server error'}, retry {attempt + 1}/{MAX_RETRIES} in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        usage = getattr(result, "usage_metadata", None) or {}
+        actual = usage.get("total_tokens")
+        limiter.release(ok=True, token_delta=(actual - estimate) if actual else 0)
+        return result
+
+
+class RateLimitedLLM(BaseChatModel):
+    """Chat model wrapper that sends every call through the shared provider limiter."""
+    inner: Any
+    provider: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"rate-limited-{self.provider}"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        text = "\n".join(str(m.content) for m in messages)
+        message = call_with_limits(self.provider, text, lambda: self.inner.invoke(messages, stop=stop, **kwargs))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema: Any = None, **kwargs):
+        structured = self.inner.with_structured_output(schema, **kwargs)
+        return RunnableLambda(lambda value: call_with_limits(self.provider, str(value), lambda: structured.invoke(value)))
@@ -0,0 +1,190 @@
+# utils/result_cache.py
+
+import io
+import os
+import re
+import json
+import sqlite3
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlglot
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+from utils.sql_linter import DIALECT
+
+load_dotenv()
+
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "result_cache.db")
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "result_cache")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "500"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+RESULT_CACHE_FULL = os.getenv("RESULT_CACHE_FULL", "false").lower() == "true"  # also keep the full result as Parquet
+
+# Snowflake keeps persisted query results for 24 hours
+RESULT_SCAN_WINDOW = timedelta(hours=24)
+
+
+# --- Keys ---
+
+def fingerprint(sql: str) -> str:
+    """Hash of the SQL with comments, whitespace and unquoted identifier case normalized away."""
+    try:
+        normalized = sqlglot.parse_one(sql, read=DIALECT).sql(dialect=DIALECT, normalize=True, comments=False)
+    except SqlglotError:
+        normalized = re.sub(r"\s+", " ", sql).strip().upper()
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def fetch_table_versions(cursor, tables: List[str]) -> Dict[str, Optional[str]]:
+    """
+    LAST_ALTERED of each DB.SCHEMA.TABLE from INFORMATION_SCHEMA.TABLES (one query per database).
+    Tables that are not found map to None.
+    """
+    versions = {t.upper(): None for t in tables}
+    by_database: Dict[str, List[List[str]]] = {}
+    for table in versions:
+        database, schema, name = table.split(".")[-3:]
+        by_database.setdefault(database, []).append([schema, name])
+
+    for database, entries in by_database.items():
+        schemas = ", ".join(sorted({f"'{s}'" for s, _ in entries}))
+        names = ", ".join(sorted({f"'{n}'" for _, n in entries}))
+        cursor.execute(f"""
+            SELECT TABLE_SCHEMA, TABLE_NAME, LAST_ALTERED
+            FROM {database}.INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA IN ({schemas}) AND TABLE_NAME IN ({names})
+        """)
+        for schema, name, altered in cursor.fetchall():
+            key = f"{database}.{schema}.{name}".upper()
+            if key in versions:
+                versions[key] = altered.isoformat() if hasattr(altered, "isoformat") else str(altered)
+    return versions
+
+
+def cache_key(sql: str, versions: Dict[str, Optional[str]], variant: str = "") -> Optional[str]:
+    """Fingerprint + source table versions + execution variant; None when a table version is unknown."""
+    if not versions or any(v is None for v in versions.values()):
+        return None
+    payload = json.dumps({"sql": fingerprint(sql), "tables": versions, "variant": variant}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+# --- Store ---
+
+def get_cache(path: str = RESULT_CACHE_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            cache_key TEXT PRIMARY KEY,
+            sql_fingerprint TEXT,
+            table_versions TEXT,
+            query_id TEXT,
+            row_count INTEGER,
+            columns TEXT,
+            result_json TEXT,
+            preview BLOB,
+            full_path TEXT,
+            size_bytes INTEGER,
+            created_at TEXT,
+            last_used_at TEXT,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    return conn
+
+
+def _to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        table = pa.Table.from_pandas(df.astype(str), preserve_index=False)
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+def put_result(cache: sqlite3.Connection, key: Optional[str], sql: str, versions: Dict[str, Optional[str]],
+               df: pd.DataFrame, result: Dict[str, Any], query_id: Optional[str] = None, preview_rows: int = 10):
+    """
+    Stores the preview rows (Parquet), row count, columns and the sql_result fields of one
+    execution; with RESULT_CACHE_FULL the whole DataFrame is written to RESULT_CACHE_DIR too.
+    """
+    if not key:
+        return
+    preview = _to_parquet_bytes(df.head(preview_rows))
+    full_path, size = None, len(preview)
+    if RESULT_CACHE_FULL:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        full_path = os.path.join(RESULT_CACHE_DIR, f"{key}.parquet")
+        with open(full_path, "wb") as f:
+            f.write(_to_parquet_bytes(df))
+        size += os.path.getsize(full_path)
+
+    now = datetime.now().isoformat()
+    kept = {k: v for k, v in result.items() if k not in ("preview_ref",)}
+    cache.execute("""
+        INSERT OR REPLACE INTO results (cache_key, sql_fingerprint, table_versions, query_id, row_count, columns,
+                                        result_json, preview, full_path, size_bytes, created_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        key, fingerprint(sql), json.dumps(versions, sort_keys=True), query_id, result.get("row_count"),
+        json.dumps([str(c) for c in df.columns]), json.dumps(kept, default=str), preview, full_path, size, now, now,
+    ))
+    cache.commit()
+    evict(cache)
+
+
+def get_result(cache: sqlite3.Connection, key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Cached entry { result, preview (DataFrame), query_id, full_path, created_at } — marks it recently used."""
+    if not key:
+        return None
+    row = cache.execute("SELECT * FROM results WHERE cache_key = ?", (key,)).fetchone()
+    if not row:
+        return None
+    cache.execute("UPDATE results SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                  (datetime.now().isoformat(), key))
+    cache.commit()
+    return {
+        "result": json.loads(row["result_json"]),
+        "preview": pq.read_table(io.BytesIO(row["preview"])).to_pandas(),
+        "query_id": row["query_id"],
+        "full_path": row["full_path"] if row["full_path"] and os.path.exists(row["full_path"]) else None,
+        "created_at": row["created_at"],
+    }
+
+
+def full_result(entry: Dict[str, Any], cursor=None) -> Optional[pd.DataFrame]:
+    """
+    The complete cached result: the local Parquet copy, else Snowflake's persisted result
+    through RESULT_SCAN while the original query is inside the 24h window. None otherwise.
+    """
+    if entry.get("full_path"):
+        return pq.read_table(entry["full_path"]).to_pandas()
+    created = datetime.fromisoformat(entry["created_at"])
+    if cursor is None or not entry.get("query_id") or datetime.now() - created > RESULT_SCAN_WINDOW:
+        return None
+    cursor.execute(f"SELECT * FROM TABLE(RESULT_SCAN('{entry['query_id']}'))")
+    return pd.DataFrame(cursor.fetchall(), columns=[d[0] for d in cursor.description or []])
+
+
+def evict(cache: sqlite3.Connection):
+    """Drops least recently used entries until both the entry and byte limits hold."""
+    rows = cache.execute("SELECT cache_key, full_path, size_bytes FROM results ORDER BY last_used_at DESC").fetchall()
+    total = sum(r["size_bytes"] or 0 for r in rows)
+    stale = []
+    while rows and (len(rows) > RESULT_CACHE_MAX_ENTRIES or total > RESULT_CACHE_MAX_BYTES):
+        row = rows.pop()
+        total -= row["size_bytes"] or 0
+        stale.append(row["cache_key"])
+        if row["full_path"] and os.path.exists(row["full_path"]):
+            os.remove(row["full_path"])
+    if stale:
+        cache.executemany("DELETE FROM results WHERE cache_key = ?", [(k,) for k in stale])
+        cache.commit()
+        print(f"🧹 Result cache evicted {len(stale)} entries")
@@ -5,8 +5,33 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 
 load_dotenv()
 
+# --- Pluggable backend ---
+_connection_factory = None
+
+def set_connection_factory(factory):
+    """
+    Routes every get_snowflake_connection() call to `factory()` — e.g. the DuckDB
+    stand-in from utils.duckdb_backend. Pass None to go back to Snowflake.
+    """
+    global _connection_factory
+    _connection_factory = factory
+
+def connection_backend():
+    """The active connection factory (None for Snowflake) — lets long-lived caches notice a switch."""
+    return _connection_factory
+
 # --- Connection ---
 def get_snowflake_connection():
+    if _connection_factory is not None:
+        return _connection_factory()
+    return default_connection()
+
+def default_connection():
+    """The connection used when no factory is set: Snowflake, or the DuckDB stand-in with ETL_BACKEND=duckdb."""
+    if os.getenv("ETL_BACKEND", "snowflake").lower() == "duckdb":
+        from utils.duckdb_backend import get_default_standin
+        return get_default_standin().connect()
+
     return snowflake.connector.connect(
         user=os.getenv("SNOWFLAKE_USER"),
         password=os.getenv("SNOWFLAKE_PASSWORD"),
@@ -121,6 +146,35 @@ def list_all_tables() -> list:
     conn.close()
     return all_tables
 
+# --- Single-level catalog listings (see utils.catalog_cache) ---
+def list_databases() -> list:
+    conn = get_snowflake_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SHOW DATABASES")
+        return [row[1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+def list_schemas(databases: list) -> dict:
+    """SHOW SCHEMAS for each database over one connection: {db: [schemas]}; [] when not accessible."""
+    conn = get_snowflake_connection()
+    cursor = conn.cursor()
+    result = {}
+    try:
+        for db in databases:
+            try:
+                cursor.execute(f"SHOW SCHEMAS IN DATABASE {db}")
+                result[db] = [row[1] for row in cursor.fetchall()]
+            except Exception as e:
+                print(f"⚠️ SHOW SCHEMAS IN DATABASE {db} failed: {e}")
+                result[db] = []
+    finally:
+        cursor.close()
+        conn.close()
+    return result
+
 # --- Cached: Get all DBs and schemas ---
 
 def get_all_databases_and_schemas() -> dict:
@@ -0,0 +1,216 @@
+# utils/sql_checker.py
+
+from typing import Dict, Any, List, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+from utils.sql_linter import DIALECT, lint_sql, unfixed
+
+# Table columns known to the checker: { "DB.SCHEMA.TABLE": {"COLUMN": "TYPE", ...} }
+# A value of None means "columns unknown" (e.g. a staging table built with SELECT *).
+SchemaMap = Dict[str, Optional[Dict[str, str]]]
+
+
+def build_schema(raw_metadata: Dict[str, Any], resolved_tables: Dict[str, str]) -> SchemaMap:
+    """SchemaMap from MetadataFetcherAgent's DESC TABLE output."""
+    schema_map = {}
+    for short_name, fqdn in (resolved_tables or {}).items():
+        columns = (raw_metadata or {}).get(short_name)
+        if isinstance(columns, list):
+            schema_map[fqdn.upper()] = {str(c.get("name", "")).upper(): c.get("type") for c in columns}
+    return schema_map
+
+
+def _error(rule: str, message: str, node: Optional[exp.Expression] = None, severity: str = "error") -> Dict[str, Any]:
+    error = {"rule": rule, "message": message, "severity": severity}
+    meta = getattr(node.this if isinstance(node, exp.Column) else node, "meta", None) if node is not None else None
+    if meta and meta.get("line"):
+        error["line"] = meta["line"]
+        error["col"] = meta.get("col")
+    return error
+
+
+def blocking(errors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Findings that certainly fail in Snowflake; the others are warnings the checker could not resolve."""
+    return [e for e in errors if e.get("severity", "error") == "error"]
+
+
+def _fqdn(table: exp.Table, database: str, schema: str) -> str:
+    return ".".join([table.catalog or database, table.db or schema, table.name]).upper()
+
+
+def _scope_columns(scope: Scope) -> Optional[List[str]]:
+    """Output column names of a CTE / subquery scope, None if it selects *."""
+    query = scope.expression
+    while isinstance(query, exp.SetOperation):
+        query = query.left
+    if not isinstance(query, exp.Select) or any(isinstance(e, exp.Star) or (isinstance(e, exp.Column) and e.is_star) for e in query.expressions):
+        return None
+    return [name.upper() for name in query.named_selects]
+
+
+def output_columns(sql: str) -> Optional[List[str]]:
+    """Columns a CREATE ... AS SELECT produces (None when it uses *)."""
+    try:
+        tree = sqlglot.parse_one(sql, read=DIALECT)
+    except SqlglotError:
+        return None
+    query = tree.expression if isinstance(tree, exp.Create) else tree
+    if not isinstance(query, exp.Query):
+        return None
+    return _scope_columns(Scope(query))
+
+
+def output_table(sql: str, database: str, schema: str) -> Optional[str]:
+    """DB.SCHEMA.TABLE a CREATE ... AS statement writes, None for a plain query."""
+    try:
+        tree = sqlglot.parse_one(sql, read=DIALECT)
+    except SqlglotError:
+        return None
+    if not isinstance(tree, exp.Create):
+        return None
+    target = tree.this.this if isinstance(tree.this, exp.Schema) else tree.this
+    return _fqdn(target, database, schema) if isinstance(target, exp.Table) else None
+
+
+def check_sql(sql: str, schema_map: SchemaMap, database: str, schema: str) -> List[Dict[str, Any]]:
+    """
+    Static check of one CTAS statement, no Snowflake round trip:
+    - SOP / forbidden-construct rules the linter cannot fix (parse errors, DML, CTAS form)
+    - every physical table exists in `schema_map`
+    - every column reference resolves to exactly one source in its scope (or an enclosing one,
+      for correlated subqueries)
+    Returns a list of { rule, message, severity[, line, col] }; severity "warning" marks what the
+    checker could not resolve (see blocking()).
+    """
+    _, violations = lint_sql(sql, database, schema)
+    errors = [_error(v["rule"], v["message"]) for v in unfixed(violations)]
+    if errors:
+        return errors
+
+    tree = sqlglot.parse_one(sql, read=DIALECT)
+    if not isinstance(tree, exp.Create) or not isinstance(tree.expression, exp.Query):
+        return [_error("ctas_form", "Statement must be CREATE OR REPLACE TABLE ... AS SELECT")]
+    if isinstance(tree.this, exp.Schema):
+        errors.append(_error("ctas_column_list", "CREATE TABLE ... (columns) AS is not valid in Snowflake", tree.this))
+
+    resolved = {}  # id(scope) → { alias: columns or None }
+
+    def scope_sources(scope: Scope) -> Dict[str, Optional[List[str]]]:
+        """Columns available from each source alias of a scope (unknown tables are reported once)"""
+        if id(scope) not in resolved:
+            sources = {}
+            for alias, source in scope.sources.items():
+                if isinstance(source, exp.Table):
+                    fqdn = _fqdn(source, database, schema)
+                    if fqdn not in schema_map:
+                        known = ", ".join(sorted(schema_map)) or "none"
+                        errors.append(_error("unknown_table", f"Table {fqdn} is not in the fetched metadata (known: {known})", source))
+                        sources[alias.upper()] = None
+                    else:
+                        sources[alias.upper()] = list((schema_map[fqdn] or {}).keys()) if schema_map[fqdn] is not None else None
+                elif isinstance(source, Scope):
+                    sources[alias.upper()] = _scope_columns(source)
+            resolved[id(scope)] = sources
+        return resolved[id(scope)]
+
+    def enclosing(scope: Scope):
+        """The scope, then the scopes around it — a correlated subquery sees the outer query's sources"""
+        while scope is not None:
+            yield scope_sources(scope)
+            scope = scope.parent
+
+    for scope in traverse_scope(tree.expression):
+        sources = scope_sources(scope)
+
+        select = scope.expression if isinstance(scope.expression, exp.Select) else None
+        select_aliases = {a.alias.upper() for a in select.expressions if isinstance(a, exp.Alias)} if select else set()
+        # USING / NATURAL join columns are one merged column, not one per side
+        joins = (select.args.get("joins") or []) if select else []
+        merged = {c.name.upper() for j in joins for c in (j.args.get("using") or [])}
+        natural = any((j.method or "").upper() == "NATURAL" for j in joins)
+
+        for column in scope.columns:
+            name = column.name.upper()
+            if column.is_star:
+                continue
+
+            if column.table:
+                qualifier = column.table.upper()
+                owner = next((s for s in enclosing(scope) if qualifier in s), None)
+                if owner is None:
+                    errors.append(_error("unknown_qualifier",
+                                         f"{column.sql(dialect=DIALECT)}: '{column.table}' is not a table or alias the checker "
+                                         f"can resolve (available: {', '.join(sorted(sources)) or 'none'})", column, "warning"))
+                elif owner[qualifier] is not None and name not in owner[qualifier]:
+                    errors.append(_error("unknown_column",
+                                         f"{column.sql(dialect=DIALECT)}: column {column.name} does not exist in {column.table}", column))
+                continue
+
+            if name in select_aliases:
+                continue
+            owners = [alias for alias, cols in sources.items() if cols is None or name in cols]
+            if not owners:
+                if any(cols is None or name in cols for outer in list(enclosing(scope))[1:] for cols in outer.values()):
+                    continue
+                errors.append(_error("unknown_column",
+                                     f"Column {column.name} does not exist in any of: {', '.join(sorted(sources)) or 'no tables'}", column))
+            elif len(owners) > 1 and all(sources[o] is not None for o in owners):
+                if name in merged:
+                    continue
+                errors.append(_error("ambiguous_column",
+                                     f"Column {column.name} is ambiguous — it exists in {', '.join(sorted(owners))}; qualify it",
+                                     column, "warning" if natural else "error"))
+
+    # A correlated column is listed in the subquery's scope and again in the outer one
+    unique = {}
+    for error in errors:
+        unique.setdefault(tuple(sorted((k, str(v)) for k, v in error.items())), error)
+    return list(unique.values())
+
+
+def check_task_graph(staging_tables: List[Dict[str, Any]], final_table: Optional[Dict[str, Any]],
+                     schema_map: SchemaMap, database: str, schema: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Checks each CTE-extracted CREATE statement in dependency order; staging tables become
+    known sources for the tables built after them. Returns { table_name: errors } for failures.
+    """
+    known = dict(schema_map)
+    pending = list(staging_tables or []) + ([final_table] if final_table else [])
+    failures = {}
+
+    # Dependency order: a table is checked once everything it depends on is known
+    for _ in range(len(pending) + 1):
+        progressed = False
+        for table in list(pending):
+            deps = [f"{database}.{schema}.{d.split('.')[-1]}".upper() for d in table.get("depends_on", [])]
+            if any(d not in known for d in deps) and len(pending) > 1:
+                continue
+            sql = table.get("create_statement", "")
+            errors = check_sql(sql, known, database, schema)
+            if blocking(errors):
+                failures[table.get("table_name")] = blocking(errors)
+            elif errors:
+                print(f"⚠️ Static check warnings for {table.get('table_name')}:\n{describe_errors(errors)}")
+            columns = output_columns(sql)
+            fqdn = f"{database}.{schema}.{table.get('table_name', '').split('.')[-1]}".upper()
+            known[fqdn] = {c: None for c in columns} if columns is not None else None
+            pending.remove(table)
+            progressed = True
+        if not pending or not progressed:
+            break
+
+    for table in pending:
+        failures[table.get("table_name")] = [_error("dependency", f"Unresolvable dependencies: {table.get('depends_on')}")]
+    return failures
+
+
+def describe_errors(errors: List[Dict[str, Any]]) -> str:
+    lines = []
+    for e in errors:
+        where = f" (line {e['line']}, col {e['col']})" if e.get("line") else ""
+        warning = " (warning)" if e.get("severity") == "warning" else ""
+        lines.append(f"- [{e['rule']}]{warning}{where} {e['message']}")
+    return "\n".join(lines)
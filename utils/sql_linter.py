@@ -0,0 +1,213 @@
+# utils/sql_linter.py
+
+import re
+from typing import Dict, Any, List, Optional, Tuple
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from sqlglot.optimizer.scope import build_scope
+
+DIALECT = "snowflake"
+FORBIDDEN = {
+    exp.Insert: "INSERT",
+    exp.Update: "UPDATE",
+    exp.Delete: "DELETE",
+    exp.Merge: "MERGE",
+    exp.Drop: "DROP",
+}
+_SIMPLE_IDENTIFIER = re.compile(r"^[A-Z_][A-Z0-9_$]*$")
+# Snowflake reserved keywords: quoted, they are valid names; unquoted, they break the statement
+RESERVED_WORDS = {
+    "ACCOUNT", "ALL", "ALTER", "AND", "ANY", "AS", "BETWEEN", "BY", "CASE", "CAST", "CHECK", "COLUMN",
+    "CONNECT", "CONNECTION", "CONSTRAINT", "CREATE", "CROSS", "CURRENT", "CURRENT_DATE", "CURRENT_TIME",
+    "CURRENT_TIMESTAMP", "CURRENT_USER", "DATABASE", "DELETE", "DISTINCT", "DROP", "ELSE", "EXISTS",
+    "FALSE", "FOLLOWING", "FOR", "FROM", "FULL", "GRANT", "GROUP", "GSCLUSTER", "HAVING", "ILIKE", "IN",
+    "INCREMENT", "INNER", "INSERT", "INTERSECT", "INTO", "IS", "ISSUE", "JOIN", "LATERAL", "LEFT", "LIKE",
+    "LOCALTIME", "LOCALTIMESTAMP", "MINUS", "NATURAL", "NOT", "NULL", "OF", "ON", "OR", "ORDER",
+    "ORGANIZATION", "QUALIFY", "REGEXP", "REVOKE", "RIGHT", "RLIKE", "ROW", "ROWS", "SAMPLE", "SCHEMA",
+    "SELECT", "SET", "SOME", "START", "TABLE", "TABLESAMPLE", "THEN", "TO", "TRIGGER", "TRUE", "TRY_CAST",
+    "UNION", "UNIQUE", "UPDATE", "USING", "VALUES", "VIEW", "WHEN", "WHENEVER", "WHERE", "WINDOW", "WITH",
+}
+
+
+def strip_markup(sql: str) -> str:
+    """Removes markdown fences and trailing semicolons the LLM tends to add."""
+    sql = re.sub(r"```(?:sql)?", "", sql or "", flags=re.IGNORECASE).strip()
+    return sql.rstrip().rstrip(";").strip()
+
+
+def _violation(rule: str, message: str, fixed: bool) -> Dict[str, Any]:
+    return {"rule": rule, "message": message, "fixed": fixed}
+
+
+def _cte_names(tree: exp.Expression) -> set:
+    return {cte.alias_or_name.upper() for cte in tree.find_all(exp.CTE)}
+
+
+def _target_table(tree: exp.Expression) -> Optional[exp.Table]:
+    if isinstance(tree, exp.Create):
+        target = tree.this
+        return target.this if isinstance(target, exp.Schema) else target
+    return None
+
+
+def _alias_for(name: str, taken: set) -> str:
+    """Short alias from the table name's initials (CUSTOMER_ORDERS → co), made unique."""
+    base = "".join(part[0] for part in name.lower().split("_") if part) or "t"
+    alias, n = base, 1
+    while alias.upper() in taken:
+        n += 1
+        alias = f"{base}{n}"
+    taken.add(alias.upper())
+    return alias
+
+
+def _expression_alias(node: exp.Expression, taken: set) -> str:
+    """Readable alias for a computed select item, e.g. SUM(o.amount) → sum_amount."""
+    parts = []
+    if isinstance(node, exp.Func):
+        parts.append(node.key.lower())
+    parts += [c.name.lower() for c in node.find_all(exp.Column)][:2]
+    alias = "_".join(parts) if len(parts) > 1 else f"{parts[0]}_value" if parts else "expr"
+    candidate, n = alias, 1
+    while candidate.upper() in taken:
+        n += 1
+        candidate = f"{alias}_{n}"
+    taken.add(candidate.upper())
+    return candidate
+
+
+def _qualifier_sources(query: exp.Expression) -> Dict[int, exp.Expression]:
+    """
+    { id(column): source node } for qualified columns: the qualifier is looked up in the column's
+    scope, then in the enclosing scopes (a correlated subquery reading an outer table), so an
+    inner table or alias of the same name shadows the outer one.
+    """
+    root = build_scope(query)
+    if root is None:
+        return {}
+    resolved = {}
+    for scope in root.traverse():
+        for column in scope.columns:
+            if not column.table:
+                continue
+            current = scope
+            while current is not None:
+                source = next((node for name, node in current.sources.items()
+                               if name.upper() == column.table.upper()), None)
+                if source is not None:
+                    if isinstance(source, exp.Table):
+                        resolved[id(column)] = source
+                    break
+                current = current.parent
+    return resolved
+
+
+def lint_sql(sql: str, database: str, schema: str, output_table: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Applies the SOP rules locally.
+    Fixes what can be fixed deterministically (CTAS form, qualification, aliases, quoting,
+    semicolons) and reports what cannot (DML, parse errors, multiple statements).
+
+    Returns (formatted_sql, violations); a violation with fixed=False needs the LLM.
+    """
+    violations = []
+    cleaned = strip_markup(sql)
+    if cleaned != (sql or "").strip():
+        violations.append(_violation("markup", "Removed markdown fences / trailing semicolon", True))
+
+    try:
+        statements = [s for s in sqlglot.parse(cleaned, read=DIALECT) if s is not None]
+    except ParseError as e:
+        detail = e.errors[0] if e.errors else {}
+        message = f"{detail.get('description', e)} (line {detail.get('line')}, col {detail.get('col')})" if detail else str(e)
+        return cleaned, violations + [_violation("parse_error", f"SQL does not parse: {message}", False)]
+
+    if len(statements) != 1:
+        return cleaned, violations + [_violation("single_statement", f"Expected exactly one statement, found {len(statements)}", False)]
+    tree = statements[0]
+
+    # 🚫 Forbidden statements
+    for node_type, keyword in FORBIDDEN.items():
+        if tree.find(node_type):
+            violations.append(_violation("forbidden_statement", f"{keyword} is not allowed — use CREATE OR REPLACE TABLE ... AS", False))
+    if any(not v["fixed"] for v in violations):
+        return cleaned, violations
+
+    # ❗ CTAS form: CREATE OR REPLACE TABLE <db>.<schema>.<output> AS <query>
+    into = tree.find(exp.Into) if isinstance(tree, exp.Select) else None
+    if into:
+        target = into.this.copy()
+        into.pop()
+        tree = exp.Create(this=target, kind="TABLE", replace=True, expression=tree)
+        violations.append(_violation("select_into", "Rewrote SELECT INTO as CREATE OR REPLACE TABLE ... AS", True))
+    elif isinstance(tree, exp.Query):
+        if not output_table:
+            return cleaned, violations + [_violation("ctas_form", "Query does not create a table and no output table is known", False)]
+        tree = exp.Create(this=exp.to_table(output_table), kind="TABLE", replace=True, expression=tree)
+        violations.append(_violation("ctas_form", f"Wrapped query in CREATE OR REPLACE TABLE {output_table} AS", True))
+
+    if not isinstance(tree, exp.Create) or not isinstance(tree.expression, exp.Query):
+        return cleaned, violations + [_violation("ctas_form", "Statement must be CREATE OR REPLACE TABLE ... AS SELECT", False)]
+
+    if isinstance(tree.this, exp.Schema):
+        tree.set("this", tree.this.this)
+        violations.append(_violation("ctas_column_list", "Removed column list from CREATE TABLE ... AS", True))
+    if tree.args.get("exists"):
+        tree.set("exists", False)
+        violations.append(_violation("if_not_exists", "Replaced CREATE TABLE IF NOT EXISTS with CREATE OR REPLACE", True))
+    if not tree.args.get("replace"):
+        tree.set("replace", True)
+        violations.append(_violation("or_replace", "Added OR REPLACE", True))
+    if (tree.args.get("kind") or "").upper() != "TABLE":
+        violations.append(_violation("ctas_form", f"Expected CREATE TABLE, found CREATE {tree.args.get('kind')}", False))
+
+    # 📍 Fully qualify physical tables (CTE names are left alone)
+    ctes = _cte_names(tree)
+    tables = [t for t in tree.find_all(exp.Table) if t.name.upper() not in ctes or t is _target_table(tree)]
+    for table in tables:
+        if not table.args.get("db"):
+            table.set("db", exp.to_identifier(schema))
+        if not table.args.get("catalog"):
+            table.set("catalog", exp.to_identifier(database))
+            violations.append(_violation("qualification", f"Qualified {table.name} as {database}.{schema}.{table.name}", True))
+
+    # 🏷️ Table aliases; rewrite `TABLE.col` references to the new alias, including correlated ones
+    query = tree.expression
+    taken = {t.alias_or_name.upper() for t in query.find_all(exp.Table)} | ctes
+    sources = _qualifier_sources(query)
+    for table in [t for t in query.find_all(exp.Table) if not t.alias and t.name.upper() not in ctes]:
+        alias = _alias_for(table.name, taken)
+        for column in query.find_all(exp.Column):
+            if sources.get(id(column)) is table:
+                column.set("table", exp.to_identifier(alias))
+        table.set("alias", exp.TableAlias(this=exp.to_identifier(alias)))
+        violations.append(_violation("table_alias", f"Aliased {table.name} as {alias}", True))
+
+    # 🏷️ Readable aliases for computed select items
+    for select in query.find_all(exp.Select):
+        taken = {e.alias_or_name.upper() for e in select.expressions}
+        for item in list(select.expressions):
+            if isinstance(item, (exp.Alias, exp.Column, exp.Star)):
+                continue
+            alias = _expression_alias(item, taken)
+            item.replace(exp.alias_(item.copy(), alias))
+            violations.append(_violation("column_alias", f"Aliased {item.sql(dialect=DIALECT)} as {alias}", True))
+
+    # ✂️ Unquote identifiers that do not need quotes — only upper-case, non-reserved names resolve
+    # the same without them ("CustomerId" is case-sensitive, "ORDER" is a keyword)
+    for identifier in tree.find_all(exp.Identifier):
+        if identifier.args.get("quoted") and _SIMPLE_IDENTIFIER.match(identifier.name) \
+                and identifier.name not in RESERVED_WORDS:
+            identifier.set("quoted", False)
+            violations.append(_violation("quoted_identifier", f"Removed quotes from {identifier.name}", True))
+
+    return tree.sql(dialect=DIALECT, pretty=True), violations
+
+
+def unfixed(violations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [v for v in violations if not v["fixed"]]
+
+
+def describe_violations(violations: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"- [{v['rule']}] {v['message']}" for v in violations)
@@ -0,0 +1,105 @@
+# utils/sql_sampling.py
+
+from typing import Dict, List, Optional, Union
+import sqlglot
+from sqlglot import exp
+
+from utils.sql_linter import DIALECT
+
+
+def _select_part(tree: exp.Expression) -> exp.Expression:
+    """The query behind a CREATE ... AS, or the statement itself."""
+    return tree.expression if isinstance(tree, exp.Create) and isinstance(tree.expression, exp.Query) else tree
+
+
+def _fqdn(table: exp.Table, database: str = "", schema: str = "") -> str:
+    return ".".join([table.catalog or database, table.db or schema, table.name]).upper()
+
+
+def _base_table_nodes(tree: exp.Expression) -> List[exp.Table]:
+    ctes = {cte.alias_or_name.upper() for cte in tree.find_all(exp.CTE)}
+    return [t for t in tree.find_all(exp.Table) if t.name and t.name.upper() not in ctes]
+
+
+def base_tables(sql: str, database: str = "", schema: str = "") -> List[str]:
+    """Physical tables the query reads (CTE names excluded), as DB.SCHEMA.TABLE."""
+    tree = _select_part(sqlglot.parse_one(sql, read=DIALECT))
+    return sorted({_fqdn(t, database, schema) for t in _base_table_nodes(tree)})
+
+
+def sample_tables(sql: str, percent: Union[float, Dict[str, float]], method: str = "SYSTEM",
+                  seed: Optional[int] = None) -> str:
+    """
+    Rewrites physical table references (not CTE names) as `<table> TABLESAMPLE <method> (<percent>)`
+    and drops the CREATE ... AS wrapper, so the sampled query only returns rows.
+    `percent` is one rate for every table, or { "DB.SCHEMA.TABLE": percent } to sample only those.
+    SYSTEM sampling skips whole micro-partitions, so it also cuts the bytes scanned.
+    """
+    tree = _select_part(sqlglot.parse_one(sql, read=DIALECT)).copy()
+
+    for table in _base_table_nodes(tree):
+        rate = percent.get(_fqdn(table)) if isinstance(percent, dict) else percent
+        if rate is None or rate >= 100 or table.args.get("sample"):
+            continue
+        table.set("sample", exp.TableSample(
+            method=exp.var(method.upper()),
+            percent=exp.Literal.number(round(max(0.0001, rate), 4)),
+            seed=exp.Literal.number(seed) if seed is not None else None,
+        ))
+
+    return tree.sql(dialect=DIALECT)
+
+
+def limit_tables(sql: str, tables: List[str], rows: int) -> str:
+    """Replaces each listed table with `(SELECT * FROM <table> LIMIT <rows>) AS <alias>`."""
+    tree = _select_part(sqlglot.parse_one(sql, read=DIALECT)).copy()
+    wanted = {t.upper() for t in tables}
+
+    for table in _base_table_nodes(tree):
+        if _fqdn(table) not in wanted:
+            continue
+        source = exp.table_(table.name, db=table.db or None, catalog=table.catalog or None)
+        table.replace(exp.select("*").from_(source).limit(rows).subquery(table.alias or table.name))
+
+    return tree.sql(dialect=DIALECT)
+
+
+def replace_tables(sql: str, mapping: Dict[str, str]) -> str:
+    """
+    Points table references at other tables ({ "DB.S.T": "DB.S.T__PREVIEW" }). Unaliased
+    references keep their old name as alias so `T.col` qualifiers still resolve.
+    """
+    tree = _select_part(sqlglot.parse_one(sql, read=DIALECT)).copy()
+    mapping = {k.upper(): v for k, v in mapping.items()}
+
+    for table in _base_table_nodes(tree):
+        target = mapping.get(_fqdn(table))
+        if not target:
+            continue
+        replacement = exp.to_table(target, dialect=DIALECT)
+        replacement.set("alias", exp.TableAlias(this=exp.to_identifier(table.alias or table.name)))
+        table.replace(replacement)
+
+    return tree.sql(dialect=DIALECT)
+
+
+def is_aggregate(sql: str) -> bool:
+    """True when the outermost SELECT groups, aggregates or de-duplicates (its row count does not scale with input)."""
+    query = _select_part(sqlglot.parse_one(sql, read=DIALECT))
+    while isinstance(query, exp.SetOperation):
+        query = query.left
+    if not isinstance(query, exp.Select):
+        return True
+    return bool(query.args.get("group") or query.args.get("distinct")
+                or any(e.find(exp.AggFunc) and not e.find(exp.Window) for e in query.expressions))
+
+
+def extrapolate_rows(rows: int, percents: Dict[str, float]) -> int:
+    """
+    Full-data row estimate for a row-preserving query over sampled inputs:
+    each sampled table contributes a factor of 100 / percent (joins multiply).
+    """
+    factor = 1.0
+    for percent in percents.values():
+        factor *= 100.0 / percent
+    return int(round(rows * factor))
@@ -0,0 +1,284 @@
+# utils/staging_optimizer.py
+
+import os
+from typing import Dict, Any, List, Optional, Callable
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+from utils.sql_linter import DIALECT
+
+load_dotenv()
+
+STAGING_OPTIMIZER = os.getenv("STAGING_OPTIMIZER", "true").lower() == "true"
+# A reused, non-trivial stage scanning at most this much is cheap enough to recompute per consumer → view
+STAGING_VIEW_MAX_BYTES = int(os.getenv("STAGING_VIEW_MAX_BYTES", str(1024 ** 3)))
+
+MATERIALIZE, INLINE, VIEW, DROP = "materialize", "inline", "view", "drop"
+
+# sqlglot renamed the WITH argument of a query from "with" to "with_"
+_WITH = "with_" if "with_" in exp.Select.arg_types else "with"
+
+# (stage name, CTAS sql) → estimate, shaped like warehouse_planner.build_estimates values
+Estimator = Callable[[str, str], Dict[str, Any]]
+
+
+def _short(name: str) -> str:
+    return name.split(".")[-1].upper()
+
+
+def refers_to(table: exp.Table, short: str, database: str, schema: str) -> bool:
+    """Whether a table reference names the staging table DATABASE.SCHEMA.<short>."""
+    return table.name.upper() == short and (table.db or schema).upper() == schema.upper() \
+        and (table.catalog or database).upper() == database.upper()
+
+
+def _query(tree: exp.Expression) -> Optional[exp.Query]:
+    query = tree.expression if isinstance(tree, exp.Create) else tree
+    return query if isinstance(query, exp.Query) else None
+
+
+def is_trivial(query: exp.Query) -> bool:
+    """A projection / filter of one table: no join, aggregate, window, DISTINCT, subquery, ORDER or LIMIT."""
+    if not isinstance(query, exp.Select) or query.args.get(_WITH):
+        return False
+    if any(query.args.get(key) for key in ("joins", "group", "having", "qualify", "distinct", "order", "limit")):
+        return False
+    if query.find(exp.AggFunc, exp.Window, exp.Subquery) or len(list(query.find_all(exp.Table))) != 1:
+        return False
+    return True
+
+
+def estimated_bytes(estimate: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Bytes a stage reads, from history (bytes_scanned) or EXPLAIN (bytes_assigned); None when unknown."""
+    if not estimate or estimate.get("source") == "default":
+        return None
+    value = estimate.get("bytes_scanned", estimate.get("bytes_assigned"))
+    return int(value) if value is not None else None
+
+
+def _cte_sql(cte: exp.CTE) -> str:
+    return cte.this.sql(dialect=DIALECT)
+
+
+def _rename_cte(scope: List[exp.Expression], old: str, new: str):
+    """Points unqualified references to CTE `old` at `new`; an unaliased reference keeps `old` as its alias."""
+    for node in scope:
+        for table in list(node.find_all(exp.Table)):
+            if not table.args.get("db") and table.name.upper() == old.upper():
+                alias = table.args.get("alias") or exp.TableAlias(this=exp.to_identifier(table.name))
+                table.set("this", exp.to_identifier(new))
+                table.set("alias", alias)
+
+
+def inline_stage(consumer: exp.Create, stage_short: str, stage_query: exp.Query, database: str, schema: str) -> bool:
+    """
+    Rewrites the consumer's references to the staging table as a CTE named after it; the stage's own
+    CTEs are hoisted in front so the result keeps a single WITH. A hoisted CTE whose name is taken by a
+    different CTE of the consumer is renamed <stage>_<cte>; one with the same name and the same body
+    (an upstream stage reached through two inlined parents) is kept once.
+    Returns False if nothing referenced the stage.
+    """
+    query = _query(consumer)
+    refs = [t for t in query.find_all(exp.Table) if refers_to(t, stage_short, database, schema)]
+    if not refs:
+        return False
+    for table in refs:
+        replacement = exp.Table(this=exp.to_identifier(stage_short.lower()))
+        if table.args.get("alias"):
+            replacement.set("alias", table.args["alias"].copy())
+        table.replace(replacement)
+
+    body = stage_query.copy()
+    hoisted = list(body.args[_WITH].expressions) if body.args.get(_WITH) else []
+    body.set(_WITH, None)
+    existing = list(query.args[_WITH].expressions) if query.args.get(_WITH) else []
+    taken = {cte.alias_or_name.upper(): _cte_sql(cte) for cte in existing}
+
+    ctes = []
+    for i, cte in enumerate(hoisted):
+        name = cte.alias_or_name
+        if name.upper() in taken and taken[name.upper()] == _cte_sql(cte):
+            # Kept at the hoisted position, ahead of the stage body that reads it
+            existing = [c for c in existing if c.alias_or_name.upper() != name.upper()]
+        elif name.upper() in taken or name.upper() == stage_short.upper():
+            renamed, n = f"{stage_short}_{name}".lower(), 2
+            while renamed.upper() in taken:
+                renamed, n = f"{stage_short}_{name}_{n}".lower(), n + 1
+            # Later hoisted CTEs and the stage body may read it
+            _rename_cte([c.this for c in hoisted[i + 1:]] + [body], name, renamed)
+            cte.set("alias", exp.TableAlias(this=exp.to_identifier(renamed)))
+            name = renamed
+        taken[name.upper()] = _cte_sql(cte)
+        ctes.append(cte)
+    existing = [c for c in existing if c.alias_or_name.upper() != stage_short.upper()]
+    ctes.append(exp.CTE(this=body, alias=exp.TableAlias(this=exp.to_identifier(stage_short.lower()))))
+    query.set(_WITH, exp.With(expressions=ctes + existing))
+    return True
+
+
+def view_statement(stage: Dict[str, Any], database: str, schema: str) -> str:
+    """CREATE OR REPLACE VIEW for a stage kept as a view, from its CTAS statement."""
+    tree = sqlglot.parse_one(stage["create_statement"], read=DIALECT)
+    return f"CREATE OR REPLACE VIEW {database}.{schema}.{_short(stage['table_name'])} AS\n" \
+           f"{_query(tree).sql(dialect=DIALECT, pretty=True)}"
+
+
+def _topological(stages: List[Dict[str, Any]], consumers: Dict[str, set]) -> Optional[List[Dict[str, Any]]]:
+    by_name = {_short(s["table_name"]): s for s in stages}
+    upstream = {name: {n for n, users in consumers.items() if name in users and n in by_name} for name in by_name}
+    order, done = [], set()
+    while len(order) < len(by_name):
+        ready = [n for n in by_name if n not in done and upstream[n] <= done]
+        if not ready:
+            return None  # cycle
+        for name in ready:
+            order.append(by_name[name])
+            done.add(name)
+    return order
+
+
+def optimize_staging_plan(staging_tables: List[Dict[str, Any]], final_table: Optional[Dict[str, Any]],
+                          database: str, schema: str, estimator: Optional[Estimator] = None,
+                          view_max_bytes: Optional[int] = None,
+                          external_consumers: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Decides per CTE-extracted staging table, in dependency order, how it is built:
+    - drop:        nothing reads it
+    - inline:      a trivial projection / filter, or read by a single consumer — becomes a CTE of
+                   each consumer (no task, no write); the consumers inherit its dependencies
+    - view:        read by several consumers, not trivial, but cheap (≤ STAGING_VIEW_MAX_BYTES scanned) and
+                   built from source tables only — CREATE OR REPLACE VIEW once, no task
+    - materialize: read by several consumers and expensive or of unknown cost — transient table + task
+
+    Consumers are found from the SQL itself (table references), not only `depends_on`;
+    external_consumers adds readers outside this plan ({ STAGE: other pipelines building the
+    same subexpression }, see utils/staging_registry.py). depends_on entries that are not stages
+    of this plan (tables shared by other pipelines) are kept and passed on to consumers.
+    Returns {"staging_tables", "final_table", "decisions", "summary"}; staging_tables keeps the
+    materialized stages and the views (marked "materialization": "view"), with rewritten SQL
+    and depends_on. est_bytes_not_written counts the bytes scanned by every stage that is no
+    longer materialized, as a proxy for what it would have written. The plan is returned
+    unchanged if any statement does not parse.
+    """
+    view_max_bytes = STAGING_VIEW_MAX_BYTES if view_max_bytes is None else view_max_bytes
+    stages = [dict(s) for s in staging_tables or []]
+    final = dict(final_table) if final_table else None
+    unchanged = {"staging_tables": staging_tables, "final_table": final_table, "decisions": [],
+                 "summary": {"tasks_before": len(stages) + (1 if final else 0),
+                             "tasks_after": len(stages) + (1 if final else 0), "views": 0,
+                             "est_bytes_not_written": 0}}
+    if not stages:
+        return unchanged
+
+    statements = stages + ([final] if final else [])
+    try:
+        trees = {id(s): sqlglot.parse_one(s["create_statement"], read=DIALECT) for s in statements}
+    except (SqlglotError, KeyError) as e:
+        print(f"⚠️ Staging optimizer skipped, statement does not parse: {e}")
+        return unchanged
+    if any(not isinstance(t, exp.Create) or _query(t) is None for t in trees.values()):
+        print("⚠️ Staging optimizer skipped, not every statement is CREATE ... AS SELECT")
+        return unchanged
+
+    names = {_short(s["table_name"]) for s in stages}
+    # { stage: {names of the statements reading it} }
+    consumers = {name: set() for name in names}
+    for statement in statements:
+        reader = _short(statement["table_name"])
+        for table in _query(trees[id(statement)]).find_all(exp.Table):
+            for name in names:
+                if name != reader and refers_to(table, name, database, schema):
+                    consumers[name].add(reader)
+
+    external = {_short(s["table_name"]): {d for d in s.get("depends_on", []) if _short(d) not in names}
+                for s in statements}
+    external_consumers = {k.upper(): v for k, v in (external_consumers or {}).items()}
+
+    order = _topological(stages, consumers)
+    if order is None:
+        print("⚠️ Staging optimizer skipped, staging tables depend on each other in a cycle")
+        return unchanged
+
+    by_name = {_short(s["table_name"]): s for s in statements}
+    decisions, views = [], set()
+    # Dependencies a consumer inherits from stages inlined into it: { stage: {materialized upstream} };
+    # stages of this plan are short names, external tables fully qualified
+    passthrough: Dict[str, set] = {}
+
+    def upstream(stage_name: str) -> set:
+        deps = set(external[stage_name])
+        for name, users in consumers.items():
+            if stage_name in users:
+                deps |= passthrough.get(name, {name})
+        return deps
+
+    for stage in order:
+        name = _short(stage["table_name"])
+        tree = trees[id(stage)]
+        query = _query(tree)
+        readers = consumers[name]
+        shared_with = external_consumers.get(name, 0)
+        reuse = len(readers) + shared_with
+        deps = upstream(name)
+        estimate = estimator(name, tree.sql(dialect=DIALECT)) if estimator else None
+        scanned = estimated_bytes(estimate)
+
+        if not readers:
+            decision, reason = DROP, "no consumers"
+        elif is_trivial(query):
+            decision, reason = INLINE, "projection / filter of one table"
+        elif reuse == 1:
+            decision, reason = INLINE, "single consumer"
+        else:
+            readers_text = f"{len(readers)} consumer{'s' if len(readers) != 1 else ''}" \
+                + (f" + {shared_with} other pipeline{'s' if shared_with != 1 else ''}" if shared_with else "")
+            if scanned is not None and scanned <= view_max_bytes and all(d in views or "." in d for d in deps):
+                decision, reason = VIEW, f"{readers_text}, ~{scanned:,} bytes scanned"
+            else:
+                decision = MATERIALIZE
+                reason = f"{readers_text}, " + (f"~{scanned:,} bytes scanned" if scanned is not None else "cost unknown")
+
+        if decision == INLINE:
+            for reader in readers:
+                inline_stage(trees[id(by_name[reader])], name, query, database, schema)
+            passthrough[name] = deps
+        elif decision == DROP:
+            passthrough[name] = set()
+        elif decision == VIEW:
+            # Consumers still wait on the tasks the view reads from
+            views.add(name)
+            passthrough[name] = {name} | deps
+        else:
+            passthrough[name] = {name}
+        decisions.append({"table_name": stage["table_name"], "decision": decision, "reason": reason,
+                          "consumers": sorted(readers), "est_bytes": scanned,
+                          "estimate_source": (estimate or {}).get("source")})
+
+    kept = {d["table_name"] for d in decisions if d["decision"] in (MATERIALIZE, VIEW)}
+    optimized = []
+    for statement in statements:
+        name = _short(statement["table_name"])
+        if statement is not final and statement["table_name"] not in kept:
+            continue
+        statement["create_statement"] = trees[id(statement)].sql(dialect=DIALECT, pretty=True)
+        statement["depends_on"] = [d if "." in d else f"{database}.{schema}.{by_name[d]['table_name'].split('.')[-1]}"
+                                   for d in sorted(upstream(name))]
+        if name in views:
+            statement["materialization"] = "view"
+        if statement is not final:
+            optimized.append(statement)
+
+    not_written = sum(d["est_bytes"] or 0 for d in decisions if d["decision"] != MATERIALIZE)
+    summary = {"tasks_before": len(stages) + (1 if final else 0),
+               "tasks_after": len(optimized) - len(views) + (1 if final else 0),
+               "views": len(views),
+               "est_bytes_not_written": not_written}
+    print(f"🧩 Staging plan: {summary['tasks_before']} → {summary['tasks_after']} tasks, "
+          + ", ".join(f"{_short(d['table_name'])}={d['decision']}" for d in decisions))
+    return {"staging_tables": optimized, "final_table": final, "decisions": decisions, "summary": summary}
+
+
+def view_names(staging_tables: List[Dict[str, Any]]) -> set:
+    return {_short(s["table_name"]) for s in staging_tables or [] if s.get("materialization") == "view"}
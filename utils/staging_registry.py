@@ -0,0 +1,475 @@
+# utils/staging_registry.py
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+from dotenv import load_dotenv
+
+from utils.sql_checker import output_columns
+from utils.sql_linter import DIALECT
+from utils.staging_optimizer import refers_to
+from utils.stream_gate import drop_statements
+
+load_dotenv()
+
+STAGING_REGISTRY_DB = os.getenv("STAGING_REGISTRY_DB", "staging_registry.db")
+STAGING_SHARING = os.getenv("STAGING_SHARING", "true").lower() == "true"
+# Task settings for a handed-over stage when the heir pipeline's were never recorded
+DEFAULT_WAREHOUSE = os.getenv("SNOWFLAKE_WAREHOUSE", "COMPUTE_WH")
+DEFAULT_SCHEDULE = "1 hour"
+
+
+# --- Fingerprints ---
+
+def _short(name: str) -> str:
+    return name.split(".")[-1].upper()
+
+
+def _table_fqdn(table: exp.Table, database: str, schema: str) -> str:
+    return ".".join([table.catalog or database, table.db or schema, table.name]).upper()
+
+
+def canonical_sql(create_statement: str, database: str, schema: str, stage_fingerprints: Dict[str, str]) -> str:
+    """
+    The SELECT behind a CREATE ... AS, in a form equal for equivalent statements: identifiers
+    normalized, tables fully qualified, table and CTE aliases renamed in order of appearance,
+    and tables built by staging stages ({ "DB.SCHEMA.TABLE": fingerprint }) replaced by their
+    fingerprints — two pipelines' stg_orders are the same table only if built the same way.
+    """
+    tree = sqlglot.parse_one(create_statement, read=DIALECT)
+    query = normalize_identifiers((tree.expression if isinstance(tree, exp.Create) else tree).copy(), dialect=DIALECT)
+    stage_fingerprints = {k.upper(): v for k, v in stage_fingerprints.items()}
+
+    ctes = {cte.alias_or_name: f"CTE_{i}" for i, cte in enumerate(query.find_all(exp.CTE))}
+    for cte in query.find_all(exp.CTE):
+        cte.set("alias", exp.TableAlias(this=exp.to_identifier(ctes[cte.alias_or_name])))
+
+    aliases = {}
+    for table in query.find_all(exp.Table):
+        fqdn = _table_fqdn(table, database, schema)
+        if table.name in ctes and not table.db:
+            table.set("this", exp.to_identifier(ctes[table.name]))
+        elif fqdn in stage_fingerprints:
+            table.set("this", exp.to_identifier(f"STAGE_{stage_fingerprints[fqdn]}"))
+            table.set("db", None)
+            table.set("catalog", None)
+        else:
+            catalog, db, _ = fqdn.split(".")
+            table.set("db", exp.to_identifier(db))
+            table.set("catalog", exp.to_identifier(catalog))
+        if table.alias:
+            aliases[table.alias] = f"T{len(aliases)}"
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(aliases[table.alias])))
+
+    for column in query.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table]))
+    return query.sql(dialect=DIALECT, comments=False)
+
+
+def fingerprint(canonical: str) -> str:
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def reads(create_statement: str, short: str, database: str, schema: str) -> bool:
+    tree = sqlglot.parse_one(create_statement, read=DIALECT)
+    query = tree.expression if isinstance(tree, exp.Create) else tree
+    return any(refers_to(t, short, database, schema) for t in query.find_all(exp.Table))
+
+
+def rename_references(create_statement: str, old_short: str, new_fqdn: str, database: str, schema: str,
+                      retarget: bool = False) -> str:
+    """
+    Points every reference to DATABASE.SCHEMA.<old_short> at new_fqdn, keeping aliases;
+    with retarget=True the statement's own CREATE target is renamed as well.
+    """
+    tree = sqlglot.parse_one(create_statement, read=DIALECT)
+    query = tree.expression if isinstance(tree, exp.Create) else tree
+    tables = list(query.find_all(exp.Table))
+    if retarget and isinstance(tree, exp.Create):
+        tables.append(tree.this.this if isinstance(tree.this, exp.Schema) else tree.this)
+    catalog, db, name = new_fqdn.split(".")
+    for table in tables:
+        if refers_to(table, old_short, database, schema):
+            table.set("this", exp.to_identifier(name))
+            table.set("db", exp.to_identifier(db))
+            table.set("catalog", exp.to_identifier(catalog))
+    return tree.sql(dialect=DIALECT, pretty=True)
+
+
+def _dependency_order(stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    names = {_short(s["table_name"]) for s in stages}
+    pending, order, done = list(stages), [], set()
+    while pending:
+        ready = [s for s in pending if {_short(d) for d in s.get("depends_on", []) if _short(d) in names} <= done]
+        if not ready:
+            return order + pending  # cycle: keep the given order, the task graph check reports it
+        for stage in ready:
+            order.append(stage)
+            done.add(_short(stage["table_name"]))
+            pending.remove(stage)
+    return order
+
+
+# --- Store ---
+
+def get_store(path: str = STAGING_REGISTRY_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS staging_tables (
+            fingerprint TEXT PRIMARY KEY,
+            table_fqdn TEXT,
+            task_name TEXT,
+            create_statement TEXT,
+            columns_json TEXT,
+            created_by TEXT,
+            created_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS staging_refs (
+            fingerprint TEXT,
+            pipeline TEXT,
+            created_at TEXT,
+            PRIMARY KEY (fingerprint, pipeline)
+        );
+        CREATE TABLE IF NOT EXISTS staging_seen (
+            fingerprint TEXT,
+            pipeline TEXT,
+            seen_at TEXT,
+            PRIMARY KEY (fingerprint, pipeline)
+        );
+        CREATE TABLE IF NOT EXISTS pipelines (
+            pipeline TEXT PRIMARY KEY,
+            final_task TEXT,
+            deployed_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS pipeline_objects (
+            pipeline TEXT,
+            kind TEXT,
+            name TEXT,
+            PRIMARY KEY (pipeline, name)
+        );
+    """)
+    # Registries created before hand-over existed
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(pipelines)")}
+    for column in ("warehouse", "schedule"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE pipelines ADD COLUMN {column} TEXT")
+    return conn
+
+
+class StagingRegistry:
+    """
+    Staging tables deployed by any pipeline, keyed by the fingerprint of their canonical SQL.
+    - share(): before a plan is optimized, stages equal to a registered table are removed and
+      their consumers read the existing table instead, on their own schedule: a Snowflake task
+      cannot run AFTER a task of another pipeline's graph (both graphs' roots would have to be
+      suspended to link them, a task cannot have predecessors under two roots, and the owner's
+      next CREATE OR REPLACE would drop the link), so the table is shared but never the task;
+      readers see the table as of the owner's last run, and a reader scheduled before the owner's
+      first run fails that run and succeeds on its next one
+    - register(): after the task graph is created, records the pipeline's materialized stages
+      and a reference from the pipeline to every registered table it reads
+    - record_objects(): other objects a pipeline deployed (the stream gate's task and streams)
+    - teardown_statements() / release(): a pipeline's tasks and tables are dropped only once no
+      other pipeline references them; a stage the torn-down pipeline built and others still read
+      is handed over to one of them (see hand_over()) instead of being left without a predecessor
+    A pipeline is identified by its final table, DATABASE.SCHEMA.TABLE.
+    """
+
+    def __init__(self, path: str = STAGING_REGISTRY_DB):
+        self.store = get_store(path)
+        self._lock = threading.Lock()
+
+    def entry(self, fp: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.store.execute("SELECT * FROM staging_tables WHERE fingerprint = ?", (fp,)).fetchone()
+            if row is None:
+                return None
+            refs = [r["pipeline"] for r in self.store.execute(
+                "SELECT pipeline FROM staging_refs WHERE fingerprint = ?", (fp,))]
+        return {**dict(row), "refs": refs}
+
+    def _by_table(self, table_fqdn: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.store.execute("SELECT fingerprint FROM staging_tables WHERE table_fqdn = ?",
+                                     (table_fqdn.upper(),)).fetchone()
+        return self.entry(row["fingerprint"]) if row else None
+
+    def upstream_statements(self, table_fqdns: List[str]) -> Dict[str, str]:
+        """
+        { table_fqdn: create_statement } of the given registered tables and of every registered
+        table they read, transitively — what a reader must watch to know a shared table changed.
+        """
+        statements, pending = {}, [t.upper() for t in table_fqdns]
+        with self._lock:
+            registered = {r["table_fqdn"]: r["create_statement"] for r in self.store.execute(
+                "SELECT table_fqdn, create_statement FROM staging_tables")}
+        while pending:
+            fqdn = pending.pop()
+            if fqdn in statements or fqdn not in registered:
+                continue
+            statements[fqdn] = registered[fqdn]
+            database, schema, _ = fqdn.split(".")
+            pending += [t for t in registered if t not in statements and reads(registered[fqdn], _short(t), database, schema)]
+        return statements
+
+    def _seen_by_others(self, fp: str, pipeline: str) -> int:
+        with self._lock:
+            return self.store.execute("SELECT COUNT(*) FROM staging_seen WHERE fingerprint = ? AND pipeline != ?",
+                                      (fp, pipeline)).fetchone()[0]
+
+    # --- Planning ---
+    def share(self, staging_tables: List[Dict[str, Any]], final_table: Dict[str, Any],
+              database: str, schema: str, pipeline: str) -> Dict[str, Any]:
+        """
+        Fingerprints each stage (in dependency order) and swaps the ones another pipeline already
+        builds for the registered table. Returns {"staging_tables", "final_table", "shared",
+        "fingerprints", "reuse", "external"}:
+        - shared:       [{table_name, fingerprint, table_fqdn, task_name}] stages taken from the registry
+        - fingerprints: { STAGE: fingerprint } for the stages left in the plan
+        - reuse:        { STAGE: other pipelines that built the same subexpression } for the optimizer
+        - external:     { table_fqdn: columns or None } for the static SQL check
+        A stage whose table name is taken by a different registered statement is renamed
+        <name>_<fingerprint[:6]> so the pipelines do not overwrite each other's table.
+        """
+        stages = [dict(s) for s in staging_tables or []]
+        final = dict(final_table)
+        by_fqdn, shared, reuse, external = {}, [], {}, {}
+
+        for stage in _dependency_order(stages):
+            short = _short(stage["table_name"])
+            fqdn = f"{database}.{schema}.{short}".upper()
+            fp = fingerprint(canonical_sql(stage["create_statement"], database, schema, by_fqdn))
+            by_fqdn[fqdn] = fp
+            entry = self.entry(fp)
+
+            if entry and set(entry["refs"]) - {pipeline}:
+                target = entry["table_fqdn"]
+                shared.append({"table_name": stage["table_name"], "fingerprint": fp,
+                               "table_fqdn": target, "task_name": entry["task_name"]})
+                columns = json.loads(entry["columns_json"]) if entry["columns_json"] else None
+                external[target] = {c: None for c in columns} if columns is not None else None
+                stages.remove(stage)
+                after = []
+            else:
+                taken = self._by_table(fqdn)
+                if not taken or taken["fingerprint"] == fp or not set(taken["refs"]) - {pipeline}:
+                    reuse[short] = self._seen_by_others(fp, pipeline)
+                    continue
+                target = f"{fqdn}_{fp[:6]}".upper()
+                stage["table_name"] = _short(target)
+                stage["create_statement"] = rename_references(stage["create_statement"], short, target,
+                                                              database, schema, retarget=True)
+                reuse[_short(target)] = self._seen_by_others(fp, pipeline)
+                print(f"🔀 {short} is taken by another pipeline's staging table, building it as {_short(target)}")
+                after = [target]
+            by_fqdn[target] = fp
+
+            # Consumers read the shared / renamed table; only a stage of this plan is a task to run after
+            for consumer in stages + [final]:
+                if consumer is stage or not reads(consumer["create_statement"], short, database, schema):
+                    continue
+                consumer["create_statement"] = rename_references(consumer["create_statement"], short, target,
+                                                                 database, schema)
+                consumer["depends_on"] = [d for d in consumer.get("depends_on", []) if _short(d) != short] + after
+
+        if shared:
+            print(f"♻️ Sharing {len(shared)} staging tables with other pipelines: "
+                  + ", ".join(f"{s['table_name']} → {s['table_fqdn']}" for s in shared))
+        fingerprints = {_short(s["table_name"]): by_fqdn[f"{database}.{schema}.{_short(s['table_name'])}".upper()]
+                        for s in stages}
+        return {"staging_tables": stages, "final_table": final, "shared": shared,
+                "fingerprints": fingerprints, "reuse": reuse, "external": external}
+
+    # --- Bookkeeping ---
+    def register(self, pipeline: str, final_task: Optional[str], materialized: List[Dict[str, Any]],
+                 shared: List[str], seen: List[str], warehouse: Optional[str] = None,
+                 schedule: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Records a deployed plan. materialized: [{fingerprint, table_fqdn, task_name, create_statement}]
+        built by this pipeline; shared: fingerprints it reads from other pipelines; seen: every
+        fingerprint in its plan, whatever the optimizer did with it. References the pipeline held
+        from an earlier deploy but no longer uses are released; returns the entries left without
+        references, now forgotten — pass them to teardown_statements() to drop their task and table.
+        warehouse / schedule are the pipeline's task settings, used if a stage is handed over to it.
+        """
+        now = datetime.now().isoformat()
+        used = {m["fingerprint"] for m in materialized} | set(shared)
+        with self._lock:
+            for m in materialized:
+                columns = output_columns(m["create_statement"])
+                self.store.execute("""
+                    INSERT INTO staging_tables (fingerprint, table_fqdn, task_name, create_statement, columns_json,
+                                                created_by, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(fingerprint) DO NOTHING
+                """, (m["fingerprint"], m["table_fqdn"].upper(), m["task_name"], m["create_statement"],
+                      json.dumps(columns) if columns is not None else None, pipeline, now))
+            for fp in used:
+                self.store.execute("INSERT OR IGNORE INTO staging_refs VALUES (?, ?, ?)", (fp, pipeline, now))
+            for fp in seen:
+                self.store.execute("INSERT OR REPLACE INTO staging_seen VALUES (?, ?, ?)", (fp, pipeline, now))
+            self.store.execute("INSERT OR REPLACE INTO pipelines (pipeline, final_task, deployed_at, warehouse, schedule) "
+                               "VALUES (?, ?, ?, ?, ?)", (pipeline, final_task, now, warehouse, schedule))
+
+            stale = [r["fingerprint"] for r in self.store.execute(
+                "SELECT fingerprint FROM staging_refs WHERE pipeline = ?", (pipeline,)) if r["fingerprint"] not in used]
+            self.store.executemany("DELETE FROM staging_refs WHERE fingerprint = ? AND pipeline = ?",
+                                   [(fp, pipeline) for fp in stale])
+            self.store.commit()
+
+        orphans = [e for e in (self.entry(fp) for fp in stale) if e and not e["refs"]]
+        self._forget_unreferenced()
+        # A stage rebuilt under the same name with new SQL is a new entry; its table stays
+        current = {m["table_fqdn"].upper() for m in materialized}
+        return [e for e in orphans if e["table_fqdn"] not in current]
+
+    def _forget_unreferenced(self):
+        with self._lock:
+            self.store.execute("""
+                DELETE FROM staging_tables
+                WHERE NOT EXISTS (SELECT 1 FROM staging_refs r WHERE r.fingerprint = staging_tables.fingerprint)
+            """)
+            self.store.commit()
+
+    def record_objects(self, pipeline: str, objects: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Replaces the pipeline's own objects ([{kind: task | stream, name}]); returns those recorded
+        by an earlier deploy and no longer part of it, for stream_gate.drop_statements().
+        """
+        current = {o["name"].upper() for o in objects}
+        with self._lock:
+            stale = [{"kind": r["kind"], "name": r["name"]} for r in self.store.execute(
+                "SELECT kind, name FROM pipeline_objects WHERE pipeline = ?", (pipeline,)) if r["name"] not in current]
+            self.store.execute("DELETE FROM pipeline_objects WHERE pipeline = ?", (pipeline,))
+            self.store.executemany("INSERT INTO pipeline_objects VALUES (?, ?, ?)",
+                                   [(pipeline, o["kind"], o["name"].upper()) for o in objects])
+            self.store.commit()
+        return stale
+
+    def hand_over(self, pipeline: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Stages built by `pipeline` that another pipeline still reads, with the registered stages
+        they read (transitively) that only `pipeline` referenced: { fingerprint: entry + "heir" },
+        in dependency order. Their tasks ran AFTER the torn-down pipeline's gate or stages, so
+        they are recreated in the heir's name: a stage reading another handed-over stage runs
+        AFTER its task, the others become scheduled roots with the heir's warehouse and schedule.
+        """
+        with self._lock:
+            kept = {r["fingerprint"]: r["heir"] for r in self.store.execute("""
+                SELECT t.fingerprint, MIN(o.pipeline) AS heir FROM staging_tables t
+                JOIN staging_refs r ON r.fingerprint = t.fingerprint AND r.pipeline = ?
+                JOIN staging_refs o ON o.fingerprint = t.fingerprint AND o.pipeline != ?
+                WHERE t.created_by = ? GROUP BY t.fingerprint
+            """, (pipeline, pipeline, pipeline))}
+            tables = [dict(r) for r in self.store.execute(
+                "SELECT fingerprint, table_fqdn FROM staging_tables ORDER BY rowid")]
+        by_table = {t["table_fqdn"]: t["fingerprint"] for t in tables}
+
+        heirs = dict(kept)
+        for fp, heir in kept.items():
+            for fqdn in self.upstream_statements([self.entry(fp)["table_fqdn"]]):
+                upstream = self.entry(by_table[fqdn])
+                if upstream["refs"] == [pipeline]:
+                    heirs.setdefault(upstream["fingerprint"], heir)
+        # Registration order is dependency order: a task is created after those it runs AFTER
+        return {t["fingerprint"]: {**self.entry(t["fingerprint"]), "heir": heirs[t["fingerprint"]]}
+                for t in tables if t["fingerprint"] in heirs}
+
+    def _hand_over_statements(self, handed: Dict[str, Dict[str, Any]]) -> List[str]:
+        with self._lock:
+            settings = {r["pipeline"]: dict(r) for r in self.store.execute("SELECT * FROM pipelines")}
+        statements, resumes = [], []
+        by_table = {e["table_fqdn"]: e for e in handed.values()}
+        for entry in handed.values():
+            heir = settings.get(entry["heir"], {})
+            database, schema, _ = entry["table_fqdn"].split(".")
+            after = [e["task_name"] for fqdn, e in by_table.items()
+                     if fqdn != entry["table_fqdn"] and reads(entry["create_statement"], _short(fqdn), database, schema)]
+            trigger = f"AFTER {', '.join(after)}" if after else f"SCHEDULE = '{heir.get('schedule') or DEFAULT_SCHEDULE}'"
+            statements += [f"ALTER TASK IF EXISTS {entry['task_name']} SUSPEND;",
+                           f"CREATE OR REPLACE TASK {entry['task_name']}\n"
+                           f"    WAREHOUSE = {heir.get('warehouse') or DEFAULT_WAREHOUSE}\n"
+                           f"    {trigger}\n    AS\n    {entry['create_statement'].strip().rstrip(';')};"]
+            resumes.append(f"ALTER TASK {entry['task_name']} RESUME;")
+        # Dependent tasks are resumed before their roots
+        return statements + resumes[::-1]
+
+    def teardown_statements(self, pipeline: str, entries: Optional[List[Dict[str, Any]]] = None) -> List[str]:
+        """
+        SQL that removes a pipeline: its gate task, its final task, then (newest first) every
+        staging task and table referenced by this pipeline only, then its streams. The final
+        table itself is kept. Stages other pipelines still read are handed over (hand_over())
+        rather than left behind AFTER a dropped task.
+        """
+        statements, streams, handed = [], [], {}
+        if entries is None:
+            handed = self.hand_over(pipeline)
+            with self._lock:
+                objects = [dict(r) for r in self.store.execute(
+                    "SELECT kind, name FROM pipeline_objects WHERE pipeline = ? ORDER BY rowid", (pipeline,))]
+                row = self.store.execute("SELECT final_task FROM pipelines WHERE pipeline = ?", (pipeline,)).fetchone()
+                owned = [r["fingerprint"] for r in self.store.execute("""
+                    SELECT r.fingerprint FROM staging_refs r JOIN staging_tables t ON t.fingerprint = r.fingerprint
+                    WHERE r.pipeline = ? AND NOT EXISTS (
+                        SELECT 1 FROM staging_refs o WHERE o.fingerprint = r.fingerprint AND o.pipeline != r.pipeline)
+                    ORDER BY t.rowid DESC
+                """, (pipeline,)) if r["fingerprint"] not in handed]
+            statements += drop_statements([o for o in objects if o["kind"] == "task"])
+            streams = [o for o in objects if o["kind"] != "task"]
+            if row and row["final_task"]:
+                statements += [f"ALTER TASK {row['final_task']} SUSPEND;", f"DROP TASK IF EXISTS {row['final_task']};"]
+            entries = [self.entry(fp) for fp in owned]
+        for entry in entries:
+            statements += [f"ALTER TASK {entry['task_name']} SUSPEND;", f"DROP TASK IF EXISTS {entry['task_name']};",
+                           f"DROP TABLE IF EXISTS {entry['table_fqdn']};"]
+        return statements + self._hand_over_statements(handed) + drop_statements(streams)
+
+    def release(self, pipeline: str):
+        """
+        Forgets a torn-down pipeline and the staging tables only it referenced; the stages
+        hand_over() picked are recorded as built and referenced by their heirs.
+        """
+        handed = self.hand_over(pipeline)
+        with self._lock:
+            for fp, entry in handed.items():
+                self.store.execute("UPDATE staging_tables SET created_by = ? WHERE fingerprint = ?", (entry["heir"], fp))
+                self.store.execute("INSERT OR IGNORE INTO staging_refs VALUES (?, ?, ?)",
+                                   (fp, entry["heir"], datetime.now().isoformat()))
+            self.store.execute("DELETE FROM staging_refs WHERE pipeline = ?", (pipeline,))
+            self.store.execute("DELETE FROM staging_seen WHERE pipeline = ?", (pipeline,))
+            self.store.execute("DELETE FROM pipelines WHERE pipeline = ?", (pipeline,))
+            self.store.execute("DELETE FROM pipeline_objects WHERE pipeline = ?", (pipeline,))
+            self.store.commit()
+        self._forget_unreferenced()
+
+    def references(self) -> Dict[str, List[str]]:
+        """{ table_fqdn: [pipelines referencing it] } — the refcount of a staging table is the list's length"""
+        references: Dict[str, List[str]] = {}
+        with self._lock:
+            for row in self.store.execute("""
+                SELECT t.table_fqdn, r.pipeline FROM staging_tables t
+                JOIN staging_refs r ON r.fingerprint = t.fingerprint ORDER BY t.table_fqdn, r.pipeline
+            """):
+                references.setdefault(row["table_fqdn"], []).append(row["pipeline"])
+        return references
+
+
+_registry: Optional[StagingRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_staging_registry() -> StagingRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = StagingRegistry()
+        return _registry
@@ -0,0 +1,95 @@
+# utils/stream_gate.py
+
+import os
+from typing import Dict, Any, List, Iterable
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from dotenv import load_dotenv
+
+from utils.sql_linter import DIALECT
+
+load_dotenv()
+
+STREAM_GATED_TASKS = os.getenv("STREAM_GATED_TASKS", "false").lower() == "true"
+GATE_TASK_PREFIX = os.getenv("STREAM_GATE_TASK_PREFIX", "GATE_")
+STREAM_PREFIX = os.getenv("STREAM_GATE_STREAM_PREFIX", "STRM_")
+# One row per gated run: which pipeline consumed how many change rows
+STREAM_RUNS_TABLE = os.getenv("STREAM_GATE_RUNS_TABLE", "ETL_STREAM_RUNS")
+
+
+def source_tables(statements: Iterable[str], database: str, schema: str, produced: Iterable[str] = ()) -> List[str]:
+    """
+    Fully qualified tables the statements read, minus CTE names and the tables in `produced`
+    (stages and views of the plan itself, tables shared from other pipelines). Statements that
+    do not parse are skipped.
+    """
+    produced = {p.upper() for p in produced}
+    sources = set()
+    for statement in statements:
+        try:
+            tree = sqlglot.parse_one(statement, read=DIALECT)
+        except SqlglotError as e:
+            print(f"⚠️ Stream gate skipped a statement that does not parse: {e}")
+            continue
+        query = tree.expression if isinstance(tree, exp.Create) else tree
+        if not isinstance(query, exp.Expression):
+            continue
+        ctes = {cte.alias_or_name.upper() for cte in query.find_all(exp.CTE)}
+        for table in query.find_all(exp.Table):
+            if not table.db and table.name.upper() in ctes:
+                continue
+            fqdn = ".".join([table.catalog or database, table.db or schema, table.name]).upper()
+            if fqdn not in produced:
+                sources.add(fqdn)
+    return sorted(sources)
+
+
+def plan_gate(pipeline_name: str, sources: List[str], database: str, schema: str) -> Dict[str, Any]:
+    """
+    The streams and root task that gate a pipeline on its source tables changing:
+    - setup: CREATE TABLE for the run log and one CREATE STREAM per source; run before the tasks
+    - task:  {name, sql, when} for the gate task — it carries the schedule, runs only
+             WHEN SYSTEM$STREAM_HAS_DATA(...) for some stream, and its body reads every stream
+             in one INSERT into the run log. A DML reading a stream advances its offset, so the
+             streams are empty again until the sources change
+    - streams: { source table: stream }
+    The gate consumes the changes as the graph starts: a downstream task that fails does not
+    retrigger the next tick (the next source change does). pipeline_name is the final table's name.
+    """
+    short = pipeline_name.split(".")[-1].upper()
+    streams: Dict[str, str] = {}
+    for source in sources:
+        name = f"{database}.{schema}.{STREAM_PREFIX}{short}_{source.split('.')[-1]}".upper()
+        if name in streams.values():  # same table name in two schemas
+            name = f"{name}_{len(streams)}"
+        streams[source] = name
+
+    log_table = f"{database}.{schema}.{STREAM_RUNS_TABLE}".upper()
+    setup = [f"CREATE TABLE IF NOT EXISTS {log_table} (PIPELINE VARCHAR, RUN_AT TIMESTAMP, CHANGED_ROWS BIGINT);"]
+    # Initial rows count as changes, so the first scheduled run builds the tables
+    setup += [f"CREATE STREAM IF NOT EXISTS {stream} ON TABLE {source} SHOW_INITIAL_ROWS = TRUE;"
+              for source, stream in streams.items()]
+
+    changed = " + ".join(f"(SELECT COUNT(*) FROM {stream})" for stream in streams.values())
+    task = {
+        "name": f"{GATE_TASK_PREFIX}{short}",
+        "sql": f"INSERT INTO {log_table} (PIPELINE, RUN_AT, CHANGED_ROWS) "
+               f"SELECT '{pipeline_name.upper()}', CURRENT_TIMESTAMP, {changed}",
+        "when": " OR ".join(f"SYSTEM$STREAM_HAS_DATA('{stream}')" for stream in streams.values()),
+        "dependencies": [],
+        "is_final": False,
+        "is_gate": True,
+    }
+    return {"setup": setup, "task": task, "streams": streams}
+
+
+def drop_statements(objects: List[Dict[str, str]]) -> List[str]:
+    """Removes gate objects ([{kind: task | stream, name}]); tasks are suspended first."""
+    statements = []
+    for obj in objects:
+        if obj["kind"] == "task":
+            statements += [f"ALTER TASK {obj['name']} SUSPEND;", f"DROP TASK IF EXISTS {obj['name']};"]
+        else:
+            statements.append(f"DROP STREAM IF EXISTS {obj['name']};")
+    return statements
@@ -0,0 +1,149 @@
+# utils/table_index.py
+
+import os
+import re
+import time
+import difflib
+import threading
+from typing import Dict, List, Set, Tuple, Optional
+from dotenv import load_dotenv
+
+from utils.snowflake_utils import get_snowflake_tables, connection_backend
+
+load_dotenv()
+
+TABLE_INDEX_TTL_S = float(os.getenv("TABLE_INDEX_TTL_S", "600"))
+TABLE_FUZZY_MIN_SCORE = float(os.getenv("TABLE_FUZZY_MIN_SCORE", "0.6"))
+TABLE_FUZZY_MAX_CANDIDATES = int(os.getenv("TABLE_FUZZY_MAX_CANDIDATES", "5"))
+
+
+def normalize(name: str) -> str:
+    """Lowercase name without quotes or any DB./SCHEMA. prefix."""
+    return name.strip().strip('"').split(".")[-1].strip('"').lower()
+
+
+# Words ending in "s" that are not plurals ("news" must not match a NEW table)
+_NOT_PLURAL = {"news", "series", "species", "means", "analytics", "economics", "logistics", "physics"}
+
+
+def _singular(word: str) -> str:
+    if word in _NOT_PLURAL:
+        return word
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 2 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def stem(name: str) -> str:
+    """Plural-insensitive key: every underscore/space-separated word singularised ("order_items" → "order_item")."""
+    return "_".join(_singular(w) for w in re.split(r"[\s_\-]+", normalize(name)) if w)
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SchemaTableIndex:
+    """
+    Name index over the tables of one DATABASE.SCHEMA, built from a single listing.
+    - lookup(): exact, case-insensitive hits from a dict
+    - match(): exact hits, else plural-insensitive hits, else fuzzy candidates —
+      tables sharing trigrams with the name, ranked by trigram overlap and edit similarity
+    """
+
+    def __init__(self, database: str, schema: str, tables: List[str]):
+        self.database = database
+        self.schema = schema
+        self.tables = list(tables)
+        self.loaded_at = time.monotonic()
+        self._exact: Dict[str, List[str]] = {}
+        self._stems: Dict[str, List[str]] = {}
+        self._grams: Dict[str, List[int]] = {}  # trigram → positions in self.tables
+        self._gram_counts: List[int] = []
+
+        for i, table in enumerate(self.tables):
+            key = normalize(table)
+            self._exact.setdefault(key, []).append(table)
+            self._stems.setdefault(stem(table), []).append(table)
+            grams = trigrams(key)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._grams.setdefault(gram, []).append(i)
+
+    def fqdn(self, table: str) -> str:
+        return f"{self.database}.{self.schema}.{table}"
+
+    def lookup(self, name: str) -> List[str]:
+        return self._exact.get(normalize(name), [])
+
+    def candidates(self, name: str, limit: int = TABLE_FUZZY_MAX_CANDIDATES,
+                   min_score: float = TABLE_FUZZY_MIN_SCORE) -> List[Tuple[str, float]]:
+        """Fuzzy (table, score) pairs, best first. Only tables sharing a trigram with `name` are scored."""
+        key = normalize(name)
+        grams = trigrams(key)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for i in self._grams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        # Edit similarity only for the best trigram overlaps: score = (dice + edit) / 2 with edit <= 1,
+        # so a table below dice 2 * min_score - 1 can never reach min_score
+        floor = 2 * min_score - 1
+        dice = {i: 2 * common / (len(grams) + self._gram_counts[i]) for i, common in shared.items()}
+        shortlist = sorted((i for i, d in dice.items() if d >= floor), key=lambda i: -dice[i])[:limit * 10]
+
+        scored = []
+        for i in shortlist:
+            table = self.tables[i]
+            edit = difflib.SequenceMatcher(None, stem(key), stem(table)).ratio()
+            score = round((dice[i] + edit) / 2, 3)
+            if score >= min_score:
+                scored.append((table, score))
+        scored.sort(key=lambda pair: (-pair[1], pair[0]))
+        return scored[:limit]
+
+    def match(self, name: str) -> Tuple[str, List[str]]:
+        """("exact" | "plural" | "fuzzy" | "missing", matching table names best first)."""
+        exact = self.lookup(name)
+        if exact:
+            return "exact", exact
+        by_stem = self._stems.get(stem(name), [])
+        if by_stem:
+            return "plural", by_stem
+        fuzzy = [table for table, _ in self.candidates(name)]
+        return ("fuzzy", fuzzy) if fuzzy else ("missing", [])
+
+
+_indexes: Dict[Tuple, SchemaTableIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_table_index(database: str, schema: str, refresh: bool = False) -> SchemaTableIndex:
+    """
+    Process-wide index of DATABASE.SCHEMA, shared by every session. The table listing is
+    queried once per TABLE_INDEX_TTL_S (or when the connection backend changes).
+    """
+    key = (id(connection_backend()), database.upper(), schema.upper())
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None and not refresh and time.monotonic() - index.loaded_at < TABLE_INDEX_TTL_S:
+        return index
+
+    index = SchemaTableIndex(database, schema, get_snowflake_tables(database, schema))
+    print(f"🗂️ Indexed {len(index.tables)} tables in {database}.{schema}")
+    with _indexes_lock:
+        _indexes[key] = index
+    return index
+
+
+def invalidate_table_index(database: Optional[str] = None, schema: Optional[str] = None):
+    """Drops cached indexes (all, one database, or one schema) — e.g. after creating tables."""
+    with _indexes_lock:
+        for key in list(_indexes):
+            if (database is None or key[1] == database.upper()) and (schema is None or key[2] == schema.upper()):
+                del _indexes[key]
@@ -0,0 +1,266 @@
+# utils/task_monitor.py
+
+import os
+import json
+import sqlite3
+import statistics
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TASK_MONITOR_DB = os.getenv("TASK_MONITOR_DB", "task_monitor.db")
+BASELINE_WINDOW = int(os.getenv("TASK_MONITOR_BASELINE_WINDOW", "10"))
+REGRESSION_THRESHOLD = float(os.getenv("TASK_MONITOR_REGRESSION_THRESHOLD", "0.5"))  # +50% over baseline
+REGRESSION_MIN_SECONDS = float(os.getenv("TASK_MONITOR_REGRESSION_MIN_SECONDS", "5"))
+
+EPOCH = "1970-01-01T00:00:00"
+
+
+# --- Local store ---
+
+def get_store(path: str = TASK_MONITOR_DB) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS task_runs (
+            run_id TEXT,
+            graph_run_group_id TEXT,
+            root_task_id TEXT,
+            name TEXT,
+            state TEXT,
+            scheduled_time TEXT,
+            query_start_time TEXT,
+            completed_time TEXT,
+            queue_s REAL,
+            exec_s REAL,
+            error_message TEXT,
+            PRIMARY KEY (graph_run_group_id, name, run_id)
+        );
+        CREATE TABLE IF NOT EXISTS poll_cursor (
+            database TEXT PRIMARY KEY,
+            last_completed_time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS graph_runs (
+            graph_run_group_id TEXT PRIMARY KEY,
+            summary_json TEXT
+        );
+    """)
+    return conn
+
+
+def get_cursor_time(store: sqlite3.Connection, database: str) -> str:
+    row = store.execute("SELECT last_completed_time FROM poll_cursor WHERE database = ?", (database,)).fetchone()
+    return row["last_completed_time"] if row else EPOCH
+
+
+def _iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _seconds(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    if not start or not end:
+        return None
+    return round((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds(), 3)
+
+
+# --- Polling ---
+
+def fetch_task_history_since(cursor, database: str, since: str, lookback_days: int = 7) -> List[Dict[str, Any]]:
+    """
+    Reads finished task runs with COMPLETED_TIME after `since` (the incremental cursor).
+    """
+    start = max(datetime.fromisoformat(since).replace(tzinfo=None), datetime.now() - timedelta(days=lookback_days))
+    cursor.execute(f"""
+        SELECT RUN_ID, GRAPH_RUN_GROUP_ID, ROOT_TASK_ID, NAME, STATE,
+               SCHEDULED_TIME, QUERY_START_TIME, COMPLETED_TIME, ERROR_MESSAGE
+        FROM TABLE({database}.INFORMATION_SCHEMA.TASK_HISTORY(
+            SCHEDULED_TIME_RANGE_START => TO_TIMESTAMP_LTZ('{start.isoformat()}'),
+            RESULT_LIMIT => 10000
+        ))
+        WHERE COMPLETED_TIME > TO_TIMESTAMP_LTZ('{since}')
+        ORDER BY COMPLETED_TIME
+    """)
+    columns = [desc[0].lower() for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def record_task_runs(store: sqlite3.Connection, database: str, rows: List[Dict[str, Any]]) -> int:
+    """Upserts task runs and advances the COMPLETED_TIME cursor. Returns rows stored."""
+    last_seen = get_cursor_time(store, database)
+
+    for row in rows:
+        scheduled = _iso(row.get("scheduled_time"))
+        started = _iso(row.get("query_start_time"))
+        completed = _iso(row.get("completed_time"))
+
+        store.execute("""
+            INSERT OR REPLACE INTO task_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            str(row.get("run_id")), str(row.get("graph_run_group_id")), str(row.get("root_task_id")),
+            row.get("name"), row.get("state"), scheduled, started, completed,
+            _seconds(scheduled, started), _seconds(started, completed), row.get("error_message"),
+        ))
+        if completed and completed > last_seen:
+            last_seen = completed
+
+    store.execute("INSERT OR REPLACE INTO poll_cursor VALUES (?, ?)", (database, last_seen))
+    store.commit()
+    return len(rows)
+
+
+def poll_task_history(cursor, store: sqlite3.Connection, database: str) -> int:
+    """One incremental poll: fetch runs newer than the cursor and store them."""
+    since = get_cursor_time(store, database)
+    rows = fetch_task_history_since(cursor, database, since)
+    print(f"🛰️ TaskMonitor: {len(rows)} new task runs in {database} since {since}")
+    return record_task_runs(store, database, rows)
+
+
+# --- Analysis ---
+
+def build_run_timeline(runs: List[Dict[str, Any]], task_graph: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds the timeline of one graph run and its critical path.
+    Input: task runs of a single GRAPH_RUN_GROUP_ID, task_graph from SQLTaskGraphAgent.
+    Output: { "tasks": [...], "critical_path": [...], "duration_s", "queue_s", "exec_s" }
+    """
+    graph = {name.upper(): spec for name, spec in (task_graph or {}).items()}
+    by_name = {r["name"].upper(): r for r in runs}
+    started = [r["scheduled_time"] for r in runs if r.get("scheduled_time")]
+    origin = min(started) if started else None
+
+    tasks = []
+    for name, r in sorted(by_name.items(), key=lambda kv: kv[1].get("scheduled_time") or ""):
+        tasks.append({
+            "name": name,
+            "state": r.get("state"),
+            "start_offset_s": _seconds(origin, r.get("scheduled_time")),
+            "end_offset_s": _seconds(origin, r.get("completed_time")),
+            "queue_s": r.get("queue_s"),
+            "exec_s": r.get("exec_s"),
+        })
+
+    # Walk back from the last task to finish through the predecessor that finished last
+    path = []
+    finished = [n for n in by_name if by_name[n].get("completed_time")]
+    node = max(finished, key=lambda n: by_name[n]["completed_time"]) if finished else None
+    while node:
+        path.append(node)
+        deps = [d.upper() for d in graph.get(node, {}).get("dependencies", []) if d.upper() in by_name]
+        deps = [d for d in deps if by_name[d].get("completed_time")]
+        node = max(deps, key=lambda d: by_name[d]["completed_time"]) if deps else None
+    path.reverse()
+
+    return {
+        "tasks": tasks,
+        "critical_path": path,
+        "duration_s": max((t["end_offset_s"] or 0) for t in tasks) if tasks else 0,
+        "queue_s": round(sum(by_name[n].get("queue_s") or 0 for n in path), 3),
+        "exec_s": round(sum(by_name[n].get("exec_s") or 0 for n in path), 3),
+    }
+
+
+def detect_regressions(store: sqlite3.Connection, graph_run_group_id: str,
+                       window: int = BASELINE_WINDOW) -> List[Dict[str, Any]]:
+    """
+    Compares each task of a run to the median of its previous `window` successful runs.
+    """
+    regressions = []
+    current = store.execute(
+        "SELECT * FROM task_runs WHERE graph_run_group_id = ? AND state = 'SUCCEEDED'", (graph_run_group_id,)
+    ).fetchall()
+
+    for run in current:
+        history = store.execute("""
+            SELECT exec_s, queue_s FROM task_runs
+            WHERE name = ? AND state = 'SUCCEEDED' AND completed_time < ?
+            ORDER BY completed_time DESC LIMIT ?
+        """, (run["name"], run["completed_time"], window)).fetchall()
+        if len(history) < 3:
+            continue
+
+        for metric in ("exec_s", "queue_s"):
+            values = [h[metric] for h in history if h[metric] is not None]
+            if not values or run[metric] is None:
+                continue
+            baseline = statistics.median(values)
+            if run[metric] > baseline * (1 + REGRESSION_THRESHOLD) and run[metric] - baseline >= REGRESSION_MIN_SECONDS:
+                regressions.append({
+                    "name": run["name"],
+                    "metric": metric,
+                    "value": run[metric],
+                    "baseline": round(baseline, 3),
+                })
+
+    return regressions
+
+
+def summarize_graph_runs(store: sqlite3.Connection, task_graph: Dict[str, Any], limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Builds (and caches) timeline + regression summaries for the most recent runs of a task graph.
+    """
+    names = [n.upper() for n in (task_graph or {})]
+    if not names:
+        return []
+
+    placeholders = ", ".join("?" for _ in names)
+    groups = store.execute(f"""
+        SELECT graph_run_group_id, MAX(completed_time) AS finished
+        FROM task_runs WHERE UPPER(name) IN ({placeholders})
+        GROUP BY graph_run_group_id ORDER BY finished DESC LIMIT ?
+    """, (*names, limit)).fetchall()
+
+    summaries = []
+    for group in groups:
+        group_id = group["graph_run_group_id"]
+        runs = [dict(r) for r in store.execute("SELECT * FROM task_runs WHERE graph_run_group_id = ?", (group_id,))]
+        summary = {
+            "graph_run_group_id": group_id,
+            "finished": group["finished"],
+            **build_run_timeline(runs, task_graph),
+            "regressions": detect_regressions(store, group_id),
+        }
+        store.execute("INSERT OR REPLACE INTO graph_runs VALUES (?, ?)", (group_id, json.dumps(summary)))
+        summaries.append(summary)
+
+    store.commit()
+    return summaries
+
+
+def summarize_gated_runs(store: sqlite3.Connection, task_graph: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    For each stream gate task of a graph (see utils/stream_gate.py): scheduled runs that executed
+    vs were SKIPPED because no source table had changed, and the task executions and execution
+    seconds avoided (each skip saves one run of every task behind the gate, at its average).
+    """
+    graph = {name.upper(): node for name, node in (task_graph or {}).items()}
+    gates = [name for name, node in graph.items() if node.get("is_gate")]
+    downstream = [name for name, node in graph.items() if not node.get("is_gate")]
+    if not gates:
+        return []
+
+    placeholders = ", ".join("?" for _ in downstream)
+    per_run_s = store.execute(f"""
+        SELECT COALESCE(SUM(avg_s), 0) AS s FROM (
+            SELECT AVG(exec_s) AS avg_s FROM task_runs
+            WHERE UPPER(name) IN ({placeholders}) AND state = 'SUCCEEDED' GROUP BY UPPER(name))
+    """, downstream).fetchone()["s"] if downstream else 0
+
+    summaries = []
+    for gate in gates:
+        counts = {r["state"]: r["n"] for r in store.execute(
+            "SELECT state, COUNT(*) AS n FROM task_runs WHERE UPPER(name) = ? GROUP BY state", (gate,))}
+        skipped = counts.get("SKIPPED", 0)
+        summaries.append({
+            "gate": gate,
+            "scheduled_runs": sum(counts.values()),
+            "executed_runs": counts.get("SUCCEEDED", 0),
+            "skipped_runs": skipped,
+            "avoided_task_runs": skipped * len(downstream),
+            "avoided_exec_s": round(skipped * per_run_s, 3),
+        })
+    return summaries
@@ -0,0 +1,57 @@
+# utils/task_monitor_ui.py
+
+import streamlit as st
+import pandas as pd
+from utils.snowflake_utils import get_snowflake_connection
+from utils.task_monitor import get_store, poll_task_history, summarize_gated_runs, summarize_graph_runs
+
+
+def render_task_monitor(state: dict):
+    """
+    Sidebar panel showing recent runs of the task graph created by SQLTaskGraphAgent.
+    """
+    task_graph = state.get("task_graph")
+    database = state.get("selected_database")
+    if not task_graph or not database:
+        return
+
+    store = get_store()
+
+    with st.sidebar:
+        st.subheader("🛰️ Task Graph Runs")
+
+        if st.button("🔄 Refresh task history", key="task_monitor_refresh"):
+            conn = get_snowflake_connection()
+            cursor = conn.cursor()
+            try:
+                new_rows = poll_task_history(cursor, store, database)
+                st.caption(f"{new_rows} new task runs")
+            except Exception as e:
+                st.warning(f"⚠️ Could not poll TASK_HISTORY: {e}")
+            finally:
+                cursor.close()
+                conn.close()
+
+        for gate in summarize_gated_runs(store, task_graph):
+            st.caption(f"🌊 `{gate['gate']}`: {gate['skipped_runs']} of {gate['scheduled_runs']} scheduled runs skipped "
+                       f"(no source changes) — {gate['avoided_task_runs']} task runs, ~{gate['avoided_exec_s']}s avoided")
+
+        summaries = summarize_graph_runs(store, task_graph)
+        if not summaries:
+            st.caption("No completed runs recorded yet.")
+            return
+
+        st.line_chart(pd.DataFrame(
+            [{"finished": s["finished"], "duration_s": s["duration_s"]} for s in reversed(summaries)]
+        ).set_index("finished"))
+
+        latest = summaries[0]
+        st.markdown(f"**Latest run** `{latest['graph_run_group_id']}` — {latest['duration_s']}s")
+        st.markdown(
+            f"Critical path: {' → '.join(latest['critical_path']) or '-'}  \n"
+            f"Queue {latest['queue_s']}s vs execution {latest['exec_s']}s"
+        )
+        st.dataframe(pd.DataFrame(latest["tasks"]))
+
+        for r in latest["regressions"]:
+            st.error(f"📈 `{r['name']}` {r['metric']} {r['value']}s vs baseline {r['baseline']}s")
@@ -0,0 +1,312 @@
+# utils/trace_recorder.py
+
+import os
+import json
+import time
+import base64
+import threading
+import contextvars
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from dotenv import load_dotenv
+
+from core.state_schema import ChatLog, ChatMessage
+from utils.fake_llm import prompt_key, prompt_text, response_record
+from utils.snowflake_utils import connection_backend, default_connection, set_connection_factory
+
+load_dotenv()
+
+TRACE_RECORDING = os.getenv("TRACE_RECORDING", "false").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join("state_logs", "traces"))
+TRACE_MAX_ROWS = int(os.getenv("TRACE_MAX_ROWS", "10000"))  # rows kept per recorded query result
+
+
+# --- Encoding: states and result rows as JSON that decodes back to the same types ---
+
+def encode(value):
+    if isinstance(value, ChatLog):
+        return {"__chat_log__": [m.to_dict() for m in value], "max_messages": value.max_messages,
+                "total": value.total, "last_user_seq": value.last_user_seq, "last_user_text": value.last_user_text}
+    if isinstance(value, ChatMessage):
+        return {"__message__": value.to_dict()}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode()}
+    if isinstance(value, dict):
+        return {str(k): encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [encode(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__chat_log__" in value:
+        log = ChatLog(value["__chat_log__"], max_messages=value["max_messages"])
+        log.total, log.last_user_seq, log.last_user_text = value["total"], value["last_user_seq"], value["last_user_text"]
+        return log
+    if "__message__" in value:
+        message = value["__message__"]
+        return ChatMessage(message["sender"], message["text"], message.get("attachment"))
+    if "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    if "__date__" in value:
+        return date.fromisoformat(value["__date__"])
+    if "__decimal__" in value:
+        return Decimal(value["__decimal__"])
+    if "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return {k: decode(v) for k, v in value.items()}
+
+
+def query_key(sql: str, params=None) -> str:
+    """Whitespace-insensitive key of a statement and its bind parameters."""
+    return " ".join(sql.split()) + (f" -- {json.dumps(encode(params))}" if params else "")
+
+
+# --- LLM calls and routing, from LangChain callbacks ---
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Collects, for one graph invocation, the nodes it ran (in order) and every chat model call
+    with its latency, in the {prompt_key, prompt, response, latency_s} shape ReplayLLM reads.
+    Calls nested in a recorded call (rate limiter, router, prompt cache wrappers) are skipped,
+    so each prompt is recorded once, as the agent sent it.
+    """
+
+    def __init__(self):
+        self.route: List[str] = []
+        self.llm: List[Dict[str, Any]] = []
+        self._calls: Dict[Any, Dict[str, Any]] = {}
+        self._nested = set()
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            with self._lock:
+                self.route.append(node)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            if parent_run_id in self._calls or parent_run_id in self._nested:
+                self._nested.add(run_id)
+                return
+            self._calls[run_id] = {"prompt": prompt_text(messages[0]), "started": time.perf_counter()}
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+            self._nested.discard(run_id)
+            if call is None:
+                return
+            generation = response.generations[0][0]
+            recorded = response_record(generation.message) if hasattr(generation, "message") else {"response": generation.text}
+            self.llm.append({"prompt_key": prompt_key(call["prompt"]), "prompt": call["prompt"],
+                             **recorded, "latency_s": round(time.perf_counter() - call["started"], 3)})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+            self._nested.discard(run_id)
+            if call is not None:
+                self.llm.append({"prompt_key": prompt_key(call["prompt"]), "prompt": call["prompt"], "response": None,
+                                 "error": str(error), "latency_s": round(time.perf_counter() - call["started"], 3)})
+
+
+# --- Snowflake query / result pairs, from a wrapping connection ---
+
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("trace_turn", default=None)
+
+
+class RecordingCursor:
+    """Cursor wrapper: runs the statement, buffers its result and records both."""
+
+    def __init__(self, inner, connection: "RecordingConnection"):
+        self._inner = inner
+        self._connection = connection
+        self._rows: List[tuple] = []
+        self.description = None
+        self.rowcount = -1
+        self.sfqid = None
+
+    def execute(self, sql: str, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            self._inner.execute(sql, params, *args, **kwargs)
+        except Exception as e:
+            self._connection.recorder.record_query({"sql": sql, "params": encode(params), "error": str(e),
+                                                    "latency_s": round(time.perf_counter() - started, 3)})
+            raise
+        self._collect(sql, params, started)
+        return self
+
+    def execute_async(self, sql: str, params=None, *args, **kwargs):
+        result = self._inner.execute_async(sql, params, *args, **kwargs)
+        self.sfqid = getattr(self._inner, "sfqid", None) or result.get("queryId")
+        self._connection.pending[self.sfqid] = (sql, params, time.perf_counter())
+        return result
+
+    def get_results_from_sfqid(self, sfqid: str):
+        sql, params, started = self._connection.pending.pop(sfqid, ("", None, time.perf_counter()))
+        try:
+            self._inner.get_results_from_sfqid(sfqid)
+        except Exception as e:
+            self._connection.recorder.record_query({"sql": sql, "params": encode(params), "async": True,
+                                                    "error": str(e), "latency_s": round(time.perf_counter() - started, 3)})
+            raise
+        self.sfqid = sfqid
+        self._collect(sql, params, started, is_async=True)
+
+    def _collect(self, sql: str, params, started: float, is_async: bool = False):
+        self.description = self._inner.description
+        self.rowcount = getattr(self._inner, "rowcount", -1)
+        self.sfqid = getattr(self._inner, "sfqid", None) or self.sfqid
+        try:
+            self._rows = list(self._inner.fetchall()) if self.description else []
+        except Exception:
+            self._rows = []
+        self._connection.recorder.record_query({
+            "sql": sql, "params": encode(params), "async": is_async,
+            "columns": [d[0] for d in self.description or []],
+            "rows": encode(self._rows[:TRACE_MAX_ROWS]), "rowcount": self.rowcount, "sfqid": self.sfqid,
+            "latency_s": round(time.perf_counter() - started, 3),
+        })
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int = 1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._inner.close()
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class RecordingConnection:
+    def __init__(self, inner, recorder: "TraceRecorder"):
+        self._inner = inner
+        self.recorder = recorder
+        self.pending: Dict[str, tuple] = {}  # sfqid → (sql, params, submitted) of execute_async calls
+
+    def cursor(self) -> RecordingCursor:
+        return RecordingCursor(self._inner.cursor(), self)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+# --- Recorder ---
+
+class TraceRecorder:
+    """
+    Appends one JSON line per graph turn to <directory>/trace_<session_id>.jsonl:
+    {session_id, turn, recorded_at, user_text, state_in, state_out, route, llm, queries, elapsed_s, error}.
+    States are encoded with encode() so core.trace_replay can restore them exactly.
+
+    Creating a recorder wraps the active connection factory; from then on every connection
+    records its statements and results. Queries are attributed to the turn running in the
+    calling context; those made from threads outside it (query job pollers) go to every turn
+    that was active when they ran — a superset, which replay lookups tolerate.
+    """
+
+    def __init__(self, directory: str = TRACE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._turns: Dict[str, int] = {}
+        self._active: List[Dict[str, Any]] = []
+        self._unattributed: List[Dict[str, Any]] = []
+        inner = connection_backend() or default_connection
+        set_connection_factory(lambda: RecordingConnection(inner(), self))
+
+    def path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"trace_{session_id}.jsonl")
+
+    def start_turn(self, session_id: str, state: Dict[str, Any], user_text: str) -> Dict[str, Any]:
+        with self._lock:
+            if session_id not in self._turns:
+                path = self.path(session_id)
+                self._turns[session_id] = sum(1 for _ in open(path)) if os.path.exists(path) else 0
+            number = self._turns[session_id]
+            self._turns[session_id] += 1
+        turn = {"session_id": session_id, "turn": number, "recorded_at": datetime.now().isoformat(),
+                "user_text": user_text, "state_in": encode(state), "handler": TraceCallbackHandler(),
+                "queries": [], "started": time.perf_counter()}
+        with self._lock:
+            self._active.append(turn)
+        turn["token"] = _current_turn.set(turn)
+        return turn
+
+    def record_query(self, query: Dict[str, Any]):
+        turn = _current_turn.get()
+        query["at"] = time.perf_counter()
+        with self._lock:
+            (turn["queries"] if turn is not None else self._unattributed).append(query)
+
+    def finish_turn(self, turn: Dict[str, Any], state: Optional[Dict[str, Any]], error: Optional[str] = None):
+        _current_turn.reset(turn["token"])
+        with self._lock:
+            self._active.remove(turn)
+            queries = turn["queries"] + [q for q in self._unattributed if q["at"] >= turn["started"]]
+            oldest = min((t["started"] for t in self._active), default=None)
+            self._unattributed = [q for q in self._unattributed if oldest is not None and q["at"] >= oldest]
+
+        handler = turn["handler"]
+        record = {
+            "session_id": turn["session_id"], "turn": turn["turn"], "recorded_at": turn["recorded_at"],
+            "user_text": turn["user_text"], "state_in": turn["state_in"],
+            "state_out": encode(state) if state is not None else None,
+            "route": handler.route, "llm": handler.llm,
+            "queries": [{k: v for k, v in q.items() if k != "at"} for q in sorted(queries, key=lambda q: q["at"])],
+            "elapsed_s": round(time.perf_counter() - turn["started"], 3), "error": error,
+        }
+        with self._lock:
+            with open(self.path(turn["session_id"]), "a") as f:
+                f.write(json.dumps(record) + "\n")
+        print(f"🎞️ Recorded turn {turn['turn']} of {turn['session_id']}: {len(handler.route)} nodes, "
+              f"{len(handler.llm)} LLM calls, {len(queries)} queries")
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """The recorded turns of a trace file, in order."""
+    with open(path) as f:
+        return sorted((json.loads(line) for line in f if line.strip()), key=lambda t: t["turn"])
+
+
+_recorder: Optional[TraceRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_trace_recorder() -> Optional[TraceRecorder]:
+    """Process-wide recorder when TRACE_RECORDING=true, else None."""
+    global _recorder
+    if not TRACE_RECORDING:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = TraceRecorder()
+        return _recorder
@@ -0,0 +1,325 @@
+# utils/warehouse_planner.py
+
+import os
+import re
+import json
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 🔁 SIZE LADDER CONFIGURATION
+# WAREHOUSE_SIZE_LADDER: comma-separated SIZE:WAREHOUSE pairs, smallest first, e.g.
+# "XSMALL:ETL_XS_WH,SMALL:ETL_S_WH,MEDIUM:ETL_M_WH,LARGE:ETL_L_WH"
+# Unset, the ladder is the single configured warehouse at its own size
+DEFAULT_WAREHOUSE = os.getenv("SNOWFLAKE_WAREHOUSE", "COMPUTE_WH")
+DEFAULT_SIZE = "XSMALL"
+
+# Credits/hour per warehouse size (standard warehouses)
+CREDITS_PER_HOUR = {
+    "XSMALL": 1, "SMALL": 2, "MEDIUM": 4, "LARGE": 8,
+    "XLARGE": 16, "XXLARGE": 32, "XXXLARGE": 64, "X4LARGE": 128,
+    "X5LARGE": 256, "X6LARGE": 512,
+}
+
+# Other spellings of the sizes above, after upper-casing and removing "-" and spaces:
+# QUERY_HISTORY.WAREHOUSE_SIZE reports "X-Small", "2X-Large", ...; CREATE WAREHOUSE accepts "2XLARGE", ...
+SIZE_ALIASES = {
+    "XS": "XSMALL", "S": "SMALL", "M": "MEDIUM", "L": "LARGE", "XL": "XLARGE",
+    "2XLARGE": "XXLARGE", "2XL": "XXLARGE", "3XLARGE": "XXXLARGE", "3XL": "XXXLARGE",
+    "4XLARGE": "X4LARGE", "XXXXLARGE": "X4LARGE", "4XL": "X4LARGE",
+    "5XLARGE": "X5LARGE", "5XL": "X5LARGE", "6XLARGE": "X6LARGE", "6XL": "X6LARGE",
+}
+
+# Rough scan throughput of an XSMALL warehouse; larger sizes scale it by SCALE_EFFICIENCY x 2 per step
+XSMALL_BYTES_PER_SECOND = float(os.getenv("WH_XSMALL_BYTES_PER_SECOND", 100 * 1024 * 1024))
+WAREHOUSE_MIN_BILLED_SECONDS = 60
+# Serverless tasks are billed per second with a compute multiplier — check your consumption table
+SERVERLESS_MULTIPLIER = float(os.getenv("SERVERLESS_TASK_MULTIPLIER", "1.2"))
+# Fraction of the ideal 2x speedup gained per size step (queries rarely scale linearly)
+SCALE_EFFICIENCY = float(os.getenv("WH_SCALE_EFFICIENCY", "0.8"))
+# Extra credits (as a fraction of the all-smallest plan) the rebalancer may spend on the critical path
+REBALANCE_BUDGET = float(os.getenv("WH_REBALANCE_BUDGET", "0.5"))
+MIN_RUNTIME_SECONDS = 1.0
+
+
+def normalize_size(size: Optional[str]) -> Optional[str]:
+    """CREDITS_PER_HOUR key for any Snowflake spelling of a warehouse size ("2X-Large" → "XXLARGE"); None if unknown"""
+    key = re.sub(r"[\s_-]", "", str(size or "")).upper()
+    key = SIZE_ALIASES.get(key, key)
+    return key if key in CREDITS_PER_HOUR else None
+
+
+def get_size_ladder(warehouse: Optional[str] = None, size: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    Parses WAREHOUSE_SIZE_LADDER into [{"size": "XSMALL", "warehouse": "ETL_XS_WH"}, ...]
+    Without one, the ladder is `warehouse` (default SNOWFLAKE_WAREHOUSE) at `size` (default XSMALL).
+    """
+    default = [{"size": normalize_size(size) or DEFAULT_SIZE, "warehouse": warehouse or DEFAULT_WAREHOUSE}]
+    raw = os.getenv("WAREHOUSE_SIZE_LADDER", "")
+    ladder = []
+    for entry in raw.split(","):
+        if ":" not in entry:
+            continue
+        size, warehouse = [p.strip() for p in entry.split(":", 1)]
+        size = normalize_size(size)
+        if size:
+            ladder.append({"size": size, "warehouse": warehouse})
+        else:
+            print(f"⚠️ Unknown warehouse size in WAREHOUSE_SIZE_LADDER: {entry.strip()}")
+
+    ladder.sort(key=lambda rung: CREDITS_PER_HOUR[rung["size"]])
+    return ladder or default
+
+
+def fetch_warehouse_size(cursor, warehouse: str) -> Optional[str]:
+    """Size of a warehouse from SHOW WAREHOUSES, normalized; None if it cannot be read."""
+    try:
+        cursor.execute(f"SHOW WAREHOUSES LIKE '{warehouse}'")
+        columns = [c[0].lower() for c in cursor.description or []]
+        for row in cursor.fetchall():
+            record = dict(zip(columns, row))
+            if str(record.get("name", "")).upper() == warehouse.upper():
+                return normalize_size(record.get("size"))
+    except Exception as e:
+        print(f"⚠️ Could not read the size of warehouse {warehouse}: {e}")
+    return None
+
+
+# --- Estimation sources ---
+
+def strip_ctas(sql: str) -> str:
+    """Returns the SELECT part of a `CREATE OR REPLACE [TRANSIENT] TABLE x AS ...` statement."""
+    sql = sql.strip().rstrip(";")
+    match = re.match(r"(?is)^\s*CREATE\s+(?:OR\s+REPLACE\s+)?(?:TRANSIENT\s+|TEMPORARY\s+)?TABLE\s+\S+\s+AS\s+(.*)$", sql)
+    return match.group(1) if match else sql
+
+
+def parse_explain_json(explain_json: Any) -> Dict[str, Any]:
+    """
+    Extracts GlobalStats from `EXPLAIN USING JSON` output.
+    Output: { bytes_assigned, partitions_assigned, partitions_total }
+    """
+    if isinstance(explain_json, str):
+        explain_json = json.loads(explain_json)
+
+    stats = (explain_json or {}).get("GlobalStats", {})
+    return {
+        "bytes_assigned": int(stats.get("bytesAssigned", 0) or 0),
+        "partitions_assigned": int(stats.get("partitionsAssigned", 0) or 0),
+        "partitions_total": int(stats.get("partitionsTotal", 0) or 0),
+    }
+
+
+def explain_task_sql(cursor, sql: str) -> Dict[str, Any]:
+    """Runs EXPLAIN USING JSON on the SELECT behind a CTAS statement."""
+    cursor.execute(f"EXPLAIN USING JSON {strip_ctas(sql)}")
+    row = cursor.fetchone()
+    return parse_explain_json(row[0] if row else {})
+
+
+def fetch_task_history(cursor, task_names: List[str], database: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Fetches the previous successful run of each task with its query statistics.
+    Output rows have the same shape as the recorded history fixture.
+    """
+    if not task_names:
+        return []
+
+    prefix = f"{database}." if database else ""
+    names = ", ".join(f"'{name.upper()}'" for name in task_names)
+    cursor.execute(f"""
+        SELECT th.NAME, th.QUERY_ID, qh.WAREHOUSE_SIZE, qh.EXECUTION_TIME,
+               qh.BYTES_SCANNED, qh.PARTITIONS_SCANNED
+        FROM TABLE({prefix}INFORMATION_SCHEMA.TASK_HISTORY()) th
+        JOIN TABLE({prefix}INFORMATION_SCHEMA.QUERY_HISTORY()) qh
+          ON th.QUERY_ID = qh.QUERY_ID
+        WHERE th.STATE = 'SUCCEEDED' AND th.NAME IN ({names})
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY th.NAME ORDER BY th.COMPLETED_TIME DESC) = 1
+    """)
+    return [
+        {
+            "name": row[0],
+            "query_id": row[1],
+            "warehouse_size": row[2],
+            "execution_time_ms": row[3],
+            "bytes_scanned": row[4],
+            "partitions_scanned": row[5],
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+def load_history_fixture(path: str) -> List[Dict[str, Any]]:
+    """Loads recorded TASK_HISTORY/QUERY_HISTORY rows (same shape as fetch_task_history)."""
+    with open(path) as f:
+        data = json.load(f)
+    return data.get("task_history", data) if isinstance(data, dict) else data
+
+
+# --- Cost model ---
+
+def _size_index(size: str) -> int:
+    key = normalize_size(size)
+    if key is None:
+        raise ValueError(f"Unknown warehouse size: {size}")
+    return list(CREDITS_PER_HOUR).index(key)
+
+
+def estimate_runtime(estimate: Dict[str, Any], size: str) -> float:
+    """Scales a task's measured (or scan-derived) runtime to the given warehouse size."""
+    steps = _size_index(size)
+    speedup = 2 * SCALE_EFFICIENCY
+
+    if estimate.get("execution_time_ms") is not None:
+        base_steps = _size_index(estimate.get("warehouse_size") or "XSMALL")
+        runtime = estimate["execution_time_ms"] / 1000.0 * (speedup ** (base_steps - steps))
+    else:
+        runtime = estimate.get("bytes_assigned", 0) / (XSMALL_BYTES_PER_SECOND * (speedup ** steps))
+
+    return max(runtime, MIN_RUNTIME_SECONDS)
+
+
+def warehouse_credits(runtime: float, size: str) -> float:
+    return CREDITS_PER_HOUR[size] * max(runtime, WAREHOUSE_MIN_BILLED_SECONDS) / 3600
+
+
+def serverless_credits(runtime: float, size: str) -> float:
+    return CREDITS_PER_HOUR[size] * runtime / 3600 * SERVERLESS_MULTIPLIER
+
+
+def choose_assignment(estimate: Dict[str, Any], rung: Dict[str, str], allow_serverless: bool = True) -> Dict[str, Any]:
+    """Picks warehouse vs serverless for a task at the given ladder rung, whichever is cheaper."""
+    size = rung["size"]
+    runtime = estimate_runtime(estimate, size)
+    wh_cost = warehouse_credits(runtime, size)
+    sl_cost = serverless_credits(runtime, size)
+
+    if allow_serverless and sl_cost < wh_cost:
+        return {"mode": "serverless", "size": size, "warehouse": None,
+                "est_runtime_s": round(runtime, 2), "est_credits": round(sl_cost, 6)}
+
+    return {"mode": "warehouse", "size": size, "warehouse": rung["warehouse"],
+            "est_runtime_s": round(runtime, 2), "est_credits": round(wh_cost, 6)}
+
+
+# --- Graph analysis ---
+
+def critical_path(task_configs: List[Dict[str, Any]], runtimes: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Longest runtime path through the DAG.
+    Output: { "path": [task names], "duration_s": float }
+    """
+    by_name = {t["name"]: t for t in task_configs}
+    finish, parent = {}, {}
+
+    def visit(name):
+        if name in finish:
+            return finish[name]
+        deps = [d for d in by_name.get(name, {}).get("dependencies", []) if d in by_name]
+        start = 0.0
+        for dep in deps:
+            if visit(dep) > start:
+                start, parent[name] = finish[dep], dep
+        finish[name] = start + runtimes.get(name, 0.0)
+        return finish[name]
+
+    for name in by_name:
+        visit(name)
+
+    if not finish:
+        return {"path": [], "duration_s": 0.0}
+
+    node = max(finish, key=finish.get)
+    path = [node]
+    while node in parent:
+        node = parent[node]
+        path.append(node)
+
+    return {"path": list(reversed(path)), "duration_s": round(max(finish.values()), 2)}
+
+
+def plan_warehouses(task_configs: List[Dict[str, Any]], estimates: Dict[str, Dict[str, Any]],
+                    ladder: Optional[List[Dict[str, str]]] = None, allow_serverless: bool = True,
+                    budget: float = REBALANCE_BUDGET, max_rebalance_steps: int = 10) -> Dict[str, Any]:
+    """
+    Assigns a warehouse (or serverless size) to every task and rebalances the critical path.
+
+    Every task starts on the cheapest rung. Then the critical-path task with the best
+    seconds-saved per extra credit moves one rung up, until the graph stops getting shorter
+    or the extra spend exceeds `budget` x the baseline credits.
+    Input: task_configs from SQLTaskGraphAgent, estimates keyed by task name.
+    Output: { "assignments": {task: {...}}, "critical_path": {...}, "total_credits": float }
+    """
+    ladder = ladder or get_size_ladder()
+    rungs = {t["name"]: 0 for t in task_configs}
+
+    def assign(name):
+        return choose_assignment(estimates.get(name, {}), ladder[rungs[name]], allow_serverless)
+
+    assignments = {name: assign(name) for name in rungs}
+    baseline_credits = sum(a["est_credits"] for a in assignments.values())
+    credit_limit = baseline_credits * (1 + budget)
+
+    for _ in range(max_rebalance_steps):
+        spent = sum(a["est_credits"] for a in assignments.values())
+        runtimes = {n: a["est_runtime_s"] for n, a in assignments.items()}
+        current = critical_path(task_configs, runtimes)
+
+        best = None
+        for name in current["path"]:
+            if rungs[name] + 1 >= len(ladder):
+                continue
+            rungs[name] += 1
+            candidate = assign(name)
+            rungs[name] -= 1
+            trial = critical_path(task_configs, {**runtimes, name: candidate["est_runtime_s"]})
+            gain = current["duration_s"] - trial["duration_s"]
+            extra = candidate["est_credits"] - assignments[name]["est_credits"]
+            if gain <= 0 or spent + extra > credit_limit:
+                continue
+            score = gain / max(extra, 1e-9)
+            if best is None or score > best[0]:
+                best = (score, name, candidate)
+
+        if best is None:
+            break
+
+        _, name, candidate = best
+        rungs[name] += 1
+        assignments[name] = candidate
+
+    runtimes = {n: a["est_runtime_s"] for n, a in assignments.items()}
+    return {
+        "assignments": assignments,
+        "critical_path": critical_path(task_configs, runtimes),
+        "baseline_credits": round(baseline_credits, 6),
+        "total_credits": round(sum(a["est_credits"] for a in assignments.values()), 6),
+    }
+
+
+def build_estimates(task_configs: List[Dict[str, Any]], history: Optional[List[Dict[str, Any]]] = None,
+                    cursor=None) -> Dict[str, Dict[str, Any]]:
+    """
+    Merges previous-run history (preferred) with EXPLAIN statistics for tasks never run before.
+    """
+    by_task = {row["name"].upper(): row for row in (history or [])}
+    estimates = {}
+
+    for task in task_configs:
+        row = by_task.get(task["name"].upper())
+        if row and row.get("warehouse_size") and normalize_size(row["warehouse_size"]) is None:
+            print(f"⚠️ Ignoring {task['name']} history, unknown warehouse size {row['warehouse_size']}")
+            row = None
+        if row and row.get("execution_time_ms") is not None:
+            estimates[task["name"]] = {**row, "source": "history"}
+        elif cursor is not None:
+            try:
+                estimates[task["name"]] = {**explain_task_sql(cursor, task["sql"]), "source": "explain"}
+            except Exception as e:
+                print(f"⚠️ EXPLAIN failed for {task['name']}: {e}")
+                estimates[task["name"]] = {"source": "default"}
+        else:
+            estimates[task["name"]] = {"source": "default"}
+
+    return estimates